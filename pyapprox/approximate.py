@@ -387,7 +387,7 @@ def adaptive_approximate_gaussian_process(
         length_scale=1,
         length_scale_bounds=(1e-2, 10),
         generate_candidate_samples=None,
-        weight_function=None):
+        weight_function=None, hyperparameter_update_interval=1):
     r"""
     Adaptively construct a Gaussian process approximation of a function using 
     weighted-pivoted-Cholesky sampling and the Matern kernel
@@ -494,6 +494,13 @@ def adaptive_approximate_gaussian_process(
 
         where samples is a np.ndarray (num_vars,num_samples)
 
+    hyperparameter_update_interval : integer
+        The GP hyper-parameters are only optimized at every 
+        hyperparameter_update_interval-th checkpoint. At the other 
+        checkpoints the Cholesky factor of the kernel matrix is updated with 
+        the new training samples, which requires O(n^2) instead of O(n^3) 
+        operations.
+
     Returns
     -------
     result : :class:`pyapprox.approximate.ApproximateResult`
@@ -525,7 +532,7 @@ def adaptive_approximate_gaussian_process(
 
     gp = AdaptiveGaussianProcess(
         kernel, n_restarts_optimizer=n_restarts_optimizer, alpha=alpha)
-    gp.setup(fun, sampler)
+    gp.setup(fun, sampler, hyperparameter_update_interval)
 
     if checkpoints is None:
         checkpoints = np.linspace(10, max_nsamples, 10).astype(int)
@@ -1483,7 +1490,8 @@ def approximate_gaussian_process(train_samples, train_vals, nu=np.inf,
                                  kernel_variance_bounds='fixed',
                                  var_trans=None,
                                  length_scale=1,
-                                 length_scale_bounds=(1e-2, 10)):
+                                 length_scale_bounds=(1e-2, 10),
+                                 max_eval_concurrency=1):
     r"""
     Compute a Gaussian process approximation of a function from a fixed data 
     set using the Matern kernel
@@ -1548,6 +1556,10 @@ def approximate_gaussian_process(train_samples, train_vals, nu=np.inf,
     verbose : integer
         Controls the amount of information printed to screen
 
+    max_eval_concurrency : integer
+        The number of processes used to run the restarts of the
+        hyper-parameter optimization in parallel
+
     Returns
     -------
     result : :class:`pyapprox.approximate.ApproximateResult`
@@ -1568,6 +1580,7 @@ def approximate_gaussian_process(train_samples, train_vals, nu=np.inf,
     
     if var_trans is not None:
         gp.set_variable_transformation(var_trans)
+    gp.set_max_eval_concurrency(max_eval_concurrency)
     gp.fit(train_samples, train_vals)
     return ApproximateResult({'approx': gp})
 
@@ -372,6 +372,18 @@ def push_forward_gaussian_though_linear_model(A,b,mean,covariance):
 
     return y_mean, y_covariance
 
+class MisfitGradientFunction(object):
+    r"""
+    Wrapper of the gradient of a misfit function that returns the gradients
+    at a set of samples as rows, i.e. with shape (num_samples,num_dims), so 
+    they can be evaluated in parallel with a PoolModel
+    """
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, samples):
+        return self.model.gradient_set(samples).T
+
 class MisfitHessianVecOperator(object):
     r"""
     Operator which computes the Hessian vector product. The Hessian
@@ -380,7 +392,9 @@ class MisfitHessianVecOperator(object):
     gradients of the misfit of from function evaluations.
     """
     def __init__(self, model, map_point, 
-                 fd_eps=2*np.sqrt(np.finfo(float).eps)):
+                 fd_eps=2*np.sqrt(np.finfo(float).eps),
+                 max_eval_concurrency=1, map_point_misfit_gradient=None,
+                 assert_omp=True, pool=None):
         r"""
         Initialize the MisfitHessianVecOperator
 
@@ -397,24 +411,57 @@ class MisfitHessianVecOperator(object):
             The finite difference step size. If not None
             Then action of hessian will be computed with finite 
             difference even if model has a hessian attribute
+
+        max_eval_concurrency : integer (default=1)
+            The number of gradients evaluated in parallel when computing
+            the finite difference approximation of the action of the 
+            Hessian on a block of vectors. If greater than one the 
+            perturbed samples of all vectors are evaluated concurrently 
+            using a PoolModel, so the model must be picklable
+
+        map_point_misfit_gradient : (num_dims) vector (default=None)
+            The gradient of the misfit at the map point. If None it will be
+            computed. It is reused by every finite difference.
+
+        assert_omp : boolean (default=True)
+            If True and max_eval_concurrency>1 make sure that 
+            OMP_NUM_THREADS=1. See PoolModel
+
+        pool : multiprocessing.Pool (default=None)
+            The pool used to evaluate the gradients in parallel when
+            max_eval_concurrency>1. If None a new pool is created for
+            each block of vectors
         """
         self.model = model
         self.map_point = map_point
         self.fd_eps = fd_eps
+        self.max_eval_concurrency = max_eval_concurrency
 
         self.map_point_misfit_gradient = None
 
         if not hasattr(self.model,'hessian') or fd_eps is not None:
             assert fd_eps is not None
             assert fd_eps>=2*np.sqrt(np.finfo(float).eps)
-            if hasattr(self.model,'gradient_set'):
+            if map_point_misfit_gradient is not None:
+                self.map_point_misfit_gradient = np.asarray(
+                    map_point_misfit_gradient).ravel()
+            elif hasattr(self.model,'gradient_set'):
                 self.map_point_misfit_gradient = self.model.gradient_set(
                     map_point[:,np.newaxis])[:,0]
-                assert (self.map_point_misfit_gradient.shape[0]==
-                    self.map_point.shape[0])
             else:
                 msg = 'model does not have member function called gradient'
                 raise Exception(msg)
+            assert (self.map_point_misfit_gradient.shape[0]==
+                    self.map_point.shape[0])
+
+        self.grad_func = None
+        if hasattr(self.model,'gradient_set'):
+            self.grad_func = MisfitGradientFunction(self.model)
+            if self.max_eval_concurrency>1:
+                from pyapprox.models.wrappers import PoolModel
+                self.grad_func = PoolModel(
+                    self.grad_func, self.max_eval_concurrency,
+                    assert_omp=assert_omp, pool=pool)
 
     def num_rows(self):
         return self.map_point.shape[0]
@@ -457,15 +504,14 @@ class MisfitHessianVecOperator(object):
             print ('TODO replace by opearator hess_vec_prod = model.hess.apply(map_point,vectors). first arg says where to evaluate hessian opearator')
             H = self.model.hessian(self.map_point)
             hessian_vector_products = np.dot(H,vectors)
-        elif hasattr(self.model,'gradient_set'):
-            grad_func = lambda x: self.model.gradient_set(x).T
+        elif self.grad_func is not None:
             # function passed to directional_derivatives function must return
             # np.ndarray with shape (num_samples,num_vars)
             # each gradient entry is considered a qoi of a function
             # directional_derivatives function also returns np.ndarray of shape
             # (num_vectors,num_dims) so must transpose result
             hessian_vector_products = directional_derivatives(
-                    grad_func, self.map_point,
+                    self.grad_func, self.map_point,
                     self.map_point_misfit_gradient, vectors, self.fd_eps).T
         else:
             msg='To implement action of hessian you need to specify hessian function or gradient_set function'
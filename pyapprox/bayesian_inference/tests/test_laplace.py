@@ -6,7 +6,8 @@ from pyapprox.bayesian_inference.laplace import *
 from pyapprox.density import NormalDensity, ObsDataDensity
 from pyapprox.utilities import get_low_rank_matrix
 from pyapprox.randomized_svd import randomized_svd, MatVecOperator, \
-     adjust_sign_svd
+     adjust_sign_svd, ChunkedMatVecOperator, streaming_randomized_svd, \
+     compute_single_pass_adaptive_randomized_svd_from_file, memmap_npz_array
 from pyapprox.tests.test_density import helper_gradient
 from pyapprox.multivariate_gaussian import MultivariateGaussian,\
      CholeskySqrtCovarianceOperator, CovarianceOperator, get_operator_diagonal
@@ -560,6 +561,35 @@ class TestLaplace(unittest.TestCase):
         true_hess_vec_prods = np.dot(model.hessian(map_point),vectors)
         assert np.allclose(true_hess_vec_prods,hess_vec_prods)
 
+        # evaluate the perturbed gradients of all vectors in parallel
+        # reusing the gradient at the map point
+        operator = MisfitHessianVecOperator(
+            model, map_point, max_eval_concurrency=2,
+            map_point_misfit_gradient=model.gradient(map_point)[:,np.newaxis],
+            assert_omp=False)
+        assert operator.map_point_misfit_gradient.shape==(num_dims,)
+        vectors = np.random.normal(0.,1.,(num_dims,5))
+        hess_vec_prods = operator.apply(vectors)
+        true_hess_vec_prods = np.dot(model.hessian(map_point),vectors)
+        assert np.allclose(true_hess_vec_prods,hess_vec_prods)
+
+        # reuse a pool owned by the caller for every block of vectors
+        from multiprocessing import Pool
+        pool = Pool(2)
+        operator = MisfitHessianVecOperator(
+            model, map_point, max_eval_concurrency=2, assert_omp=False,
+            pool=pool)
+        for ii in range(2):
+            vectors = np.random.normal(0.,1.,(num_dims,3))
+            hess_vec_prods = operator.apply(vectors)
+            true_hess_vec_prods = np.dot(model.hessian(map_point),vectors)
+            assert np.allclose(true_hess_vec_prods,hess_vec_prods)
+        pool.close()
+
+        self.assertRaises(
+            AssertionError, MisfitHessianVecOperator, model, map_point,
+            map_point_misfit_gradient=np.ones(num_dims+1))
+
     def test_hessian_vector_multiply_operator_with_randomized_svd(self):
         num_dims = 100; rank = 21; num_qoi=30
         concurrency=10
@@ -604,6 +634,73 @@ class TestLaplace(unittest.TestCase):
         assert np.allclose(Utrue[:,J],U[:,J])
         assert np.allclose(Vtrue[J,:],V[J,:])
 
+    def test_streaming_randomized_svd_from_memmap(self):
+        import tempfile, os
+        np.random.seed(2)
+        num_rows, num_cols, rank = 60, 40, 5
+        Amatrix = get_low_rank_matrix(num_rows,num_cols,rank)
+        Strue = np.linalg.svd(Amatrix,compute_uv=False)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir,'matrix.npy')
+            np.save(filename,Amatrix)
+            matrix = np.load(filename,mmap_mode='r')
+            for max_eval_concurrency in [1,3]:
+                operator = ChunkedMatVecOperator(
+                    matrix,7,max_eval_concurrency)
+                vectors = np.random.normal(0.,1.,(num_cols,2))
+                assert np.allclose(operator.apply(vectors,transpose=False),
+                                   np.dot(Amatrix,vectors))
+                vectors = np.random.normal(0.,1.,(num_rows,2))
+                assert np.allclose(operator.apply(vectors),
+                                   np.dot(Amatrix.T,vectors))
+
+                svd_opts = {'single_pass':False,
+                            'standard_opts':{'num_singular_values':rank}}
+                U,S,V = randomized_svd(operator,svd_opts)
+                assert np.allclose(Strue[:rank],S)
+                assert np.allclose(np.dot(U*S,V),Amatrix)
+                assert np.allclose(np.dot(U.T,U),np.eye(rank))
+                
+                U,S,V = streaming_randomized_svd(
+                    operator,{'num_singular_values':rank})
+                assert np.allclose(Strue[:rank],S)
+                assert np.allclose(np.dot(U*S,V),Amatrix)
+                assert np.allclose(np.dot(U.T,U),np.eye(rank))
+            del matrix
+
+    def test_single_pass_adaptive_randomized_svd_from_file(self):
+        import tempfile, os
+        np.random.seed(2)
+        num_dims, rank = 20, 3
+        Bmatrix = get_low_rank_matrix(num_dims,num_dims,rank)
+        Amatrix = np.dot(Bmatrix,Bmatrix.T)
+        Strue = np.linalg.svd(Amatrix,compute_uv=False)
+        operator = MatVecOperator(Amatrix)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            history_filename = os.path.join(tmpdir,'svd-history')
+            svd_opts = {'single_pass':True,
+                        'standard_opts':{'num_singular_values':rank,
+                                         'num_extra_samples':7},
+                        'history_filename':history_filename}
+            randomized_svd(operator,svd_opts)
+            svd_data = np.load(history_filename+'.npz')
+            X = memmap_npz_array(history_filename+'.npz','X')
+            assert np.allclose(X,svd_data['X'])
+            del X
+
+            for max_num_samples in [None,8]:
+                U,S,V = compute_single_pass_adaptive_randomized_svd_from_file(
+                    history_filename,4,max_num_samples)
+                assert np.allclose(S[:rank],Strue[:rank])
+                assert np.allclose(
+                    np.dot(U[:,:rank]*S[:rank],V[:rank]),Amatrix)
+
+            # compressed arrays cannot be memory mapped so are loaded
+            filename = os.path.join(tmpdir,'compressed.npz')
+            np.savez_compressed(filename,Y=svd_data['Y'])
+            assert np.allclose(memmap_npz_array(filename,'Y'),svd_data['Y'])
+            svd_data.close()
+
     def test_prior_conditioned_misfit_covariance_operator(self):
         num_dims = 3; rank = 2; num_qoi=2
 
@@ -594,6 +594,64 @@ def get_discrepancy_covariances_KL(cov,nsample_ratios,K,L,pkg=np):
     cf = pkg.diag(F) * cov[1:, 0]
     return CF,cf
 
+def get_discrepancy_covariances_recursion_index(cov,nsample_ratios,
+                                                recursion_index,pkg=np):
+    r"""
+    Get the covariances of the discrepancies :math:`\delta` 
+    between each low-fidelity model and its estimated mean for the 
+    generalized multi-fidelity (ACV-GMF) estimator defined by a recursion 
+    index.
+
+    All sample sets are nested subsets of one set of samples. Low-fidelity 
+    model :math:`\alpha` computes its first mean using the 
+    :math:`N_{\gamma_\alpha}` samples of the model :math:`\gamma_\alpha` it 
+    is paired with and its second mean using its :math:`N_\alpha` samples.
+
+    Parameters
+    ----------
+    cov : np.ndarray (nmodels,nmodels)
+        The estimated covariance between each model.
+
+    nsample_ratios : iterable (nmodels-1)
+        The sample ratioss :math:`r_\alpha>1` for each low-fidelity model
+
+    recursion_index : iterable (nmodels-1)
+        The id :math:`\gamma_\alpha` of the model paired with each 
+        low-fidelity model :math:`\alpha=1,\ldots,M-1`. 
+        The index [0,...,0] gives ACV-MF and [0,1,...,M-2] gives MFMC.
+
+    pkg : package (optional)
+        A python package (numpy or torch) used to store the covariances.
+
+    Results
+    -------
+    CF : np.ndarray (nmodels-1,nmodels-1)
+        The matrix of covariances between the discrepancies :math:`\delta`
+
+    cf : np.ndarray (nmodels-1)
+        The vector of covariances between the discrepancies and the 
+        high-fidelity model.
+    """
+    nmodels = cov.shape[0]
+    assert len(recursion_index)==nmodels-1
+    ratios = [1.]+[nsample_ratios[ii] for ii in range(nmodels-1)]
+    # the sizes of the first and second sample sets relative to N_0
+    rs1 = [ratios[recursion_index[ii]] for ii in range(nmodels-1)]
+    rs2 = ratios[1:]
+    F = pkg.zeros((nmodels-1, nmodels-1), dtype=pkg.double)
+    f = pkg.zeros((nmodels-1), dtype=pkg.double)
+    for ii in range(nmodels-1):
+        # the intersection of two nested sets is the smaller set
+        f[ii] = 1/rs1[ii]-1/rs2[ii]
+        for jj in range(ii,nmodels-1):
+            F[ii, jj] = (1/max(rs1[ii],rs1[jj])-1/max(rs1[ii],rs2[jj])-
+                         1/max(rs2[ii],rs1[jj])+1/max(rs2[ii],rs2[jj]))
+            F[jj, ii] = F[ii, jj]
+
+    CF = cov[1:,1:] * F
+    cf = f * cov[1:, 0]
+    return CF,cf
+
 def get_control_variate_weights(cov):
     r"""
     Get the weights used by the control variate estimator with known low 
@@ -684,43 +742,145 @@ def acv_sample_allocation_sample_ratio_constraint(ratios, *args):
     ind = args[0]
     return ratios[ind] - ratios[ind-1]
 
-def generate_samples_and_values_acv_IS(nhf_samples,nsample_ratios,
-                                       functions,generate_samples):
-    nmodels = len(nsample_ratios)+1
+def evaluate_acv_sample_sets(samples,model_sample_ids,sample_set_ranges,
+                             functions,max_eval_concurrency=1):
+    r"""
+    Evaluate each model of an ensemble at the union of its two sample sets 
+    using one batch of evaluations and scatter the values back to the 
+    sample sets of each model.
+
+    Each model is evaluated at most once at each sample. The samples of all 
+    models are gathered into one array of jobs tagged with model ids, which
+    is evaluated with one call to functions when it is callable, e.g. a 
+    ModelEnsemble wrapping a pool of models. When functions is a list the 
+    jobs are split into chunks which are evaluated concurrently.
+
+    The sample sets and values returned are views of the arrays of jobs 
+    and values, i.e. no copies are made.
+
+    Parameters
+    ----------
+    samples : np.ndarray (nvars,nsamples)
+        All the random samples drawn for one realization of the estimator
+
+    model_sample_ids : list (nmodels) of np.ndarray
+        The indices of the samples at which each model is evaluated
+
+    sample_set_ranges : list (nmodels)
+        Each entry [range1,range2] contains the bounds (lb,ub) of the 
+        sample sets :math:`\mathcal{Z}_{i,1}` and :math:`\mathcal{Z}_{i,2}` 
+        within the samples model_sample_ids[i] of each model. 
+        The entry range2 of the high-fidelity model is None
+
+    functions : list of callables or callable
+        The functions used to evaluate each model or a function that 
+        evaluates samples augmented with a model id. See ModelEnsemble
+
+    max_eval_concurrency : integer
+        The number of chunks of jobs evaluated concurrently when functions 
+        is a list
+
+    Returns
+    -------
+    samples : list 
+        List containing the samples :math:`\mathcal{Z}_{i,1}` and 
+        :math:`\mathcal{Z}_{i,2}` for each model :math:`i=0,\ldots,M-1`.
+
+    values : list 
+        Model values at the points in samples
+    """
+    nmodels = len(model_sample_ids)
     if not callable(functions):
         assert len(functions)==nmodels
-    samples1 = [generate_samples(nhf_samples)]*nmodels
-    samples2 = [None]+[np.hstack(
-        [samples1[ii+1],generate_samples(int(nhf_samples*r-nhf_samples))])
-                       for ii,r in enumerate(nsample_ratios)]
-    if not callable(functions):
-        values2  = [None]+[f(s) for f,s in zip(functions[1:],samples2[1:])]
-        values1  = [functions[0](samples1[0])]
-        values1 += [values2[ii][:nhf_samples] for ii in range(1,nmodels)]
-    else:
-        nsamples2 = [0]
-        samples_with_id = np.vstack([samples1[0],np.zeros((1,nhf_samples))])
-        for ii in range(1,nmodels):
-            samples2_ii = np.vstack(
-                [samples2[ii],ii*np.ones((1,samples2[ii].shape[1]))])
-            nsamples2.append(samples2[ii].shape[1])
-            samples_with_id = np.hstack([
-                samples_with_id,samples2_ii])
+    nmodel_samples = [ids.shape[0] for ids in model_sample_ids]
+    offsets = np.concatenate([[0],np.cumsum(nmodel_samples)]).astype(int)
+    samples_with_id = np.empty((samples.shape[0]+1,offsets[-1]))
+    samples_with_id[:-1] = samples[:,np.concatenate(model_sample_ids)]
+    samples_with_id[-1] = np.repeat(np.arange(nmodels),nmodel_samples)
+
+    if callable(functions):
         values_flattened = functions(samples_with_id)
-        values1 = [values_flattened[:nhf_samples]]
-        values2 = [None]
-        cnt = nhf_samples
-        for ii in range(1,nmodels):
-            values1.append(values_flattened[cnt:cnt+nhf_samples])
-            values2.append(values_flattened[cnt:cnt+nsamples2[ii]])
-            cnt += nsamples2[ii]
-        
-    samples = [[s1,s2] for s1,s2 in zip(samples1,samples2)]
-    values  = [[v1,v2] for v1,v2 in zip(values1,values2)]
-    return samples,values
+    else:
+        jobs = []
+        for ii in range(nmodels):
+            chunksize = max(
+                int(np.ceil(nmodel_samples[ii]/max_eval_concurrency)),1)
+            jobs += [(ii,lb,min(lb+chunksize,offsets[ii+1])) for lb in range(
+                offsets[ii],offsets[ii+1],chunksize)]
+        def evaluate_job(job):
+            return functions[job[0]](samples_with_id[:-1,job[1]:job[2]])
+        if max_eval_concurrency>1:
+            from multiprocessing.pool import ThreadPool
+            with ThreadPool(max_eval_concurrency) as pool:
+                job_values = pool.map(evaluate_job,jobs)
+        else:
+            job_values = [evaluate_job(job) for job in jobs]
+        values_flattened = np.empty((offsets[-1],job_values[0].shape[1]))
+        for job,vals in zip(jobs,job_values):
+            values_flattened[job[1]:job[2]] = vals
+    assert values_flattened.shape[0]==offsets[-1]
+
+    samples_sets, values_sets = [], []
+    for ii in range(nmodels):
+        samples_sets.append([None,None])
+        values_sets.append([None,None])
+        for jj,bounds in enumerate(sample_set_ranges[ii]):
+            if bounds is None:
+                continue
+            lb,ub = offsets[ii]+bounds[0],offsets[ii]+bounds[1]
+            assert ub<=offsets[ii+1]
+            samples_sets[ii][jj] = samples_with_id[:-1,lb:ub]
+            values_sets[ii][jj] = values_flattened[lb:ub]
+    return samples_sets, values_sets
+
+def evaluate_nested_acv_sample_sets(samples,nsamples1,nsamples2,functions,
+                                    max_eval_concurrency=1):
+    r"""
+    Evaluate the models of an estimator whose sample sets are prefixes of 
+    one set of samples. See evaluate_acv_sample_sets.
+
+    Parameters
+    ----------
+    samples : np.ndarray (nvars,nsamples)
+        All the random samples drawn for one realization of the estimator
+
+    nsamples1 : iterable (nmodels)
+        The number of samples in the first sample set of each model
+
+    nsamples2 : iterable (nmodels-1)
+        The number of samples in the second sample set of each 
+        low-fidelity model
+    """
+    nmodel_samples = [nsamples1[0]]+[
+        max(n1,n2) for n1,n2 in zip(nsamples1[1:],nsamples2)]
+    model_sample_ids = [np.arange(n) for n in nmodel_samples]
+    sample_set_ranges = [[(0,nsamples1[0]),None]]+[
+        [(0,n1),(0,n2)] for n1,n2 in zip(nsamples1[1:],nsamples2)]
+    return evaluate_acv_sample_sets(
+        samples,model_sample_ids,sample_set_ranges,functions,
+        max_eval_concurrency)
+
+def generate_samples_and_values_acv_IS(nhf_samples,nsample_ratios,
+                                       functions,generate_samples,
+                                       max_eval_concurrency=1):
+    nmodels = len(nsample_ratios)+1
+    nhf_samples = int(nhf_samples)
+    nnew_samples = [int(nhf_samples*r-nhf_samples) for r in nsample_ratios]
+    bounds = np.cumsum([nhf_samples]+nnew_samples)
+    samples = generate_samples(bounds[-1])
+    # each low-fidelity model is evaluated at the high-fidelity samples 
+    # and a set of independent samples
+    model_sample_ids = [np.arange(nhf_samples)]+[np.concatenate(
+        [np.arange(nhf_samples),np.arange(bounds[ii],bounds[ii+1])])
+                                                 for ii in range(nmodels-1)]
+    sample_set_ranges = [[(0,nhf_samples),None]]+[
+        [(0,nhf_samples),(0,nhf_samples+nnew)] for nnew in nnew_samples]
+    return evaluate_acv_sample_sets(
+        samples,model_sample_ids,sample_set_ranges,functions,
+        max_eval_concurrency)
 
 def generate_samples_and_values_mlmc(nhf_samples,nsample_ratios,functions,
-                                     generate_samples):
+                                     generate_samples,max_eval_concurrency=1):
     r"""
     Parameters
     ==========
@@ -737,59 +897,40 @@ def generate_samples_and_values_mlmc(nhf_samples,nsample_ratios,functions,
     generate_samples : callable
         Function used to generate realizations of the random variables
 
+    max_eval_concurrency : integer
+        The number of chunks of model evaluations run concurrently when 
+        functions is a list. See evaluate_acv_sample_sets
+
     Returns
     =======
-    
+    samples : list 
+        List containing the samples :math:`\mathcal{Z}_{i,1}` and 
+        :math:`\mathcal{Z}_{i,2}` for each model :math:`i=0,\ldots,M-1`.
+
+    values : list 
+        Model values at the points in samples
     """
     nmodels = len(nsample_ratios)+1
-    if not callable:
-        assert nmodels==len(functions)
     assert np.all(nsample_ratios>=1)
-    samples1 = [generate_samples(nhf_samples)]
-    samples2 = [None]
-    prev_samples = samples1[0]
+    nhf_samples = int(nhf_samples)
+    # model ii is evaluated at the samples of level ii-1 and the new 
+    # samples of level ii
+    nlevel_samples = [nhf_samples]
     for ii in range(nmodels-1):
         total_samples = nsample_ratios[ii] * nhf_samples
         assert total_samples/int(total_samples)==1.0
-        total_samples = int(total_samples)
-        samples1.append(prev_samples)
-        nnew_samples = total_samples - prev_samples.shape[1]
-        samples2.append(generate_samples(nnew_samples))
-        prev_samples = samples2[-1]
-
-    if not callable(functions):
-        values1 = [functions[0](samples1[0])]
-        values2 = [None]
-        for ii in range(1,nmodels):
-            values1.append(functions[ii](samples1[ii]))
-            values2.append(functions[ii](samples2[ii]))
-    else:
-        samples_with_id = np.vstack([samples1[0],np.zeros((1,nhf_samples))])
-        nsamples1 = [nhf_samples]
-        nsamples2 = [0]
-        for ii in range(1,nmodels):
-            samples1_ii = np.vstack(
-                [samples1[ii],ii*np.ones((1,samples1[ii].shape[1]))])
-            samples2_ii = np.vstack(
-                [samples2[ii],ii*np.ones((1,samples2[ii].shape[1]))])
-            nsamples1.append(samples1[ii].shape[1])
-            nsamples2.append(samples2[ii].shape[1])
-            samples_with_id = np.hstack([
-                samples_with_id,samples1_ii,samples2_ii])
-        values_flattened = functions(samples_with_id)
-        values1 = [values_flattened[:nsamples1[0]]]
-        values2 = [None]
-        cnt = nsamples1[0]
-        for ii in range(1,nmodels):
-            values1.append(values_flattened[cnt:cnt+nsamples1[ii]])
-            cnt += nsamples1[ii]
-            values2.append(values_flattened[cnt:cnt+nsamples2[ii]])
-            cnt += nsamples2[ii]
-
-    samples = [[s1,s2] for s1,s2 in zip(samples1,samples2)]
-    values  = [[v1,v2] for v1,v2 in zip(values1,values2)]
-    
-    return samples, values
+        nlevel_samples.append(int(total_samples)-nlevel_samples[-1])
+    bounds = np.concatenate([[0],np.cumsum(nlevel_samples)])
+    samples = generate_samples(bounds[-1])
+    model_sample_ids = [np.arange(nhf_samples)]+[
+        np.arange(bounds[ii-1],bounds[ii+1]) for ii in range(1,nmodels)]
+    sample_set_ranges = [[(0,nhf_samples),None]]+[
+        [(0,nlevel_samples[ii-1]),
+         (nlevel_samples[ii-1],nlevel_samples[ii-1]+nlevel_samples[ii])]
+        for ii in range(1,nmodels)]
+    return evaluate_acv_sample_sets(
+        samples,model_sample_ids,sample_set_ranges,functions,
+        max_eval_concurrency)
 
 def get_mfmc_control_variate_weights(cov):
     weights = -cov[0,1:]/np.diag(cov[1:,1:])
@@ -814,7 +955,8 @@ def validate_nsample_ratios(nhf_samples,nsample_ratios):
     return nlf_samples
 
 def generate_samples_and_values_acv_KL(nhf_samples,nsample_ratios,functions,
-                                       generate_samples,K,L):
+                                       generate_samples,K,L,
+                                       max_eval_concurrency=1):
     r"""
 
     K : integer (K<=nmodels-1)
@@ -829,64 +971,24 @@ def generate_samples_and_values_acv_KL(nhf_samples,nsample_ratios,functions,
     nmodels = nsample_ratios.shape[0]+1
     assert L<=K+1 and L>=1 and K<nmodels
     K,L=K-1,L-1
+    nhf_samples = int(nhf_samples)
     
-    max_nsamples = nlf_samples.max()
+    max_nsamples = max(nlf_samples.max(),nhf_samples)
     samples = generate_samples(max_nsamples)
-    samples1 = [samples[:,:nhf_samples]]
-    samples2 = [None]
+    nsamples1 = [nhf_samples]
     nprev_samples1 = nhf_samples
-    nprev_samples_total = nhf_samples
     for ii in range(1,nmodels):
-        samples1.append(samples[:,:nprev_samples1])
-        samples2.append(samples[:,:nlf_samples[ii-1]])
+        nsamples1.append(nprev_samples1)
         if (ii<=K):
             nprev_samples1 = nhf_samples
         else:
             nprev_samples1 = nlf_samples[L]
-        nprev_samples_total= nlf_samples[ii-1]
-        
-    if not callable(functions):
-        values1 = [functions[0](samples1[0])]
-        values2 = [None]
-        for ii in range(1,nmodels):
-            values_ii = functions[ii](samples2[ii])
-            values1.append(values_ii[:samples1[ii].shape[1]])
-            values2.append(values_ii)
-    else:
-        # collect all samples assign an id and then evaluate in one batch
-        # this can be faster if functions is something like a pool model
-        samples_with_id = np.vstack([samples1[0],np.zeros((1,nhf_samples))])
-        for ii in range(1,nmodels):
-            samples_with_id = np.hstack([
-                samples_with_id,
-                np.vstack(
-                    [samples2[ii],ii*np.ones((1,samples2[ii].shape[1]))])])
-        assert samples_with_id.shape[1]==nhf_samples+np.sum(nlf_samples)
-            
-        values_flattened = functions(samples_with_id)
-        values1 = [values_flattened[:nhf_samples]]
-        values2 = [None]
-        nprev_samples1 = nhf_samples
-        nprev_samples_total = nhf_samples
-        cnt = nhf_samples
-        for ii in range(1,nmodels):
-            values1.append(values_flattened[cnt:cnt+nprev_samples1])
-            values2.append(values_flattened[cnt:cnt+nlf_samples[ii-1]])
-            cnt += nlf_samples[ii-1]
-            if (ii <= K):
-                nprev_samples1 = nhf_samples
-            else:
-                nprev_samples1 = nlf_samples[L]
-            nprev_samples_total = nlf_samples[ii-1]
-        assert cnt==values_flattened.shape[0]
-            
-    samples = [[s1,s2] for s1,s2 in zip(samples1,samples2)]
-    values  = [[v1,v2] for v1,v2 in zip(values1,values2)]
-
-    return samples,values
+    return evaluate_nested_acv_sample_sets(
+        samples,nsamples1,nlf_samples,functions,max_eval_concurrency)
 
 def generate_samples_and_values_mfmc(nhf_samples,nsample_ratios,functions,
-                                     generate_samples,acv_modification=False):
+                                     generate_samples,acv_modification=False,
+                                     max_eval_concurrency=1):
     r"""
     Parameters
     ==========
@@ -903,6 +1005,10 @@ def generate_samples_and_values_mfmc(nhf_samples,nsample_ratios,functions,
     generate_samples : callable
         Function used to generate realizations of the random variables
 
+    max_eval_concurrency : integer
+        The number of chunks of model evaluations run concurrently when 
+        functions is a list. See evaluate_acv_sample_sets
+
     Returns
     =======
     samples : list 
@@ -919,55 +1025,68 @@ def generate_samples_and_values_mfmc(nhf_samples,nsample_ratios,functions,
     nlf_samples = validate_nsample_ratios(nhf_samples,nsample_ratios)
     nmodels = nsample_ratios.shape[0]+1
 
-    max_nsamples = nlf_samples.max()
+    nhf_samples = int(nhf_samples)
+    max_nsamples = max(nlf_samples.max(),nhf_samples)
     samples = generate_samples(max_nsamples)
-    samples1 = [samples[:,:nhf_samples]]
-    samples2 = [None]
+    nsamples1 = [nhf_samples]
     nprev_samples = nhf_samples
     for ii in range(1,nmodels):
-        samples1.append(samples[:,:nprev_samples])
-        samples2.append(samples[:,:nlf_samples[ii-1]])
+        nsamples1.append(nprev_samples)
         if acv_modification:
             nprev_samples = nhf_samples
         else:
-            nprev_samples = samples2[ii].shape[1]
+            nprev_samples = nlf_samples[ii-1]
+    return evaluate_nested_acv_sample_sets(
+        samples,nsamples1,nlf_samples,functions,max_eval_concurrency)
 
-    if not callable(functions):
-        values1 = [functions[0](samples1[0])]
-        values2 = [None]
-        for ii in range(1,nmodels):
-            values_ii = functions[ii](samples2[ii])
-            values1.append(values_ii[:samples1[ii].shape[1]])
-            values2.append(values_ii)
-    else:
-        # collect all samples assign an id and then evaluate in one batch
-        # this can be faster if functions is something like a pool model
-        samples_with_id = np.vstack([samples1[0],np.zeros((1,nhf_samples))])
-        for ii in range(1,nmodels):
-            samples_with_id = np.hstack([
-                samples_with_id,
-                np.vstack(
-                    [samples2[ii],ii*np.ones((1,samples2[ii].shape[1]))])])
-        values_flattened = functions(samples_with_id)
-        values1 = [values_flattened[:nhf_samples]]
-        values2 = [None]
-        nprev_samples = nhf_samples
-        cnt = nhf_samples
-        for ii in range(1,nmodels):
-            values1.append(values_flattened[cnt:cnt+nprev_samples])
-            values2.append(values_flattened[cnt:cnt+nlf_samples[ii-1]])
-            cnt += nlf_samples[ii-1]
-            if acv_modification:
-                nprev_samples = nhf_samples
-            else:
-                nprev_samples = samples2[ii].shape[1]
-    assert cnt==values_flattened.shape[0]
-    assert cnt==nhf_samples + np.sum(nlf_samples)
-            
-    samples = [[s1,s2] for s1,s2 in zip(samples1,samples2)]
-    values  = [[v1,v2] for v1,v2 in zip(values1,values2)]
+def generate_samples_and_values_acv_recursion_index(
+        nhf_samples,nsample_ratios,functions,generate_samples,
+        recursion_index,max_eval_concurrency=1):
+    r"""
+    Generate the samples and values of the generalized multi-fidelity 
+    (ACV-GMF) estimator. See get_discrepancy_covariances_recursion_index.
+
+    Parameters
+    ==========
+    nhf_samples : integer
+        The number of samples of the high fidelity model
+
+    nsample_ratios : np.ndarray (nmodels-1)
+        The sample ratios r used to specify the number of samples of the 
+        lower fidelity models, e.g. N_i = r_i*nhf_samples, i=1,...,nmodels-1
+
+    functions : list of callables
+        The functions used to evaluate each model
+
+    generate_samples : callable
+        Function used to generate realizations of the random variables
+
+    recursion_index : iterable (nmodels-1)
+        The id of the model paired with each low-fidelity model
 
-    return samples,values
+    max_eval_concurrency : integer
+        The number of chunks of model evaluations run concurrently when 
+        functions is a list. See evaluate_acv_sample_sets
+
+    Returns
+    =======
+    samples : list 
+        List containing the samples :math:`\mathcal{Z}_{i,1}` and 
+        :math:`\mathcal{Z}_{i,2}` for each model :math:`i=0,\ldots,M-1`.
+
+    values : list 
+        Model values at the points in samples
+    """
+    nsample_ratios = np.asarray(nsample_ratios)
+    nlf_samples = validate_nsample_ratios(nhf_samples,nsample_ratios)
+    nmodels = nsample_ratios.shape[0]+1
+    assert len(recursion_index)==nmodels-1
+    nsamples = np.concatenate([[int(nhf_samples)],nlf_samples])
+
+    samples = generate_samples(nsamples.max())
+    return evaluate_nested_acv_sample_sets(
+        samples,nsamples[[0]+list(recursion_index)],nsamples[1:],functions,
+        max_eval_concurrency)
 
 def acv_sample_allocation_cost_constraint(ratios, nhf, costs, target_cost):
     cost = nhf*(costs[0] + np.dot(ratios, costs[1:]))
@@ -1208,7 +1327,25 @@ def get_rsquared_acv_KL_best(cov, nsample_ratios):
 
 def allocate_samples_acv_best_kl(cov,costs,target_cost,standardize=True,
                                  initial_guess=None,optim_options=None,
-                                 optim_method='SLSQP'):
+                                 optim_method='SLSQP',nstarts=3,
+                                 ncandidates=1000,max_eval_concurrency=1):
+    r"""
+    Determine the samples to be allocated to each model of the ACV-KL 
+    estimator with the values of K and L that minimize the estimator 
+    variance.
+
+    optim_options are the options of the scipy optimizer. 
+    If optim_method=='multistart' allocate_samples_acv_best_kl_multistart 
+    is used with the arguments nstarts, ncandidates and 
+    max_eval_concurrency, which are ignored otherwise.
+    """
+    if optim_method=='multistart':
+        return allocate_samples_acv_best_kl_multistart(
+            cov,costs,target_cost,standardize,initial_guess,
+            nstarts=nstarts,ncandidates=ncandidates,
+            optim_options=optim_options,
+            max_eval_concurrency=max_eval_concurrency)[:3]
+    
     nmodels = len(costs)
     sol, KL, opt_log10_var = None, None, np.inf
 
@@ -1227,116 +1364,978 @@ def allocate_samples_acv_best_kl(cov,costs,target_cost,standardize=True,
 
     return sol[0], sol[1], opt_log10_var
 
-class ModelEnsemble(object):
+def get_discrepancy_factors_MF_batch(nsample_ratios):
     r"""
-    Wrapper class to allow easy one-dimensional 
-    indexing of models in an ensemble.
-    """
-    def __init__(self,functions,names=None):
-        r"""
-        Parameters
-        ----------
-        functions : list of callable
-            A list of functions defining the model ensemble. The functions must
-            have the call signature values=function(samples)
-        """
-        self.functions=functions
-        self.nmodels = len(self.functions)
-        if names is None:
-            names = ['f%d'%ii for ii in range(self.nmodels)]
-        self.names=names
-    
-    def __call__(self,samples):
-        r"""
-        Evaluate a set of models at a set of samples
+    Get the factors :math:`F` used to compute the covariances of the 
+    discrepancies of the ACV-MF estimator for many sample ratios at once.
+    See get_discrepancy_covariances_MF.
 
-        Parameters
-        ----------
-        samples : np.ndarray (nvars+1,nsamples)
-            Realizations of a multivariate random variable each with an 
-            additional scalar model id indicating which model to evaluate.
+    Parameters
+    ----------
+    nsample_ratios : np.ndarray (ncandidates,nmodels-1)
+        Each row contains the sample ratios :math:`r_\alpha>1` for each 
+        low-fidelity model
 
-        Returns
-        -------
-        values : np.ndarray (nsamples,nqoi)
-            The values of the models at samples
-        """
-        model_ids = samples[-1,:]
-        #print(model_ids.max(),self.nmodels)
-        assert model_ids.max()<self.nmodels
-        active_model_ids = np.unique(model_ids).astype(int)
-        active_model_id=active_model_ids[0]
-        I = np.where(model_ids==active_model_id)[0]
-        values_0 = self.functions[active_model_id](samples[:-1,I])
-        assert values_0.ndim==2
-        nqoi = values_0.shape[1]
-        values = np.empty((samples.shape[1],nqoi))
-        values[I,:]=values_0
-        for ii in range(1,active_model_ids.shape[0]):
-            active_model_id=active_model_ids[ii]
-            I = np.where(model_ids==active_model_id)[0]
-            values[I] = self.functions[active_model_id](samples[:-1,I])
-        return values
+    Returns
+    -------
+    factors : np.ndarray (ncandidates,nmodels-1,nmodels-1)
+        The factors :math:`F` such that CF = cov[1:,1:]*F
+    """
+    min_ratios = np.minimum(
+        nsample_ratios[:,:,np.newaxis],nsample_ratios[:,np.newaxis,:])
+    return (min_ratios-1)/(min_ratios+1e-20)
 
-def estimate_model_ensemble_covariance(npilot_samples,generate_samples,
-                                       model_ensemble):
+def get_discrepancy_factors_IS_batch(nsample_ratios):
     r"""
-    Estimate the covariance of a model ensemble from a set of pilot samples
+    Get the factors :math:`F` used to compute the covariances of the 
+    discrepancies of the ACV-IS estimator for many sample ratios at once.
+    See get_discrepancy_covariances_IS.
 
     Parameters
     ----------
-    npilot_samples : integer
-        The number of samples used to estimate the covariance
+    nsample_ratios : np.ndarray (ncandidates,nmodels-1)
+        Each row contains the sample ratios :math:`r_\alpha>1` for each 
+        low-fidelity model
 
-    generate_samples : callable
-        Function used to generate realizations of the random variables with 
-        call signature samples = generate_samples(npilot_samples)
+    Returns
+    -------
+    factors : np.ndarray (ncandidates,nmodels-1,nmodels-1)
+        The factors :math:`F` such that CF = cov[1:,1:]*F
+    """
+    diag = (nsample_ratios-1)/nsample_ratios
+    factors = diag[:,:,np.newaxis]*diag[:,np.newaxis,:]
+    nratios = nsample_ratios.shape[1]
+    factors[:,np.arange(nratios),np.arange(nratios)] = diag
+    return factors
 
-    model_emsemble : callable
-        Function that takes a set of samples and models ids and evaluates
-        a set of models. See ModelEnsemble.
-        call signature values = model_emsemble(samples)
+def _get_nested_discrepancy_factors(rs1_rows,rs2_rows,rs1_cols,rs2_cols):
+    r"""
+    Compute a block of the factors :math:`F` of estimators whose sample 
+    sets are all nested subsets of one set of samples, given the sizes 
+    of the first and second sample set of each discrepancy relative to 
+    :math:`N_0`.
+    """
+    def inv_max(a,b):
+        # the intersection of two nested sets is the smaller set
+        return 1/np.maximum(a[:,:,np.newaxis],b[:,np.newaxis,:])
+    factors = (inv_max(rs1_rows,rs1_cols)-inv_max(rs1_rows,rs2_cols)-
+               inv_max(rs2_rows,rs1_cols)+inv_max(rs2_rows,rs2_cols))
+    # change the sign of discrepancies whose second set is smaller than the
+    # first so that cf=diag(F)*cov[1:,0]. This does not change r^2 but
+    # does change the sign of the control variate weights
+    row_signs = np.where(rs2_rows<rs1_rows,-1.,1.)
+    col_signs = np.where(rs2_cols<rs1_cols,-1.,1.)
+    return row_signs[:,:,np.newaxis]*factors*col_signs[:,np.newaxis,:]
+
+def get_discrepancy_factors_recursion_index_batch(nsample_ratios,
+                                                  recursion_index):
+    r"""
+    Get the factors :math:`F` used to compute the covariances of the 
+    discrepancies of the ACV-GMF estimator for many sample ratios at once.
+    See get_discrepancy_covariances_recursion_index.
+
+    Parameters
+    ----------
+    nsample_ratios : np.ndarray (ncandidates,nmodels-1)
+        Each row contains the sample ratios :math:`r_\alpha>1` for each 
+        low-fidelity model
+
+    recursion_index : iterable (nmodels-1)
+        The id of the model paired with each low-fidelity model
 
     Returns
     -------
-    cov : np.ndarray (nqoi,nqoi)
-        The covariance between the model qoi
-    
-    pilot_random_samples : np.ndarray (nvars,npilot_samples)
-        The random samples used to compute the covariance. These samples 
-        DO NOT have a model id
-
-    pilot_values : np.ndaray (npilot_samples,nmodels)
-        The values of each model at the pilot samples
+    factors : np.ndarray (ncandidates,nmodels-1,nmodels-1)
+        The factors :math:`F` such that CF = cov[1:,1:]*F
     """
-    # generate pilot samples
-    pilot_random_samples = generate_samples(npilot_samples)
-    config_vars = np.arange(model_ensemble.nmodels)[np.newaxis,:]
-    # append model ids to pilot smaples
-    pilot_samples = get_all_sample_combinations(
-        pilot_random_samples,config_vars)
-    # evaluate models at pilot samples
-    pilot_values = model_ensemble(pilot_samples)
-    pilot_values = np.reshape(
-        pilot_values,(npilot_samples,model_ensemble.nmodels))
-    # compute covariance
-    cov = np.cov(pilot_values,rowvar=False)
-    return cov, pilot_random_samples, pilot_values
+    ratios = np.hstack(
+        [np.ones((nsample_ratios.shape[0],1)),nsample_ratios])
+    rs1 = ratios[:,np.asarray(recursion_index)]
+    return _get_nested_discrepancy_factors(
+        rs1,nsample_ratios,rs1,nsample_ratios)
 
-class ACVMF(object):
-    def __init__(self,cov,costs):
-        self.cov=cov
-        self.costs=costs
-        if use_torch:
-            self.cov=torch.tensor(np.copy(self.cov), dtype=torch.double)
-            self.costs=torch.tensor(np.copy(self.costs), dtype=torch.double)
-        
-        #self.objective_fun = partial(
-        #    acv_sample_allocation_objective,self)
-        #self.jacobian_fun = partial(
-        #    acv_sample_allocation_jacobian,self)
-        self.objective_fun_all = partial(
-            acv_sample_allocation_objective_all,self)
+def get_discrepancy_factors_KL_batch(nsample_ratios,K,L,mf_factors=None):
+    r"""
+    Get the factors :math:`F` used to compute the covariances of the 
+    discrepancies of the ACV-KL estimator for many sample ratios at once.
+
+    The sample sets of the ACV-KL estimator are all nested subsets of one
+    set of samples. The first sample set of models 1,...,K contains the 
+    high-fidelity samples and the first sample set of models K+1,...,M-1 
+    contains the samples of model L. The factors are computed from the 
+    sizes of these nested sets which, unlike get_discrepancy_covariances_KL,
+    is also valid when the sample ratios of models K+1,...,M-1 are smaller 
+    than the ratio of model L. The ACV-KL estimator is the ACV-GMF 
+    estimator with recursion index [0,...,0,L,...,L] where the first K 
+    entries are zero.
+
+    Parameters
+    ----------
+    nsample_ratios : np.ndarray (ncandidates,nmodels-1)
+        Each row contains the sample ratios :math:`r_\alpha>1` for each 
+        low-fidelity model
+
+    K : integer (K<=nmodels-1)
+        The number of effective control variates.
+
+    L : integer (1<=L<=K+1)
+        The id of the models whose mean is being targeted by the 
+        remaining nmodels-K low fidelity models. 
+
+    mf_factors : np.ndarray (ncandidates,nmodels-1,nmodels-1)
+        The factors of the ACV-MF estimator computed with 
+        get_discrepancy_factors_MF_batch. The factors of the first K 
+        low-fidelity models are shared by all K and L and so can be 
+        computed once when considering many K and L.
+        If None they are computed here
+
+    Returns
+    -------
+    factors : np.ndarray (ncandidates,nmodels-1,nmodels-1)
+        The factors :math:`F` such that CF = cov[1:,1:]*F
+    """
+    nratios = nsample_ratios.shape[1]
+    assert L<=K+1 and L>=1 and K<=nratios
+    if mf_factors is None:
+        mf_factors = get_discrepancy_factors_MF_batch(nsample_ratios)
+    if K==nratios:
+        return mf_factors.copy()
+
+    ratios = np.hstack(
+        [np.ones((nsample_ratios.shape[0],1)),nsample_ratios])
+    # the model whose samples form the first set of each low-fidelity model
+    recursion_index = np.asarray([0]*K+[L]*(nratios-K))
+    rs1 = ratios[:,recursion_index]
+    factors = np.empty_like(mf_factors)
+    factors[:,:K,:K] = mf_factors[:,:K,:K]
+    factors[:,:,K:] = _get_nested_discrepancy_factors(
+        rs1,nsample_ratios,rs1[:,K:],nsample_ratios[:,K:])
+    factors[:,K:,:K] = np.transpose(factors[:,:K,K:],(0,2,1))
+    return factors
+
+def get_sample_ratio_constraints_KL(nmodels,K,L):
+    r"""
+    Get the ordering of the sample ratios assumed by 
+    get_discrepancy_covariances_KL. Within these constraints the factors 
+    computed by get_discrepancy_factors_KL_batch match 
+    get_discrepancy_covariances_KL.
+
+    Parameters
+    ----------
+    nmodels : integer
+        The number of models
+
+    K : integer (K<=nmodels-1)
+        The number of effective control variates.
+
+    L : integer (1<=L<=K)
+        The id of the models whose mean is being targeted by the 
+        remaining nmodels-K low fidelity models. 
+
+    Returns
+    -------
+    ratio_constraints : list of tuple (2)
+        Each pair (a,b) requires nsample_ratios[a]>=nsample_ratios[b].
+        The pairs are ordered so that one pass of 
+        apply_sample_ratio_constraints satisfies all constraints.
+    """
+    nratios = nmodels-1
+    assert L<=K and L>=1 and K<=nratios
+    # models 1,...,L-1 use no more samples than model L
+    ratio_constraints = [(L-1,ii) for ii in range(L-1)]
+    # models L+1,...,K use at least as many samples as model L
+    ratio_constraints += [(ii,L-1) for ii in range(L,K)]
+    # models K+1,...,M-1 use at least as many samples as models L,...,K
+    ratio_constraints += [
+        (jj,ii) for jj in range(K,nratios) for ii in range(L-1,K)]
+    return ratio_constraints
+
+def apply_sample_ratio_constraints(nsample_ratios,ratio_constraints):
+    r"""
+    Increase the sample ratios so that they satisfy the constraints 
+    nsample_ratios[:,a]>=nsample_ratios[:,b] for each pair (a,b) in 
+    ratio_constraints. The constraints are enforced in the order given.
+
+    Parameters
+    ----------
+    nsample_ratios : np.ndarray (ncandidates,nmodels-1)
+        Each row contains the sample ratios :math:`r_\alpha>1` for each 
+        low-fidelity model
+
+    Returns
+    -------
+    nsample_ratios : np.ndarray (ncandidates,nmodels-1)
+        The constrained sample ratios
+    """
+    nsample_ratios = nsample_ratios.copy()
+    for a, b in ratio_constraints:
+        nsample_ratios[:,a] = np.maximum(
+            nsample_ratios[:,a],nsample_ratios[:,b])
+    return nsample_ratios
+
+def get_rsquared_acv_batch(cov,factors):
+    r"""
+    Compute r^2 used to compute the variance reduction of 
+    Approximate Control Variate Algorithms for many sample ratios at once.
+    See get_rsquared_acv.
+
+    Parameters
+    ----------
+    cov : np.ndarray (nmodels,nmodels)
+        The covariance C between each of the models. The highest fidelity model
+        is the first model, i.e its variance is cov[0,0]
+
+    factors : np.ndarray (ncandidates,nmodels-1,nmodels-1)
+        The factors :math:`F` of the discrepancy covariances of each 
+        candidate set of sample ratios 
+
+    Returns
+    -------
+    rsquared : np.ndarray (ncandidates)
+        The values r^2. Zero is returned if the discrepancy covariance 
+        is singular.
+    """
+    CF = cov[1:,1:]*factors
+    cf = np.diagonal(factors,axis1=1,axis2=2)*cov[1:,0]
+    try:
+        sol = np.linalg.solve(CF,cf[:,:,np.newaxis])[:,:,0]
+    except np.linalg.LinAlgError:
+        sol = np.zeros_like(cf)
+        for ii in range(cf.shape[0]):
+            try:
+                sol[ii] = np.linalg.solve(CF[ii],cf[ii])
+            except np.linalg.LinAlgError:
+                pass
+    return np.sum(cf*sol,axis=1)/cov[0,0]
+
+def get_acv_log10_variance_batch(cov,costs,target_cost,nsample_ratios,
+                                 get_discrepancy_factors):
+    r"""
+    Compute the base 10 logarithm of the variance of an approximate control
+    variate estimator for many sample ratios at once. The number of 
+    high-fidelity samples is chosen so that the total cost equals the 
+    target cost.
+
+    Parameters
+    ----------
+    nsample_ratios : np.ndarray (ncandidates,nmodels-1)
+        Each row contains the sample ratios :math:`r_\alpha>1` for each 
+        low-fidelity model
+
+    get_discrepancy_factors : callable
+        Function with signature 
+
+        ``get_discrepancy_factors(nsample_ratios) -> np.ndarray (ncandidates,nmodels-1,nmodels-1)``
+
+        e.g. get_discrepancy_factors_MF_batch
+
+    Returns
+    -------
+    log10_variance : np.ndarray (ncandidates)
+        The base 10 logarithm of the variance of the estimator. Infinity is
+        returned for sample ratios that do not define a valid estimator
+    """
+    rsquared = get_rsquared_acv_batch(
+        cov,get_discrepancy_factors(nsample_ratios))
+    nhf_samples = target_cost/(costs[0]+nsample_ratios.dot(costs[1:]))
+    variance = cov[0,0]*(1-rsquared)/nhf_samples
+    log10_variance = np.full(variance.shape[0],np.inf)
+    # r^2 cannot exceed the r^2 of the control variate estimator with known
+    # low-fidelity means. Larger values are caused by ill-conditioned
+    # discrepancy covariances
+    rsquared_ocv = get_control_variate_rsquared(cov)
+    II = np.where(np.isfinite(variance)&(variance>0)&(
+        rsquared<=rsquared_ocv*(1+1e-8)))[0]
+    log10_variance[II] = np.log10(variance[II])
+    return log10_variance
+
+def get_acv_candidate_sample_ratios(costs,target_cost,ncandidates,
+                                    initial_guess=None,cov=None,
+                                    min_ratio=1.1):
+    r"""
+    Draw random sample ratios, uniformly in log space, for which the 
+    cost of one high-fidelity sample and the corresponding 
+    lower-fidelity samples does not exceed the target cost.
+
+    The ratios of the initial guess [nhf_samples,nsample_ratios] are 
+    added as the first candidate. If initial_guess is None the MFMC 
+    allocation is used if it exists.
+    """
+    costs = np.asarray(costs,dtype=float)
+    max_ratios = np.maximum(
+        (target_cost-costs[0])/costs[1:]/(costs.shape[0]-1),2*min_ratio)
+    candidates = np.exp(np.random.uniform(
+        np.log(min_ratio),np.log(max_ratios),
+        (ncandidates,costs.shape[0]-1)))
+    if initial_guess is None and cov is not None:
+        try:
+            initial_guess = get_initial_guess(
+                initial_guess,cov,costs,target_cost)
+        except Exception:
+            # MFMC requires models ordered by correlation with the
+            # high-fidelity model
+            pass
+    if initial_guess is not None:
+        candidates = np.vstack([np.asarray(initial_guess)[1:],candidates])
+    return candidates
+
+def minimize_acv_log10_variance(objective_batch,costs,target_cost,
+                                initial_guess,min_ratio=1.1,
+                                optim_options=None,ratio_constraints=None):
+    r"""
+    Minimize the variance of an approximate control variate estimator 
+    with respect to the sample ratios using SLSQP. The gradient is computed
+    with centered finite differences that are evaluated with one call
+    to objective_batch.
+
+    ratio_constraints is a list of pairs (a,b) that require 
+    nsample_ratios[a]>=nsample_ratios[b], e.g. computed with 
+    get_sample_ratio_constraints_KL.
+
+    Returns
+    -------
+    nsample_ratios : np.ndarray (nmodels-1)
+        The optimal sample ratios
+
+    log10_variance : float
+        The base 10 logarithm of the variance of the estimator
+    """
+    costs = np.asarray(costs,dtype=float)
+    nratios = costs.shape[0]-1
+    def objective(ratios):
+        steps = 1e-7*np.maximum(np.absolute(ratios),1)
+        perturbations = np.vstack(
+            [np.zeros((1,nratios)),np.diag(steps),-np.diag(steps)])
+        vals = objective_batch(ratios+perturbations)
+        with np.errstate(invalid='ignore'):
+            grad = (vals[1:nratios+1]-vals[nratios+1:])/(2*steps)
+        # ignore directions that lead to invalid estimators
+        grad[~np.isfinite(grad)] = 0
+        return vals[0], grad
+
+    if optim_options is None:
+        optim_options = {'ftol':1e-10,'maxiter':1000}
+    # ensure at least one high-fidelity sample is used
+    cons = [{'type':'ineq',
+             'fun':lambda r: target_cost-costs[0]-costs[1:].dot(r),
+             'jac':lambda r: -costs[1:]}]
+    if ratio_constraints is not None and len(ratio_constraints)>0:
+        G = np.zeros((len(ratio_constraints),nratios))
+        for ii, (a, b) in enumerate(ratio_constraints):
+            G[ii,a], G[ii,b] = 1, -1
+        cons.append({'type':'ineq','fun':lambda r: G.dot(r),
+                     'jac':lambda r: G})
+    bounds = [(min_ratio,np.inf)]*nratios
+    initial_guess = np.maximum(initial_guess,min_ratio)
+    opt = minimize(objective,initial_guess,method='SLSQP',jac=True,
+                   bounds=bounds,constraints=cons,options=optim_options)
+    return opt.x, opt.fun
+
+def allocate_samples_acv_multistart(
+        cov,costs,target_cost,get_discrepancy_factors,standardize=True,
+        initial_guess=None,nstarts=5,ncandidates=1000,optim_options=None,
+        max_eval_concurrency=1,ratio_constraints=None):
+    r"""
+    Determine the samples to be allocated to each model of an approximate 
+    control variate estimator using multiple local optimizations.
+
+    The variance of the estimator is first evaluated at many random 
+    sample ratios in one vectorized computation. The best nstarts candidates
+    are then used as initial guesses for local optimizations which can 
+    be run in parallel.
+
+    Parameters
+    ----------
+    cov : np.ndarray (nmodels,nmodels)
+        The covariance C between each of the models. The highest 
+        fidelity model is the first model, i.e its variance is cov[0,0]
+
+    costs : np.ndarray (nmodels)
+        The relative costs of evaluating each model
+
+    target_cost : float
+        The total cost budget
+
+    get_discrepancy_factors : callable
+        Function with signature 
+
+        ``get_discrepancy_factors(nsample_ratios) -> np.ndarray (ncandidates,nmodels-1,nmodels-1)``
+
+        e.g. get_discrepancy_factors_MF_batch
+
+    initial_guess : np.ndarray (nmodels)
+        An initial guess [nhf_samples,nsample_ratios] added to 
+        the candidates. If None the MFMC allocation is used if it exists.
+
+    nstarts : integer
+        The number of local optimizations
+
+    ncandidates : integer
+        The number of random candidates used to choose the initial guesses
+        of the local optimizations
+
+    max_eval_concurrency : integer
+        The number of threads used to run the local optimizations
+
+    ratio_constraints : list of tuple (2)
+        Pairs (a,b) that require nsample_ratios[a]>=nsample_ratios[b].
+        The candidates are increased to satisfy the constraints, see 
+        apply_sample_ratio_constraints, and the constraints are enforced
+        by the local optimizations. If None the ratios are unconstrained
+
+    Returns
+    -------
+    nhf_samples : integer 
+        The number of samples of the high fidelity model
+
+    nsample_ratios : np.ndarray (nmodels-1)
+        The sample ratios r used to specify the number of samples of the 
+        lower fidelity models, e.g. N_i=r_i*nhf_samples,i=1,...,nmodels-1
+
+    log10_variance : float
+        The base 10 logarithm of the variance of the estimator
+    """
+    costs = np.asarray(costs,dtype=float)
+    objective_batch = partial(
+        get_acv_log10_variance_batch,cov,costs,target_cost,
+        get_discrepancy_factors=get_discrepancy_factors)
+    candidates = get_acv_candidate_sample_ratios(
+        costs,target_cost,ncandidates,initial_guess,cov)
+    if ratio_constraints is not None:
+        candidates = apply_sample_ratio_constraints(
+            candidates,ratio_constraints)
+    candidate_vals = objective_batch(candidates)
+    initial_guesses = candidates[np.argsort(candidate_vals)[:nstarts]]
+    
+    func = partial(
+        minimize_acv_log10_variance,objective_batch,costs,target_cost,
+        optim_options=optim_options,ratio_constraints=ratio_constraints)
+    if max_eval_concurrency>1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(max_eval_concurrency)
+        results = pool.map(func,initial_guesses)
+        pool.close()
+    else:
+        results = [func(x0) for x0 in initial_guesses]
+    nsample_ratios = results[np.argmin([r[1] for r in results])][0]
+    
+    nhf_samples = target_cost/(costs[0]+costs[1:].dot(nsample_ratios))
+    if standardize:
+        nhf_samples, nsample_ratios = standardize_sample_ratios(
+            nhf_samples, nsample_ratios)
+    # the variance at the standardized nhf_samples which may not use
+    # all the target cost
+    log10_var = get_acv_log10_variance_batch(
+        cov,costs,nhf_samples*(costs[0]+costs[1:].dot(nsample_ratios)),
+        nsample_ratios[np.newaxis,:],get_discrepancy_factors)[0]
+    return nhf_samples, nsample_ratios, log10_var
+
+def allocate_samples_acv_best_kl_multistart(
+        cov,costs,target_cost,standardize=True,initial_guess=None,
+        nstarts=3,ncandidates=1000,optim_options=None,
+        max_eval_concurrency=1):
+    r"""
+    Determine the samples to be allocated to each model of the ACV-KL 
+    estimator with the values of K and L that minimize the estimator 
+    variance. See allocate_samples_acv_multistart.
+
+    The same random candidates are used to choose the initial guesses for
+    all K and L. The candidates and the local optimizations are 
+    constrained to the ordering of the sample ratios assumed by 
+    get_discrepancy_covariances_KL, see get_sample_ratio_constraints_KL, 
+    so that the variance reported is the variance of the ACVMFKL 
+    estimator.
+
+    Returns
+    -------
+    nhf_samples : integer 
+        The number of samples of the high fidelity model
+
+    nsample_ratios : np.ndarray (nmodels-1)
+        The sample ratios r used to specify the number of samples of the 
+        lower fidelity models, e.g. N_i=r_i*nhf_samples,i=1,...,nmodels-1
+
+    log10_variance : float
+        The base 10 logarithm of the variance of the estimator
+
+    KL : tuple (2)
+        The optimal values of K and L
+    """
+    nmodels = len(costs)
+    costs = np.asarray(costs,dtype=float)
+    candidates = get_acv_candidate_sample_ratios(
+        costs,target_cost,ncandidates,initial_guess,cov)
+
+    sol, KL, opt_log10_var = None, None, np.inf
+    for K in range(1,nmodels):
+        for L in range(1, K+1):
+            get_discrepancy_factors = partial(
+                get_discrepancy_factors_KL_batch,K=K,L=L)
+            ratio_constraints = get_sample_ratio_constraints_KL(
+                nmodels,K,L)
+            candidates_KL = apply_sample_ratio_constraints(
+                candidates,ratio_constraints)
+            candidate_vals = get_acv_log10_variance_batch(
+                cov,costs,target_cost,candidates_KL,
+                get_discrepancy_factors)
+            # the number of high-fidelity samples of the initial guess
+            # is not used
+            initial_guess_KL = np.concatenate(
+                [[1],candidates_KL[np.argmin(candidate_vals)]])
+            nhf_samples, nsample_ratios, log10_var = \
+                allocate_samples_acv_multistart(
+                    cov,costs,target_cost,get_discrepancy_factors,
+                    standardize,initial_guess_KL,nstarts,
+                    max(ncandidates//10,nstarts),optim_options,
+                    max_eval_concurrency,ratio_constraints)
+            if log10_var < opt_log10_var:
+                opt_log10_var = log10_var
+                sol = (nhf_samples, nsample_ratios)
+                KL  = (K, L)
+
+    return sol[0], sol[1], opt_log10_var, KL
+
+def get_acv_recursion_indices(nmodels):
+    r"""
+    Enumerate the recursion indices of the ACV-GMF estimator in which
+    each low-fidelity model is paired with a model with a smaller id. 
+    There are (nmodels-1)! such indices.
+    """
+    import itertools
+    for index in itertools.product(*[range(ii) for ii in range(1,nmodels)]):
+        yield np.asarray(index)
+
+def get_acv_recursion_index_neighbors(recursion_index):
+    r"""
+    Return the recursion indices that differ from recursion_index in
+    the model paired with one low-fidelity model.
+    """
+    neighbors = []
+    for ii in range(len(recursion_index)):
+        for jj in range(ii+1):
+            if jj!=recursion_index[ii]:
+                neighbor = recursion_index.copy()
+                neighbor[ii] = jj
+                neighbors.append(neighbor)
+    return neighbors
+
+def screen_acv_recursion_indices(cov,costs,target_cost,recursion_indices,
+                                 candidates):
+    r"""
+    Compute the smallest variance of the ACV-GMF estimators defined by 
+    each recursion index over a set of candidate sample ratios. 
+    These values are upper bounds of the optimal variances.
+
+    Returns
+    -------
+    log10_variances : np.ndarray (nindices)
+        The base 10 logarithm of the smallest variance of each estimator
+    """
+    log10_variances = np.empty(len(recursion_indices))
+    for ii,index in enumerate(recursion_indices):
+        log10_variances[ii] = get_acv_log10_variance_batch(
+            cov,costs,target_cost,candidates,
+            partial(get_discrepancy_factors_recursion_index_batch,
+                    recursion_index=index)).min()
+    return log10_variances
+
+def search_acv_recursion_index(cov,costs,target_cost,standardize=True,
+                               max_nindices=1000,noptimize=5,
+                               ncandidates=1000,nstarts=3,nseeds=3,
+                               max_eval_concurrency=1,verbose=0):
+    r"""
+    Find the recursion index of the generalized multi-fidelity (ACV-GMF) 
+    estimator, i.e. which model each low-fidelity model is paired with, 
+    and the sample allocation that minimizes the estimator variance for a 
+    target cost.
+
+    The variance of each recursion index is bounded above by the smallest
+    variance over a common set of random candidate sample ratios, which
+    can be computed cheaply. Only the noptimize indices with the smallest
+    bounds, and the nseeds ACV-KL and MFMC estimators with the smallest 
+    bounds, are optimized with allocate_samples_acv_multistart.
+    
+    If there are no more than max_nindices recursion indices all indices 
+    are screened. Otherwise a local search is used that starts from the
+    nseeds ACV-KL and MFMC estimators with the smallest bounds and changes 
+    the model paired with one low-fidelity model at a time until the bound 
+    cannot be reduced.
+
+    Parameters
+    ----------
+    cov : np.ndarray (nmodels,nmodels)
+        The covariance C between each of the models. The highest 
+        fidelity model is the first model, i.e its variance is cov[0,0]
+
+    costs : np.ndarray (nmodels)
+        The relative costs of evaluating each model
+
+    target_cost : float
+        The total cost budget
+
+    max_nindices : integer
+        The maximum number of recursion indices that are enumerated
+
+    noptimize : integer
+        The number of recursion indices whose allocation is optimized
+
+    ncandidates : integer
+        The number of random sample ratios used to screen each index
+
+    nstarts : integer
+        The number of local optimizations used for each index
+
+    nseeds : integer
+        The number of ACV-KL and MFMC estimators that are optimized and used
+        to start the local search
+
+    max_eval_concurrency : integer
+        The number of threads used to optimize the recursion indices 
+        in parallel
+
+    Returns
+    -------
+    nhf_samples : integer 
+        The number of samples of the high fidelity model
+
+    nsample_ratios : np.ndarray (nmodels-1)
+        The sample ratios r used to specify the number of samples of the 
+        lower fidelity models, e.g. N_i=r_i*nhf_samples,i=1,...,nmodels-1
+
+    log10_variance : float
+        The base 10 logarithm of the variance of the estimator
+
+    recursion_index : np.ndarray (nmodels-1)
+        The optimal recursion index
+    """
+    nmodels = len(costs)
+    costs = np.asarray(costs,dtype=float)
+    candidates = get_acv_candidate_sample_ratios(
+        costs,target_cost,ncandidates,None,cov)
+
+    visited = {}
+    def screen(indices):
+        indices = [index for index in indices if tuple(index) not in visited]
+        bounds = screen_acv_recursion_indices(
+            cov,costs,target_cost,indices,candidates)
+        for index,bound in zip(indices,bounds):
+            visited[tuple(index)] = bound
+
+    # the ACV-KL (which includes ACV-MF) and MFMC estimators
+    seeds = [tuple([0]*K+[L]*(nmodels-1-K))
+             for K in range(1,nmodels) for L in range(1,K+1)]
+    seeds = [np.asarray(index) for index in dict.fromkeys(seeds)]
+    seeds.append(np.arange(nmodels-1))
+    screen(seeds)
+    seed_bounds = np.asarray([visited[tuple(index)] for index in seeds])
+    best_seeds = [seeds[ii] for ii in np.argsort(seed_bounds)[:nseeds]]
+
+    nindices = np.prod(np.arange(1,nmodels))
+    if nindices<=max_nindices:
+        screen(list(get_acv_recursion_indices(nmodels)))
+    else:
+        for index in best_seeds:
+            bound = visited[tuple(index)]
+            while True:
+                neighbors = get_acv_recursion_index_neighbors(index)
+                screen(neighbors)
+                neighbor_bounds = [visited[tuple(n)] for n in neighbors]
+                best = np.argmin(neighbor_bounds)
+                if neighbor_bounds[best]>=bound:
+                    break
+                index, bound = neighbors[best], neighbor_bounds[best]
+    recursion_indices = [np.asarray(index) for index in visited]
+    bounds = np.asarray([visited[index] for index in visited])
+    if verbose>0:
+        print('Screened',len(recursion_indices),'recursion indices')
+
+    # always optimize the best seeds because the bounds computed with random
+    # candidates can be loose
+    best_indices = dict.fromkeys(
+        [tuple(recursion_indices[ii])
+         for ii in np.argsort(bounds)[:noptimize]]+
+        [tuple(index) for index in best_seeds])
+    best_indices = [np.asarray(index) for index in best_indices]
+    def optimize(index):
+        return allocate_samples_acv_multistart(
+            cov,costs,target_cost,
+            partial(get_discrepancy_factors_recursion_index_batch,
+                    recursion_index=index),standardize,
+            nstarts=nstarts,ncandidates=ncandidates)
+    if max_eval_concurrency>1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(max_eval_concurrency)
+        results = pool.map(optimize,best_indices)
+        pool.close()
+    else:
+        results = [optimize(index) for index in best_indices]
+    best = np.argmin([r[2] for r in results])
+    nhf_samples, nsample_ratios, log10_var = results[best]
+    return nhf_samples, nsample_ratios, log10_var, best_indices[best]
+
+class ModelEnsemble(object):
+    r"""
+    Wrapper class to allow easy one-dimensional 
+    indexing of models in an ensemble.
+    """
+    def __init__(self,functions,names=None):
+        r"""
+        Parameters
+        ----------
+        functions : list of callable
+            A list of functions defining the model ensemble. The functions must
+            have the call signature values=function(samples)
+        """
+        self.functions=functions
+        self.nmodels = len(self.functions)
+        if names is None:
+            names = ['f%d'%ii for ii in range(self.nmodels)]
+        self.names=names
+    
+    def __call__(self,samples):
+        r"""
+        Evaluate a set of models at a set of samples
+
+        Parameters
+        ----------
+        samples : np.ndarray (nvars+1,nsamples)
+            Realizations of a multivariate random variable each with an 
+            additional scalar model id indicating which model to evaluate.
+
+        Returns
+        -------
+        values : np.ndarray (nsamples,nqoi)
+            The values of the models at samples
+        """
+        model_ids = samples[-1,:]
+        #print(model_ids.max(),self.nmodels)
+        assert model_ids.max()<self.nmodels
+        active_model_ids = np.unique(model_ids).astype(int)
+        active_model_id=active_model_ids[0]
+        I = np.where(model_ids==active_model_id)[0]
+        values_0 = self.functions[active_model_id](samples[:-1,I])
+        assert values_0.ndim==2
+        nqoi = values_0.shape[1]
+        values = np.empty((samples.shape[1],nqoi))
+        values[I,:]=values_0
+        for ii in range(1,active_model_ids.shape[0]):
+            active_model_id=active_model_ids[ii]
+            I = np.where(model_ids==active_model_id)[0]
+            values[I] = self.functions[active_model_id](samples[:-1,I])
+        return values
+
+def estimate_model_ensemble_covariance(npilot_samples,generate_samples,
+                                       model_ensemble):
+    r"""
+    Estimate the covariance of a model ensemble from a set of pilot samples
+
+    Parameters
+    ----------
+    npilot_samples : integer
+        The number of samples used to estimate the covariance
+
+    generate_samples : callable
+        Function used to generate realizations of the random variables with 
+        call signature samples = generate_samples(npilot_samples)
+
+    model_emsemble : callable
+        Function that takes a set of samples and models ids and evaluates
+        a set of models. See ModelEnsemble.
+        call signature values = model_emsemble(samples)
+
+    Returns
+    -------
+    cov : np.ndarray (nqoi,nqoi)
+        The covariance between the model qoi
+    
+    pilot_random_samples : np.ndarray (nvars,npilot_samples)
+        The random samples used to compute the covariance. These samples 
+        DO NOT have a model id
+
+    pilot_values : np.ndaray (npilot_samples,nmodels)
+        The values of each model at the pilot samples
+    """
+    # generate pilot samples
+    pilot_random_samples = generate_samples(npilot_samples)
+    config_vars = np.arange(model_ensemble.nmodels)[np.newaxis,:]
+    # append model ids to pilot smaples
+    pilot_samples = get_all_sample_combinations(
+        pilot_random_samples,config_vars)
+    # evaluate models at pilot samples
+    pilot_values = model_ensemble(pilot_samples)
+    pilot_values = np.reshape(
+        pilot_values,(npilot_samples,model_ensemble.nmodels))
+    # compute covariance
+    cov = np.cov(pilot_values,rowvar=False)
+    return cov, pilot_random_samples, pilot_values
+
+def estimate_model_ensemble_covariance_sequential(
+        npilot_samples_batch,generate_samples,model_ensemble,
+        allocate_samples,costs,target_cost,max_npilot_samples,rtol=5e-2,
+        nbootstraps=20,verbose=0):
+    r"""
+    Estimate the covariance of a model ensemble from pilot samples 
+    added in batches until the optimal allocation of samples to each model
+    computed with the covariance stabilizes.
+
+    After each batch the uncertainty in the covariance and the allocation 
+    is estimated by bootstrapping the pilot values. The study terminates when 
+    the maximum coefficient of variation of the bootstrapped number of 
+    samples of each model is smaller than rtol. If nbootstraps is zero the 
+    study terminates when the maximum relative change in the number of 
+    samples of each model between two consecutive batches is smaller 
+    than rtol.
+
+    Parameters
+    ----------
+    npilot_samples_batch : integer
+        The number of pilot samples added at each iteration
+
+    generate_samples : callable
+        Function used to generate realizations of the random variables with 
+        call signature samples = generate_samples(npilot_samples)
+
+    model_emsemble : callable
+        Function that takes a set of samples and models ids and evaluates
+        a set of models. See ModelEnsemble.
+        call signature values = model_emsemble(samples)
+
+    allocate_samples : callable
+        Function used to allocate the samples of each model with signature
+
+        ``allocate_samples(cov, costs, target_cost) -> (nhf_samples, nsample_ratios, log10_variance)``
+
+        e.g. allocate_samples_mfmc
+
+    costs : np.ndarray (nmodels)
+        The relative costs of evaluating each model
+
+    target_cost : float
+        The total cost budget used to allocate samples
+
+    max_npilot_samples : integer
+        The maximum number of pilot samples
+
+    rtol : float
+        The tolerance used to terminate the study
+
+    nbootstraps : integer
+        The number of bootstraps used to estimate the uncertainty in the 
+        covariance and allocation
+
+    verbose : integer
+        The verbosity level
+
+    Returns
+    -------
+    cov : np.ndarray (nmodels,nmodels)
+        The covariance between the models
+
+    pilot_random_samples : np.ndarray (nvars,npilot_samples)
+        The random samples used to compute the covariance. These samples 
+        DO NOT have a model id
+
+    pilot_values : np.ndaray (npilot_samples,nmodels)
+        The values of each model at the pilot samples
+
+    history : dict
+        The allocation computed after each batch with the keys
+
+        npilot_samples : np.ndarray (niters)
+            The number of pilot samples
+
+        nsamples : np.ndarray (niters,nmodels)
+            The number of samples allocated to each model
+
+        log10_variance : np.ndarray (niters)
+            The base 10 logarithm of the variance of the estimator 
+
+        nsamples_std : np.ndarray (niters,nmodels)
+            The bootstrap standard deviation of the number of samples 
+            allocated to each model. Only returned if nbootstraps>0
+
+        cov_std : np.ndarray (niters,nmodels,nmodels)
+            The bootstrap standard deviation of the covariance. 
+            Only returned if nbootstraps>0
+    """
+    nmodels = model_ensemble.nmodels
+    config_vars = np.arange(nmodels)[np.newaxis,:]
+    pilot_random_samples = None
+    pilot_values = np.empty((0,nmodels))
+    history = {'npilot_samples':[],'nsamples':[],'log10_variance':[]}
+    if nbootstraps>0:
+        history['nsamples_std'] = []
+        history['cov_std'] = []
+
+    def get_nsamples(cov):
+        nhf_samples,nsample_ratios,log10_var = allocate_samples(
+            cov,costs,target_cost)
+        return np.concatenate(
+            [[nhf_samples],nsample_ratios*nhf_samples]), log10_var
+
+    converged = False
+    while not converged:
+        npilot_samples = pilot_values.shape[0]
+        nnew_samples = min(
+            npilot_samples_batch,max_npilot_samples-npilot_samples)
+        new_samples = generate_samples(nnew_samples)
+        new_values = model_ensemble(
+            get_all_sample_combinations(new_samples,config_vars))
+        new_values = np.reshape(new_values,(nnew_samples,nmodels))
+        if pilot_random_samples is None:
+            pilot_random_samples = new_samples
+        else:
+            pilot_random_samples = np.hstack(
+                [pilot_random_samples,new_samples])
+        pilot_values = np.vstack([pilot_values,new_values])
+        npilot_samples = pilot_values.shape[0]
+
+        cov = np.cov(pilot_values,rowvar=False)
+        nsamples,log10_var = get_nsamples(cov)
+        history['npilot_samples'].append(npilot_samples)
+        history['nsamples'].append(nsamples)
+        history['log10_variance'].append(log10_var)
+
+        if nbootstraps>0:
+            bootstrap_covs, bootstrap_nsamples = [],[]
+            for jj in range(nbootstraps):
+                II = np.random.choice(
+                    np.arange(npilot_samples),size=npilot_samples,
+                    replace=True)
+                bootstrap_covs.append(np.cov(pilot_values[II],rowvar=False))
+                bootstrap_nsamples.append(get_nsamples(bootstrap_covs[-1])[0])
+            nsamples_std = np.std(bootstrap_nsamples,axis=0)
+            history['nsamples_std'].append(nsamples_std)
+            history['cov_std'].append(np.std(bootstrap_covs,axis=0))
+            error = np.max(nsamples_std/np.mean(bootstrap_nsamples,axis=0))
+        elif len(history['nsamples'])>1:
+            error = np.max(np.absolute(
+                nsamples-history['nsamples'][-2])/history['nsamples'][-2])
+        else:
+            error = np.inf
+
+        if verbose>0:
+            print('Pilot samples',npilot_samples,'error',error)
+        converged = error<rtol or npilot_samples>=max_npilot_samples
+
+    for key in history:
+        history[key] = np.asarray(history[key])
+    return cov, pilot_random_samples, pilot_values, history
+
+class ACVMF(object):
+    def __init__(self,cov,costs):
+        self.cov=cov
+        self.costs=costs
+        if use_torch:
+            self.cov=torch.tensor(np.copy(self.cov), dtype=torch.double)
+            self.costs=torch.tensor(np.copy(self.costs), dtype=torch.double)
+        
+        #self.objective_fun = partial(
+        #    acv_sample_allocation_objective,self)
+        #self.jacobian_fun = partial(
+        #    acv_sample_allocation_jacobian,self)
+        self.objective_fun_all = partial(
+            acv_sample_allocation_objective_all,self)
         if use_torch:
             self.jacobian_fun_all = partial(
                 acv_sample_allocation_jacobian_all_torch,self)
@@ -1455,6 +2454,48 @@ class ACVMFKLBest(ACVMF):
             optim_method='SLSQP')
 
 
+class ACVGMF(ACVMF):
+    def __init__(self,cov,costs,recursion_index):
+        self.recursion_index = np.asarray(recursion_index)
+        super().__init__(cov, costs)
+
+    def get_rsquared(self,nsample_ratios):
+        if use_torch:
+            pkg=torch
+        else:
+            pkg=np
+        rsquared = get_rsquared_acv(
+            self.cov,nsample_ratios,
+            partial(get_discrepancy_covariances_recursion_index,
+                    recursion_index=self.recursion_index,pkg=pkg))
+        try:
+            return rsquared.numpy()
+        except:
+            return rsquared
+
+    def allocate_samples(self,target_cost,**kwargs):
+        return allocate_samples_acv_multistart(
+            self.get_covariance(),np.asarray(self.costs),target_cost,
+            partial(get_discrepancy_factors_recursion_index_batch,
+                    recursion_index=self.recursion_index),**kwargs)
+
+    def generate_data(self,nhf_samples,nsample_ratios,generate_samples,
+                      model_ensemble):
+        return generate_samples_and_values_acv_recursion_index(
+            nhf_samples,nsample_ratios,model_ensemble,
+            generate_samples,self.recursion_index)
+
+    def __call__(self,values):
+        eta = get_approximate_control_variate_weights(
+            self.get_covariance(),self.get_nsample_ratios(values),
+            partial(get_discrepancy_covariances_recursion_index,
+                    recursion_index=self.recursion_index))
+        return compute_approximate_control_variate_mean_estimate(eta,values)
+
+    def get_nsample_ratios(self,values):
+        nhf_samples = values[0][0].shape[0]
+        return np.asarray([v[1].shape[0]/nhf_samples for v in values[1:]])
+
 class MFMC(ACVMF):
     def __init__(self,cov,costs):
         super().__init__(cov, costs)
@@ -1498,6 +2539,584 @@ class MLMC(ACVMF):
     def allocate_samples(self,target_cost):
         return allocate_samples_mlmc(self.cov, self.costs, target_cost)
 
+class StreamingACVEstimator(object):
+    r"""
+    Compute approximate control variate estimates of the mean of a 
+    high-fidelity model from evaluations of the models that arrive in
+    batches.
+
+    The samples of all models are nested subsets of one sequence of random 
+    samples, as in generate_samples_and_values_mfmc. Model :math:`i` is 
+    evaluated at the first :math:`N_i` samples of the sequence. Consequently,
+    the number of samples can be increased, e.g. by increasing the target 
+    cost, and only the models at the samples not already evaluated must be
+    evaluated. 
+
+    The running covariance between the models is computed from the samples
+    at which all models have been evaluated.
+    """
+    def __init__(self,estimator,generate_samples,update_covariance=False):
+        r"""
+        Parameters
+        ----------
+        estimator : ACVMF or MFMC
+            The estimator used to allocate samples and whose covariance is 
+            used to compute the control variate weights. Only ACVMF and MFMC 
+            estimators use the nested samples of the sequence. ACVMF 
+            estimates the mean of the low fidelity model :math:`i` using the 
+            first :math:`N_0` and :math:`N_i` samples and MFMC using the 
+            first :math:`N_{i-1}` and :math:`N_i` samples.
+
+        generate_samples : callable
+            Function used to generate realizations of the random variables 
+            with call signature samples = generate_samples(nsamples)
+
+        update_covariance : boolean
+            True - compute the control variate weights from the running 
+            covariance of the models
+            False - compute the control variate weights from the covariance 
+            of the estimator
+        """
+        if type(estimator) not in (ACVMF,MFMC):
+            msg = 'estimator must be an instance of ACVMF or MFMC. '
+            msg += f'{type(estimator).__name__} is not supported'
+            raise Exception(msg)
+        self.estimator=estimator
+        self.generate_samples=generate_samples
+        self.acv_modification=type(estimator)==ACVMF
+        self.update_covariance=update_covariance
+        self.nmodels = self.estimator.get_covariance().shape[0]
+
+        self.samples = None
+        # the number of samples of the sequence drawn so far
+        self.nsamples_drawn = 0
+        self.values = [None for ii in range(self.nmodels)]
+        self.nsamples_evaluated = np.zeros(self.nmodels,dtype=int)
+        self.nsamples = np.zeros(self.nmodels,dtype=int)
+
+        # running statistics of the samples evaluated by all models
+        self.nshared_samples = 0
+        self.shared_mean = None
+        self.shared_cov_sum = None
+
+    def _extend_buffer(self,buffer,nrows):
+        """
+        Return a buffer with at least nrows rows containing the entries of
+        buffer. Capacity is doubled so the number of reallocations grows
+        logarithmically with the number of samples.
+        """
+        if buffer.shape[0] >= nrows:
+            return buffer
+        new_buffer = np.empty(
+            (max(nrows, 2*buffer.shape[0], 16),)+buffer.shape[1:])
+        new_buffer[:buffer.shape[0]] = buffer
+        return new_buffer
+
+    def set_nsamples(self,nhf_samples,nsample_ratios):
+        r"""
+        Set the number of samples of each model. The number of samples 
+        may be larger or smaller than a previous allocation. 
+
+        Parameters
+        ----------
+        nhf_samples : integer
+            The number of samples of the high fidelity model
+
+        nsample_ratios : np.ndarray (nmodels-1)
+            The sample ratios r used to specify the number of samples of the 
+            lower fidelity models, e.g. N_i = r_i*nhf_samples, 
+            i=1,...,nmodels-1
+        """
+        nsample_ratios = np.asarray(nsample_ratios)
+        assert nsample_ratios.shape[0]==self.nmodels-1
+        assert np.all(nsample_ratios>=1)
+        self.nsamples = np.round(np.concatenate(
+            [[nhf_samples],nsample_ratios*nhf_samples])).astype(int)
+
+    def get_nsamples(self):
+        r"""
+        Return the number of samples :math:`N_i` of each model in the 
+        current allocation.
+        """
+        return self.nsamples.copy()
+
+    def set_target_cost(self,target_cost):
+        r"""
+        Allocate the samples of each model using the estimator for a given 
+        target cost. Samples evaluated for a smaller target cost are reused.
+
+        Returns
+        -------
+        nhf_samples : integer
+            The number of samples of the high fidelity model
+
+        nsample_ratios : np.ndarray (nmodels-1)
+            The sample ratios of the lower fidelity models
+        """
+        nhf_samples,nsample_ratios = self.estimator.allocate_samples(
+            target_cost)[:2]
+        self.set_nsamples(nhf_samples,nsample_ratios)
+        return nhf_samples,nsample_ratios
+
+    def get_new_samples(self):
+        r"""
+        Get the samples at which each model must be evaluated to 
+        complete the current allocation.
+
+        Returns
+        -------
+        new_samples : list (nmodels)
+            The samples np.ndarray (nvars,nnew_samples_i) not yet evaluated 
+            by each model. The values at these samples must be passed to
+            add_values in the same order.
+        """
+        max_nsamples = self.nsamples.max()
+        if max_nsamples>self.nsamples_drawn:
+            samples = self.generate_samples(
+                int(max_nsamples-self.nsamples_drawn))
+            if self.samples is None:
+                self.samples = np.empty((samples.shape[0],0))
+            self.samples = self._extend_buffer(
+                self.samples.T,max_nsamples).T
+            self.samples[:,self.nsamples_drawn:max_nsamples]=samples
+            self.nsamples_drawn = max_nsamples
+        return [self.samples[:,self.nsamples_evaluated[ii]:self.nsamples[ii]]
+                for ii in range(self.nmodels)]
+
+    def add_values(self,model_id,values):
+        r"""
+        Add a batch of evaluations of a model. The values must correspond 
+        to the next samples, returned by get_new_samples, not yet 
+        evaluated by the model.
+
+        Parameters
+        ----------
+        model_id : integer
+            The id of the model evaluated
+
+        values : np.ndarray (nnew_samples,nqoi)
+            The values of the model
+        """
+        assert values.ndim==2
+        lb = self.nsamples_evaluated[model_id]
+        ub = lb+values.shape[0]
+        if ub>self.nsamples_drawn:
+            raise Exception('Too many values were provided')
+        if self.values[model_id] is None:
+            self.values[model_id] = np.empty((0,values.shape[1]))
+        self.values[model_id] = self._extend_buffer(self.values[model_id],ub)
+        self.values[model_id][lb:ub] = values
+        self.nsamples_evaluated[model_id] = ub
+        self._update_shared_statistics()
+
+    def _update_shared_statistics(self):
+        """
+        Update the running mean and covariance of the models using the 
+        samples that have just been evaluated by all the models. 
+        """
+        nshared_samples = self.nsamples_evaluated.min()
+        if nshared_samples==self.nshared_samples:
+            return
+        # only use the first qoi of each model
+        new_values = np.hstack(
+            [v[self.nshared_samples:nshared_samples,:1] for v in self.values])
+        nnew = new_values.shape[0]
+        new_mean = new_values.mean(axis=0)
+        new_cov_sum = (new_values-new_mean).T.dot(new_values-new_mean)
+        if self.nshared_samples==0:
+            self.shared_mean = new_mean
+            self.shared_cov_sum = new_cov_sum
+        else:
+            # Combine statistics using the update of Chan et al.
+            nold = self.nshared_samples
+            delta = new_mean-self.shared_mean
+            self.shared_mean = self.shared_mean+delta*nnew/(nold+nnew)
+            self.shared_cov_sum += new_cov_sum+np.outer(delta,delta)*(
+                nold*nnew/(nold+nnew))
+        self.nshared_samples = nshared_samples
+
+    def evaluate_models(self,model_ensemble):
+        r"""
+        Evaluate the models at the samples not yet evaluated and add
+        the values to the estimator.
+
+        Parameters
+        ----------
+        model_ensemble : callable or list of callables
+            A function with signature values = model_ensemble(samples) 
+            where the last row of samples contains the model id, e.g. 
+            ModelEnsemble, or a list of functions with signature 
+            values = function(samples)
+        """
+        new_samples = self.get_new_samples()
+        if not callable(model_ensemble):
+            for ii in range(self.nmodels):
+                if new_samples[ii].shape[1]>0:
+                    self.add_values(ii,model_ensemble[ii](new_samples[ii]))
+            return
+
+        # collect all samples assign an id and then evaluate in one batch
+        samples_with_id = np.hstack(
+            [np.vstack([s,ii*np.ones((1,s.shape[1]))])
+             for ii,s in enumerate(new_samples)])
+        if samples_with_id.shape[1]==0:
+            return
+        values_flattened = model_ensemble(samples_with_id)
+        cnt = 0
+        for ii in range(self.nmodels):
+            nnew_samples = new_samples[ii].shape[1]
+            if nnew_samples>0:
+                self.add_values(ii,values_flattened[cnt:cnt+nnew_samples])
+            cnt += nnew_samples
+
+    def get_covariance(self):
+        r"""
+        Return the running covariance between the models.
+
+        Returns
+        -------
+        cov : np.ndarray (nmodels,nmodels)
+            The covariance computed from the samples at which all models 
+            have been evaluated
+        """
+        if self.nshared_samples<2:
+            raise Exception('At least two shared samples must be evaluated')
+        return self.shared_cov_sum/(self.nshared_samples-1)
+
+    def get_weights(self):
+        if self.update_covariance:
+            cov = self.get_covariance()
+        else:
+            cov = self.estimator.get_covariance()
+        # ACVMF and MFMC both use these weights, see ACVMF.__call__
+        return get_mfmc_control_variate_weights(cov)
+
+    def _mean(self,model_id,nsamples):
+        return self.values[model_id][:nsamples].mean(axis=0)
+
+    def __call__(self):
+        r"""
+        Compute the estimate of the mean of the high fidelity model.
+
+        Returns
+        -------
+        est : np.ndarray (nqoi)
+            The control variate estimate of the mean
+        """
+        if np.any(self.nsamples_evaluated<self.nsamples):
+            raise Exception('Not all models have been evaluated')
+        eta = self.get_weights()
+        est = self._mean(0,self.nsamples[0])
+        for ii in range(1,self.nmodels):
+            if self.acv_modification:
+                nsamples1 = self.nsamples[0]
+            else:
+                nsamples1 = self.nsamples[ii-1]
+            est += eta[ii-1]*(self._mean(ii,nsamples1)-
+                              self._mean(ii,self.nsamples[ii]))
+        return est
+
+def compute_multioutput_pilot_statistics(pilot_values,nmodels):
+    r"""
+    Compute the statistics of a model ensemble with multiple quantities
+    of interest (QoI) needed to compute the covariance of multi-output 
+    approximate control variate estimators.
+
+    Parameters
+    ----------
+    pilot_values : np.ndarray (npilot_samples,nmodels*nqoi)
+        The values of each model at the pilot samples. The first nqoi
+        columns contain the QoI of the first model and so on.
+
+    nmodels : integer
+        The number of models
+
+    Returns
+    -------
+    cov : np.ndarray (nmodels*nqoi,nmodels*nqoi)
+        The covariance between the QoI of all models
+
+    V : np.ndarray (nmodels*nqoi,nmodels*nqoi)
+        The covariance between the squared deviations from the mean of
+        the QoI of all models :math:`V_{ab}=\mathrm{Cov}[(f_a-\mu_a)^2,(f_b-\mu_b)^2]`
+        Only needed to estimate variances.
+    """
+    assert pilot_values.shape[1]%nmodels==0
+    cov = np.cov(pilot_values,rowvar=False)
+    centered_values_sq = (pilot_values-pilot_values.mean(axis=0))**2
+    V = np.cov(centered_values_sq,rowvar=False)
+    return cov, V
+
+def get_nested_statistic_covariance_factors(nsamples1,nsamples2,statistic):
+    r"""
+    Compute the factors of the covariance between a statistic of one 
+    model computed with a set of :math:`N` samples and a statistic of 
+    another model computed with a set of :math:`M` samples, when the 
+    smaller set is a subset of the larger set.
+
+    For the mean the covariance is :math:`\frac{1}{\max(N,M)}C`. For the
+    unbiased variance it is 
+    :math:`\frac{1}{\max(N,M)}V+\frac{2}{\max(N,M)(\max(N,M)-1)}C\circ C`.
+
+    Parameters
+    ----------
+    nsamples1 : np.ndarray (...)
+        The number of samples N of the first statistic
+
+    nsamples2 : np.ndarray (...)
+        The number of samples M of the second statistic
+
+    statistic : string
+        The statistic estimated. Either 'mean' or 'variance'
+
+    Returns
+    -------
+    factors : list (nterms) of np.ndarray (...)
+        The factors of the covariance C (for 'mean') or of V and 
+        :math:`C\circ C` (for 'variance')
+    """
+    nmax = np.maximum(nsamples1,nsamples2)
+    if statistic=='mean':
+        return [1/nmax]
+    if statistic=='variance':
+        return [1/nmax,2/(nmax*(nmax-1))]
+    raise Exception('statistic {0} not supported'.format(statistic))
+
+class MultiOutputACV(object):
+    r"""
+    Approximate control variate estimator of the means or variances of 
+    multiple quantities of interest (QoI) of a high-fidelity model.
+
+    All QoI are estimated using one set of model evaluations. The control
+    variate weights are matrices that couple all the QoI of all models.
+
+    The samples of each model are nested subsets of one set of samples 
+    defined by a recursion index, see 
+    generate_samples_and_values_acv_recursion_index. The recursion index 
+    [0,...,0] gives the ACV-MF estimator and [0,1,...,M-2] gives MFMC.
+    """
+    def __init__(self,cov,costs,nqoi,recursion_index=None,statistic='mean',
+                 V=None,qoi_weights=None):
+        r"""
+        Parameters
+        ----------
+        cov : np.ndarray (nmodels*nqoi,nmodels*nqoi)
+            The covariance between the QoI of all models
+
+        costs : np.ndarray (nmodels)
+            The relative costs of evaluating each model
+
+        nqoi : integer
+            The number of QoI of each model
+
+        recursion_index : iterable (nmodels-1)
+            The id of the model paired with each low-fidelity model.
+            If None the ACV-MF estimator is used
+
+        statistic : string
+            The statistic estimated. Either 'mean' or 'variance'
+
+        V : np.ndarray (nmodels*nqoi,nmodels*nqoi)
+            The covariance between the squared deviations from the mean of 
+            the QoI of all models. Required if statistic=='variance'. See
+            compute_multioutput_pilot_statistics
+
+        qoi_weights : np.ndarray (nqoi)
+            The weights of the variance of each QoI in the objective,
+            :math:`\mathrm{Trace}(\mathrm{diag}(w)\Sigma)`, minimized when 
+            allocating samples. If None all weights are one.
+        """
+        self.costs = np.asarray(costs,dtype=float)
+        self.nmodels = self.costs.shape[0]
+        self.nqoi = nqoi
+        assert cov.shape[0]==self.nmodels*self.nqoi
+        self.cov = cov
+        if recursion_index is None:
+            recursion_index = np.zeros(self.nmodels-1,dtype=int)
+        self.recursion_index = np.asarray(recursion_index)
+        assert self.recursion_index.shape[0]==self.nmodels-1
+        self.statistic = statistic
+        if statistic=='variance' and V is None:
+            raise Exception('V must be provided to estimate variances')
+        self.V = V
+        if qoi_weights is None:
+            qoi_weights = np.ones(nqoi)
+        self.qoi_weights = qoi_weights
+
+        # matrices whose blocks are scaled by the covariance factors
+        shape = (self.nmodels,nqoi,self.nmodels,nqoi)
+        if statistic=='mean':
+            self.stat_covs = [cov.reshape(shape)]
+        else:
+            self.stat_covs = [V.reshape(shape),(cov**2).reshape(shape)]
+
+    def get_nsamples(self,nhf_samples,nsample_ratios):
+        return np.concatenate([[nhf_samples],nsample_ratios*nhf_samples])
+
+    def get_discrepancy_covariances(self,nhf_samples,nsample_ratios):
+        r"""
+        Get the covariances of the discrepancies between the statistics
+        of each low-fidelity model computed with its two sample sets.
+
+        Returns
+        -------
+        CF : np.ndarray ((nmodels-1)*nqoi,(nmodels-1)*nqoi)
+            The covariance between the discrepancies
+
+        cf : np.ndarray ((nmodels-1)*nqoi,nqoi)
+            The covariance between the discrepancies and the high-fidelity
+            statistics
+
+        hf_cov : np.ndarray (nqoi,nqoi)
+            The covariance of the high-fidelity statistics
+        """
+        nsamples = self.get_nsamples(nhf_samples,np.asarray(nsample_ratios))
+        nsamples1 = nsamples[self.recursion_index]
+        nsamples2 = nsamples[1:]
+        def factors(n1,n2):
+            return get_nested_statistic_covariance_factors(
+                n1[:,np.newaxis],n2[np.newaxis,:],self.statistic)
+        n0 = nsamples[:1]
+        nlf, nqoi = self.nmodels-1, self.nqoi
+        CF = np.zeros((nlf,nqoi,nlf,nqoi))
+        cf = np.zeros((nlf,nqoi,nqoi))
+        hf_cov = np.zeros((nqoi,nqoi))
+        FF = [f11-f12-f21+f22 for f11,f12,f21,f22 in zip(
+            factors(nsamples1,nsamples1),factors(nsamples1,nsamples2),
+            factors(nsamples2,nsamples1),factors(nsamples2,nsamples2))]
+        Ff = [f1[:,0]-f2[:,0] for f1,f2 in zip(
+            factors(nsamples1,n0),factors(nsamples2,n0))]
+        F0 = [f[0,0] for f in factors(n0,n0)]
+        for stat_cov,F,f,f0 in zip(self.stat_covs,FF,Ff,F0):
+            CF += F[:,np.newaxis,:,np.newaxis]*stat_cov[1:,:,1:,:]
+            cf += f[:,np.newaxis,np.newaxis]*stat_cov[1:,:,0,:]
+            hf_cov += f0*stat_cov[0,:,0,:]
+        return (CF.reshape(nlf*nqoi,nlf*nqoi),cf.reshape(nlf*nqoi,nqoi),
+                hf_cov)
+
+    def get_weights(self,nhf_samples,nsample_ratios):
+        r"""
+        Get the control variate weights.
+
+        Returns
+        -------
+        weights : np.ndarray (nqoi,(nmodels-1)*nqoi)
+            The weights applied to the discrepancies of all low-fidelity
+            models
+        """
+        from scipy.linalg import cho_factor, cho_solve
+        CF,cf,hf_cov = self.get_discrepancy_covariances(
+            nhf_samples,nsample_ratios)
+        return -cho_solve(cho_factor(CF),cf).T
+
+    def get_covariance(self,nhf_samples,nsample_ratios):
+        r"""
+        Get the covariance of the estimator of the statistics of all QoI
+        using the optimal control variate weights.
+
+        Returns
+        -------
+        est_cov : np.ndarray (nqoi,nqoi)
+            The covariance of the estimator
+        """
+        from scipy.linalg import cho_factor, cho_solve
+        CF,cf,hf_cov = self.get_discrepancy_covariances(
+            nhf_samples,nsample_ratios)
+        return hf_cov-cf.T.dot(cho_solve(cho_factor(CF),cf))
+
+    def get_variance(self,nhf_samples,nsample_ratios):
+        r"""
+        Get the weighted trace of the covariance of the estimator which is
+        minimized when allocating samples.
+        """
+        est_cov = self.get_covariance(nhf_samples,nsample_ratios)
+        return np.sum(self.qoi_weights*np.diag(est_cov))
+
+    def objective(self,x):
+        try:
+            variance = self.get_variance(x[0],x[1:])
+        except np.linalg.LinAlgError:
+            return np.inf
+        if variance<=0:
+            return np.inf
+        return np.log10(variance)
+
+    def jacobian(self,x):
+        from scipy.optimize import approx_fprime
+        return approx_fprime(x,self.objective,1e-7*np.maximum(
+            np.absolute(x),1))
+
+    def allocate_samples(self,target_cost,standardize=True,
+                         initial_guess=None,optim_options=None):
+        r"""
+        Determine the samples to be allocated to each model by minimizing
+        the weighted trace of the covariance of the estimator.
+
+        Returns
+        -------
+        nhf_samples : integer 
+            The number of samples of the high fidelity model
+
+        nsample_ratios : np.ndarray (nmodels-1)
+            The sample ratios of the lower fidelity models
+
+        log10_variance : float
+            The base 10 logarithm of the weighted trace of the covariance
+            of the estimator
+        """
+        if initial_guess is None:
+            # use the MFMC allocation of the first QoI if it exists
+            hf_cov = self.cov[::self.nqoi,::self.nqoi]
+            initial_guess = get_acv_candidate_sample_ratios(
+                self.costs,target_cost,1,None,hf_cov)[0]
+            nhf_samples = target_cost/(
+                self.costs[0]+self.costs[1:].dot(initial_guess))
+            initial_guess = np.concatenate([[nhf_samples],initial_guess])
+        if optim_options is None:
+            optim_options = {'disp':False,'ftol':1e-10,'maxiter':1000}
+        opt = solve_allocate_samples_acv_slsqp_optimization(
+            self,self.costs,target_cost,initial_guess,optim_options)
+        nhf_samples, nsample_ratios = opt.x[0], opt.x[1:]
+        if standardize:
+            nhf_samples, nsample_ratios = standardize_sample_ratios(
+                nhf_samples, nsample_ratios)
+        var = self.get_variance(nhf_samples,nsample_ratios)
+        return nhf_samples, nsample_ratios, np.log10(var)
+
+    def generate_data(self,nhf_samples,nsample_ratios,generate_samples,
+                      model_ensemble):
+        return generate_samples_and_values_acv_recursion_index(
+            nhf_samples,nsample_ratios,model_ensemble,
+            generate_samples,self.recursion_index)
+
+    def _statistic(self,values):
+        if self.statistic=='mean':
+            return values.mean(axis=0)
+        return values.var(axis=0,ddof=1)
+
+    def __call__(self,values):
+        r"""
+        Compute the estimate of the statistic of each QoI.
+
+        Parameters
+        ----------
+        values : list (nmodels)
+            The values [values1,values2] of each model computed with 
+            generate_data
+
+        Returns
+        -------
+        est : np.ndarray (nqoi)
+            The estimate of the statistic of each QoI
+        """
+        nhf_samples = values[0][0].shape[0]
+        nsample_ratios = np.asarray(
+            [v[1].shape[0]/nhf_samples for v in values[1:]])
+        weights = self.get_weights(nhf_samples,nsample_ratios)
+        deltas = np.concatenate(
+            [self._statistic(v[0])-self._statistic(v[1]) for v in values[1:]])
+        return self._statistic(values[0][0])+weights.dot(deltas)
+
 def compute_single_fidelity_and_approximate_control_variate_mean_estimates(
         nhf_samples,nsample_ratios,
         model_ensemble,generate_samples,
@@ -1537,11 +3156,132 @@ def compute_single_fidelity_and_approximate_control_variate_mean_estimates(
     acv_mean = compute_approximate_control_variate_mean_estimate(eta,values)
     return hf_mean, acv_mean
 
+def _identity_model(samples):
+    return samples.T
+
+def get_acv_sample_ids(nhf_samples,nsample_ratios,generate_samples_and_values):
+    r"""
+    Determine which of the random samples drawn for a single realization
+    of an estimator are used to evaluate each model.
+
+    The allocation of samples to models only depends on the number of
+    samples and the sample ratios so it can be computed once by tracing
+    the indices of the samples returned by generate_samples through
+    generate_samples_and_values.
+
+    Parameters
+    ----------
+    nhf_samples : integer
+        The number of samples of the high fidelity model
+
+    nsample_ratios : np.ndarray (nmodels-1)
+        The sample ratios r used to specify the number of samples of the 
+        lower fidelity models, e.g. N_i = r_i*nhf_samples, i=1,...,nmodels-1
+
+    generate_samples_and_values : callable
+        Function used to generate the samples and values of an estimator,
+        e.g. generate_samples_and_values_mfmc
+
+    Returns
+    -------
+    sample_ids : list (nmodels)
+        Each entry [ids1,ids2] contains the indices of the samples used to
+        compute the values1 and values2 of each model. The entry ids2 of the
+        high-fidelity model is None
+
+    nsamples_per_trial : integer
+        The number of random samples drawn for a single realization of the 
+        estimator
+    """
+    nmodels = len(nsample_ratios)+1
+    counter = [0]
+    def generate_sample_ids(nsamples):
+        ids = np.arange(counter[0],counter[0]+nsamples)[np.newaxis,:]
+        counter[0] += int(nsamples)
+        return ids
+    
+    samples,values = generate_samples_and_values(
+        nhf_samples,nsample_ratios,[_identity_model]*nmodels,
+        generate_sample_ids)
+    sample_ids = [[None if v is None else v[:,0].astype(int) for v in vals]
+                  for vals in values]
+    return sample_ids, counter[0]
+
+def compute_single_fidelity_and_approximate_control_variate_mean_estimates_vectorized(
+        nhf_samples,nsample_ratios,model_ensemble,generate_samples,
+        sample_ids,nsamples_per_trial,cv_weights,seed,ntrials):
+    r"""
+    Compute multiple realizations of the approximate control variate estimate
+    and the single fidelity Monte Carlo estimate of the mean of a
+    high-fidelity model.
+
+    The random samples of all realizations are drawn at once and each model 
+    is evaluated only once at the samples of all realizations.
+    This is much faster than repeatedly calling 
+    compute_single_fidelity_and_approximate_control_variate_mean_estimates
+    when the models are inexpensive to evaluate.
+
+    Parameters
+    ----------
+    sample_ids : list (nmodels)
+        The indices of the samples used to compute the values of each model.
+        See get_acv_sample_ids
+
+    nsamples_per_trial : integer
+        The number of random samples drawn for a single realization of the 
+        estimator
+
+    cv_weights : np.ndarray (nmodels-1)
+        The control variate weights
+
+    seed : integer
+        The seed of the random number generator used to draw the samples
+
+    ntrials : integer
+        The number of realizations of the estimators
+
+    Returns
+    -------
+    means : np.ndarray (ntrials,2)
+        The single fidelity (first column) and approximate control 
+        variate (second column) estimates of the mean
+    """
+    random_state = np.random.RandomState(seed)
+    samples = generate_samples(
+        ntrials*nsamples_per_trial,random_state=random_state)
+    nvars = samples.shape[0]
+    samples = samples.reshape(nvars,ntrials,nsamples_per_trial)
+    nmodels = len(sample_ids)
+    means = np.empty((ntrials,2))
+    for ii in range(nmodels):
+        ids = [s for s in sample_ids[ii] if s is not None]
+        unique_ids = np.unique(np.concatenate(ids))
+        # use C-order so values for each realization are contiguous
+        samples_ii = samples[:,:,unique_ids].reshape(
+            nvars,ntrials*unique_ids.shape[0])
+        if not callable(model_ensemble):
+            values_ii = model_ensemble[ii](samples_ii)
+        else:
+            values_ii = model_ensemble(np.vstack(
+                [samples_ii,ii*np.ones((1,samples_ii.shape[1]))]))
+        values_ii = values_ii.reshape(ntrials,unique_ids.shape[0],-1)
+        sub_means = [
+            values_ii[:,np.searchsorted(unique_ids,s),:].mean(axis=(1,2))
+            for s in ids]
+        if ii==0:
+            means[:,0] = sub_means[0]
+            means[:,1] = sub_means[0]
+        else:
+            means[:,1] += cv_weights[ii-1]*(sub_means[0]-sub_means[1])
+    return means
+
 def estimate_variance_reduction(model_ensemble, cov, generate_samples,
                                 allocate_samples,generate_samples_and_values,
                                 get_cv_weights,get_rsquared=None,
                                 ntrials=1e3,max_eval_concurrency=1,
-                                target_cost=None, costs=None):
+                                target_cost=None, costs=None,
+                                vectorize_trials=False,pool=None,
+                                chunksize=None,assert_omp=True):
     r"""
     Numerically estimate the variance of an approximate control variate estimator
     and compare its value to the estimator using only the high-fidelity data.
@@ -1555,6 +3295,31 @@ def estimate_variance_reduction(model_ensemble, cov, generate_samples,
     max_eval_concurrency : integer
         The number of processors used to compute realizations of the estimators,
         which can be run independently and in parallel.
+
+    vectorize_trials : boolean
+        True - draw the samples of many realizations of the estimators at once
+        and evaluate each model only once per chunk of realizations. 
+        The functions in model_ensemble must accept large sets of samples.
+        This is recommended for inexpensive models.
+        False - compute each realization of the estimators separately
+
+    pool : multiprocessing.Pool
+        A pool used to compute the realizations of the estimators in parallel.
+        Passing a pool avoids the cost of creating a new pool each time 
+        this function is called. If None and max_eval_concurrency>1 a pool 
+        is created and closed on exit.
+
+    chunksize : integer
+        The number of realizations of the estimators computed by each call
+        to the vectorized estimator (vectorize_trials=True) or sent to each 
+        process of the pool at once (vectorize_trials=False).
+        If None the number of realizations computed by the vectorized 
+        estimator is chosen so that at most approximately 4e6 random samples
+        are drawn at once.
+
+    assert_omp : boolean
+        If True and a pool is created make sure that the environment
+        variable OMP_NUM_THREADS has been set to 1. See PoolModel
     """
     
     M = cov.shape[0]-1 # number of lower fidelity models
@@ -1567,19 +3332,49 @@ def estimate_variance_reduction(model_ensemble, cov, generate_samples,
         cov, costs, target_cost)[:2]
 
     ntrials = int(ntrials)
-    from multiprocessing import Pool
-    pool = Pool(max_eval_concurrency)
-    func = partial(
-        compute_single_fidelity_and_approximate_control_variate_mean_estimates,
-        nhf_samples,nsample_ratios,model_ensemble,generate_samples,
-        generate_samples_and_values,cov,get_cv_weights)
-    if max_eval_concurrency>1:
-        assert int(os.environ['OMP_NUM_THREADS'])==1
-        means = np.asarray(pool.map(func,[ii for ii in range(ntrials)]))
+    close_pool = False
+    if pool is None and max_eval_concurrency>1:
+        if assert_omp and os.environ.get('OMP_NUM_THREADS')!='1':
+            msg = 'User set assert_omp=True but OMP_NUM_THREADS has not been '
+            msg += 'set to 1. Run script with '
+            msg += 'OMP_NUM_THREADS=1 python script.py'
+            raise Exception(msg)
+        from multiprocessing import Pool
+        pool = Pool(max_eval_concurrency)
+        close_pool = True
+
+    if vectorize_trials:
+        sample_ids, nsamples_per_trial = get_acv_sample_ids(
+            nhf_samples,nsample_ratios,generate_samples_and_values)
+        if chunksize is None:
+            chunksize = max(1,int(4e6)//nsamples_per_trial)
+        func = partial(
+            compute_single_fidelity_and_approximate_control_variate_mean_estimates_vectorized,
+            nhf_samples,nsample_ratios,model_ensemble,generate_samples,
+            sample_ids,nsamples_per_trial,get_cv_weights(cov,nsample_ratios))
+        # use the index of the first trial as the seed of each chunk
+        args = [(ii,min(chunksize,ntrials-ii))
+                for ii in range(0,ntrials,chunksize)]
+        if pool is not None:
+            means = np.vstack(pool.starmap(func,args))
+        else:
+            means = np.vstack([func(*arg) for arg in args])
     else:
-        means = np.empty((ntrials,2))
-        for ii in range(ntrials):
-            means[ii,:] = func(ii)
+        func = partial(
+            compute_single_fidelity_and_approximate_control_variate_mean_estimates,
+            nhf_samples,nsample_ratios,model_ensemble,generate_samples,
+            generate_samples_and_values,cov,get_cv_weights)
+        if pool is not None:
+            means = np.asarray(
+                pool.map(func,[ii for ii in range(ntrials)],chunksize))
+        else:
+            means = np.empty((ntrials,2))
+            for ii in range(ntrials):
+                means[ii,:] = func(ii)
+
+    if close_pool:
+        pool.close()
+        pool.join()
 
     numerical_var_reduction=means[:,1].var(axis=0)/means[:,0].var(axis=0)
     if get_rsquared is not None:
@@ -146,6 +146,88 @@ def core_grad_left(sample, core_params, core_params_map, ranks,
             cnt += params.shape[0]
     return core_values, core_derivs
 
+def get_core_parameter_indices(core_params_map,num_core_params):
+    """
+    Get the univariate function and basis function associated with each
+    parameter of a core.
+
+    Parameters
+    ----------
+    core_params_map : np.ndarray (ranks[0]*ranks[1])
+        The index of the first parameter of each univariate function
+
+    num_core_params : integer
+        The number of parameters in the core
+
+    Returns
+    -------
+    function_indices : np.ndarray (num_core_params)
+        The univariate function (in column major ordering) of each parameter
+
+    basis_indices : np.ndarray (num_core_params)
+        The index of the basis function of each parameter
+    """
+    num_params_per_function = np.diff(
+        np.append(core_params_map,num_core_params))
+    function_indices = np.repeat(
+        np.arange(core_params_map.shape[0]),num_params_per_function)
+    basis_indices = np.arange(num_core_params)-core_params_map[
+        function_indices]
+    return function_indices, basis_indices
+
+def evaluate_core_batch(samples_1d, core_params, core_params_map, ranks,
+                        recursion_coeffs, return_basis_matrix=False):
+    """
+    Evaluate a core of the function train at a set of samples
+
+    Parameters
+    ----------
+    samples_1d : np.ndarray (num_samples)
+        The samples of the variable associated with the core
+
+    core_params : np.ndarray (num_core_params)
+        The parameters of all univariate functions of the core
+
+    core_params_map : np.ndarray (ranks[0]*ranks[1])
+        The index of the first parameter of each univariate function
+
+    ranks : np.ndarray (2)
+        The ranks of the core [r_{k-1},r_k]
+
+    recursion_coeffs : np.ndarray (max_degree+1)
+        The recursion coefficients used to evaluate the univariate functions
+        which are assumed to polynomials defined by the recursion coefficients
+
+    return_basis_matrix : boolean
+        True - also return the values of the basis at the samples
+
+    Returns
+    -------
+    core_values : np.ndarray (num_samples,ranks[0],ranks[1])
+        The values of each univariate function evaluated at each sample
+
+    basis_matrix : np.ndarray (num_samples,max_degree+1)
+        The values of the univariate basis at the samples. Only returned 
+        if return_basis_matrix is True
+    """
+    assert ranks.shape[0]==2
+    max_degree = recursion_coeffs.shape[0]-1
+    basis_matrix = evaluate_orthonormal_polynomial_1d(
+        samples_1d, max_degree, recursion_coeffs)
+    function_indices, basis_indices = get_core_parameter_indices(
+        core_params_map,core_params.shape[0])
+    assert basis_indices.max()<recursion_coeffs.shape[0]
+    # store parameters of each univariate function in columns of a 
+    # matrix padded with zeros so all functions are evaluated with one
+    # matrix-matrix product
+    coefficients = np.zeros((max_degree+1,core_params_map.shape[0]))
+    coefficients[basis_indices,function_indices] = core_params
+    core_values = np.dot(basis_matrix,coefficients).reshape(
+        samples_1d.shape[0],ranks[1],ranks[0]).transpose(0,2,1)
+    if return_basis_matrix:
+        return core_values, basis_matrix
+    return core_values
+
 def evaluate_function_train(samples,ft_data,recursion_coeffs):
     """
     Evaluate the function train
@@ -178,21 +260,14 @@ def evaluate_function_train(samples,ft_data,recursion_coeffs):
     num_vars = len(ranks)-1
     num_samples = samples.shape[1]
     assert len(ranks)==num_vars+1
-    values = np.zeros((num_samples,1),dtype=float)
-    for ii in range(num_samples):
+    values = np.ones((num_samples,1,1),dtype=float)
+    for dd in range(num_vars):
         core_params,core_params_map = get_all_univariate_params_of_core(
-            ft_params,ft_params_map,ft_cores_map,0)
-        core_values = evaluate_core(
-            samples[0,ii],core_params,core_params_map,ranks[:2],
-            recursion_coeffs)
-        for dd in range(1,num_vars):
-            core_params,core_params_map = get_all_univariate_params_of_core(
-                ft_params,ft_params_map,ft_cores_map,dd)
-            core_values = np.dot(core_values,evaluate_core(
-                samples[dd,ii],core_params,core_params_map,ranks[dd:dd+2],
-                recursion_coeffs))
-        values[ii,0] = core_values[0,0]
-    return values
+            ft_params,ft_params_map,ft_cores_map,dd)
+        values = np.matmul(values,evaluate_core_batch(
+            samples[dd,:],core_params,core_params_map,ranks[dd:dd+2],
+            recursion_coeffs))
+    return values[:,:,0]
 
 def core_grad_right(ranks, right_vals, intermediate_core_derivs,
                     core_params_map):
@@ -241,6 +316,76 @@ def core_grad_right(ranks, right_vals, intermediate_core_derivs,
     return core_derivs
 
 
+def evaluate_function_train_jacobian(samples,ft_data,recursion_coeffs):
+    """
+    Evaluate the function train and its gradient with respect to the 
+    parameters of the univariate functions at a set of samples.
+
+    The cores are evaluated at all samples at once and the products of the 
+    cores to the left and right of each core are computed with batched 
+    matrix products.
+
+    Parameters
+    ----------
+    samples : np.ndarray (num_vars, num_samples)
+        The samples at which to evaluate the function train
+
+    ft_data : list
+        The ranks, parameters, parameter map and cores map of the 
+        function train
+
+    recursion_coeffs : np.ndarray (max_degree+1)
+        The recursion coefficients used to evaluate the univariate functions
+        which are assumed to polynomials defined by the recursion coefficients
+
+    Returns
+    -------
+    values : np.ndarray (num_samples,1)
+        The values of the function train at the samples
+
+    jacobian : np.ndarray(num_samples,num_ft_params)
+        The derivative of the function train at each sample with respect to 
+        each coefficient of each univariate core, using the ordering
+        of :func:`evaluate_function_train_grad`
+    """
+    ranks,ft_params,ft_params_map,ft_cores_map=ft_data
+    num_vars = len(ranks)-1
+    num_samples = samples.shape[1]
+    assert samples.shape[0]==num_vars
+
+    values_of_cores, basis_matrices, core_params_maps = [], [], []
+    for dd in range(num_vars):
+        core_params,core_params_map = get_all_univariate_params_of_core(
+            ft_params,ft_params_map,ft_cores_map,dd)
+        core_values, basis_matrix = evaluate_core_batch(
+            samples[dd,:],core_params,core_params_map,ranks[dd:dd+2],
+            recursion_coeffs,True)
+        values_of_cores.append(core_values)
+        basis_matrices.append(basis_matrix)
+        core_params_maps.append(core_params_map)
+
+    # left_vals[dd] is the product of cores 0,...,dd-1
+    left_vals = [np.ones((num_samples,1,1))]
+    for dd in range(num_vars-1):
+        left_vals.append(np.matmul(left_vals[-1],values_of_cores[dd]))
+    values = np.matmul(left_vals[-1],values_of_cores[-1])[:,:,0]
+
+    jacobian = np.empty((num_samples,ft_params.shape[0]),dtype=float)
+    right_vals = np.ones((num_samples,1,1))
+    for dd in range(num_vars-1,-1,-1):
+        lb,ub = get_index_bounds_of_core_params(
+            dd,ft_cores_map,ft_params_map,ft_params.shape[0])[:2]
+        function_indices, basis_indices = get_core_parameter_indices(
+            core_params_maps[dd],ub-lb)
+        # weights[:,jj,kk] is the derivative of the function train with 
+        # respect to univariate function jj,kk of the core
+        weights = left_vals[dd][:,0,:,None]*right_vals[:,None,:,0]
+        weights = weights.transpose(0,2,1).reshape(num_samples,-1)
+        jacobian[:,lb:ub] = weights[:,function_indices]*\
+            basis_matrices[dd][:,basis_indices]
+        right_vals = np.matmul(values_of_cores[dd],right_vals)
+    return values, jacobian
+
 def evaluate_function_train_grad(sample,ft_data,recursion_coeffs):
     """
     Evaluate the function train and its gradient
@@ -277,14 +422,10 @@ def evaluate_function_train_grad(sample,ft_data,recursion_coeffs):
 
 
     """
-    value, values_of_cores, derivs_of_cores = \
-      evaluate_ft_gradient_forward_pass(sample,ft_data,recursion_coeffs)
-
-    ranks, ft_params, ft_params_map, ft_cores_map = ft_data
-    gradient = evalaute_ft_gradient_backward_pass(
-        ranks,values_of_cores,derivs_of_cores,ft_params_map,ft_cores_map)
-
-    return value, gradient
+    assert sample.shape[1]==1
+    values, jacobian = evaluate_function_train_jacobian(
+        sample,ft_data,recursion_coeffs)
+    return values[0], jacobian[0]
     
 def evaluate_ft_gradient_forward_pass(sample,ft_data,recursion_coeffs):
     ranks,ft_params,ft_params_map,ft_cores_map=ft_data
@@ -689,22 +830,15 @@ def ft_least_squares_jacobian(samples,values,ft_data,recursion_coeffs,
     Warning this only overwrites parameters associated with the active indices
     the rest of the parameters are taken from ft_data.
     """
-    num_samples = samples.shape[1]
-    num_params = ft_params.shape[0]
     if active_indices is not None:
         ft_data[1][active_indices]=ft_params
-        nactive_params = active_indices.shape[0]
     else:
         ft_data[1]=ft_params
-        nactive_params = num_params
     
-    jacobian = np.empty((num_samples,nactive_params),dtype=float)
-    for ii in range(num_samples):
-        __,grad = evaluate_function_train_grad(
-            samples[:,ii:ii+1],ft_data,recursion_coeffs)
-        if active_indices is None:
-            jacobian[ii,:] = -grad
-        jacobian[ii,:] = -grad[active_indices]
+    jacobian = -evaluate_function_train_jacobian(
+        samples,ft_data,recursion_coeffs)[1]
+    if active_indices is not None:
+        jacobian = jacobian[:,active_indices]
     return jacobian
 
 def apply_function_train_adjoint_jacobian(samples,ft_data,recursion_coeffs,
@@ -726,14 +860,9 @@ def apply_function_train_adjoint_jacobian(samples,ft_data,recursion_coeffs,
     new_ft_data=copy.deepcopy(ft_data)
     new_ft_data[1]=ft_params.copy()
     new_ft_data[1][ft_params==0]=perturb
-    result = np.zeros((ft_params.shape[0]),dtype=float)
-    num_samples = samples.shape[1]
-    for ii in range(num_samples):
-        __, ft_gradient = evaluate_function_train_grad(
-        samples[:,ii:ii+1],new_ft_data,recursion_coeffs)
-        for jj in range(ft_gradient.shape[0]):
-            result[jj]+=-ft_gradient[jj]*vec[ii]
-        #print 'result',result
+    jacobian = evaluate_function_train_jacobian(
+        samples,new_ft_data,recursion_coeffs)[1]
+    result = -np.dot(jacobian.T,vec)
     return result
     
 def ft_non_linear_least_squares_regression(samples,values,ft_data,
@@ -11,7 +11,7 @@ from pyapprox.utilities import cartesian_product, outer_product, \
     cholesky_solve_linear_system, update_cholesky_factorization
 from scipy.spatial.distance import cdist
 from functools import partial
-from scipy.linalg import solve_triangular
+from scipy.linalg import solve_triangular, cholesky
 from pyapprox.low_discrepancy_sequences import transformed_halton_sequence
 from pyapprox.utilities import pivoted_cholesky_decomposition, \
     continue_pivoted_cholesky_decomposition
@@ -23,10 +23,155 @@ from pyapprox.probability_measure_sampling import \
     generate_independent_random_samples
 
 
+def compute_pairwise_squared_distances_per_dimension(X):
+    r"""
+    Compute the squared distance between each pair of samples for each
+    dimension.
+
+    Parameters
+    ----------
+    X : np.ndarray (nsamples, nvars)
+        The samples (sklearn ordering)
+
+    Returns
+    -------
+    sq_dists : np.ndarray (nsamples, nsamples, nvars)
+        The entries sq_dists[i, j, k] = (X[i, k]-X[j, k])**2
+    """
+    return (X[:, None, :]-X[None, :, :])**2
+
+
+def _stationary_kernel_matrix_and_gradients(kernel, sq_dists, eval_gradient):
+    length_scale = np.atleast_1d(kernel.length_scale)
+    # Matern is a subclass of RBF
+    if isinstance(kernel, Matern):
+        nu = kernel.nu
+    else:
+        nu = np.inf
+    if nu not in [0.5, 1.5, 2.5, np.inf]:
+        return None
+    # scaled squared distances for each dimension
+    scaled_sq_dists = sq_dists/length_scale**2
+    sq_r = scaled_sq_dists.sum(axis=2)
+    if nu == np.inf:
+        K = np.exp(-0.5*sq_r)
+    else:
+        r = np.sqrt(sq_r)
+        if nu == 0.5:
+            K = np.exp(-r)
+        elif nu == 1.5:
+            K = (1+np.sqrt(3)*r)*np.exp(-np.sqrt(3)*r)
+        else:
+            K = (1+np.sqrt(5)*r+5/3*sq_r)*np.exp(-np.sqrt(5)*r)
+    if not eval_gradient or kernel.hyperparameter_length_scale.fixed:
+        return K, []
+
+    # derivative of K with respect to log length scale is -dK/dr*r*dr/dlogl
+    # and dr/dlogl_k = -sq_dists_k/(l_k**2*r)
+    if nu == np.inf:
+        factor = K
+    elif nu == 0.5:
+        factor = np.zeros_like(K)
+        II = r > 0
+        factor[II] = K[II]/r[II]
+    elif nu == 1.5:
+        factor = 3*np.exp(-np.sqrt(3)*r)
+    else:
+        factor = 5/3*(1+np.sqrt(5)*r)*np.exp(-np.sqrt(5)*r)
+    if length_scale.shape[0] > 1 and np.iterable(kernel.length_scale):
+        return K, [factor*scaled_sq_dists[:, :, kk]
+                   for kk in range(length_scale.shape[0])]
+    return K, [factor*sq_r]
+
+
+def compute_kernel_matrix_and_gradients(kernel, sq_dists, eval_gradient):
+    r"""
+    Evaluate a kernel at the training samples using the pairwise squared
+    distances of the training samples in each dimension.
+
+    The squared distances do not depend on the kernel hyper-parameters
+    so they can be computed once and reused for every evaluation of the
+    marginal likelihood.
+
+    Only kernels composed from the :class:`sklearn.gaussian_process.kernels`
+    RBF, Matern (nu in [0.5, 1.5, 2.5, inf]), ConstantKernel and
+    WhiteKernel via sums and products are supported.
+
+    Parameters
+    ----------
+    kernel : :class:`sklearn.gaussian_process.kernels.Kernel`
+        The kernel
+
+    sq_dists : np.ndarray (nsamples1, nsamples2, nvars)
+        The squared distances between each pair of samples for each
+        dimension. See :func:`compute_pairwise_squared_distances_per_dimension`
+        WhiteKernel assumes the two sets of samples are the same.
+
+    eval_gradient : boolean
+        True - compute the gradient of the kernel with respect to the
+        log of the hyper-parameters which are not fixed
+
+    Returns
+    -------
+    K : np.ndarray (nsamples1, nsamples2)
+        The kernel matrix. None is returned if the kernel is not supported
+
+    K_grads : list (ntheta)
+        The gradient of the kernel matrix np.ndarray (nsamples1, nsamples2)
+        with respect to each entry of kernel.theta
+    """
+    nsamples = sq_dists.shape[0]
+    if isinstance(kernel, (RBF, Matern)):
+        result = _stationary_kernel_matrix_and_gradients(
+            kernel, sq_dists, eval_gradient)
+        if result is None:
+            return None, None
+        return result
+    if isinstance(kernel, ConstantKernel):
+        K = np.full(sq_dists.shape[:2], kernel.constant_value)
+        if eval_gradient and not kernel.hyperparameter_constant_value.fixed:
+            return K, [K.copy()]
+        return K, []
+    if isinstance(kernel, WhiteKernel):
+        K = kernel.noise_level*np.eye(nsamples)
+        if eval_gradient and not kernel.hyperparameter_noise_level.fixed:
+            return K, [K.copy()]
+        return K, []
+    if isinstance(kernel, (Sum, Product)):
+        K1, K1_grads = compute_kernel_matrix_and_gradients(
+            kernel.k1, sq_dists, eval_gradient)
+        if K1 is None:
+            return None, None
+        K2, K2_grads = compute_kernel_matrix_and_gradients(
+            kernel.k2, sq_dists, eval_gradient)
+        if K2 is None:
+            return None, None
+        if isinstance(kernel, Sum):
+            return K1+K2, K1_grads+K2_grads
+        return K1*K2, [g*K2 for g in K1_grads]+[K1*g for g in K2_grads]
+    return None, None
+
+
+def _optimize_gaussian_process_hyperparameters(gp, initial_theta):
+    def obj_func(theta):
+        lml, grad = gp.log_marginal_likelihood(
+            theta, eval_gradient=True, clone_kernel=False)
+        return -lml, -grad
+    return gp._constrained_optimization(
+        obj_func, initial_theta, gp.kernel_.bounds)
+
+
 class GaussianProcess(GaussianProcessRegressor):
     def set_variable_transformation(self, var_trans):
         self.var_trans = var_trans
 
+    def set_max_eval_concurrency(self, max_eval_concurrency):
+        r"""
+        Set the number of processes used to run the restarts of the
+        hyper-parameter optimization in parallel.
+        """
+        self.max_eval_concurrency = max_eval_concurrency
+
     def map_to_canonical_space(self, samples):
         if hasattr(self,'var_trans'):
             return self.var_trans.map_to_canonical_space(samples)
@@ -51,9 +196,109 @@ class GaussianProcess(GaussianProcessRegressor):
             transpose of this matrix, i.e a matrix with size (nsamples,nvars)
         """
         canonical_train_samples = self.map_to_canonical_space(train_samples)
-        return super().fit(canonical_train_samples.T, train_values)
+        max_eval_concurrency = getattr(self, 'max_eval_concurrency', 1)
+        if (max_eval_concurrency == 1 or self.optimizer is None or
+                self.n_restarts_optimizer == 0):
+            return super().fit(canonical_train_samples.T, train_values)
+        return self._fit_with_parallel_restarts(
+            canonical_train_samples.T, train_values, max_eval_concurrency)
+
+    def _fit_with_parallel_restarts(self, X, y, max_eval_concurrency):
+        from multiprocessing import Pool
+        from sklearn.utils import check_random_state
+        optimizer, kernel = self.optimizer, self.kernel
+        # fit with the initial hyper-parameters to set the training data
+        self.optimizer = None
+        super().fit(X, y)
+        bounds = self.kernel_.bounds
+        if not np.isfinite(bounds).all():
+            self.optimizer = optimizer
+            raise Exception(
+                'Multiple optimizer restarts requires that all bounds '
+                'are finite.')
+        self._rng = check_random_state(self.random_state)
+        initial_thetas = [self.kernel_.theta]+[
+            self._rng.uniform(bounds[:, 0], bounds[:, 1])
+            for ii in range(self.n_restarts_optimizer)]
+        self.optimizer = optimizer
+        with Pool(max_eval_concurrency) as pool:
+            optima = pool.map(
+                partial(_optimize_gaussian_process_hyperparameters, self),
+                initial_thetas)
+        lml_values = [-optimum[1] for optimum in optima]
+        best_theta = optima[np.argmax(lml_values)][0]
+
+        # compute the Cholesky factor at the optimal hyper-parameters
+        self.kernel = self.kernel_.clone_with_theta(best_theta)
+        self.optimizer = None
+        try:
+            super().fit(X, y)
+        finally:
+            self.optimizer, self.kernel = optimizer, kernel
+        self.log_marginal_likelihood_value_ = np.max(lml_values)
+        return self
+
+    def log_marginal_likelihood(self, theta=None, eval_gradient=False,
+                                clone_kernel=True):
+        r"""
+        Compute the log marginal likelihood of the training data.
+
+        The kernel matrix and its gradient with respect to the
+        hyper-parameters are computed from the pairwise squared distances
+        between the training samples in each dimension. These distances are
+        computed once and reused for every evaluation of the likelihood
+        during hyper-parameter optimization. Kernels not supported by
+        :func:`compute_kernel_matrix_and_gradients` are evaluated by sklearn.
+
+        See :meth:`sklearn.gaussian_process.GaussianProcessRegressor.log_marginal_likelihood`
+        """
+        if theta is None:
+            return super().log_marginal_likelihood(
+                theta, eval_gradient, clone_kernel)
 
-    def __call__(self, samples, return_std=False, return_cov=False):
+        if clone_kernel:
+            kernel = self.kernel_.clone_with_theta(theta)
+        else:
+            kernel = self.kernel_
+            kernel.theta = theta
+
+        if getattr(self, '_sq_dists_train_samples', None) is not self.X_train_:
+            self._sq_dists = compute_pairwise_squared_distances_per_dimension(
+                self.X_train_)
+            self._sq_dists_train_samples = self.X_train_
+        K, K_grads = compute_kernel_matrix_and_gradients(
+            kernel, self._sq_dists, eval_gradient)
+        if K is None:
+            return super().log_marginal_likelihood(
+                theta, eval_gradient, clone_kernel)
+
+        K[np.diag_indices_from(K)] += self.alpha
+        try:
+            L = cholesky(K, lower=True, check_finite=False)
+        except np.linalg.LinAlgError:
+            if eval_gradient:
+                return -np.inf, np.zeros_like(theta)
+            return -np.inf
+
+        y_train = self.y_train_
+        if y_train.ndim == 1:
+            y_train = y_train[:, None]
+        alpha = cholesky_solve_linear_system(L, y_train)
+        nsamples = K.shape[0]
+        log_likelihood = (-0.5*np.sum(y_train*alpha) -
+                          y_train.shape[1]*np.log(np.diag(L)).sum() -
+                          y_train.shape[1]*nsamples/2*np.log(2*np.pi))
+        if not eval_gradient:
+            return log_likelihood
+
+        inner_term = alpha.dot(alpha.T)-y_train.shape[1]*\
+            cholesky_solve_linear_system(L, np.eye(nsamples))
+        log_likelihood_gradient = np.array(
+            [0.5*np.sum(inner_term*K_grad) for K_grad in K_grads])
+        return log_likelihood, log_likelihood_gradient
+
+    def __call__(self, samples, return_std=False, return_cov=False,
+                 nsamples_per_batch=None, max_eval_concurrency=1):
         r"""
         A light weight wrapper of sklearn GaussianProcessRegressor.predict
         function. See sklearn documentation for more info. This wrapper
@@ -65,7 +310,22 @@ class GaussianProcess(GaussianProcessRegressor):
         samples : np.ndarray (nvars,nsamples)
             Samples at which to evaluate the GP. Sklearn requires the
             transpose of this matrix, i.e a matrix with size (nsamples,nvars)
+
+        nsamples_per_batch : integer
+            If not None the samples are processed in batches of this size
+            so the memory required is proportional to
+            nsamples_per_batch*ntrain_samples, see
+            :meth:`predict_in_batches`. Cannot be used with return_cov.
+
+        max_eval_concurrency : integer
+            The number of batches evaluated in parallel by a pool of threads.
+            Only used if nsamples_per_batch is not None.
         """
+        if nsamples_per_batch is not None:
+            if return_cov:
+                raise Exception('Cannot use nsamples_per_batch and return_cov')
+            return self.predict_in_batches(
+                samples, nsamples_per_batch, return_std, max_eval_concurrency)
         canonical_samples = self.map_to_canonical_space(samples)
         result = self.predict(canonical_samples.T, return_std, return_cov)
         if type(result) == tuple:
@@ -75,8 +335,80 @@ class GaussianProcess(GaussianProcessRegressor):
                 result = tuple(result)
         return result
 
+    def _predict_batch(self, canonical_samples, return_std):
+        K_trans = self.kernel_(canonical_samples.T, self.X_train_)
+        vals = K_trans.dot(self.alpha_)
+        if vals.ndim == 1:
+            vals = vals[:, None]
+        vals = self._y_train_std*vals + self._y_train_mean
+        if not return_std:
+            return vals, None
+        # the diagonal of K(X,X)-V^TV with V = L^{-1}K(X_train,X)
+        V = solve_triangular(self.L_, K_trans.T, lower=True)
+        variance = self.kernel_.diag(canonical_samples.T)-np.sum(V**2, axis=0)
+        variance = np.maximum(variance, 0)
+        variance = np.outer(variance, np.atleast_1d(self._y_train_std)**2)
+        if variance.shape[1] == 1:
+            variance = variance[:, 0]
+        return vals, np.sqrt(variance)
+
+    def predict_in_batches(self, samples, nsamples_per_batch,
+                           return_std=False, max_eval_concurrency=1):
+        r"""
+        Evaluate the mean and optionally the standard deviation of the GP
+        at a large number of samples by processing the samples in batches.
+
+        Only the cross-covariance between a batch and the training
+        samples is formed. The variance is computed from triangular solves
+        with the Cholesky factor of the kernel matrix of the training data.
+        The covariance between the samples is never formed.
+
+        Parameters
+        ----------
+        samples : np.ndarray (nvars,nsamples)
+            Samples at which to evaluate the GP
+
+        nsamples_per_batch : integer
+            The number of samples in each batch
+
+        return_std : boolean
+            True - return the standard deviation of the GP at each sample
+
+        max_eval_concurrency : integer
+            The number of batches evaluated in parallel. Threads are used
+            because numpy releases the GIL during the linear algebra.
+
+        Returns
+        -------
+        vals : np.ndarray (nsamples,nqoi)
+            The mean of the GP
+
+        std : np.ndarray (nsamples)
+            The standard deviation of the GP. Only returned if return_std 
+            is True. The shape is (nsamples,nqoi) if nqoi > 1
+        """
+        if not hasattr(self, 'X_train_'):
+            raise Exception('The Gaussian process must be fit first')
+        canonical_samples = self.map_to_canonical_space(samples)
+        nsamples = canonical_samples.shape[1]
+        batches = [canonical_samples[:, lb:lb+nsamples_per_batch]
+                   for lb in range(0, nsamples, nsamples_per_batch)]
+        func = partial(self._predict_batch, return_std=return_std)
+        if max_eval_concurrency > 1:
+            from multiprocessing.pool import ThreadPool
+            with ThreadPool(max_eval_concurrency) as pool:
+                results = pool.map(func, batches)
+        else:
+            results = [func(batch) for batch in batches]
+        vals = np.vstack([r[0] for r in results])
+        if not return_std:
+            return vals
+        std = np.concatenate([r[1] for r in results], axis=0)
+        return vals, std
+
     def predict_random_realization(self, samples, rand_noise=1,
-                                   truncated_svd=None, keep_normalized=False):
+                                   truncated_svd=None, keep_normalized=False,
+                                   truncated_cholesky=None):
         """
         Predict values of a random realization of the Gaussian process
         
@@ -109,6 +441,21 @@ class GaussianProcess(GaussianProcessRegressor):
         tol : float
             The contribution to total variance from the truncated singular
             values must not exceed this value.
+
+        truncated_cholesky : dictionary
+           Dictionary containing the following attributes needed to define
+           a low-rank pivoted Cholesky factorization of the covariance
+           matrix. The cost of the factorization is O(nsamples*rank**2)
+           instead of the O(nsamples**3) cost of the SVD. Only one of
+           truncated_svd and truncated_cholesky can be provided.
+
+        max_rank : integer
+            The maximum number of pivots (rank) of the factorization
+
+        tol : float
+            Stop adding pivots when the trace of the residual covariance
+            divided by the trace of the covariance is smaller than this value
+
         Notes
         -----
         This function replaces 
@@ -120,9 +467,17 @@ class GaussianProcess(GaussianProcessRegressor):
         if keep_normalized is True:
             mean = (mean - self._y_train_mean) / self._y_train_std
             cov /=  self._y_train_std**2
+        if truncated_svd is not None and truncated_cholesky is not None:
+            raise Exception(
+                'Only one of truncated_svd and truncated_cholesky can be set')
         # Use SVD because it is more robust than Cholesky
         # L = np.linalg.cholesky(cov)
-        if truncated_svd is None:
+        if truncated_cholesky is not None:
+            max_rank = min(cov.shape[0], truncated_cholesky['max_rank'])
+            L = pivoted_cholesky_decomposition(
+                cov, max_rank, tol=truncated_cholesky.get('tol', 0.),
+                error_on_small_tol=False, econ=True)[0]
+        elif truncated_svd is None:
             U, S, V = np.linalg.svd(cov)
         else:
             from sklearn.decomposition import TruncatedSVD
@@ -135,15 +490,16 @@ class GaussianProcess(GaussianProcessRegressor):
             print('Explained variance', svd.explained_variance_ratio_.sum())
             assert svd.explained_variance_ratio_.sum() >= truncated_svd['tol']
             # print(S.shape, cov.shape)
-        L = U*np.sqrt(S)
+        if truncated_cholesky is None:
+            L = U*np.sqrt(S)
         # create nsamples x nvars then transpose so same samples
         # are produced if this function is called repeatedly with nsamples=1
         if np.isscalar(rand_noise):
             rand_noise = np.random.normal(0, 1, (rand_noise, mean.shape[0])).T
         else:
             assert rand_noise.shape[0] == mean.shape[0]
-        if truncated_svd is not None:
-            rand_noise = rand_noise[:S.shape[0], :]
+        if truncated_svd is not None or truncated_cholesky is not None:
+            rand_noise = rand_noise[:L.shape[1], :]
         vals = mean + L.dot(rand_noise)
         return vals
 
@@ -172,8 +528,15 @@ class RandomGaussianProcessRealizations:
     nvalidation_samples : integer
         The number of samples of the random realization used to compute the
         accuracy of the interpolant.
+
+    truncated_cholesky : dictionary
+        If not None, the realizations at the interpolation and validation
+        samples are drawn using a low-rank pivoted Cholesky factorization
+        of the GP covariance. See
+        :meth:`GaussianProcess.predict_random_realization`
     """
-    def __init__(self, gp, use_cholesky=False, alpha=0):
+    def __init__(self, gp, use_cholesky=False, alpha=0,
+                 truncated_cholesky=None):
         self.gp = gp
         kernel_types = [RBF, Matern]
         # ignore white noise kernel as we want to interpolate the data
@@ -185,6 +548,7 @@ class RandomGaussianProcessRealizations:
         # it is useful to specify alpha different to the one use to invert
         # Kernel marix at training data of gp
         self.alpha = alpha 
+        self.truncated_cholesky = truncated_cholesky
 
     def fit(self, candidate_samples, rand_noise=None,
             ninterpolation_samples=500, nvalidation_samples=100):
@@ -254,7 +618,7 @@ class RandomGaussianProcessRealizations:
         vals = self.gp.predict_random_realization(
             self.gp.map_from_canonical_space(samples),
             rand_noise=rand_noise, truncated_svd=None,
-            keep_normalized=True)
+            keep_normalized=True, truncated_cholesky=self.truncated_cholesky)
         self.train_vals = vals[:self.selected_canonical_samples.shape[1]]
         self.validation_vals = vals[self.selected_canonical_samples.shape[1]:]
         # Entries of the following should be size of alpha when
@@ -290,23 +654,397 @@ class RandomGaussianProcessRealizations:
 
 
 class AdaptiveGaussianProcess(GaussianProcess):
-    def setup(self, func, sampler):
+    def setup(self, func, sampler, hyperparameter_update_interval=1):
+        """
+        Parameters
+        ----------
+        func : callable
+            The function being approximated with signature
+
+            ``func(samples) -> np.ndarray (nsamples, 1)``
+
+        sampler : callable
+            The sampler used to generate the training samples with
+            signature
+
+            ``sampler(num_samples) -> (np.ndarray (nvars, nnew_samples), int)``
+
+        hyperparameter_update_interval : integer
+            The kernel hyper-parameters are optimized every 
+            hyperparameter_update_interval refinements. In between, the 
+            hyper-parameters are frozen and the Cholesky factor of the 
+            kernel matrix is updated in O(n^2) operations when new samples 
+            are added.
+        """
         self.func = func
         self.sampler = sampler
+        self.hyperparameter_update_interval = hyperparameter_update_interval
+        self.nrefinements = 0
+
+    def update(self, new_samples, new_values):
+        r"""
+        Add training data without re-optimizing the kernel hyper-parameters.
+
+        The Cholesky factor :math:`L` of the kernel matrix is updated 
+        with :func:`pyapprox.utilities.update_cholesky_factorization` so the
+        cost is :math:`O(n^2m+m^3)` instead of :math:`O((n+m)^3)`,
+        where :math:`n` and :math:`m` are the number of existing and new 
+        samples respectively.
+
+        Parameters
+        ----------
+        new_samples : np.ndarray (nvars,nnew_samples)
+            The new training samples
+
+        new_values : np.ndarray (nnew_samples,nqoi)
+            The values of the function at the new training samples
+        """
+        if not np.isscalar(self.alpha):
+            raise Exception('update is only supported for scalar alpha')
+        canonical_new_samples = self.map_to_canonical_space(new_samples).T
+        A_12 = self.kernel_(self.X_train_, canonical_new_samples)
+        A_22 = self.kernel_(canonical_new_samples)
+        A_22[np.diag_indices_from(A_22)] += self.alpha
+        self.L_ = update_cholesky_factorization(self.L_, A_12, A_22)
+        self.X_train_ = np.vstack([self.X_train_, canonical_new_samples])
+
+        # undo and redo normalization of the training values
+        train_values = np.vstack([
+            self.y_train_*self._y_train_std+self._y_train_mean,
+            new_values])
+        if self.normalize_y:
+            self._y_train_mean = np.mean(train_values, axis=0)
+            self._y_train_std = np.std(train_values, axis=0)
+        self.y_train_ = (
+            train_values-self._y_train_mean)/self._y_train_std
+        self.alpha_ = cholesky_solve_linear_system(self.L_, self.y_train_)
+
+        # log-marginal likelihood, see Alg. 2.1 of Rasmussen and Williams
+        ntrain_samples = self.X_train_.shape[0]
+        self.log_marginal_likelihood_value_ = np.sum(
+            -0.5*np.sum(self.y_train_*self.alpha_, axis=0) -
+            np.log(np.diag(self.L_)).sum() -
+            ntrain_samples/2*np.log(2*np.pi))
 
     def refine(self, num_samples):
         new_samples, chol_flag = self.sampler(num_samples)
         new_values = self.func(new_samples)
         assert new_values.shape[1] == 1  # must be scalar values QoI
+        optimize_hyperparameters = (
+            self.nrefinements % self.hyperparameter_update_interval == 0)
+        self.nrefinements += 1
+        if hasattr(self, 'X_train_') and not optimize_hyperparameters:
+            self.update(new_samples, new_values)
+            return chol_flag
         if hasattr(self, 'X_train_'):
             train_samples = np.hstack([self.X_train_.T, new_samples])
-            train_values = np.vstack([self.y_train_, new_values])
+            train_values = np.vstack([
+                self.y_train_*self._y_train_std+self._y_train_mean,
+                new_values])
         else:
             train_samples, train_values = new_samples, new_values
         self.fit(train_samples, train_values)
         return chol_flag
 
 
+class SparseGaussianProcess(GaussianProcess):
+    r"""
+    A Gaussian process that uses :math:`m` inducing samples :math:`Z` to
+    approximate the covariance of :math:`n` training samples :math:`X`
+    so that the hyper-parameters can be optimized with :math:`O(nm^2)`
+    operations and :math:`O(nm)` memory.
+
+    The kernel matrix is approximated by
+
+    .. math:: Q+\Lambda, \qquad Q=K(X,Z)K(Z,Z)^{-1}K(Z,X)
+
+    The fully independent training conditional (FITC) approximation uses
+    :math:`\Lambda=\mathrm{diag}(K(X,X)-Q)+\sigma^2I`. The variational free
+    energy (VFE) approximation uses :math:`\Lambda=\sigma^2I` and subtracts
+    :math:`\mathrm{tr}(K(X,X)-Q)/(2\sigma^2)` from the log marginal
+    likelihood. The noise :math:`\sigma^2` is set by alpha.
+
+    The predictive distribution of the sparse GP is the same as that of an
+    exact GP conditioned on pseudo observations at the inducing samples
+    with kernel matrix :math:`A+AC^{-1}A` and values
+    :math:`AC^{-1}K(Z,X)\Lambda^{-1}y` where :math:`A=K(Z,Z)` and
+    :math:`C=K(Z,X)\Lambda^{-1}K(X,Z)`. After fitting, X_train_, y_train_,
+    L_ and alpha_ store this exact GP. Consequently prediction,
+    :func:`integrate_gaussian_process`, :func:`marginalize_gaussian_process`
+    and :func:`compute_expected_sobol_indices` can be used without
+    modification.
+
+    Only kernels supported by :func:`compute_kernel_matrix_and_gradients`
+    are supported. Kernels containing a WhiteKernel are not supported,
+    use alpha instead.
+    """
+    def set_inducing_samples(self, inducing_samples=None, sampler=None,
+                             ninducing_samples=None, nugget=1e-10):
+        r"""
+        Set the inducing samples.
+
+        Parameters
+        ----------
+        inducing_samples : np.ndarray (nvars, ninducing_samples)
+            The inducing samples. Must be None if sampler is not None.
+
+        sampler : :class:`CholeskySampler`
+            A sampler whose pivots are used as the inducing samples. If the
+            kernel of the sampler has not been set, the kernel of the GP
+            is used.
+
+        ninducing_samples : integer
+            The number of inducing samples generated with sampler
+
+        nugget : float
+            A small number added to the diagonal of K(Z,Z) to improve its
+            conditioning
+        """
+        if (inducing_samples is None) == (sampler is None):
+            raise Exception(
+                'Must specify one of inducing_samples and sampler')
+        if sampler is not None and ninducing_samples is None:
+            raise Exception('Must specify ninducing_samples with sampler')
+        self.inducing_samples = inducing_samples
+        self.inducing_sampler = sampler
+        self.ninducing_samples = ninducing_samples
+        self.inducing_nugget = nugget
+
+    def set_approximation(self, approximation):
+        r"""
+        Set the sparse approximation. Must be one of ['fitc', 'vfe'].
+        The default is 'fitc'
+        """
+        if approximation not in ['fitc', 'vfe']:
+            raise Exception(f'Approximation {approximation} not supported')
+        self.approximation = approximation
+
+    def _get_inducing_samples(self):
+        if not hasattr(self, 'inducing_sampler'):
+            raise Exception('Must call set_inducing_samples')
+        if self.inducing_sampler is None:
+            return self.inducing_samples
+        sampler = self.inducing_sampler
+        if not hasattr(sampler, 'kernel'):
+            sampler.set_kernel(self.kernel)
+        if sampler.training_samples.shape[1] < self.ninducing_samples:
+            sampler(self.ninducing_samples)
+        return sampler.training_samples[:, :self.ninducing_samples]
+
+    def fit(self, train_samples, train_values):
+        r"""
+        Fit the sparse Gaussian process.
+
+        Parameters
+        ----------
+        train_samples : np.ndarray (nvars,nsamples)
+            The training samples
+
+        train_values : np.ndarray (nsamples,nqoi)
+            The values of the function at the training samples
+        """
+        from sklearn.base import clone
+        from sklearn.utils import check_random_state
+        if extract_covariance_kernel(self.kernel, [WhiteKernel]) is not None:
+            raise Exception('kernels with noise not supported, use alpha')
+        self.kernel_ = clone(self.kernel)
+        self._rng = check_random_state(self.random_state)
+        self.approximation = getattr(self, 'approximation', 'fitc')
+        if self.approximation == 'vfe' and np.any(self.alpha <= 0):
+            raise Exception('alpha must be positive when using vfe')
+
+        X = self.map_to_canonical_space(train_samples).T
+        y = np.asarray(train_values)
+        if self.normalize_y:
+            self._y_train_mean = np.mean(y, axis=0)
+            self._y_train_std = np.std(y, axis=0)
+            self._y_train_std[self._y_train_std == 0] = 1.
+            y = (y-self._y_train_mean)/self._y_train_std
+        else:
+            shape_y_stats = (y.shape[1],) if y.ndim == 2 else 1
+            self._y_train_mean = np.zeros(shape_y_stats)
+            self._y_train_std = np.ones(shape_y_stats)
+        self.n_features_in_ = X.shape[1]
+        self.X_data_, self.y_data_ = X, y
+
+        Z = self.map_to_canonical_space(self._get_inducing_samples()).T
+        self.inducing_samples_ = Z
+        self._sq_dists_zz = compute_pairwise_squared_distances_per_dimension(
+            Z)
+        self._sq_dists_zx = (Z[:, None, :]-X[None, :, :])**2
+        if self.sparse_kernel_matrices(self.kernel_, False) is None:
+            raise Exception(f'Kernel {self.kernel_} not supported')
+
+        if self.optimizer is not None and self.kernel_.n_dims > 0:
+            def obj_func(theta):
+                lml, grad = self.log_marginal_likelihood(
+                    theta, eval_gradient=True, clone_kernel=False)
+                return -lml, -grad
+
+            bounds = self.kernel_.bounds
+            initial_thetas = [self.kernel_.theta]+[
+                self._rng.uniform(bounds[:, 0], bounds[:, 1])
+                for ii in range(self.n_restarts_optimizer)]
+            optima = [self._constrained_optimization(obj_func, theta, bounds)
+                      for theta in initial_thetas]
+            lml_values = [-optimum[1] for optimum in optima]
+            self.kernel_.theta = optima[np.argmax(lml_values)][0]
+            self.log_marginal_likelihood_value_ = np.max(lml_values)
+        else:
+            self.log_marginal_likelihood_value_ = \
+                self.log_marginal_likelihood(self.kernel_.theta)
+
+        self._set_equivalent_training_data()
+        return self
+
+    def sparse_kernel_matrices(self, kernel, eval_gradient):
+        r"""
+        Evaluate K(Z,Z), K(Z,X) and the diagonal of K(X,X) and optionally
+        their gradients with respect to the log of the hyper-parameters.
+        Returns None if the kernel is not supported.
+        """
+        Kzz, Kzz_grads = compute_kernel_matrix_and_gradients(
+            kernel, self._sq_dists_zz, eval_gradient)
+        if Kzz is None:
+            return None
+        Kzx, Kzx_grads = compute_kernel_matrix_and_gradients(
+            kernel, self._sq_dists_zx, eval_gradient)
+        # the kernels are stationary so the diagonal is constant
+        kdiag, kdiag_grads = compute_kernel_matrix_and_gradients(
+            kernel, np.zeros((1, 1, self._sq_dists_zz.shape[2])),
+            eval_gradient)
+        Kzz[np.diag_indices_from(Kzz)] += self.inducing_nugget
+        return Kzz, Kzx, kdiag[0, 0], Kzz_grads, Kzx_grads, [
+            g[0, 0] for g in kdiag_grads]
+
+    def _sparse_noise_covariance(self, kdiag, qdiag):
+        if self.approximation == 'fitc':
+            return kdiag-qdiag+self.alpha
+        return np.full(qdiag.shape[0], 1.)*self.alpha
+
+    def log_marginal_likelihood(self, theta=None, eval_gradient=False,
+                                clone_kernel=True):
+        r"""
+        Compute the sparse approximation of the log marginal likelihood of
+        the training data with :math:`O(nm^2)` operations.
+
+        See :meth:`sklearn.gaussian_process.GaussianProcessRegressor.log_marginal_likelihood`
+        """
+        if theta is None:
+            if eval_gradient:
+                raise ValueError(
+                    'Gradient can only be evaluated for theta!=None')
+            return self.log_marginal_likelihood_value_
+
+        if clone_kernel:
+            kernel = self.kernel_.clone_with_theta(theta)
+        else:
+            kernel = self.kernel_
+            kernel.theta = theta
+
+        Kzz, Kzx, kdiag, Kzz_grads, Kzx_grads, kdiag_grads = \
+            self.sparse_kernel_matrices(kernel, eval_gradient)
+        y = self.y_data_
+        if y.ndim == 1:
+            y = y[:, None]
+        nqoi, nsamples = y.shape[1], y.shape[0]
+        try:
+            factors = self._factorize_sparse_kernel(Kzz, Kzx, kdiag)
+        except np.linalg.LinAlgError:
+            if eval_gradient:
+                return -np.inf, np.zeros_like(theta)
+            return -np.inf
+        L_zz, L_zz_inv_Kzx, lamda, L_B = factors
+        qdiag = np.sum(L_zz_inv_Kzx**2, axis=0)
+
+        def solve_sigma(rhs):
+            # Sigma = K(Z,Z)+K(Z,X)Lambda^{-1}K(X,Z) = L_zz(I+W W^T)L_zz^T
+            return solve_triangular(L_zz.T, cholesky_solve_linear_system(
+                L_B, solve_triangular(L_zz, rhs, lower=True)), lower=False)
+
+        Kzx_lamda_inv = Kzx/lamda
+        b = Kzx_lamda_inv.dot(y)
+        Sigma_inv_b = solve_sigma(b)
+        log_likelihood = -0.5*(
+            np.sum(y**2/lamda[:, None])-np.sum(b*Sigma_inv_b))
+        log_likelihood -= 0.5*nqoi*(
+            np.log(lamda).sum()+2*np.log(np.diag(L_B)).sum() +
+            nsamples*np.log(2*np.pi))
+        if self.approximation == 'vfe':
+            log_likelihood -= 0.5*nqoi*np.sum((kdiag-qdiag)/self.alpha)
+        if not eval_gradient:
+            return log_likelihood
+
+        # Let S = Q+Lambda. Use d log_likelihood = 0.5*a^T dS a
+        # -0.5*tr(S^{-1}dS), a = S^{-1}y, and the Woodbury identity
+        # S^{-1} = Lambda^{-1}-Lambda^{-1}K(X,Z)Sigma^{-1}K(Z,X)Lambda^{-1}
+        a = (y-Kzx.T.dot(Sigma_inv_b))/lamda[:, None]
+        # V = K(Z,Z)^{-1}K(Z,X)
+        V = solve_triangular(L_zz.T, L_zz_inv_Kzx, lower=False)
+        gamma = V.dot(a)
+        Sigma_inv_Kzx_lamda_inv = solve_sigma(Kzx_lamda_inv)
+        # R = V S^{-1}
+        R = V/lamda-V.dot(Kzx_lamda_inv.T).dot(Sigma_inv_Kzx_lamda_inv)
+        R_Vt = R.dot(V.T)
+        S_inv_diag = 1/lamda-np.sum(
+            Kzx_lamda_inv*Sigma_inv_Kzx_lamda_inv, axis=0)
+        log_likelihood_gradient = np.empty(len(Kzz_grads))
+        for kk in range(len(Kzz_grads)):
+            dKzz, dKzx, dkdiag = Kzz_grads[kk], Kzx_grads[kk], kdiag_grads[kk]
+            # dQ = dK(X,Z)V+V^TdK(Z,X)-V^TdK(Z,Z)V
+            grad = np.sum(gamma*dKzx.dot(a))-0.5*np.sum(gamma*dKzz.dot(gamma))
+            grad -= 0.5*nqoi*(2*np.sum(dKzx*R)-np.sum(R_Vt*dKzz))
+            dqdiag = 2*np.sum(dKzx*V, axis=0)-np.sum(V*dKzz.dot(V), axis=0)
+            if self.approximation == 'fitc':
+                dlamda = dkdiag-dqdiag
+                grad += 0.5*np.sum(a**2*dlamda[:, None])-0.5*nqoi*np.sum(
+                    S_inv_diag*dlamda)
+            else:
+                grad -= 0.5*nqoi*np.sum((dkdiag-dqdiag)/self.alpha)
+            log_likelihood_gradient[kk] = grad
+        return log_likelihood, log_likelihood_gradient
+
+    def _factorize_sparse_kernel(self, Kzz, Kzx, kdiag):
+        L_zz = cholesky(Kzz, lower=True, check_finite=False)
+        L_zz_inv_Kzx = solve_triangular(L_zz, Kzx, lower=True)
+        qdiag = np.sum(L_zz_inv_Kzx**2, axis=0)
+        lamda = self._sparse_noise_covariance(kdiag, qdiag)
+        W = L_zz_inv_Kzx/np.sqrt(lamda)
+        B = W.dot(W.T)
+        B[np.diag_indices_from(B)] += 1
+        L_B = cholesky(B, lower=True, check_finite=False)
+        return L_zz, L_zz_inv_Kzx, lamda, L_B
+
+    def _set_equivalent_training_data(self):
+        Kzz, Kzx, kdiag = self.sparse_kernel_matrices(self.kernel_, False)[:3]
+        L_zz, L_zz_inv_Kzx, lamda, L_B = self._factorize_sparse_kernel(
+            Kzz, Kzx, kdiag)
+        # G = W W^T. The kernel matrix of the pseudo observations
+        # A+AC^{-1}A = L_zz(I+G^{-1})L_zz^T
+        W = L_zz_inv_Kzx/np.sqrt(lamda)
+        G = W.dot(W.T)
+        try:
+            L_G = cholesky(G, lower=True, check_finite=False)
+        except np.linalg.LinAlgError as exc:
+            exc.args = (
+                'The training data does not inform all inducing samples. '
+                'Try reducing the number of inducing samples.',) + exc.args
+            raise
+        H = cholesky_solve_linear_system(L_G, np.eye(G.shape[0]))
+        H = 0.5*(H+H.T)
+        H[np.diag_indices_from(H)] += 1
+        self.L_ = L_zz.dot(cholesky(H, lower=True, check_finite=False))
+        L_zz_inv_b = W.dot(self.y_data_/(
+            np.sqrt(lamda)[:, None] if self.y_data_.ndim == 2 else
+            np.sqrt(lamda)))
+        self.y_train_ = L_zz.dot(
+            cholesky_solve_linear_system(L_G, L_zz_inv_b))
+        self.alpha_ = solve_triangular(L_zz.T, cholesky_solve_linear_system(
+            L_B, L_zz_inv_b), lower=False)
+        self.X_train_ = self.inducing_samples_
+        self._K_inv = None
+
+
 def is_covariance_kernel(kernel, kernel_types):
     return (type(kernel) in kernel_types)
 
@@ -332,20 +1070,46 @@ def gaussian_u(delta, sigma):
     return np.sqrt(delta/(delta+4*sigma**2)).prod()
 
 
-def gaussian_P(train_samples, delta, mu, sigma):
-    nvars, ntrain_samples = train_samples.shape
-    P = np.ones((ntrain_samples, ntrain_samples))
-    for ii in range(nvars):
-        si, mi, di = sigma[ii, 0], mu[ii, 0], delta[ii, 0]
-        denom1 = 4*(di+4*si**2)
-        term2 = np.sqrt(di/(di+4*si**2))
-        for mm in range(ntrain_samples):
-            xm = train_samples[ii, mm]
-            xn = train_samples[ii, mm:]
-            P[mm, mm:] *= np.exp(-1/(2*si**2*di)*(
-                2*si**2*(xm**2+xn**2)+di*mi**2 -
-                (4*si**2*(xm+xn)+2*di*mi)**2/denom1))*term2
-            P[mm:, mm] = P[mm, mm:]
+def _get_row_blocks(nrows, ncols, max_block_entries):
+    """
+    Split the rows of a (nrows, ncols) array into contiguous blocks
+    with at most max_block_entries entries each.
+    """
+    block_size = max(1, min(nrows, max_block_entries//ncols))
+    for lb in range(0, nrows, block_size):
+        yield slice(lb, min(lb+block_size, nrows))
+
+
+def _gaussian_quadratic_form_exp(shifted_samples, alpha, beta,
+                                 max_block_entries):
+    r"""
+    Evaluate the matrix with entries
+
+    .. math:: \exp\left(-\sum_{k=1}^d \alpha_k(z_{km}^2+z_{kn}^2)+
+              \beta_k z_{km}z_{kn}\right)
+
+    The exponent of each block of rows is computed with one matrix-matrix
+    product so no (nrows, nsamples, nvars) array is ever formed.
+    """
+    nsamples = shifted_samples.shape[1]
+    diag = np.sum(alpha*shifted_samples**2, axis=0)
+    beta_samples = beta*shifted_samples
+    result = np.empty((nsamples, nsamples))
+    for rows in _get_row_blocks(nsamples, nsamples, max_block_entries):
+        result[rows] = np.exp(-(
+            diag[rows, np.newaxis]+diag[np.newaxis, :] +
+            shifted_samples[:, rows].T.dot(beta_samples)))
+    return result
+
+
+def gaussian_P(train_samples, delta, mu, sigma, max_block_entries=2**24):
+    # The exponent is a quadratic form in the shifted samples z=x-mu
+    denom = delta*(delta+4*sigma**2)
+    alpha = (delta+2*sigma**2)/denom
+    beta = -4*sigma**2/denom
+    P = _gaussian_quadratic_form_exp(
+        train_samples-mu, alpha, beta, max_block_entries)
+    P *= np.sqrt(delta/(delta+4*sigma**2)).prod()
     return P
 
 
@@ -353,19 +1117,14 @@ def gaussian_nu(delta, sigma):
     return np.sqrt(delta/(delta+8.*sigma**2)).prod()
 
 
-def gaussian_Pi(train_samples, delta, mu, sigma):
-    nvars, ntrain_samples = train_samples.shape
-    Pi = np.ones((ntrain_samples, ntrain_samples))
-    for ii in range(nvars):
-        si, mi, di = sigma[ii, 0], mu[ii, 0], delta[ii, 0]
-        denom1 = (12*si**4+8*di*si**2+di**2)
-        denom2, denom3 = (di+2*si**2), (di+6*si**2)
-        for mm in range(ntrain_samples):
-            xm = train_samples[ii, mm]
-            xn = train_samples[ii, mm:]
-            t1 = 2*(xm-xn)**2/di+3*(-2*mi+xm+xn)**2/denom2+(xm-xn)**2/denom3
-            Pi[mm, mm:] *= np.exp(-t1/6)*np.sqrt(di**2/(denom1))
-            Pi[mm:, mm] = Pi[mm, mm:]
+def gaussian_Pi(train_samples, delta, mu, sigma, max_block_entries=2**24):
+    # exponent is (a*(z_m-z_n)**2+b*(z_m+z_n)**2)/6 with z=x-mu
+    a = 2/delta+1/(delta+6*sigma**2)
+    b = 3/(delta+2*sigma**2)
+    Pi = _gaussian_quadratic_form_exp(
+        train_samples-mu, (a+b)/6, (b-a)/3, max_block_entries)
+    Pi *= np.sqrt(
+        delta**2/(12*sigma**4+8*delta*sigma**2+delta**2)).prod()
     return Pi
 
 
@@ -461,15 +1220,9 @@ def compute_var_of_var_term3(varsigma_sq, kernel_var, eta, v_sq):
 
 
 def gaussian_lamda(train_samples, delta, mu, sigma):
-    nvars = train_samples.shape[0]
-    lamda = 1
-    for ii in range(nvars):
-        xxi, si = train_samples[ii, :], sigma[ii, 0]
-        mi, di = mu[ii, 0], delta[ii, 0]
-        denom1 = 4*si**4+6*di*si**2+di**2
-        t1 = (di+4*si**2)/denom1*(mi-xxi)**2
-        lamda *= di/np.sqrt(denom1)*np.exp(-t1)
-    return lamda
+    denom1 = 4*sigma**4+6*delta*sigma**2+delta**2
+    t1 = (delta+4*sigma**2)/denom1*(mu-train_samples)**2
+    return np.prod(delta/np.sqrt(denom1)*np.exp(-t1), axis=0)
 
 
 def gaussian_xi_1(delta, sigma):
@@ -506,9 +1259,9 @@ def extract_gaussian_process_attributes_for_integration(gp):
         msg += 'Only squared exponential kernel supported'
         raise Exception(msg)
 
-    if gp._K_inv is None:
-        L_inv = solve_triangular(gp.L_.T, np.eye(gp.L_.shape[0]), lower=False)
-        K_inv = L_inv.dot(L_inv.T)
+    if getattr(gp, '_K_inv', None) is None:
+        L_inv = solve_triangular(gp.L_, np.eye(gp.L_.shape[0]), lower=True)
+        K_inv = L_inv.T.dot(L_inv)
     else:
         K_inv = gp._K_inv.copy()
 
@@ -564,41 +1317,25 @@ def integrate_tau_P(xx_1d, ww_1d, xtr, lscale_ii):
 
 
 def integrate_u_lamda_Pi_nu(xx_1d, ww_1d, xtr, lscale_ii):
-    # Get 2D tensor product quadrature rule
-    xx_2d = cartesian_product([xx_1d]*2)
-    ww_2d = outer_product([ww_1d]*2)
-    dists_2d_x1_x2 = (xx_2d[0, :].T/lscale_ii-xx_2d[1, :].T/lscale_ii)**2
-    K = np.exp(-.5*dists_2d_x1_x2)
-    u = ww_2d.dot(K)
-
-    ntrain_samples = xtr.shape[1]
+    # The 2D tensor product quadrature sums factor into products of the
+    # 1D kernel matrices so only matrices with ntrain_samples and
+    # xx_1d.shape[0] rows and columns need to be formed
+    K_qq = np.exp(-.5*(xx_1d[:, np.newaxis]-xx_1d[np.newaxis, :])**2 /
+                  lscale_ii**2)
     dist_func = partial(cdist, metric='sqeuclidean')
-    dists_2d_x1_x2 = (xx_2d[0:1, :].T/lscale_ii-xx_2d[1:2, :].T/lscale_ii)**2
-    dists_2d_x2_xtr = dist_func(xx_2d[1:2, :].T/lscale_ii, xtr.T/lscale_ii)
-    lamda = np.exp(-.5*dists_2d_x1_x2.T-.5*dists_2d_x2_xtr.T).dot(ww_2d)
-
-    dists_2d_x1_xtr = dist_func(xx_2d[0:1, :].T/lscale_ii, xtr.T/lscale_ii)
-    # Pi = np.empty((ntrain_samples, ntrain_samples))
-    # for mm in range(ntrain_samples):
-    #     dists1=dists_2d_x1_xtr[:, mm:mm+1]
-    #     Pi[mm, mm:]= np.exp(
-    #         -.5*dists1-.5*dists_2d_x1_x2-.5*dists_2d_x2_xtr[:, mm:]).T.dot(
-    #             ww_2d)
-    #     Pi[mm:, mm] = Pi[mm, mm:]
-    w = np.exp(-.5*dists_2d_x1_x2[:, 0])*ww_2d
-    Pi = np.exp(-.5*dists_2d_x1_xtr).T.dot(w[:, np.newaxis]*np.exp(
-        -.5*dists_2d_x2_xtr))
-
-    nu = np.exp(-dists_2d_x1_x2)[:, 0].dot(ww_2d)
+    K = np.exp(-.5*dist_func(xx_1d[:, np.newaxis]/lscale_ii, xtr.T/lscale_ii))
+    w_K_qq = ww_1d.dot(K_qq)
+    u = w_K_qq.dot(ww_1d)
+    lamda = (w_K_qq*ww_1d).dot(K)
+    Pi = K.T.dot((ww_1d[:, np.newaxis]*K_qq*ww_1d[np.newaxis, :]).dot(K))
+    nu = ww_1d.dot(K_qq**2).dot(ww_1d)
     return u, lamda, Pi, nu
 
 
 def integrate_xi_1(xx_1d, ww_1d, lscale_ii):
-    xx_3d = cartesian_product([xx_1d]*3)
-    ww_3d = outer_product([ww_1d]*3)
-    dists_3d_x1_x2 = (xx_3d[0, :]/lscale_ii-xx_3d[1, :]/lscale_ii)**2
-    dists_3d_x2_x3 = (xx_3d[1, :]/lscale_ii-xx_3d[2, :]/lscale_ii)**2
-    xi_1 = np.exp(-.5*dists_3d_x1_x2-.5*dists_3d_x2_x3).dot(ww_3d)
+    K_qq = np.exp(-.5*(xx_1d[:, np.newaxis]-xx_1d[np.newaxis, :])**2 /
+                  lscale_ii**2)
+    xi_1 = ww_1d.dot(K_qq.dot(ww_1d)**2)
     return xi_1
 
 
@@ -670,6 +1407,94 @@ def get_gaussian_process_squared_exponential_kernel_1d_integrals(
     return tau_list, P_list, u_list, lamda_list, Pi_list, nu_list, xi_1_list 
 
 
+def get_gaussian_process_squared_exponential_kernel_integrals(
+        X_train, length_scale, variable, transform_quad_rules,
+        nquad_samples=50, skip_xi_1=False, max_block_entries=2**24):
+    """
+    Compute the multivariate integrals of the squared exponential kernel
+    needed to integrate a Gaussian process.
+
+    Unlike :func:`get_gaussian_process_squared_exponential_kernel_1d_integrals`
+    the univariate integrals are multiplied together as they are computed
+    so only one matrix of each type, with shape
+    (ntrain_samples, ntrain_samples), is stored. The integrals with respect
+    to Gaussian marginals are evaluated in closed form for all such
+    dimensions at once. Quadrature is used for all other marginals.
+
+    Parameters
+    ----------
+    max_block_entries : integer
+        The maximum number of entries of the temporary arrays used to
+        evaluate the closed form integrals.
+
+    Returns
+    -------
+    tau, P, u, lamda, Pi, nu, xi_1
+        The products over all dimensions of the integrals returned by
+        :func:`get_gaussian_process_squared_exponential_kernel_1d_integrals`
+    """
+    ntrain_samples = X_train.shape[1]
+    nvars = variable.num_vars()
+    degrees = [nquad_samples]*nvars
+    univariate_quad_rules, pce = get_univariate_quadrature_rules_from_variable(
+        variable, degrees)
+    lscale = np.atleast_1d(length_scale)
+
+    tau, u = np.ones(ntrain_samples), 1
+    P = np.ones((ntrain_samples, ntrain_samples))
+    lamda = np.ones(ntrain_samples)
+    Pi = np.ones((ntrain_samples, ntrain_samples))
+    nu = 1
+    xi_1 = None if skip_xi_1 else 1
+
+    all_variables = variable.all_variables()
+    gaussian_dims, mu, sigma = [], [], []
+    for ii in range(nvars):
+        jj = pce.basis_type_index_map[ii]
+        loc, scale = pce.var_trans.scale_parameters[jj, :]
+        if transform_quad_rules is False:
+            loc, scale = 0, 1
+        if all_variables[ii].dist.name == 'norm':
+            gaussian_dims.append(ii)
+            mu.append(loc)
+            sigma.append(scale)
+            continue
+
+        xtr = X_train[ii:ii+1, :]
+        xx_1d, ww_1d = univariate_quad_rules[ii](degrees[ii]+1)
+        xx_1d = xx_1d*scale+loc
+        tau_ii, P_ii = integrate_tau_P(xx_1d, ww_1d, xtr, lscale[ii])
+        tau *= tau_ii
+        P *= P_ii
+        del P_ii
+        u_ii, lamda_ii, Pi_ii, nu_ii = integrate_u_lamda_Pi_nu(
+            xx_1d, ww_1d, xtr, lscale[ii])
+        u *= u_ii
+        lamda *= lamda_ii
+        Pi *= Pi_ii
+        nu *= nu_ii
+        del Pi_ii
+        if skip_xi_1 is False:
+            xi_1 *= integrate_xi_1(xx_1d, ww_1d, lscale[ii])
+
+    if len(gaussian_dims) > 0:
+        xtr = X_train[gaussian_dims, :]
+        # The closed form expressions use the kernel exp(-dists/delta)
+        delta = 2*lscale[gaussian_dims, np.newaxis]**2
+        mu = np.array(mu)[:, np.newaxis]
+        sigma = np.array(sigma)[:, np.newaxis]
+        tau *= gaussian_tau(xtr, delta, mu, sigma)
+        P *= gaussian_P(xtr, delta, mu, sigma, max_block_entries)
+        u *= gaussian_u(delta, sigma)
+        lamda *= gaussian_lamda(xtr, delta, mu, sigma)
+        Pi *= gaussian_Pi(xtr, delta, mu, sigma, max_block_entries)
+        nu *= gaussian_nu(delta, sigma)
+        if skip_xi_1 is False:
+            xi_1 *= gaussian_xi_1(delta, sigma)
+
+    return tau, P, u, lamda, Pi, nu, xi_1
+
+
 def integrate_gaussian_process_squared_exponential_kernel(
         X_train,
         Y_train,
@@ -680,7 +1505,8 @@ def integrate_gaussian_process_squared_exponential_kernel(
         return_full=False,
         transform_quad_rules=False,
         nquad_samples=50,
-        y_train_mean=0):
+        y_train_mean=0,
+        max_block_entries=2**24):
     r"""
     Compute
 
@@ -732,6 +1558,11 @@ def integrate_gaussian_process_squared_exponential_kernel(
        If true return intermediate quantities used to compute statistics.
        This is only necessary for testing
 
+    max_block_entries : integer
+        The maximum number of entries of the temporary arrays used to
+        compute the integrals of the kernel with respect to Gaussian
+        marginals in closed form
+
     Returns
     -------
     expected_random_mean : float
@@ -750,17 +1581,10 @@ def integrate_gaussian_process_squared_exponential_kernel(
         The variance :math:`v_\Sigma^2` of the Gaussian random variable
         representing the variance :math:`\Sigma`
     """
-    tau_list, P_list, u_list, lamda_list, Pi_list, nu_list, xi_1_list = \
-        get_gaussian_process_squared_exponential_kernel_1d_integrals(
+    tau, P, u, lamda, Pi, nu, xi_1 = \
+        get_gaussian_process_squared_exponential_kernel_integrals(
             X_train, length_scale, variable, transform_quad_rules,
-            nquad_samples)
-    tau = np.prod(np.array(tau_list), axis=0)
-    P = np.prod(np.array(P_list), axis=0)
-    u = np.prod(u_list)
-    lamda = np.prod(np.array(lamda_list), axis=0)
-    Pi = np.prod(np.array(Pi_list), axis=0)
-    nu = np.prod(nu_list)
-    xi_1 = np.prod(xi_1_list)
+            nquad_samples, max_block_entries=max_block_entries)
 
     # K_inv is inv(kernel_var*A). Thus multiply by kernel_var to get
     # Haylock formula
@@ -1699,6 +2523,14 @@ class GreedyVarianceOfMeanSampler(object):
 
     ncandidate_samples : integer
         The number of samples used by the greedy downselection procedure
+
+    Notes
+    -----
+    When econ is True the factors :math:`L^{-1}A_{12}` of all candidates are
+    stored in buffers that are extended by one row each time a pivot is
+    added, instead of being recomputed at every step. The candidates are
+    scored in blocks which can be processed by multiple threads, see
+    :meth:`set_max_eval_concurrency`.
     """
 
     def __init__(self, num_vars, nquad_samples,
@@ -1723,6 +2555,9 @@ class GreedyVarianceOfMeanSampler(object):
         self.compute_cond_nums = compute_cond_nums
         self.init_pivots = None
         self.nugget = nugget
+        self.max_eval_concurrency = 1
+        self.candidate_block_size = 1000
+        self.batch_size = 1
         self.initialize()
         self.best_obj_vals = []
         self.pred_samples = None
@@ -1733,6 +2568,149 @@ class GreedyVarianceOfMeanSampler(object):
         if self.econ is True:
             self.y_1 = np.zeros((0))
             self.candidate_y_2 = np.empty(self.candidate_samples.shape[1])
+        self.initialize_candidate_buffers()
+
+    def set_max_eval_concurrency(self, max_eval_concurrency):
+        """
+        Set the number of threads used to score the candidates.
+
+        Parameters
+        ----------
+        max_eval_concurrency : integer
+            The number of blocks of candidates, with size
+            self.candidate_block_size, processed concurrently
+        """
+        self.max_eval_concurrency = max_eval_concurrency
+
+    def set_candidate_block_size(self, candidate_block_size):
+        """
+        Set the number of candidates scored together. Smaller blocks reduce
+        the size of the temporary arrays used to score the candidates.
+        """
+        self.candidate_block_size = candidate_block_size
+
+    def set_batch_size(self, batch_size):
+        """
+        Set the number of points selected between each evaluation of the
+        objective at all candidates.
+
+        When batch_size > 1 the objective values computed at the start of a
+        batch are used as stale estimates of the reduction in the objective
+        provided by each candidate. The remaining points in the batch are
+        chosen by recomputing the reduction of the candidate with the
+        largest stale estimate until the candidate with the largest
+        estimate has been recomputed (lazy greedy selection). The points
+        chosen are the same as those chosen when batch_size=1 if the
+        reduction provided by each candidate never increases as points are
+        added. The reductions of the greedy objectives can increase, e.g.
+        those of the variance of the mean often do, in which case the
+        points chosen may differ.
+
+        Parameters
+        ----------
+        batch_size : integer
+            The number of points selected before the objective is recomputed
+            at all candidates
+        """
+        if self.econ is False:
+            raise Exception('batch_size > 1 requires econ=True')
+        self.batch_size = batch_size
+
+    def initialize_candidate_buffers(self):
+        ncandidates = self.candidate_samples.shape[1]
+        self.nfactored_pivots = 0
+        self.candidate_L_12 = np.empty((0, ncandidates))
+        self.candidate_schur_diag = None
+        self.stale_obj_reductions = None
+        self.nbatch_pivots = 0
+
+    def _extend_buffer(self, buffer, nrows):
+        """
+        Return a buffer with at least nrows rows containing the entries of
+        buffer. Capacity is doubled so the number of reallocations grows
+        logarithmically with the number of pivots.
+        """
+        if buffer.shape[0] >= nrows:
+            return buffer
+        new_buffer = np.empty(
+            (max(nrows, 2*buffer.shape[0], 16),)+buffer.shape[1:])
+        new_buffer[:buffer.shape[0]] = buffer
+        return new_buffer
+
+    def map_candidate_blocks(self, fun):
+        """
+        Call fun(block) for each contiguous block (slice) of candidates.
+        fun must write its results into preallocated arrays.
+        """
+        ncandidates = self.candidate_samples.shape[1]
+        blocks = [slice(lb, min(lb+self.candidate_block_size, ncandidates))
+                  for lb in range(0, ncandidates, self.candidate_block_size)]
+        if self.max_eval_concurrency > 1 and len(blocks) > 1:
+            from multiprocessing.pool import ThreadPool
+            with ThreadPool(self.max_eval_concurrency) as pool:
+                pool.map(fun, blocks)
+        else:
+            for block in blocks:
+                fun(block)
+
+    def precompute_candidate_factor_rows(self, rows):
+        pass
+
+    def update_candidate_factor_block(self, rows, cols):
+        """
+        Compute the rows of :math:`L^{-1}A_{12}` associated with the pivots
+        indexed by rows for the candidates in cols by forward substitution.
+        """
+        for kk in rows:
+            pivot = self.pivots[kk]
+            self.candidate_L_12[kk, cols] = (
+                self.A[pivot, cols]-self.L[kk, :kk].dot(
+                    self.candidate_L_12[:kk, cols]))/self.L[kk, kk]
+            self.candidate_schur_diag[cols] -= self.candidate_L_12[kk, cols]**2
+
+    def update_candidate_factors(self):
+        npivots = len(self.pivots)
+        if self.nfactored_pivots == npivots:
+            return
+        if self.nfactored_pivots == 0:
+            self.candidate_schur_diag = np.diagonal(self.A).copy()
+        rows = range(self.nfactored_pivots, npivots)
+        self.candidate_L_12 = self._extend_buffer(self.candidate_L_12, npivots)
+        self.precompute_candidate_factor_rows(rows)
+        self.map_candidate_blocks(
+            partial(self.update_candidate_factor_block, rows))
+        self.nfactored_pivots = npivots
+
+    def select_pivot_econ(self):
+        """
+        Return the candidate that minimizes the objective and the value of
+        the objective when that candidate is added to the training samples.
+        """
+        best_obj_val = 0 if len(self.best_obj_vals) == 0 else \
+            self.best_obj_vals[-1]
+        if (self.batch_size == 1 or self.stale_obj_reductions is None or
+                self.nbatch_pivots >= self.batch_size):
+            obj_vals = self.vectorized_objective_vals_econ()
+            pivot = np.argmin(obj_vals)
+            if self.batch_size > 1:
+                self.stale_obj_reductions = best_obj_val-obj_vals
+                self.nbatch_pivots = 1
+            return pivot, obj_vals[pivot]
+
+        reductions = self.stale_obj_reductions
+        reductions[self.pivots] = -np.inf
+        recomputed = np.zeros(reductions.shape[0], dtype=bool)
+        while True:
+            pivot = np.argmax(reductions)
+            if recomputed[pivot] or not np.isfinite(reductions[pivot]):
+                break
+            obj_val = self.objective_econ(pivot)
+            if not np.isfinite(obj_val):
+                obj_val = np.inf
+            reductions[pivot] = best_obj_val-obj_val
+            recomputed[pivot] = True
+        self.nbatch_pivots += 1
+        return pivot, best_obj_val-reductions[pivot]
 
     # def monte_carlo_objective(self, new_sample_index):
     #     train_samples = np.hstack(
@@ -1834,14 +2812,12 @@ class GreedyVarianceOfMeanSampler(object):
             pivot = self.init_pivots[len(self.pivots)]
             obj_val = self.objective_econ(pivot)
         else:
-            training_samples = self.ntraining_samples
-            obj_vals = self.vectorized_objective_vals_econ()
-            pivot = np.argmin(obj_vals)
+            pivot, obj_val = self.select_pivot_econ()
 
-        assert np.isfinite(obj_vals[pivot])
+        assert np.isfinite(obj_val)
 
         if self.L.shape[0] == 0:
-            self.L = np.atleast_2d(self.A[pivot, pivot])
+            self.L = np.atleast_2d(np.sqrt(self.A[pivot, pivot]))
         else:
             A_12 = self.A[self.pivots, pivot:pivot+1]
             L_12 = solve_triangular(self.L, A_12, lower=True)
@@ -1850,6 +2826,7 @@ class GreedyVarianceOfMeanSampler(object):
                 # recompute Cholesky from scratch to make sure roundoff error
                 # is not causing L_22_sq to be negative
                 indices = np.concatenate([self.pivots, [pivot]]).astype(int)
+                self.nfactored_pivots = 0
                 try:
                     self.L = np.linalg.cholesky(
                         self.A[np.ix_(indices, indices)])
@@ -1864,7 +2841,7 @@ class GreedyVarianceOfMeanSampler(object):
         assert np.isfinite(self.candidate_y_2[pivot])
         self.y_1 = np.concatenate([self.y_1, [self.candidate_y_2[pivot]]])
 
-        return pivot, obj_vals[pivot]
+        return pivot, obj_val
 
     def objective_vals_econ(self):
         obj_vals = np.inf*np.ones(self.candidate_samples.shape[1])
@@ -1881,29 +2858,28 @@ class GreedyVarianceOfMeanSampler(object):
             self.candidate_y_2 = self.tau/L
             return -vals
 
-        A_12 = np.atleast_2d(self.A[self.pivots, :])
-        L_12 = solve_triangular(self.L, A_12, lower=True)
-        J = np.where((np.diagonal(self.A)-np.sum(L_12*L_12, axis=0)) <= 0)[0]
-        self.temp = np.diagonal(self.A)-np.sum(L_12*L_12, axis=0)
-        useful_candidates = np.ones(
-            (self.candidate_samples.shape[1]), dtype=bool)
-        useful_candidates[J] = False
-        useful_candidates[self.pivots] = False
-        L_12 = L_12[:, useful_candidates]
-        L_22 = np.sqrt(np.diagonal(self.A)[useful_candidates] - np.sum(
-            L_12*L_12, axis=0))
-        y_2 = (self.tau[useful_candidates]-L_12.T.dot(self.y_1))/L_22
-        self.candidate_y_2[useful_candidates] = y_2
-        self.candidate_y_2[~useful_candidates] = np.inf
-        z_2 = y_2/L_22
-        vals = np.inf*np.ones((self.candidate_samples.shape[1]))
-
-        vals[useful_candidates] = -(
-            self.best_obj_vals[-1] + self.tau[useful_candidates]*z_2 -
-            self.tau[self.pivots].dot(
-                solve_triangular(self.L.T, L_12*z_2, lower=False)))
+        self.update_candidate_factors()
+        vals = np.empty((self.candidate_samples.shape[1]))
+        self.map_candidate_blocks(
+            partial(self._score_candidate_block, vals))
         return vals
 
+    def _score_candidate_block(self, vals, cols):
+        npivots = len(self.pivots)
+        schur_diag = self.candidate_schur_diag[cols]
+        useful_candidates = (schur_diag > 0) & self.active_candidates[cols]
+        L_12 = self.candidate_L_12[:npivots, cols][:, useful_candidates]
+        L_22 = np.sqrt(schur_diag[useful_candidates])
+        # y_1 solves L y_1 = tau[pivots] so
+        # tau[pivots].dot(L^{-T}L_12 z_2) = y_1.dot(L_12 z_2)
+        y_2 = (self.tau[cols][useful_candidates]-L_12.T.dot(self.y_1))/L_22
+        block_y_2 = np.full(schur_diag.shape[0], np.inf)
+        block_y_2[useful_candidates] = y_2
+        self.candidate_y_2[cols] = block_y_2
+        block_vals = np.full(schur_diag.shape[0], np.inf)
+        block_vals[useful_candidates] = self.best_obj_vals[-1]-y_2**2
+        vals[cols] = block_vals
+
     def objective_econ(self, new_sample_index):
         if self.L.shape[0] == 0:
             L = np.sqrt(self.A[new_sample_index, new_sample_index])
@@ -1923,12 +2899,13 @@ class GreedyVarianceOfMeanSampler(object):
         val = -(-self.best_obj_vals[-1] + self.tau[new_sample_index]*z_2 -
                 self.tau[self.pivots].dot(
                     solve_triangular(self.L.T, L_12*z_2, lower=False)))
-        return val[0, 0]
+        return val[0]
 
     def compute_A(self):
         self.active_candidates = np.ones(
             self.candidate_samples.shape[1], dtype=bool)
         self.A = self.kernel(self.candidate_samples.T, self.candidate_samples.T)
+        self.initialize_candidate_buffers()
 
     def set_kernel(self, kernel, kernels_1d=None):
         self.kernel = kernel
@@ -2073,6 +3050,16 @@ class GreedyIntegratedVarianceSampler(GreedyVarianceOfMeanSampler):
         self.L = np.zeros((0, 0))
         self.L_inv = np.zeros((0, 0))
         self.A_inv = np.zeros((0, 0))
+        self.initialize_candidate_buffers()
+
+    def initialize_candidate_buffers(self):
+        super().initialize_candidate_buffers()
+        ncandidates = self.candidate_samples.shape[1]
+        # L^{-1}P[pivots, :]
+        self.candidate_L_inv_P_12 = np.empty((0, ncandidates))
+        # M L^{-1}A[pivots, :] with M = L^{-1}P[pivots, pivots]L^{-T}
+        self.candidate_M_L_12 = np.empty((0, ncandidates))
+        self.M = np.empty((0, 0))
 
     def precompute_monte_carlo(self):
         self.pred_samples = self.generate_random_samples(
@@ -2147,48 +3134,72 @@ class GreedyIntegratedVarianceSampler(GreedyVarianceOfMeanSampler):
                 2*np.sum(C.T/L_22*P_12) + 1/L_22**2*P_22)
         return val[0, 0]
 
+    def precompute_candidate_factor_rows(self, rows):
+        npivots = len(self.pivots)
+        self.candidate_L_inv_P_12 = self._extend_buffer(
+            self.candidate_L_inv_P_12, npivots)
+        self.candidate_M_L_12 = self._extend_buffer(
+            self.candidate_M_L_12, npivots)
+        M = np.empty((npivots, npivots))
+        M[:rows.start, :rows.start] = self.M[:rows.start, :rows.start]
+        P_11 = self.P[np.ix_(self.pivots, self.pivots)]
+        for kk in rows:
+            # the leading block of L^{-1} does not change when a pivot is
+            # added so only the last row and column of M must be computed
+            M[:kk+1, kk] = self.L_inv[:kk+1, :kk+1].dot(
+                P_11[:kk+1, :kk+1].dot(self.L_inv[kk, :kk+1]))
+            M[kk, :kk+1] = M[:kk+1, kk]
+        self.M = M
+
+    def update_candidate_factor_block(self, rows, cols):
+        super().update_candidate_factor_block(rows, cols)
+        for kk in rows:
+            self.candidate_L_inv_P_12[kk, cols] = self.L_inv[kk, :kk+1].dot(
+                self.P[self.pivots[:kk+1], cols])
+            L_12_kk = self.candidate_L_12[kk, cols]
+            self.candidate_M_L_12[:kk, cols] += np.outer(
+                self.M[:kk, kk], L_12_kk)
+            self.candidate_M_L_12[kk, cols] = self.M[kk, :kk].dot(
+                self.candidate_L_12[:kk, cols])+self.M[kk, kk]*L_12_kk
+
     def vectorized_objective_vals_econ(self):
         if self.L_inv.shape[0] == 0:
             vals = np.diagonal(self.P)/np.diagonal(self.A)
             return -vals
 
-        A_12 = np.atleast_2d(self.A[self.pivots, :])
-        L_12 = solve_triangular(self.L, A_12, lower=True)
-        J = np.where((np.diagonal(self.A)-np.sum(L_12*L_12, axis=0)) <= 0)[0]
-        self.temp = np.diagonal(self.A)-np.sum(L_12*L_12, axis=0)
-        useful_candidates = np.ones(
-            (self.candidate_samples.shape[1]), dtype=bool)
-        useful_candidates[J] = False
-        useful_candidates[self.pivots] = False
-        L_12 = L_12[:, useful_candidates]
-        L_22 = np.sqrt(np.diagonal(self.A)[useful_candidates] - np.sum(
-            L_12*L_12, axis=0))
-
-        P_11 = self.P[np.ix_(self.pivots, self.pivots)]
-        P_12 = self.P[np.ix_(self.pivots, useful_candidates)]
-        P_22 = np.diagonal(self.P)[useful_candidates]
-
-        C = -np.dot((L_12/L_22).T, self.L_inv)
-        vals = np.inf*np.ones((self.candidate_samples.shape[1]))
-
-        vals[useful_candidates] = -(
-            -self.best_obj_vals[-1] +
-            np.sum(C.T*P_11.dot(C.T), axis=0) +
-            2*np.sum(C.T/L_22*P_12, axis=0) + 1/L_22**2*P_22)
-
+        self.update_candidate_factors()
+        vals = np.empty((self.candidate_samples.shape[1]))
+        self.map_candidate_blocks(
+            partial(self._score_candidate_block, vals))
         return vals
 
+    def _score_candidate_block(self, vals, cols):
+        npivots = len(self.pivots)
+        schur_diag = self.candidate_schur_diag[cols]
+        useful_candidates = (schur_diag > 0) & self.active_candidates[cols]
+        L_12 = self.candidate_L_12[:npivots, cols][:, useful_candidates]
+        M_L_12 = self.candidate_M_L_12[:npivots, cols][:, useful_candidates]
+        L_inv_P_12 = self.candidate_L_inv_P_12[:npivots, cols][
+            :, useful_candidates]
+        P_22 = np.diagonal(self.P)[cols][useful_candidates]
+        # With C = -(L_12/L_22).T L^{-1}
+        # C P_11 C.T = L_12.T M L_12/L_22**2 and
+        # C P_12/L_22 = -L_12.T L^{-1} P_12/L_22**2
+        block_vals = np.full(schur_diag.shape[0], np.inf)
+        block_vals[useful_candidates] = -(
+            -self.best_obj_vals[-1] + (
+                np.sum(L_12*M_L_12, axis=0) -
+                2*np.sum(L_12*L_inv_P_12, axis=0) + P_22) /
+            schur_diag[useful_candidates])
+        vals[cols] = block_vals
+
     def refine_econ(self):
         if (self.init_pivots is not None and
                 len(self.pivots) < len(self.init_pivots)):
             pivot = self.init_pivots[len(self.pivots)]
             obj_val = self.objective_econ(pivot)
         else:
-            training_samples = self.ntraining_samples
-            obj_vals = self.vectorized_objective_vals_econ()
-            # obj_vals = self.objective_vals_econ()
-            pivot = np.argmin(obj_vals)
-            obj_val = obj_vals[pivot]
+            pivot, obj_val = self.select_pivot_econ()
 
         if not np.isfinite(obj_val):  # or obj_val < -1:
             # ill conditioning causes obj_val to go below -1 which should not
@@ -2196,8 +3207,8 @@ class GreedyIntegratedVarianceSampler(GreedyVarianceOfMeanSampler):
             return -1, np.inf
 
         if self.L_inv.shape[0] == 0:
-            self.L = np.atleast_2d(self.A[pivot, pivot])
-            self.L_inv = np.atleast_2d(1/self.A[pivot, pivot])
+            self.L = np.atleast_2d(np.sqrt(self.A[pivot, pivot]))
+            self.L_inv = np.atleast_2d(1/self.L[0, 0])
             return pivot, obj_val
 
         A_12 = self.A[self.pivots, pivot:pivot+1]
@@ -2207,6 +3218,7 @@ class GreedyIntegratedVarianceSampler(GreedyVarianceOfMeanSampler):
             # recompute Cholesky from scratch to make sure roundoff error
             # is not causing L_22_sq to be negative
             indices = np.concatenate([self.pivots, [pivot]]).astype(int)
+            self.nfactored_pivots = 0
             try:
                 self.L = np.linalg.cholesky(self.A[np.ix_(indices, indices)])
             except:
@@ -2360,17 +3372,11 @@ def marginalize_gaussian_process(gp, variable, center=True):
 
 
 def compute_conditional_P(xx_1d, ww_1d, xtr, lscale_ii):
-    # Get 2D tensor product quadrature rule
-    xx_2d = cartesian_product([xx_1d]*2)
-    ww_2d = outer_product([ww_1d]*2)
+    # The double integral factors into the outer product of the single
+    # integrals tau
+    tau = integrate_tau_P(xx_1d, ww_1d, xtr, lscale_ii)[0]
+    return np.outer(tau, tau)
 
-    ntrain_samples = xtr.shape[1]
-    dist_func = partial(cdist, metric='sqeuclidean')
-    dists_2d_x2_xtr = dist_func(xx_2d[1:2, :].T/lscale_ii, xtr.T/lscale_ii)
-    dists_2d_x1_xtr = dist_func(xx_2d[0:1, :].T/lscale_ii, xtr.T/lscale_ii)
-    P = np.exp(-.5*dists_2d_x1_xtr).T.dot(ww_2d[:, np.newaxis]*np.exp(
-        -.5*dists_2d_x2_xtr))
-    return P
 
 def compute_expected_sobol_indices(gp, variable, interaction_terms,
                                    nquad_samples=50):
@@ -2388,117 +3394,208 @@ def compute_expected_sobol_indices(gp, variable, interaction_terms,
         K_inv, lscale, kernel_var, transform_quad_rules, gp._y_train_mean)
     return result
 
-def _compute_expected_sobol_indices(
-        gp, variable, interaction_terms, nquad_samples, x_train, y_train,
-        K_inv, lscale, kernel_var, transform_quad_rules, y_train_mean=0):
-    assert np.isscalar(y_train_mean) or y_train_mean.shape == (1,)
-    tau_list, P_list, u_list, lamda_list, Pi_list, nu_list, _  = \
-        get_gaussian_process_squared_exponential_kernel_1d_integrals(
-            x_train, lscale, variable, transform_quad_rules,
-            nquad_samples=nquad_samples, skip_xi_1=True)
 
-    ntrain_samples = x_train.shape[1]
-    nvars = variable.num_vars()
-    degrees = [nquad_samples]*nvars
-    univariate_quad_rules, pce = get_univariate_quadrature_rules_from_variable(
-        variable, degrees)
+class GaussianProcessSobolIntegrals(object):
+    r"""
+    Cache the univariate integrals of the squared exponential kernel needed
+    to compute the expected Sobol indices of a Gaussian process.
 
-    P_mod_list = []
-    for ii in range(nvars):
-        # Training samples of ith variable
-        xtr = x_train[ii:ii+1, :]
-        xx_1d, ww_1d = univariate_quad_rules[ii](degrees[ii]+1)
-        if transform_quad_rules is True:
-            jj = pce.basis_type_index_map[ii]
-            loc, scale = pce.var_trans.scale_parameters[jj, :]
-            xx_1d = xx_1d*scale+loc
-        P_mod_list.append(compute_conditional_P(xx_1d, ww_1d, xtr, lscale[ii]))
+    The expected variance of the conditional expectation of the GP with
+    respect to the variables in an interaction term :math:`\mathcal{I}`
+    depends on the matrix
 
-    A_inv = K_inv*kernel_var
-    # print('cond num', np.linalg.cond(A_inv))
-    tau = np.prod(np.array(tau_list), axis=0)
-    u = np.prod(np.array(u_list), axis=0)
-    varpi = compute_varpi(tau, A_inv)
-    varsigma_sq = compute_varsigma_sq(u, varpi)
-    P = np.prod(np.array(P_list), axis=0)
-    A_inv_P = A_inv.dot(P)
-    v_sq = compute_v_sq(A_inv, P)
+    .. math:: P_\mathcal{I} = \prod_{i\in\mathcal{I}}P_i\circ
+              \prod_{i\notin\mathcal{I}}\tau_i\tau_i^T
 
-    A_inv_y = A_inv.dot(y_train)
-    expected_random_mean = tau.dot(A_inv_y)
-    expected_random_mean += y_train_mean
-    variance_random_mean = np.empty_like(expected_random_mean)
-    expected_random_var = np.empty_like(expected_random_mean)
-    for ii in range(y_train.shape[1]):
-        variance_random_mean[ii] = variance_of_mean(kernel_var, varsigma_sq)
-        zeta_ii = compute_zeta_econ(
-            y_train[:, ii:ii+1], A_inv_y[:, ii:ii+1], A_inv_P)
-        zeta_ii += 2*tau.dot(A_inv_y[:, ii:ii+1])*y_train_mean+y_train_mean**2
-        expected_random_var[ii] = mean_of_variance(
-            zeta_ii, v_sq, kernel_var, expected_random_mean[ii],
-            variance_random_mean[ii])
-
-    assert interaction_terms.max() == 1
-    # add indices need to compute main effects. These may already be
-    # in interaction terms but cost of recomputing them is negligible
-    # and avoids extra book keeping
-    total_effect_interaction_terms = np.ones((nvars, nvars))-np.eye(nvars)
-    myinteraction_terms = np.hstack(
-        (interaction_terms, total_effect_interaction_terms))
-    unnormalized_interaction_values = np.empty(
-        (myinteraction_terms.shape[1], y_train.shape[1]))
-    for jj in range(myinteraction_terms.shape[1]):
-        index = myinteraction_terms[:, jj]
-        P_p, U_p = 1, 1
-        for ii in range(nvars):
-            if index[ii] == 1:
-                P_p *= P_list[ii]
-                U_p *= 1
-            else:
-                P_p *= P_mod_list[ii]
-                U_p *= u_list[ii]
-        trace_A_inv_Pp = np.sum(A_inv*P_p)# U_p-np.trace(A_inv.dot(P_p))
-        for ii in range(y_train.shape[1]):
-            v_sq_ii = U_p-trace_A_inv_Pp
-            zeta_ii = A_inv_y[:, ii:ii+1].T.dot(P_p.dot(A_inv_y[:, ii:ii+1]))
-            zeta_ii += 2*tau.dot(A_inv_y[:, ii:ii+1])*y_train_mean+\
-                y_train_mean**2
-            unnormalized_interaction_values[jj, ii] = mean_of_variance(
-                zeta_ii, v_sq_ii, kernel_var, expected_random_mean[ii],
-                variance_random_mean[ii])
-    unnormalized_total_effect_values = \
-        unnormalized_interaction_values[interaction_terms.shape[1]:]
-    unnormalized_interaction_values = \
-        unnormalized_interaction_values[:interaction_terms.shape[1]]
-
-    I = argsort_indices_leixographically(interaction_terms)
-    from itertools import combinations
-    unnormalized_sobol_indices = unnormalized_interaction_values.copy()
-    sobol_indices_dict = dict()
-    for ii in range(I.shape[0]):
-        index = interaction_terms[:, I[ii]]
-        active_vars = np.where(index>0)[0]
-        nactive_vars = index.sum()
-        sobol_indices_dict[tuple(active_vars)] = I[ii]
-        if nactive_vars > 1:
-            for jj in range(nactive_vars-1):
-                indices = combinations(active_vars, jj+1)
-                for key in indices:
-                    unnormalized_sobol_indices[I[ii]] -= \
-                        unnormalized_sobol_indices[sobol_indices_dict[key]]
-
-    return unnormalized_sobol_indices/expected_random_var, \
-        1-unnormalized_total_effect_values/expected_random_var, \
-        expected_random_mean, expected_random_var
+    where :math:`\circ` denotes the elementwise product. The univariate
+    matrices :math:`P_i` and vectors :math:`\tau_i` are computed once so the
+    statistics of any interaction term can be assembled from elementwise
+    products without further quadrature. The rank-one factors are never
+    formed explicitly.
+
+    Parameters
+    ----------
+    y_train : np.ndarray (ntrain_samples, nqoi)
+        The training values. Each column can be the values of a different
+        realization of the GP at the training samples.
+
+    See :func:`integrate_gaussian_process_squared_exponential_kernel` for
+    a description of the remaining parameters.
+    """
+    def __init__(self, variable, x_train, y_train, K_inv, length_scale,
+                 kernel_var, transform_quad_rules, y_train_mean=0,
+                 nquad_samples=50):
+        assert np.isscalar(y_train_mean) or y_train_mean.shape == (1,)
+        self.nvars = variable.num_vars()
+        self.kernel_var = kernel_var
+        self.y_train_mean = y_train_mean
+        self.compute_univariate_integrals(
+            variable, x_train, length_scale, transform_quad_rules,
+            nquad_samples)
+
+        self.A_inv = K_inv*kernel_var
+        self.A_inv_y = self.A_inv.dot(y_train)
+        tau = np.prod(self.tau_list, axis=0)
+        self.tau_A_inv_y = tau.dot(self.A_inv_y)
+        self.expected_random_mean = self.tau_A_inv_y+y_train_mean
+        varsigma_sq = compute_varsigma_sq(
+            np.prod(self.u_list), compute_varpi(tau, self.A_inv))
+        self.variance_random_mean = np.full(
+            self.expected_random_mean.shape,
+            variance_of_mean(kernel_var, varsigma_sq))
+        self.expected_random_var = self.expected_variance(
+            np.arange(self.nvars), self.product_of_P(np.arange(self.nvars)))
+
+    def compute_univariate_integrals(self, variable, x_train, length_scale,
+                                     transform_quad_rules, nquad_samples):
+        degrees = [nquad_samples]*self.nvars
+        univariate_quad_rules, pce = \
+            get_univariate_quadrature_rules_from_variable(variable, degrees)
+        lscale = np.atleast_1d(length_scale)
+        self.tau_list, self.P_list, self.u_list = [], [], []
+        for ii in range(self.nvars):
+            xx_1d, ww_1d = univariate_quad_rules[ii](degrees[ii]+1)
+            if transform_quad_rules is True:
+                jj = pce.basis_type_index_map[ii]
+                loc, scale = pce.var_trans.scale_parameters[jj, :]
+                xx_1d = xx_1d*scale+loc
+            tau_ii, P_ii = integrate_tau_P(
+                xx_1d, ww_1d, x_train[ii:ii+1, :], lscale[ii])
+            K_qq = np.exp(-.5*(xx_1d[:, np.newaxis]-xx_1d[np.newaxis, :])**2 /
+                          lscale[ii]**2)
+            self.tau_list.append(tau_ii)
+            self.P_list.append(P_ii)
+            self.u_list.append(ww_1d.dot(K_qq).dot(ww_1d))
+        self.tau_list = np.array(self.tau_list)
+
+    def product_of_P(self, active_vars):
+        P_p = self.P_list[active_vars[0]]
+        for ii in active_vars[1:]:
+            P_p = P_p*self.P_list[ii]
+        return P_p
+
+    def expected_variance(self, active_vars, P_p):
+        """
+        Return the expected variance of the conditional expectation of the
+        GP given the active variables. P_p must be the product of the
+        matrices P_i of the active variables.
+        """
+        inactive_vars = np.setdiff1d(np.arange(self.nvars), active_vars)
+        tau_p = np.prod(self.tau_list[inactive_vars], axis=0)
+        U_p = np.prod([self.u_list[ii] for ii in inactive_vars])
+        # A_inv_y.T (P_p o tau_p tau_p^T) A_inv_y with rank one factor
+        # absorbed into A_inv_y
+        tau_A_inv_y = tau_p[:, np.newaxis]*self.A_inv_y
+        zeta = np.sum(tau_A_inv_y*P_p.dot(tau_A_inv_y), axis=0)
+        zeta += 2*self.tau_A_inv_y*self.y_train_mean+self.y_train_mean**2
+        v_sq = U_p-tau_p.dot((self.A_inv*P_p).dot(tau_p))
+        return mean_of_variance(
+            zeta, v_sq, self.kernel_var, self.expected_random_mean,
+            self.variance_random_mean)
+
+    def _all_but_one_products(self, indices, partial_product):
+        """
+        Yield (index, product of P_i over all i except index) using
+        divide and conquer so only O(log(nvars)) products are stored.
+        """
+        if len(indices) == 1:
+            yield indices[0], partial_product
+            return
+        mid = len(indices)//2
+        for left, right in [(indices[:mid], indices[mid:]),
+                            (indices[mid:], indices[:mid])]:
+            product = self.product_of_P(right)
+            if partial_product is not None:
+                product = product*partial_product
+            yield from self._all_but_one_products(left, product)
+
+    def total_effect_variances(self):
+        """
+        Return the expected variance of the conditional expectation of the
+        GP given all variables but one, for each variable.
+        """
+        values = np.empty((self.nvars,)+self.expected_random_mean.shape)
+        if self.nvars == 1:
+            values[0] = self.expected_variance(
+                [], np.ones_like(self.P_list[0]))
+            return values
+        for ii, P_p in self._all_but_one_products(
+                np.arange(self.nvars), None):
+            active_vars = np.delete(np.arange(self.nvars), ii)
+            values[ii] = self.expected_variance(active_vars, P_p)
+        return values
+
+    def interaction_variances(self, interaction_terms):
+        values = np.empty(
+            (interaction_terms.shape[1],)+self.expected_random_mean.shape)
+        for jj in range(interaction_terms.shape[1]):
+            active_vars = np.where(interaction_terms[:, jj] == 1)[0]
+            values[jj] = self.expected_variance(
+                active_vars, self.product_of_P(active_vars))
+        return values
+
+    def __call__(self, interaction_terms):
+        """
+        Compute the expected Sobol indices.
+
+        Returns
+        -------
+        sobol_indices : np.ndarray (nterms, nqoi)
+            The Sobol indices of each interaction term
+
+        total_effects : np.ndarray (nvars, nqoi)
+            The total effect indices of each variable
+
+        expected_random_mean : np.ndarray (nqoi)
+            The expected value of the mean of the GP
+
+        expected_random_var : np.ndarray (nqoi)
+            The expected value of the variance of the GP
+        """
+        assert interaction_terms.max() == 1
+        unnormalized_interaction_values = self.interaction_variances(
+            interaction_terms)
+        unnormalized_total_effect_values = self.total_effect_variances()
+
+        I = argsort_indices_leixographically(interaction_terms)
+        from itertools import combinations
+        unnormalized_sobol_indices = unnormalized_interaction_values.copy()
+        sobol_indices_dict = dict()
+        for ii in range(I.shape[0]):
+            index = interaction_terms[:, I[ii]]
+            active_vars = np.where(index>0)[0]
+            nactive_vars = index.sum()
+            sobol_indices_dict[tuple(active_vars)] = I[ii]
+            if nactive_vars > 1:
+                for jj in range(nactive_vars-1):
+                    indices = combinations(active_vars, jj+1)
+                    for key in indices:
+                        unnormalized_sobol_indices[I[ii]] -= \
+                            unnormalized_sobol_indices[sobol_indices_dict[key]]
+
+        expected_random_var = self.expected_random_var
+        return unnormalized_sobol_indices/expected_random_var, \
+            1-unnormalized_total_effect_values/expected_random_var, \
+            self.expected_random_mean, expected_random_var
+
+
+def _compute_expected_sobol_indices(
+        gp, variable, interaction_terms, nquad_samples, x_train, y_train,
+        K_inv, lscale, kernel_var, transform_quad_rules, y_train_mean=0):
+    integrals = GaussianProcessSobolIntegrals(
+        variable, x_train, y_train, K_inv, lscale, kernel_var,
+        transform_quad_rules, y_train_mean, nquad_samples)
+    return integrals(interaction_terms)
 
 
 def generate_gp_realizations(gp, ngp_realizations, ninterpolation_samples, 
                              nvalidation_samples, ncandidate_samples,
-                             variable, use_cholesky=True, alpha=0):
+                             variable, use_cholesky=True, alpha=0,
+                             truncated_cholesky=None):
     rand_noise = np.random.normal(
         0, 1, (ngp_realizations, ninterpolation_samples+nvalidation_samples)).T
-    gp_realizations = RandomGaussianProcessRealizations(gp, use_cholesky,
-                                                        alpha)
+    gp_realizations = RandomGaussianProcessRealizations(
+        gp, use_cholesky, alpha, truncated_cholesky)
     if use_cholesky is True:
         generate_random_samples = partial(
             generate_independent_random_samples, variable)
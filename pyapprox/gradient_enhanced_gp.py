@@ -207,6 +207,49 @@ def full_kernel(XX1,length_scale,n_XX_func,XX2=None,return_code='full'):
         K = np.vstack((K1,K2))
     return K
 
+def full_kernel_gradient(XX1,length_scale,n_XX_func,return_code='full'):
+    r"""
+    Compute the gradient of full_kernel(XX1,length_scale,n_XX_func) with
+    respect to the log of the length scales.
+
+    Every entry of the kernel is the Gaussian kernel K(x,x^*) multiplied by
+    a factor that depends on the directions of the derivatives associated
+    with the row and column. Differentiating K(x,x^*) with respect to
+    log(l_i) gives w_i(x_i-x_i^*)^2K(x,x^*). Each first derivative in
+    direction i multiplies K(x,x^*) by a factor proportional to w_i whose
+    derivative with respect to log(l_i) is -2w_i. The second derivative
+    w_i(1-w_i(x_i-x_i^*)^2) has derivative -2w_i(1-2w_i(x_i-x_i^*)^2).
+
+    Returns
+    -------
+    grad : np.ndarray (nsamples,nsamples,nvars)
+        The gradient of the kernel
+    """
+    nsamples, nvars = XX1.shape
+    length_scale = np.atleast_1d(length_scale)*np.ones(nvars)
+    w = 1./length_scale**2
+    K = full_kernel(XX1,length_scale,n_XX_func,return_code=return_code)
+    # the direction of the derivative associated with each row (-1 if none)
+    if return_code=='values':
+        directions = -np.ones(nsamples,dtype=int)
+    elif return_code=='derivs':
+        directions = np.repeat(np.arange(nvars),nsamples//nvars)
+    else:
+        directions = np.hstack(
+            (-np.ones(n_XX_func,dtype=int),
+             np.repeat(np.arange(nvars),(nsamples-n_XX_func)//nvars)))
+    sq_dists = (XX1[:,np.newaxis,:]-XX1[np.newaxis,:,:])**2
+    K_ff = np.exp(-.5*np.sum(sq_dists*w,axis=2))
+    grad = K[:,:,np.newaxis]*sq_dists*w
+    for ii in range(nvars):
+        idx = np.where(directions==ii)[0]
+        grad[idx,:,ii] -= 2*K[idx,:]
+        grad[:,idx,ii] -= 2*K[:,idx]
+        # correct the entries of the second derivatives in direction ii
+        grad[idx[:,np.newaxis],idx[np.newaxis,:],ii] += 2*w[ii]*K_ff[
+            idx[:,np.newaxis],idx[np.newaxis,:]]
+    return grad
+
 class DerivGPKernel(StationaryKernelMixin, NormalizedKernelMixin, Kernel):
     def __init__(self, n_XX_func, length_scale=[1.0],
                  length_scale_bounds=(1e-5, 1e5)):
@@ -259,7 +302,6 @@ class DerivGPKernel(StationaryKernelMixin, NormalizedKernelMixin, Kernel):
                     "Gradient can only be evaluated when XX2 is None.")
             K = full_kernel(XX1,length_scale,self.n_XX_func,XX2,
                             self.return_code)
-        print(K.shape,'KK')
         if not eval_gradient:
             return K
             
@@ -267,12 +309,12 @@ class DerivGPKernel(StationaryKernelMixin, NormalizedKernelMixin, Kernel):
             # Hyperparameter l kept fixed
             length_scale_gradient = np.empty((K.shape[0], K.shape[1], 0))
         else:
-            # approximate gradient numerically
-            def f(gamma):  # helper function
-                return full_kernel(XX1,gamma,self.n_XX_func,
-                                   return_code=self.return_code)
-            length_scale = np.atleast_1d(length_scale)
-            length_scale_gradient = _approx_fprime(length_scale, f, 1e-8)
+            # gradient with respect to the log of the length scales
+            length_scale_gradient = full_kernel_gradient(
+                XX1,length_scale,self.n_XX_func,self.return_code)
+            if not self.anisotropic:
+                length_scale_gradient = length_scale_gradient.sum(
+                    axis=2)[:,:,np.newaxis]
         return K, length_scale_gradient
 
     def values_kernel(self,XX1,XX2):
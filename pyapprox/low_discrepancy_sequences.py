@@ -1,5 +1,6 @@
 import numpy as np
-from numba import njit
+from functools import lru_cache
+from abc import ABC, abstractmethod
 
 from pyapprox.utilities import get_first_n_primes
 from pyapprox.sys_utilities import trace_error_with_msg
@@ -17,27 +18,25 @@ def halton_sequence(num_vars, index1, index2):
     except Exception as e:
         trace_error_with_msg('halton_sequence extension failed', e)
 
-    return __halton_sequence(num_vars, index1, index2)
+    return __halton_sequence(primes, index1, index2)
 
 
-@njit(cache=True)
-def __halton_sequence(num_vars, index1, index2):
+def __halton_sequence(primes, index1, index2):
+    """
+    Compute the Halton sequence by extracting the digits of all sample 
+    indices, in the base of each prime, at once.
+    """
+    num_vars = primes.shape[0]
     num_samples = index2-index1
     sequence = np.zeros((num_vars, num_samples))
-    ones = np.ones(num_vars)
-
-    kk = 0
-    for ii in range(index1, index2):
-        ff = ii*ones
-        prime_inv = 1./primes
-        summand = ii*num_vars
-        while summand > 0:
-            remainder = np.remainder(ff, primes)
-            sequence[:, kk] += remainder*prime_inv
-            prime_inv /= primes
-            ff = ff//primes
-            summand = ff.sum()
-        kk += 1
+    indices = np.arange(index1, index2, dtype=np.int64)
+    for dd in range(num_vars):
+        ff = indices.copy()
+        prime_inv = 1./primes[dd]
+        while np.any(ff > 0):
+            sequence[dd, :] += np.remainder(ff, primes[dd])*prime_inv
+            prime_inv /= primes[dd]
+            ff //= primes[dd]
     return sequence
 
 
@@ -96,7 +95,7 @@ def load_direction_sequence(nvars):
         line = dir_seq_file.readline()
         if not line:
             msg = 'Requested to many dimension. Can only compute sequences for '
-            msg += f'dimensions up to {max_nvars}.'
+            msg += f'dimensions up to {ii}.'
             raise Exception(msg)
         line = line.split()
         dim, s, a_vals[ii-1] = line[:3]
@@ -137,7 +136,56 @@ def compute_direction_numbers(seq, max_nbits, power, a_val):
     return dir_nums
 
 
-def _sobol_sequence(nvars, nsamples):
+@lru_cache(maxsize=8)
+def get_sobol_direction_numbers(nvars, power=32):
+    """
+    Get the direction numbers, scaled by 2**power, of each dimension of 
+    the Sobol sequence. These are cached so that repeated generation of
+    Sobol samples does not repeatedly read the direction sequence from file.
+
+    Returns
+    -------
+    dir_nums : np.ndarray (nvars, power)
+        The direction numbers. Must not be modified.
+    """
+    dir_nums = np.empty((nvars, power), dtype=np.int64)
+    dir_nums[0] = compute_direction_numbers(None, power, power, None)
+    if nvars > 1:
+        a_vals, dir_seq = load_direction_sequence(nvars)
+        for dd in range(1, nvars):
+            dir_nums[dd] = compute_direction_numbers(
+                dir_seq[dd-1], power, power, a_vals[dd-1])
+    dir_nums.flags.writeable = False
+    return dir_nums
+
+
+def _sobol_sequence_integers(dir_nums, index1, index2):
+    """
+    Compute the integer representation of the Sobol samples with indices
+    in [index1, index2).
+
+    The sample with index ii in the Gray code ordering used by Algorithm 659
+    is the exclusive or of the direction numbers associated with the 
+    non-zero bits of the Gray code ii ^ (ii >> 1). Thus any sample can be 
+    computed directly in O(nvars*nbits) operations and all samples are 
+    generated with vectorized bitwise operations.
+    """
+    indices = np.arange(index1, index2, dtype=np.int64)
+    gray_codes = indices ^ (indices >> 1)
+    nbits = max(int(index2-1).bit_length(), 0)
+    if nbits > dir_nums.shape[-1]:
+        msg = 'Requested to many samples. '
+        msg += f'Can only compute {2**dir_nums.shape[-1]} samples.'
+        raise Exception(msg)
+    samples = np.zeros(
+        dir_nums.shape[:-1]+(indices.shape[0],), dtype=np.int64)
+    for jj in range(nbits):
+        active = ((gray_codes >> jj) & 1).astype(bool)
+        samples[..., active] ^= dir_nums[..., jj:jj+1]
+    return samples
+
+
+def _sobol_sequence(nvars, nsamples, start_index=0):
     """
     Compute Sobol sequence using 
     Algorithm 659: Implementing Sobol’s quasirandom sequence generator
@@ -148,44 +196,388 @@ def _sobol_sequence(nvars, nsamples):
     https://web.maths.unsw.edu.au/~fkuo/sobol/joe-kuo-notes.pdf
     """
     power = 32
-    max_nbits = np.int64(np.ceil(np.log2(nsamples)))
-    if max_nbits > power:
-        msg = 'Requested to many samples. '
-        msg += f'Can only compute {max_nbits} samples.'
-        raise Exception(msg)
-
-    a_vals, dir_seq = load_direction_sequence(nvars)
-
-    # compute the first right zero bit of each sample index
-    indices = np.array(
-        [index_of_first_zero_bit_moving_right_to_left(ii)
-         for ii in range(nsamples)])
-
+    dir_nums = get_sobol_direction_numbers(nvars, power)
     const = np.double(1 << power)  # 2**power
-    samples = np.empty((nvars, nsamples))
-    samples[:, 0] = 0
-
-    tmp1 = 0
-    seq = np.ones((max_nbits), dtype=np.int64)
-    dir_nums = compute_direction_numbers(None, max_nbits, power, None)
-    for ii in range(1, nsamples):
-        tmp2 = tmp1 ^ dir_nums[indices[ii-1]]
-        samples[0, ii] = tmp2/const
-        tmp1 = tmp2
-    for dd in range(1, nvars):
-        dir_nums = compute_direction_numbers(
-            dir_seq[dd-1], max_nbits, power, a_vals[dd-1])
-        tmp1 = 0
-        for ii in range(1, nsamples):
-            tmp2 = tmp1 ^ dir_nums[indices[ii-1]]
-            samples[dd, ii] = tmp2/const
-            tmp1 = tmp2
+    samples = _sobol_sequence_integers(
+        dir_nums, start_index, start_index+nsamples)/const
     assert samples.max()<=1 and samples.min()>=0
     return samples
 
+
 def sobol_sequence(nvars, nsamples, start_index=0, variable=None):
-    samples =  _sobol_sequence(nvars, nsamples+start_index)[:, start_index:]
+    samples = _sobol_sequence(nvars, nsamples, start_index)
     if variable is None:
         return samples
     samples = variable.evaluate('ppf', samples)
     return samples
+
+
+class LowDiscrepancySequence(ABC):
+    def __init__(self, nvars, start_index=0, variable=None):
+        """
+        Generate consecutive blocks of a low-discrepancy sequence. This
+        allows quasi Monte Carlo studies to be extended incrementally 
+        without regenerating the samples already used.
+
+        Parameters
+        ----------
+        nvars : integer
+            The number of variables
+
+        start_index : integer
+            The index of the first sample generated
+
+        variable : :class:`pyapprox.variables.IndependentMultivariateRandomVariable`
+            If not None map the samples on the unit hypercube using the 
+            inverse CDFs of the variable
+        """
+        self.nvars = nvars
+        self.index = start_index
+        self.variable = variable
+
+    @abstractmethod
+    def _generate_samples(self, index1, index2):
+        """
+        Generate the samples of the sequence with indices [index1, index2)
+        on the unit hypercube.
+        """
+
+    def __call__(self, nsamples):
+        """
+        Generate the next nsamples of the sequence.
+
+        Returns
+        -------
+        samples : np.ndarray (nvars, nsamples)
+            The samples with indices [self.index, self.index+nsamples)
+        """
+        samples = self._generate_samples(self.index, self.index+nsamples)
+        self.index += nsamples
+        if self.variable is None:
+            return samples
+        return self.variable.evaluate('ppf', samples)
+
+
+class SobolSequence(LowDiscrepancySequence):
+    def _generate_samples(self, index1, index2):
+        return sobol_sequence(self.nvars, index2-index1, index1)
+
+
+class HaltonSequence(LowDiscrepancySequence):
+    def _generate_samples(self, index1, index2):
+        return halton_sequence(self.nvars, index1, index2)
+
+
+def _bitwise_parity(x):
+    """
+    Return the parity, i.e. the sum modulo 2, of the bits of each 32 bit 
+    integer in the array x
+    """
+    x = x ^ (x >> 16)
+    x ^= x >> 8
+    x ^= x >> 4
+    x ^= x >> 2
+    x ^= x >> 1
+    return x & 1
+
+
+def _reverse_bits_uint32(x):
+    """
+    Reverse the order of the bits of each unsigned 32 bit integer in x
+    """
+    x = ((x >> np.uint32(1)) & np.uint32(0x55555555)) | \
+        ((x & np.uint32(0x55555555)) << np.uint32(1))
+    x = ((x >> np.uint32(2)) & np.uint32(0x33333333)) | \
+        ((x & np.uint32(0x33333333)) << np.uint32(2))
+    x = ((x >> np.uint32(4)) & np.uint32(0x0F0F0F0F)) | \
+        ((x & np.uint32(0x0F0F0F0F)) << np.uint32(4))
+    x = ((x >> np.uint32(8)) & np.uint32(0x00FF00FF)) | \
+        ((x & np.uint32(0x00FF00FF)) << np.uint32(8))
+    return (x >> np.uint32(16)) | (x << np.uint32(16))
+
+
+def _owen_scramble_integers(samples, seeds):
+    """
+    Apply nested uniform (Owen) scrambling to the integer representation
+    of a set of samples, with values in [0, 2**32). 
+
+    Each bit of a sample is flipped by a pseudo-random bit that only 
+    depends on the more significant bits. The random bits are generated
+    with the hash-based permutation of Laine and Karras, using the constants
+    of Burley, Practical Hash-based Owen Scrambling, Journal of Computer 
+    Graphics Techniques, 2020, so all samples are scrambled consistently
+    without storing the random bits of every node in the scrambling tree.
+
+    Parameters
+    ----------
+    samples : np.ndarray (..., nsamples)
+        The integer samples
+
+    seeds : np.ndarray (...)
+        The seed used to scramble the samples of each variable and replicate
+    """
+    x = _reverse_bits_uint32(samples.astype(np.uint32))
+    x += seeds.astype(np.uint32)[..., None]
+    for const in [0x6c50b47c, 0xb82f1e52, 0xc7afe638, 0x8d22f6e6]:
+        x ^= x*np.uint32(const)
+    return _reverse_bits_uint32(x).astype(np.int64)
+
+
+def _linear_matrix_scramble_direction_numbers(dir_nums, nreplicates,
+                                              power=32):
+    """
+    Multiply the direction numbers by random lower triangular binary 
+    matrices with unit diagonal, i.e. Matousek's linear matrix scrambling.
+
+    Parameters
+    ----------
+    dir_nums : np.ndarray (nvars, power)
+        The direction numbers of each dimension
+
+    Returns
+    -------
+    scrambled_dir_nums : np.ndarray (nreplicates, nvars, power)
+        The scrambled direction numbers of each replicate
+    """
+    nvars = dir_nums.shape[0]
+    # bit kk of the output depends on bits ll<=kk of the input, where bits
+    # are ordered from most to least significant
+    matrices = np.random.randint(
+        0, 2, (nreplicates, nvars, power, power), dtype=np.int64)
+    matrices = np.tril(matrices, -1) + np.eye(power, dtype=np.int64)
+    bit_values = np.int64(1) << np.arange(power-1, -1, -1, dtype=np.int64)
+    masks = matrices.dot(bit_values)
+    bits = _bitwise_parity(masks[..., :, None] & dir_nums[None, :, None, :])
+    return np.sum(bits*bit_values[:, None], axis=2)
+
+
+class RandomizedLowDiscrepancySequence(LowDiscrepancySequence):
+    def __init__(self, nvars, nreplicates, scramble, start_index=0,
+                 variable=None):
+        """
+        Generate consecutive blocks of independent randomizations of a 
+        low-discrepancy sequence. Each randomization is fixed at
+        construction so that the sequences can be extended incrementally.
+
+        Parameters
+        ----------
+        nvars : integer
+            The number of variables
+
+        nreplicates : integer
+            The number of independent randomizations
+
+        scramble : string
+            The type of randomization
+
+        start_index : integer
+            The index of the first sample generated
+
+        variable : :class:`pyapprox.variables.IndependentMultivariateRandomVariable`
+            If not None map the samples on the unit hypercube using the 
+            inverse CDFs of the variable
+        """
+        super().__init__(nvars, start_index, variable)
+        self.nreplicates = nreplicates
+        self.scramble = scramble
+
+    def __call__(self, nsamples):
+        """
+        Generate the next nsamples of each randomized sequence.
+
+        Returns
+        -------
+        samples : np.ndarray (nreplicates, nvars, nsamples)
+            The samples with indices [self.index, self.index+nsamples) of 
+            each replicate
+        """
+        samples = self._generate_samples(self.index, self.index+nsamples)
+        self.index += nsamples
+        if self.variable is None:
+            return samples
+        samples = self.variable.evaluate(
+            'ppf', samples.transpose(1, 0, 2).reshape(
+                self.nvars, self.nreplicates*nsamples))
+        return samples.reshape(
+            self.nvars, self.nreplicates, nsamples).transpose(1, 0, 2)
+
+
+class RandomizedSobolSequence(RandomizedLowDiscrepancySequence):
+    def __init__(self, nvars, nreplicates, scramble='owen', start_index=0,
+                 variable=None):
+        """
+        Randomized Sobol sequences.
+
+        Parameters
+        ----------
+        scramble : string
+            'shift' - random digital shift
+            'matousek' - linear matrix scrambling with a random digital shift
+            'owen' - nested uniform scrambling
+        """
+        super().__init__(nvars, nreplicates, scramble, start_index, variable)
+        self.power = 32
+        dir_nums = get_sobol_direction_numbers(nvars, self.power)
+        if scramble == 'matousek':
+            self.dir_nums = _linear_matrix_scramble_direction_numbers(
+                dir_nums, nreplicates, self.power)
+        elif scramble == 'shift' or scramble == 'owen':
+            self.dir_nums = dir_nums
+        else:
+            raise Exception(f'Scrambling method {scramble} not supported')
+        # shifts and seeds are sampled from [0, 2**power)
+        self.shifts = np.random.randint(
+            0, 1 << self.power, (nreplicates, nvars), dtype=np.int64)
+
+    def _generate_samples(self, index1, index2):
+        samples = _sobol_sequence_integers(self.dir_nums, index1, index2)
+        if samples.ndim == 2:
+            samples = np.tile(samples, (self.nreplicates, 1, 1))
+        if self.scramble == 'owen':
+            samples = _owen_scramble_integers(samples, self.shifts)
+        else:
+            samples ^= self.shifts[:, :, None]
+        return samples/np.double(1 << self.power)
+
+
+class RandomizedHaltonSequence(RandomizedLowDiscrepancySequence):
+    def __init__(self, nvars, nreplicates, scramble='permutation',
+                 start_index=0, variable=None):
+        """
+        Randomized Halton sequences.
+
+        Parameters
+        ----------
+        scramble : string
+            'shift' - random digital shift in the base of each dimension
+            'permutation' - random permutation of each digit of 
+            each dimension
+        """
+        super().__init__(nvars, nreplicates, scramble, start_index, variable)
+        self.primes = get_first_n_primes(nvars)
+        self.permutations = []
+        for prime in self.primes:
+            # number of digits resolved by double precision
+            ndigits = int(np.ceil(53*np.log(2)/np.log(prime)))
+            if scramble == 'permutation':
+                perms = np.argsort(
+                    np.random.uniform(0, 1, (nreplicates, ndigits, prime)),
+                    axis=2)
+            elif scramble == 'shift':
+                perms = (np.arange(prime)[None, None, :] + np.random.randint(
+                    0, prime, (nreplicates, ndigits, 1))) % prime
+            else:
+                raise Exception(
+                    f'Scrambling method {scramble} not supported')
+            self.permutations.append(perms)
+
+    def _generate_samples(self, index1, index2):
+        indices = np.arange(index1, index2, dtype=np.int64)
+        samples = np.zeros((self.nreplicates, self.nvars, indices.shape[0]))
+        for dd, prime in enumerate(self.primes):
+            ff = indices.copy()
+            prime_inv = 1./prime
+            for kk in range(self.permutations[dd].shape[1]):
+                samples[:, dd, :] += self.permutations[dd][
+                    :, kk, np.remainder(ff, prime)]*prime_inv
+                prime_inv /= prime
+                ff //= prime
+        return samples
+
+
+def randomized_sobol_sequence(nvars, nsamples, nreplicates, start_index=0,
+                              scramble='owen', variable=None):
+    """
+    Generate independent randomizations of the Sobol sequence.
+
+    See :class:`RandomizedSobolSequence`
+
+    Returns
+    -------
+    samples : np.ndarray (nreplicates, nvars, nsamples)
+        The randomized samples of each replicate
+    """
+    return RandomizedSobolSequence(
+        nvars, nreplicates, scramble, start_index, variable)(nsamples)
+
+
+def randomized_halton_sequence(nvars, nsamples, nreplicates, start_index=0,
+                               scramble='permutation', variable=None):
+    """
+    Generate independent randomizations of the Halton sequence.
+
+    See :class:`RandomizedHaltonSequence`
+
+    Returns
+    -------
+    samples : np.ndarray (nreplicates, nvars, nsamples)
+        The randomized samples of each replicate
+    """
+    return RandomizedHaltonSequence(
+        nvars, nreplicates, scramble, start_index, variable)(nsamples)
+
+
+def estimate_mean_using_randomized_qmc(fun, sequence, nsamples, tol=None,
+                                       max_nsamples=None):
+    """
+    Estimate the mean of a function and the standard error of the estimate
+    using independent randomizations of a low-discrepancy sequence.
+
+    If a tolerance is provided the number of samples in each replicate
+    is doubled until the standard error of every QoI is below the tolerance 
+    or the maximum number of samples is reached. Previous evaluations are
+    reused each time the number of samples is increased.
+
+    Parameters
+    ----------
+    fun : callable
+        The function with signature
+
+        ``fun(z) -> np.ndarray``
+
+        where ``z`` is a 2D np.ndarray with shape (nvars,nsamples) and the
+        output is a 2D np.ndarray with shape (nsamples,nqoi)
+
+    sequence : :class:`RandomizedLowDiscrepancySequence`
+        The randomized sequence. Sobol sequences are most accurate when 
+        nsamples is a power of two.
+
+    nsamples : integer
+        The initial number of samples in each replicate
+
+    tol : float
+        The tolerance on the standard error
+
+    max_nsamples : integer
+        The maximum number of samples in each replicate
+
+    Returns
+    -------
+    mean : np.ndarray (nqoi)
+        The average of the estimates of each replicate
+
+    std_error : np.ndarray (nqoi)
+        The standard error of the mean
+
+    nsamples : integer
+        The number of samples used in each replicate
+    """
+    nreplicates = sequence.nreplicates
+    assert nreplicates > 1
+    if max_nsamples is None:
+        max_nsamples = nsamples
+    sums = 0
+    nnew_samples, nsamples = nsamples, 0
+    while True:
+        samples = sequence(nnew_samples)
+        values = fun(samples.transpose(1, 0, 2).reshape(
+            sequence.nvars, nreplicates*nnew_samples))
+        sums += values.reshape(nreplicates, nnew_samples, -1).sum(axis=1)
+        nsamples += nnew_samples
+        means = sums/nsamples
+        std_error = means.std(axis=0, ddof=1)/np.sqrt(nreplicates)
+        if (tol is None or np.all(std_error <= tol) or
+                2*nsamples > max_nsamples):
+            break
+        nnew_samples = nsamples
+    return means.mean(axis=0), std_error, nsamples
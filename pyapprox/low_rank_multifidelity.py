@@ -2,6 +2,8 @@ import numpy
 import hashlib
 from pyapprox.utilities import cholesky_solve_linear_system, \
     pivoted_cholesky_decomposition
+from pyapprox.randomized_svd import ChunkedMatVecOperator, \
+    randomized_range_finder
 
 
 def select_nodes(V, N, weights=None, order=None):
@@ -112,8 +114,71 @@ def select_nodes_cholesky(V, npivots, weights=None, order=None):
     L = L[P,:]
     return P,L
 
+def select_nodes_randomized(V, N, order=None, num_extra_samples=10,
+                            num_power_iterations=0, chunksize=1000):
+    r"""
+    Select interpolation nodes from a finite-cardinality candidate set 
+    using a randomized sketch of the snapshots of the low-fidelity model.
+
+    An orthonormal basis Q of the range of V is computed with a randomized
+    range finder and the nodes are selected with a pivoted QR 
+    factorization of the small matrix B = Q^T V, which approximates the
+    pivoted Cholesky factorization of the Grammian V^T V used by 
+    select_nodes. The Cholesky factor of the Grammian of the selected 
+    snapshots is then computed exactly.
+
+    V is only accessed in blocks of chunksize rows so it can be a np.memmap
+    of a matrix that is too large to fit in memory.
+
+    V (matrix): columns of V are snapshots of low-fidelity model
+    N (int)   : the number of interpolation nodes/ high-fidelity runs
+
+    order = columns of V that must be added first. These columns correspond
+    to previously used points when adding new points to a bifidelity 
+    approximation
+
+    num_extra_samples (int) : the number of columns of the random sketch 
+        in addition to N
+
+    num_power_iterations (int) : the number of power iterations used by the
+        range finder. Each iteration requires two passes over V
+
+    chunksize (int) : the number of rows of V loaded into memory at a time
+    """
+    from scipy.linalg import qr, cholesky
+    M = V.shape[1]
+    assert N <= M
+    operator = ChunkedMatVecOperator(V, chunksize)
+    Q = randomized_range_finder(
+        operator, {'num_singular_values':N,
+                   'num_extra_samples':num_extra_samples},
+        num_power_iterations)[0]
+    B = operator.apply(Q, transpose=True).T
+
+    pivots = []
+    if order is not None:
+        pivots = list(order)[:N]
+        # remove the component of the snapshots that is already 
+        # interpolated by the nodes that must be added first
+        Q_order = numpy.linalg.qr(B[:, pivots])[0]
+        B = B - numpy.dot(Q_order, numpy.dot(Q_order.T, B))
+        B[:, pivots] = 0
+    if len(pivots) < N:
+        P = qr(B, mode='r', pivoting=True)[1]
+        pivots += list(P[:N-len(pivots)])
+    P = numpy.asarray(pivots, dtype=int)
+
+    # compute the Grammian of the selected snapshots
+    G = numpy.zeros((N, N))
+    for lb in range(0, V.shape[0], chunksize):
+        V_selected = numpy.asarray(V[lb:lb+chunksize])[:, P]
+        G += numpy.dot(V_selected.T, V_selected)
+    L = cholesky(G, lower=True)
+    return P, L
+
 def synthesis_operator(lf_selected_values, hf_selected_values,
-                       chol_factor, lf_test_values, weights=None):
+                       chol_factor, lf_test_values, weights=None,
+                       chunksize=None):
     r"""
     Algorithm 2. Algorithmic evaluation of the synthesis operation
     -----------------------------------------------------------------
@@ -123,34 +188,73 @@ def synthesis_operator(lf_selected_values, hf_selected_values,
     lf_selected_values: matrix (num_selected__samples x num_qoi)
     hf_selected_values: matrix (num_selected_samples x num_qoi)
     lf_test_values:     matrix (num_test_samples x num_qoi)
+
+    chunksize: if not None the QoI are processed in blocks of chunksize
+    so only the values of chunksize QoI are loaded into memory at a time,
+    e.g. when the values are np.memmap arrays
+
+    weights:            matrix (num_qoi x num_qoi) defining the inner
+    product of the QoI. If None the Euclidean inner product is used
     """
     assert lf_selected_values.shape == hf_selected_values.shape
     assert lf_selected_values.shape[1] == lf_test_values.shape[1]
 
+    if chunksize is not None:
+        num_qoi = lf_selected_values.shape[1]
+        g = numpy.zeros((lf_selected_values.shape[0],
+                         lf_test_values.shape[0]))
+        for lb in range(0, num_qoi, chunksize):
+            lf_test_chunk = numpy.asarray(
+                lf_test_values[:, lb:lb+chunksize]).T
+            if weights is None:
+                g += numpy.dot(
+                    numpy.asarray(lf_selected_values[:, lb:lb+chunksize]),
+                    lf_test_chunk)
+                continue
+            for la in range(0, num_qoi, chunksize):
+                g += numpy.dot(
+                    numpy.asarray(lf_selected_values[:, la:la+chunksize]),
+                    numpy.dot(weights[la:la+chunksize, lb:lb+chunksize],
+                              lf_test_chunk))
+        c = cholesky_solve_linear_system(chol_factor, g)
+        mf_test_values = numpy.empty((lf_test_values.shape[0], num_qoi))
+        for lb in range(0, num_qoi, chunksize):
+            mf_test_values[:, lb:lb+chunksize] = numpy.dot(
+                c.T, numpy.asarray(hf_selected_values[:, lb:lb+chunksize]))
+        return mf_test_values.squeeze(), c
+
     # INNER PRODUCT addition
-    if weights == None:
+    if weights is None:
         g = numpy.dot( lf_selected_values, lf_test_values.T )
     else:
-        g = numpy.dot( lf_selected_values, dot(weights,lf_test_values.T) )
-
-    # TODO
-    # should not compute G_l_inv but rather use back aand forward subsitution 
-    # to compute L^{-T}L^{-1}g (see akils first paper), L is cholesky factor
-    G_l_inv = numpy.linalg.inv( numpy.dot(chol_factor,chol_factor.T) )
-    c = numpy.dot( G_l_inv, g )
-    #c = cholesky_solve_linear_system( L, rhs[pivots] ).squeeze()
+        g = numpy.dot(
+            lf_selected_values, numpy.dot(weights,lf_test_values.T) )
+
+    # use back and forward substitution to compute L^{-T}L^{-1}g
+    # (see akils first paper), L is cholesky factor
+    c = cholesky_solve_linear_system( chol_factor, g )
     mf_test_values = numpy.dot( hf_selected_values.T, c ).squeeze()
     # dot product returns num-qoi x num-samples
     # but my models return num-samples x num-qoi
     return mf_test_values.T, c
 
 class BiFidelityModel(object):
-    def __init__(self, lf_model, hf_model):
+    def __init__(self, lf_model, hf_model, node_selection='cholesky',
+                 chunksize=None):
+        r"""
+        node_selection: 'cholesky' selects nodes with select_nodes and
+        'randomized' with select_nodes_randomized
+
+        chunksize: if not None the snapshots and values of the QoI are
+        processed in blocks of chunksize QoI
+        """
         self.lf_model = lf_model
         self.hf_model = hf_model
         self.candidate_samples = None
         self.chol_factor = None
         self.id=None
+        self.node_selection = node_selection
+        self.chunksize = chunksize
 
     def build(self, num_hf_runs, generate_samples, num_lf_candidates=1e3):
         # 1. Evaluate the low-fidelity model u_L on a candidate set Gamma.
@@ -166,8 +270,18 @@ class BiFidelityModel(object):
         # ----------------------------------------------------------------
         # select_nodes assumes num-qoi x num-samples
         # but my models return num-samples x num-qoi 
-        pivots, self.chol_factor= select_nodes(
-            V=lf_candidate_values.T, N=num_hf_runs)
+        if self.node_selection == 'randomized':
+            opts = {}
+            if self.chunksize is not None:
+                opts['chunksize'] = self.chunksize
+            pivots, self.chol_factor = select_nodes_randomized(
+                lf_candidate_values.T, num_hf_runs, **opts)
+        elif self.node_selection == 'cholesky':
+            pivots, self.chol_factor= select_nodes(
+                V=lf_candidate_values.T, N=num_hf_runs)
+        else:
+            raise Exception('node_selection %s not supported' %
+                            self.node_selection)
         
         self.lf_selected_samples = candidate_samples[:,pivots]
         self.lf_selected_values = lf_candidate_values[pivots,:]
@@ -186,7 +300,7 @@ class BiFidelityModel(object):
         lf_values = self.lf_model( samples )
         mf_values = synthesis_operator(
             self.lf_selected_values, self.hf_selected_values,
-            self.chol_factor, lf_values)[0]
+            self.chol_factor, lf_values, chunksize=self.chunksize)[0]
         return mf_values
 
     def get_condition_number_data(self):
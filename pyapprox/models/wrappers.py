@@ -545,7 +545,7 @@ class WorkTrackingModel(object):
 
 class PoolModel(object):
     def __init__(self, function, max_eval_concurrency, assert_omp=True,
-                 base_model=None):
+                 base_model=None, pool=None):
         """
         Evaluate a function at multiple samples in parallel using 
         multiprocessing.Pool
@@ -585,6 +585,10 @@ class PoolModel(object):
              base_model and algorithms or the user want access to the attribtes
              of the base_model.
 
+        pool : multiprocessing.Pool
+            A pool used to evaluate the function. If None a new pool is
+            created, and closed, every time the function is evaluated
+
         Notes
         -----
         If defining a custom __getattr__ it seems I cannot have member
@@ -596,6 +600,7 @@ class PoolModel(object):
         self.num_evaluations = 0
         self.assert_omp = assert_omp
         self.pool_function = function
+        self.pool = pool
 
     def set_max_eval_concurrency(self, max_eval_concurrency):
         """
@@ -622,7 +627,7 @@ class PoolModel(object):
         """
         vals = run_model_samples_in_parallel(
             self.pool_function, self.max_eval_concurrency, samples,
-            pool=None, assert_omp=self.assert_omp)
+            pool=self.pool, assert_omp=self.assert_omp)
         return vals
 
 
@@ -84,6 +84,86 @@ def full_multilevel_kernel(XX1,hyperparams,nsamples_per_model,hf_only=False):
             K[lb2:ub2,lb1:ub1] = K[lb1:ub1,lb2:ub2].T
     return K
 
+def multilevel_covariance_block_gradient(XXmm,XXnn,hyperparams,mm,nn):
+    """
+    Compute the gradient of the covariance between the samples of the mm-th
+    and nn-th models with respect to the log of the hyperparameters.
+
+    Each block is a sum of terms c*kernel_ff(XXmm,XXnn,l_kk) where c is a
+    monomial in rho. So the derivative with respect to log(rho_j) is the
+    term multiplied by the exponent of rho_j and the derivative with
+    respect to the log of the ii-th length scale of model kk is
+    the term multiplied by (x_ii-x_ii')**2/l_ii**2.
+
+    Parameters
+    ----------
+    XXmm : np.ndarray (nsamples_mm,nvars)
+        The samples of the mm the model
+
+    XXnn : np.ndarray (nsamples_nn,nvars)
+        The samples of the nn the model
+
+    Returns
+    -------
+    grad : np.ndarray (nsamples_mm,nsamples_nn,nhyperparams)
+        The gradient of the block
+    """
+    assert mm<=nn
+    nvars = XXmm.shape[1]
+    nhyperparams = len(hyperparams)
+    nmodels = (nhyperparams+1)//(nvars+1)
+    length_scales = np.asarray(hyperparams[:nmodels*nvars])
+    rho = np.asarray(hyperparams[nmodels*nvars:])
+    sq_dists = (XXmm[:,None,:]-XXnn[None,:,:])**2
+    grad = np.zeros((XXmm.shape[0],XXnn.shape[0],nhyperparams))
+    for kk in range(mm+1):
+        rho_exponents = np.zeros(nmodels-1)
+        rho_exponents[mm:nn] += 1
+        if kk<mm:
+            rho_exponents[:kk+1] += 2
+        lb,ub=nvars*kk,nvars*(kk+1)
+        term = np.prod(rho**rho_exponents)*kernel_ff(
+            XXmm,XXnn,length_scales[lb:ub])
+        grad[:,:,lb:ub] += term[:,:,None]*sq_dists/length_scales[lb:ub]**2
+        grad[:,:,nmodels*nvars:] += term[:,:,None]*rho_exponents
+    return grad
+
+def full_multilevel_kernel_gradient(XX1,hyperparams,nsamples_per_model,
+                                    hf_only=False):
+    """
+    Compute the gradient of :func:`full_multilevel_kernel` with respect to
+    the log of the hyperparameters.
+
+    Returns
+    -------
+    grad : np.ndarray (nsamples,nsamples,nhyperparams)
+        The gradient of the kernel
+    """
+    nrows=XX1.shape[0]
+    nmodels = len(nsamples_per_model)
+    if hf_only:
+        return multilevel_covariance_block_gradient(
+            XX1,XX1,hyperparams,nmodels-1,nmodels-1)
+    assert np.sum(nsamples_per_model)==XX1.shape[0]
+
+    samples = unpack_samples(XX1,nsamples_per_model)
+    grad = np.zeros((nrows,nrows,len(hyperparams)),dtype=float)
+    lb1,ub1=0,0
+    for mm in range(nmodels):
+        lb1=ub1
+        ub1+=nsamples_per_model[mm]
+        lb2,ub2=lb1,ub1
+        grad[lb1:ub1,lb2:ub2] = multilevel_covariance_block_gradient(
+            samples[mm],samples[mm],hyperparams,mm,mm)
+        for nn in range(mm+1,nmodels):
+            lb2=ub2
+            ub2+=nsamples_per_model[nn]
+            grad[lb1:ub1,lb2:ub2] = multilevel_covariance_block_gradient(
+                samples[mm],samples[nn],hyperparams,mm,nn)
+            grad[lb2:ub2,lb1:ub1] = np.transpose(
+                grad[lb1:ub1,lb2:ub2],(1,0,2))
+    return grad
+
 def multilevel_kernel_for_prediction(XX1,train_samples_mm,hyperparams,
                                      nsamples_per_model,mm):    
     nvars = XX1.shape[1]
@@ -178,11 +258,10 @@ class MultilevelGPKernel(StationaryKernelMixin, NormalizedKernelMixin, Kernel):
             # Hyperparameter l kept fixed
             length_scale_gradient = np.empty((K.shape[0], K.shape[1], 0))
         else:
-            # approximate gradient numerically
-            def f(gamma):  # helper function
-                return full_multilevel_kernel(XX1,gamma,self.nsamples_per_model)
-            length_scale = np.atleast_1d(self.length_scale)
-            length_scale_gradient = _approx_fprime(length_scale, f, 1e-8)
+            # gradient with respect to the log of the hyperparameters
+            length_scale_gradient = full_multilevel_kernel_gradient(
+                XX1,hyperparams,self.nsamples_per_model,
+                self.return_code!='full')
 
         return K, length_scale_gradient
 
@@ -1,4 +1,5 @@
-from scipy.optimize import Bounds, minimize, LinearConstraint, NonlinearConstraint
+from scipy.optimize import Bounds, minimize, LinearConstraint, NonlinearConstraint, \
+    minimize_scalar, OptimizeResult
 from functools import partial
 import numpy as np
 from scipy.linalg import solve_triangular
@@ -7,9 +8,10 @@ import copy
 
 def compute_prediction_variance(design_prob_measure, pred_factors,
                                 homog_outer_prods, noise_multiplier=None,
-                                regression_type='lstsq'):
+                                regression_type='lstsq', design_factors=None):
     M0, M1 = get_M0_and_M1_matrices(
-        homog_outer_prods, design_prob_measure, noise_multiplier, regression_type)
+        homog_outer_prods, design_prob_measure, noise_multiplier,
+        regression_type, design_factors)
     u = np.linalg.solve(M1, pred_factors.T)
     if M0 is not None:
         M0u = M0.dot(u)
@@ -42,17 +44,44 @@ def compute_homoscedastic_outer_products(factors):
        The outer products of each row of F with itself, i.e. 
        :math:`f(x_i)f(x_i)^T`
     """
-    num_design_pts, num_factors = factors.shape
-    homoscedastic_outer_products = np.empty(
-        (num_factors, num_factors, num_design_pts), dtype=float)
-    for ii in range(num_design_pts):
-        homoscedastic_outer_products[:, :, ii] = np.outer(
-            factors[ii, :], factors[ii, :])
+    homoscedastic_outer_products = \
+        factors.T[:, np.newaxis, :]*factors.T[np.newaxis, :, :]
     return homoscedastic_outer_products
 
 
+def weighted_outer_products_sum(homog_outer_prods, design_factors, weights):
+    r"""
+    Compute
+
+    .. math:: \sum_{i=1}^M w_i f(x_i)f(x_i)^T = F^T\mathrm{diag}(w)F
+
+    Parameters
+    ----------
+    homog_outer_prods : np.ndarray(num_factors,num_factors,num_design_pts)
+        The outer products :math:`f(x_i)f(x_i)^T` for each design point 
+        :math:`x_i`. If None the sum is computed directly from 
+        design_factors without forming the outer products, which requires 
+        O(num_factors*num_design_pts) memory.
+
+    design_factors : np.ndarray (num_design_pts,num_factors)
+       The design factors evaluated at each of the design points
+
+    weights : np.ndarray (num_design_pts)
+        The weights :math:`w_i` for each design point
+
+    Returns
+    -------
+    M : np.ndarray (num_factors,num_factors)
+        The weighted sum of the outer products
+    """
+    if homog_outer_prods is not None:
+        return homog_outer_prods.dot(weights)
+    return (design_factors.T*weights).dot(design_factors)
+
+
 def get_M0_and_M1_matrices(
-        homog_outer_prods, design_prob_measure, noise_multiplier, regression_type):
+        homog_outer_prods, design_prob_measure, noise_multiplier,
+        regression_type, design_factors=None):
     r"""
     Compute the matrices :math:`M_0` and :math:`M_1` used to compute the
     asymptotic covariance matrix :math:`C(\mu) = M_1^{-1} M_0 M^{-1}` of the
@@ -76,7 +105,7 @@ def get_M0_and_M1_matrices(
     ----------
     homog_outer_prods : np.ndarray(num_factors,num_factors,num_design_pts)
         The outer products :math:`f(x_i)f(x_i)^T` for each design point 
-        :math:`x_i`
+        :math:`x_i`. If None the matrices are computed from design_factors
 
     design_prob_measure : np.ndarray (num_design_pts)
         The weights :math:`r_i` for each design point
@@ -88,6 +117,10 @@ def get_M0_and_M1_matrices(
         The method used to compute the coefficients of the linear model. 
         Currently supported options are ``lstsq`` and ``quantile``.
 
+    design_factors : np.ndarray (num_design_pts,num_design_factors)
+       The design factors evaluated at each of the design points. Only
+       used if homog_outer_prods is None
+
     Returns
     -------
     M0 : np.ndarray (num_factors,num_factors)
@@ -97,15 +130,19 @@ def get_M0_and_M1_matrices(
         The matrix :math:`M_1`
 
     """
+    if homog_outer_prods is None:
+        assert design_factors is not None
+    weighted_sum = partial(
+        weighted_outer_products_sum, homog_outer_prods, design_factors)
     if noise_multiplier is None:
-        return None, homog_outer_prods.dot(design_prob_measure)
+        return None, weighted_sum(design_prob_measure)
 
     if regression_type == 'lstsq':
-        M0 = homog_outer_prods.dot(design_prob_measure*noise_multiplier**2)
-        M1 = homog_outer_prods.dot(design_prob_measure)
+        M0 = weighted_sum(design_prob_measure*noise_multiplier**2)
+        M1 = weighted_sum(design_prob_measure)
     elif regression_type == 'quantile':
-        M0 = homog_outer_prods.dot(design_prob_measure)
-        M1 = homog_outer_prods.dot(design_prob_measure/noise_multiplier)
+        M0 = weighted_sum(design_prob_measure)
+        M1 = weighted_sum(design_prob_measure/noise_multiplier)
     else:
         msg = f'regression type {regression_type} not supported'
         raise Exception(msg)
@@ -135,7 +172,8 @@ def ioptimality_criterion(homog_outer_prods, design_factors,
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
        The outer_products :math:`f(x_i)f(x_i)^T` for each design point 
-       :math:`x_i`
+       :math:`x_i`. If None the criterion is computed directly from
+       design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -175,7 +213,7 @@ def ioptimality_criterion(homog_outer_prods, design_factors,
         design_prob_measure = design_prob_measure[:, 0]
     M0, M1 = get_M0_and_M1_matrices(
         homog_outer_prods, design_prob_measure, noise_multiplier,
-        regression_type)
+        regression_type, design_factors)
     if noise_multiplier is not None:
         Q, R = np.linalg.qr(M1)
         u = solve_triangular(R, Q.T.dot(pred_factors.T))
@@ -241,7 +279,8 @@ def coptimality_criterion(homog_outer_prods, design_factors,
     ----------
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
-       The hessian M_1 of the error for each design point
+       The hessian M_1 of the error for each design point. If None the 
+       criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -274,7 +313,8 @@ def coptimality_criterion(homog_outer_prods, design_factors,
         assert design_prob_measure.shape[1] == 1
         design_prob_measure = design_prob_measure[:, 0]
     M0, M1 = get_M0_and_M1_matrices(
-        homog_outer_prods, design_prob_measure, noise_multiplier, regression_type)
+        homog_outer_prods, design_prob_measure, noise_multiplier,
+        regression_type, design_factors)
     if noise_multiplier is not None:
         Q, R = np.linalg.qr(M1)
         u = solve_triangular(R, Q.T.dot(c))
@@ -328,7 +368,8 @@ def doptimality_criterion(homog_outer_prods, design_factors,
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
        The outer_products :math:`f(x_i)f(x_i)^T` for each design point 
-       :math:`x_i`
+       :math:`x_i`. If None the criterion is computed directly from
+       design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -363,7 +404,8 @@ def doptimality_criterion(homog_outer_prods, design_factors,
         design_prob_measure = design_prob_measure[:, 0]
     #M1 = homog_outer_prods.dot(design_prob_measure)
     M0, M1 = get_M0_and_M1_matrices(
-        homog_outer_prods, design_prob_measure, noise_multiplier, regression_type)
+        homog_outer_prods, design_prob_measure, noise_multiplier,
+        regression_type, design_factors)
     M1_inv = np.linalg.inv(M1)
     if noise_multiplier is not None:
         gamma = M0.dot(M1_inv)
@@ -444,7 +486,8 @@ def aoptimality_criterion(homog_outer_prods, design_factors,
     ----------
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
-       The hessian M_1 of the error for each design point
+       The hessian M_1 of the error for each design point. If None the 
+       criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -478,25 +521,29 @@ def aoptimality_criterion(homog_outer_prods, design_factors,
         assert design_prob_measure.shape[1] == 1
         design_prob_measure = design_prob_measure[:, 0]
     M0, M1 = get_M0_and_M1_matrices(
-        homog_outer_prods, design_prob_measure, noise_multiplier, regression_type)
+        homog_outer_prods, design_prob_measure, noise_multiplier,
+        regression_type, design_factors)
     M1_inv = np.linalg.inv(M1)
     if noise_multiplier is not None:
         gamma = M0.dot(M1_inv)
         value = np.trace(M1_inv.dot(gamma))
         if (return_grad):
-            ident = np.eye(gamma.shape[0])
-            M0_inv = np.linalg.inv(M0)
-            kappa = M1.dot(M0_inv)
-            gradient = np.zeros(num_design_pts)
-            for ii in range(num_design_pts):
-                if regression_type == 'lstsq':
-                    gradient[ii] = np.trace(
-                        M1_inv.dot(homog_outer_prods[:, :, ii]).dot(
-                            -2*gamma.T+noise_multiplier[ii]**2*ident).dot(M1_inv))
-                elif regression_type == 'quantile':
-                    gradient[ii] = np.trace(
-                        M1_inv.dot(homog_outer_prods[:, :, ii]).dot(
-                            -2*gamma.T/noise_multiplier[:, np.newaxis][ii]+ident).dot(M1_inv))
+            # The ith entry of the gradient is
+            # trace(M1_inv.dot(f_i f_i^T).dot(B_i).dot(M1_inv))
+            # = f_i^T B_i M1_inv M1_inv f_i
+            # where B_i = -2 gamma^T + eta_i^2 I for least squares
+            # and B_i = -2 gamma^T/eta_i + I for quantile regression.
+            # These row-wise quadratic forms are computed without forming
+            # the outer products f_i f_i^T
+            temp = M1_inv.dot(M1_inv)
+            quad_form = np.sum(design_factors*design_factors.dot(temp), axis=1)
+            gamma_quad_form = np.sum(
+                design_factors*design_factors.dot(gamma.T.dot(temp).T),
+                axis=1)
+            if regression_type == 'lstsq':
+                gradient = -2*gamma_quad_form+noise_multiplier**2*quad_form
+            elif regression_type == 'quantile':
+                gradient = -2*gamma_quad_form/noise_multiplier+quad_form
             return value, gradient.T
         else:
             return value
@@ -538,7 +585,8 @@ def roptimality_criterion(beta, homog_outer_prods, design_factors,
 
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
-       The hessian M_1 of the error for each design point
+       The hessian M_1 of the error for each design point. If None the 
+       criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -578,7 +626,8 @@ def roptimality_criterion(beta, homog_outer_prods, design_factors,
         assert design_prob_measure.shape[1] == 1
         design_prob_measure = design_prob_measure[:, 0]
     M0, M1 = get_M0_and_M1_matrices(
-        homog_outer_prods, design_prob_measure, noise_multiplier, regression_type)
+        homog_outer_prods, design_prob_measure, noise_multiplier,
+        regression_type, design_factors)
     if noise_multiplier is not None:
         Q, R = np.linalg.qr(M1)
         u = solve_triangular(R, Q.T.dot(pred_factors.T))
@@ -641,7 +690,8 @@ def goptimality_criterion(homog_outer_prods, design_factors,
     ----------
     homog_outer_prods : np.ndarray (num_design_factors,num_design_factors,
                                     num_design_pts)
-       The hessian M_1 of the error for each design point
+       The hessian M_1 of the error for each design point. If None the 
+       criterion is computed directly from design_factors
 
     design_factors : np.ndarray (num_design_pts,num_design_factors)
        The design factors evaluated at each of the design points
@@ -677,7 +727,8 @@ def goptimality_criterion(homog_outer_prods, design_factors,
         assert design_prob_measure.shape[1] == 1
         design_prob_measure = design_prob_measure[:, 0]
     M0, M1 = get_M0_and_M1_matrices(
-        homog_outer_prods, design_prob_measure, noise_multiplier, regression_type)
+        homog_outer_prods, design_prob_measure, noise_multiplier,
+        regression_type, design_factors)
     if noise_multiplier is not None:
         Q, R = np.linalg.qr(M1)
         u = solve_triangular(R, Q.T.dot(pred_factors.T))
@@ -714,6 +765,485 @@ def goptimality_criterion(homog_outer_prods, design_factors,
         return value, gradient.T
 
 
+def get_batched_M0_and_M1_matrices(
+        design_factors, design_prob_measure, noise_multiplier,
+        regression_type):
+    r"""
+    Compute the matrices :math:`M_0` and :math:`M_1` for a set of design
+    factors, e.g. those of a nonlinear model linearized at different
+    parameter samples, using batched linear algebra.
+
+    Parameters
+    ----------
+    design_factors : np.ndarray (nsamples,num_design_pts,num_design_factors)
+       The design factors evaluated at each of the design points for each
+       sample
+
+    design_prob_measure : np.ndarray (num_design_pts)
+        The weights :math:`r_i` for each design point
+
+    noise_multiplier : np.ndarray (nsamples,num_design_pts)
+        The design dependent noise function :math:`\eta(x)` for each sample
+
+    regression_type : string
+        The method used to compute the coefficients of the linear model. 
+        Currently supported options are ``lstsq`` and ``quantile``.
+
+    Returns
+    -------
+    M0 : np.ndarray (nsamples,num_design_factors,num_design_factors)
+        The matrices :math:`M_0`. None if noise_multiplier is None
+
+    M1 : np.ndarray (nsamples,num_design_factors,num_design_factors)
+        The matrices :math:`M_1`
+    """
+    design_factors_T = np.swapaxes(design_factors, 1, 2)
+    M1 = np.matmul(design_factors_T*design_prob_measure, design_factors)
+    if noise_multiplier is None:
+        return None, M1
+
+    noise_multiplier = noise_multiplier[:, np.newaxis, :]
+    if regression_type == 'lstsq':
+        M0 = np.matmul(
+            design_factors_T*(design_prob_measure*noise_multiplier**2),
+            design_factors)
+    elif regression_type == 'quantile':
+        M0 = M1
+        M1 = np.matmul(
+            design_factors_T*(design_prob_measure/noise_multiplier),
+            design_factors)
+    else:
+        msg = f'regression type {regression_type} not supported'
+        raise Exception(msg)
+    return M0, M1
+
+
+def _batched_quadratic_forms(design_factors, mats):
+    """
+    Compute :math:`f_i^T A f_i` for each row :math:`f_i` of each design
+    factor matrix and the corresponding matrix :math:`A`.
+    """
+    return np.sum(design_factors*np.matmul(design_factors, mats), axis=2)
+
+
+def _batched_doptimality_criterion(
+        design_factors, M0, M1, noise_multiplier, regression_type):
+    M1_inv = np.linalg.inv(M1)
+    if noise_multiplier is None:
+        values = -np.linalg.slogdet(M1)[1]
+        grads = -_batched_quadratic_forms(design_factors, M1_inv)
+        return values, grads
+
+    values = np.linalg.slogdet(M0)[1]-2*np.linalg.slogdet(M1)[1]
+    quad_form_M1_inv = _batched_quadratic_forms(design_factors, M1_inv)
+    quad_form_M0_inv = _batched_quadratic_forms(
+        design_factors, np.linalg.inv(M0))
+    if regression_type == 'lstsq':
+        grads = -2*quad_form_M1_inv+noise_multiplier**2*quad_form_M0_inv
+    elif regression_type == 'quantile':
+        grads = -2*quad_form_M1_inv/noise_multiplier+quad_form_M0_inv
+    return values, grads
+
+
+def _batched_aoptimality_criterion(
+        design_factors, M0, M1, noise_multiplier, regression_type):
+    M1_inv = np.linalg.inv(M1)
+    M1_inv_sq = np.matmul(M1_inv, M1_inv)
+    if noise_multiplier is None:
+        values = np.trace(M1_inv, axis1=1, axis2=2)
+        grads = -_batched_quadratic_forms(design_factors, M1_inv_sq)
+        return values, grads
+
+    values = np.sum(M1_inv_sq*M0, axis=(1, 2))
+    quad_form = _batched_quadratic_forms(design_factors, M1_inv_sq)
+    gamma_quad_form = _batched_quadratic_forms(
+        design_factors, np.matmul(np.matmul(M1_inv, M0), M1_inv_sq))
+    if regression_type == 'lstsq':
+        grads = -2*gamma_quad_form+noise_multiplier**2*quad_form
+    elif regression_type == 'quantile':
+        grads = -2*gamma_quad_form/noise_multiplier+quad_form
+    return values, grads
+
+
+def _batched_ioptimality_criterion(
+        design_factors, pred_factors, M0, M1, noise_multiplier,
+        regression_type):
+    num_pred_pts = pred_factors.shape[1]
+    u = np.linalg.solve(M1, np.swapaxes(pred_factors, 1, 2))
+    Fu = np.matmul(design_factors, u)
+    if noise_multiplier is None:
+        values = np.sum(np.swapaxes(pred_factors, 1, 2)*u, axis=(1, 2))
+        grads = -np.sum(Fu**2, axis=2)
+        return values/num_pred_pts, grads/num_pred_pts
+
+    M0u = np.matmul(M0, u)
+    values = np.sum(u*M0u, axis=(1, 2))
+    Fgamma = -np.matmul(design_factors, np.linalg.solve(M1, M0u))
+    if regression_type == 'lstsq':
+        grads = 2*np.sum(Fu*Fgamma, axis=2) + np.sum(
+            (noise_multiplier[:, :, np.newaxis]*Fu)**2, axis=2)
+    elif regression_type == 'quantile':
+        grads = 2*np.sum(
+            Fu*Fgamma/noise_multiplier[:, :, np.newaxis], axis=2) + \
+            np.sum(Fu**2, axis=2)
+    return values/num_pred_pts, grads/num_pred_pts
+
+
+def _batched_coptimality_criterion(
+        design_factors, M0, M1, noise_multiplier, regression_type):
+    c = np.ones((design_factors.shape[2], 1))
+    pred_factors = np.tile(c.T, (design_factors.shape[0], 1, 1))
+    return _batched_ioptimality_criterion(
+        design_factors, pred_factors, M0, M1, noise_multiplier,
+        regression_type)
+
+
+def batched_optimality_criterion(criteria, design_factors,
+                                 design_prob_measure, noise_multiplier=None,
+                                 pred_factors=None, regression_type='lstsq'):
+    r"""
+    Evaluate an optimality criterion and its gradient for a set of design
+    factors, e.g. those of a nonlinear model linearized at different
+    parameter samples, using batched linear algebra.
+
+    Parameters
+    ----------
+    criteria : string
+        The optimality criteria. Supported options are ``A``, ``C``,
+        ``D`` and ``I``
+
+    design_factors : np.ndarray (nsamples,num_design_pts,num_design_factors)
+       The design factors evaluated at each of the design points for each
+       sample
+
+    design_prob_measure : np.ndarray (num_design_pts)
+        The weights :math:`r_i` for each design point
+
+    noise_multiplier : np.ndarray (nsamples,num_design_pts)
+        The design dependent noise function :math:`\eta(x)` for each sample
+
+    pred_factors : np.ndarray (nsamples,num_pred_pts,num_design_factors)
+        The prediction factors for each sample. Only used by I-optimality
+
+    regression_type : string
+        The method used to compute the coefficients of the linear model. 
+        Currently supported options are ``lstsq`` and ``quantile``.
+
+    Returns
+    -------
+    values : np.ndarray (nsamples)
+        The value of the criterion for each sample
+
+    grads : np.ndarray (nsamples,num_design_pts)
+        The gradient of the criterion for each sample
+    """
+    if design_prob_measure.ndim == 2:
+        assert design_prob_measure.shape[1] == 1
+        design_prob_measure = design_prob_measure[:, 0]
+    M0, M1 = get_batched_M0_and_M1_matrices(
+        design_factors, design_prob_measure, noise_multiplier,
+        regression_type)
+    if criteria == 'D':
+        return _batched_doptimality_criterion(
+            design_factors, M0, M1, noise_multiplier, regression_type)
+    if criteria == 'A':
+        return _batched_aoptimality_criterion(
+            design_factors, M0, M1, noise_multiplier, regression_type)
+    if criteria == 'C':
+        return _batched_coptimality_criterion(
+            design_factors, M0, M1, noise_multiplier, regression_type)
+    if criteria == 'I':
+        return _batched_ioptimality_criterion(
+            design_factors, pred_factors, M0, M1, noise_multiplier,
+            regression_type)
+    msg = f'Optimality criteria: {criteria} is not supported. '
+    msg += 'Supported criteria are A, C, D and I'
+    raise Exception(msg)
+
+
+def _multiplicative_design_criterion_matrix(criteria, num_design_factors,
+                                            pred_factors):
+    r"""
+    Return the matrix :math:`B` such that the criterion is
+    :math:`\mathrm{tr}(BM_1^{-1})`, or None for D-optimality.
+    """
+    if criteria == 'D':
+        return None
+    if criteria == 'A':
+        return np.eye(num_design_factors)
+    if criteria == 'C':
+        c = np.ones((num_design_factors, 1))
+        return c.dot(c.T)
+    if criteria == 'I':
+        return pred_factors.T.dot(pred_factors)/pred_factors.shape[0]
+    msg = f'Optimality criteria: {criteria} is not supported. '
+    msg += 'Supported criteria are A, C, D and I'
+    raise Exception(msg)
+
+
+def _multiplicative_design_sensitivities(design_factors, support, weights,
+                                         B):
+    """
+    Return the value of the criterion, its negative gradient
+    (the sensitivities) at every candidate design point and the inverse
+    of :math:`M_1`.
+    """
+    M1 = (design_factors[support].T*weights[support]).dot(
+        design_factors[support])
+    M1_inv = np.linalg.inv(M1)
+    if B is None:
+        value = -np.linalg.slogdet(M1)[1]
+        sensitivities = np.sum(
+            design_factors*design_factors.dot(M1_inv), axis=1)
+        return value, sensitivities, M1_inv
+    temp = M1_inv.dot(B).dot(M1_inv)
+    value = np.sum(B*M1_inv)
+    sensitivities = np.sum(design_factors*design_factors.dot(temp), axis=1)
+    return value, sensitivities, M1_inv
+
+
+def _multiplicative_design_line_search(factor, M1_inv, B, lb, ub):
+    r"""
+    Find the step :math:`\alpha\in[lb,ub]` minimizing the criterion of
+    :math:`(1-\alpha)M_1+\alpha f f^T` using the Sherman-Morrison formula,
+    so each evaluation of the line objective costs O(1).
+    """
+    num_design_factors = M1_inv.shape[0]
+    M1_inv_f = M1_inv.dot(factor)
+    d0 = factor.dot(M1_inv_f)
+    if B is None:
+        def line_objective(alpha):
+            t = alpha/(1-alpha)
+            return -num_design_factors*np.log(1-alpha)-np.log(1+t*d0)
+    else:
+        phi0 = np.sum(B*M1_inv)
+        b = M1_inv_f.dot(B.dot(M1_inv_f))
+
+        def line_objective(alpha):
+            t = alpha/(1-alpha)
+            return (phi0-t*b/(1+t*d0))/(1-alpha)
+    # the matrix is singular when 1+t*d0=0 so restrict negative steps
+    if d0 > 1:
+        lb = max(lb, -1/(d0-1)*(1-1e-8))
+    if lb >= ub:
+        return 0
+    res = minimize_scalar(
+        line_objective, bounds=(lb, ub), method='bounded',
+        options={'xatol': 1e-14})
+    if line_objective(res.x) < line_objective(0):
+        return res.x
+    return 0
+
+
+def _multiplicative_design_exchange(factor_to, factor_from, M1_inv, B, lb,
+                                    ub):
+    r"""
+    Find the weight :math:`\delta\in[lb,ub]` moved from one design point
+    to another that minimizes the criterion of
+    :math:`M_1+\delta(f_\mathrm{to}f_\mathrm{to}^T-f_\mathrm{from}f_\mathrm{from}^T)`
+    and return it with the inverse of the updated matrix, which is computed
+    with the Woodbury formula for the rank-two update.
+    """
+    U = np.array([factor_to, factor_from]).T
+    M1_inv_U = M1_inv.dot(U)
+    H = U.T.dot(M1_inv_U)
+    if B is None:
+        # the determinant of M1 is multiplied by
+        # 1+delta*(H[0,0]-H[1,1])-delta**2*det(H) which has a closed form
+        # maximizer
+        det_H = H[0, 0]*H[1, 1]-H[0, 1]**2
+        if det_H > 0:
+            delta = (H[0, 0]-H[1, 1])/(2*det_H)
+        else:
+            delta = ub if H[0, 0] > H[1, 1] else lb
+        delta = min(max(delta, lb), ub)
+    else:
+        # the change in the criterion is the rational function
+        # -(delta*g1+delta**2*g2)/(1+delta*h1-delta**2*h2) whose stationary
+        # points are the roots of (g1*h2+g2*h1)*delta**2+2*g2*delta+g1
+        G = M1_inv_U.T.dot(B.dot(M1_inv_U))
+        g1 = G[0, 0]-G[1, 1]
+        g2 = 2*H[0, 1]*G[0, 1]-H[1, 1]*G[0, 0]-H[0, 0]*G[1, 1]
+        h1 = H[0, 0]-H[1, 1]
+        h2 = H[0, 0]*H[1, 1]-H[0, 1]**2
+        roots = np.roots([g1*h2+g2*h1, 2*g2, g1])
+        roots = roots[np.isreal(roots)].real
+        deltas = np.concatenate(
+            [[0, lb, ub], roots[(roots >= lb) & (roots <= ub)]])
+        dets = 1+deltas*h1-deltas**2*h2
+        changes = np.full(deltas.shape[0], np.inf)
+        changes[dets > 0] = -(deltas*g1+deltas**2*g2)[dets > 0]/dets[dets > 0]
+        delta = deltas[np.argmin(changes)]
+    if delta == 0:
+        return 0, M1_inv
+    C = np.diag([delta, -delta])
+    M1_inv = M1_inv-M1_inv_U.dot(
+        np.linalg.solve(np.eye(2)+C.dot(H), C.dot(M1_inv_U.T)))
+    return delta, M1_inv
+
+
+def _multiplicative_design_exchange_sweep(design_factors, weights,
+                                          sensitivities, M1_inv, B):
+    """
+    Exchange weight between random pairs of points, one from the support
+    and one from the union of the support and the num_design_factors
+    points with the largest sensitivities.
+    """
+    num_design_factors = design_factors.shape[1]
+    support = np.where(weights > 0)[0]
+    candidates = np.union1d(
+        support, np.argsort(sensitivities)[-num_design_factors:])
+    idx_from = np.random.choice(support, candidates.shape[0])
+    idx_to = np.random.permutation(candidates)
+    for kk, ll in zip(idx_from, idx_to):
+        if kk == ll:
+            continue
+        delta, M1_inv = _multiplicative_design_exchange(
+            design_factors[ll], design_factors[kk], M1_inv, B,
+            -weights[ll], weights[kk])
+        weights[ll] += delta
+        weights[kk] -= delta
+    return weights
+
+
+def _prune_design(weights, prune_tol, num_design_factors):
+    """
+    Set the weights below prune_tol to zero unless doing so would leave
+    fewer than num_design_factors support points, and renormalize.
+    """
+    weights = np.maximum(weights, 0)
+    support = weights >= prune_tol
+    if support.sum() >= num_design_factors:
+        weights[~support] = 0
+    support = weights > 0
+    weights /= weights.sum()
+    return weights, support
+
+
+def multiplicative_optimal_design(criteria, design_factors, x0=None,
+                                  pred_factors=None, maxiter=1000,
+                                  gtol=1e-6, prune_tol=1e-10, iprint=0):
+    r"""
+    Compute A-, C-, D- or I-optimal approximate designs for large numbers
+    of candidate design points using a first order method that only
+    requires O(num_design_pts*num_design_factors**2) operations per
+    iteration.
+
+    Each iteration consists of a multiplicative weight update
+
+    .. math:: w_i \leftarrow w_i\frac{d_i}{\sum_j w_jd_j}
+
+    where :math:`d_i` are the sensitivities, i.e. the negative gradient of
+    the criterion, followed by a vertex-direction step towards the design
+    point with the largest sensitivity and a sweep of Fedorov exchanges,
+    which move weight between random pairs of support points and points
+    with large sensitivities and so include away steps. The step lengths
+    are found by line searches that use rank-one and rank-two updates of
+    :math:`M_1^{-1}`. Design points with weights smaller than prune_tol are
+    removed from the support, provided at least num_design_factors points
+    remain. The algorithm terminates when the general equivalence theorem
+    is satisfied to within gtol, i.e.
+
+    .. math:: \max_i d_i \le (1+\mathrm{gtol})\sum_j w_jd_j
+
+    Only homoscedastic least squares regression is supported and the
+    optimal design must be nonsingular, which may not be the case for
+    C-optimality.
+
+    Parameters
+    ----------
+    criteria : string
+        The optimality criteria. Supported options are ``A``, ``C``,
+        ``D`` and ``I``
+
+    design_factors : np.ndarray (num_design_pts,num_design_factors)
+       The design factors evaluated at each of the design points
+
+    x0 : np.ndarray (num_design_pts)
+        The initial design. If None the uniform design is used
+
+    pred_factors : np.ndarray (num_pred_pts,num_pred_factors)
+        The prediction factors. Only used by I-optimality
+
+    maxiter : integer
+        The maximum number of iterations
+
+    gtol : float
+        The tolerance of the general equivalence theorem used to terminate
+        the algorithm
+
+    prune_tol : float
+        Design points with weights below this tolerance are removed from
+        the support
+
+    iprint : integer
+        The verbosity level. If > 0 the progress is printed
+
+    Returns
+    -------
+    res : OptimizeResult
+        The optimization result with attributes x (the design weights),
+        fun, jac, nit, success and message
+    """
+    num_design_pts, num_design_factors = design_factors.shape
+    B = _multiplicative_design_criterion_matrix(
+        criteria, num_design_factors, pred_factors)
+    if x0 is None:
+        x0 = np.ones(num_design_pts)/num_design_pts
+    weights, support = _prune_design(
+        np.array(x0, dtype=float), prune_tol, num_design_factors)
+
+    success = False
+    for it in range(maxiter):
+        value, sensitivities, M1_inv = _multiplicative_design_sensitivities(
+            design_factors, support, weights, B)
+        # sum_j w_j d_j is num_design_factors for D-optimality and the
+        # value of the criterion otherwise
+        mean_sensitivity = weights.dot(sensitivities)
+        gap = sensitivities.max()/mean_sensitivity-1
+        if iprint > 0:
+            print(f'Iter {it}: objective {value}, equivalence gap {gap}, '
+                  f'support size {support.sum()}')
+        if gap <= gtol:
+            success = True
+            break
+
+        # multiplicative update
+        weights *= sensitivities/mean_sensitivity
+        weights, support = _prune_design(
+            weights, prune_tol, num_design_factors)
+
+        # vertex-direction step towards the most sensitive design point
+        value, sensitivities, M1_inv = _multiplicative_design_sensitivities(
+            design_factors, support, weights, B)
+        idx = np.argmax(sensitivities)
+        alpha = _multiplicative_design_line_search(
+            design_factors[idx], M1_inv, B, 0, 1-1e-8)
+        weights *= (1-alpha)
+        weights[idx] += alpha
+
+        # exchange weight between pairs of points
+        support = weights > 0
+        value, sensitivities, M1_inv = _multiplicative_design_sensitivities(
+            design_factors, support, weights, B)
+        weights = _multiplicative_design_exchange_sweep(
+            design_factors, weights, sensitivities, M1_inv, B)
+        weights, support = _prune_design(
+            weights, prune_tol, num_design_factors)
+    else:
+        value, sensitivities, M1_inv = _multiplicative_design_sensitivities(
+            design_factors, support, weights, B)
+
+    if success:
+        message = 'Optimality conditions satisfied'
+    else:
+        message = 'Maximum number of iterations reached'
+    res = OptimizeResult(
+        x=weights, fun=value, jac=-sensitivities, nit=it, success=success,
+        message=message)
+    return res
+
+
 def minimax_oed_objective(x):
     return x[0]
 
@@ -914,8 +1444,10 @@ class AlphabetOptimalDesign(object):
 
     def solve(self, options=None, init_design=None, return_full=False):
         num_design_pts = self.design_factors.shape[0]
-        homog_outer_prods = compute_homoscedastic_outer_products(
-            self.design_factors)
+        # the criteria are evaluated directly from the design factors to
+        # avoid storing the (num_factors,num_factors,num_design_pts)
+        # outer products
+        homog_outer_prods = None
 
         objective, jac = self.get_objective_and_jacobian(
             self.design_factors, homog_outer_prods,
@@ -994,6 +1526,17 @@ class AlphabetOptimalDesign(object):
             res = minimize_ipopt(
                 objective, x0, jac=jac, bounds=bounds, constraints=con,
                 options=options)
+        elif method == 'multiplicative':
+            if self.noise_multiplier is not None:
+                msg = 'The multiplicative solver only supports homoscedastic '
+                msg += 'noise'
+                raise Exception(msg)
+            pred_factors = None
+            if self.opts is not None:
+                pred_factors = self.opts.get('pred_factors', None)
+            res = multiplicative_optimal_design(
+                self.criteria, self.design_factors, x0, pred_factors,
+                **options)
         else:
             res = minimize(
                 objective, x0, method=method, jac=jac, hess=None,
@@ -1012,8 +1555,6 @@ class AlphabetOptimalDesign(object):
         for ii in range(parameter_samples.shape[1]):
             design_factors = self.design_factors(
                 parameter_samples[:, ii], design_samples)
-            homog_outer_prods = compute_homoscedastic_outer_products(
-                design_factors)
             opts = copy.deepcopy(self.opts)
             if opts is not None and 'pred_factors' in opts:
                 opts['pred_factors'] = opts['pred_factors'](
@@ -1026,7 +1567,7 @@ class AlphabetOptimalDesign(object):
                 assert noise_multiplier.ndim == 1
                 assert noise_multiplier.shape[0] == design_samples.shape[1]
             obj, jac = self.get_objective_and_jacobian(
-                design_factors.copy(), homog_outer_prods.copy(),
+                design_factors.copy(), None,
                 noise_multiplier, copy.deepcopy(opts))
             constraint_obj = partial(minimax_oed_constraint_objective, obj)
             constraint_jac = partial(minimax_oed_constraint_jacobian, jac)
@@ -1113,8 +1654,6 @@ class AlphabetOptimalDesign(object):
         for ii in range(parameter_samples.shape[1]):
             design_factors = self.design_factors(
                 parameter_samples[:, ii], design_samples)
-            homog_outer_prods = compute_homoscedastic_outer_products(
-                design_factors)
             if self.noise_multiplier is None:
                 noise_multiplier = None
             else:
@@ -1127,41 +1666,186 @@ class AlphabetOptimalDesign(object):
                 opts['pred_factors'] = opts['pred_factors'](
                     parameter_samples[:, ii], opts['pred_samples'])
             obj, jac = self.get_objective_and_jacobian(
-                design_factors.copy(), homog_outer_prods.copy(),
+                design_factors.copy(), None,
                 noise_multiplier, copy.deepcopy(opts))
             objs.append(obj)
             jacs.append(jac)
 
-        num_design_pts = homog_outer_prods.shape[2]
+        num_design_pts = design_factors.shape[0]
         return objs, jacs, num_design_pts
 
+    def get_batched_design_factors(self, parameter_samples, design_samples):
+        """
+        Stack the design factors, noise multipliers and prediction factors
+        of each parameter sample into 3D arrays.
+
+        Returns
+        -------
+        design_factors : np.ndarray (nsamples,num_design_pts,num_factors)
+            The design factors of each sample
+
+        noise_multiplier : np.ndarray (nsamples,num_design_pts)
+            The noise multiplier of each sample. None if the noise is
+            homoscedastic
+
+        pred_factors : np.ndarray (nsamples,num_pred_pts,num_factors)
+            The prediction factors of each sample. None if opts does not
+            contain pred_factors
+        """
+        nsamples = parameter_samples.shape[1]
+        design_factors = np.array([
+            self.design_factors(parameter_samples[:, ii], design_samples)
+            for ii in range(nsamples)])
+        if self.noise_multiplier is None:
+            noise_multiplier = None
+        else:
+            noise_multiplier = np.array([
+                self.noise_multiplier(
+                    parameter_samples[:, ii], design_samples).squeeze()
+                for ii in range(nsamples)])
+            assert noise_multiplier.shape == (
+                nsamples, design_samples.shape[1])
+        if self.opts is not None and 'pred_factors' in self.opts:
+            pred_factors = np.array([
+                self.opts['pred_factors'](
+                    parameter_samples[:, ii], self.opts['pred_samples'])
+                for ii in range(nsamples)])
+        else:
+            pred_factors = None
+        return design_factors, noise_multiplier, pred_factors
+
+    def bayesian_batched_objective_and_jacobian(
+            self, parameter_samples, design_samples, sample_weights,
+            nsamples_per_batch=None, max_eval_concurrency=1):
+        """
+        Return the expected value of the optimality criterion and its
+        jacobian, with respect to the design probability measure, evaluated
+        with batched linear algebra over the parameter samples.
+
+        Parameters
+        ----------
+        parameter_samples : np.ndarray (nparams,nsamples)
+            The parameter samples used to compute the expectation
+
+        design_samples : np.ndarray (nvars,num_design_pts)
+            The candidate design points
+
+        sample_weights : np.ndarray (nsamples)
+            The quadrature weights of the parameter samples
+
+        nsamples_per_batch : integer
+            The number of parameter samples processed at once. Limits the
+            memory used to store the intermediate arrays. If None all
+            samples are processed at once.
+
+        max_eval_concurrency : integer
+            The number of batches evaluated in parallel. Threads are used
+            because numpy releases the GIL during the batched linear
+            algebra.
+
+        Returns
+        -------
+        objective : callable
+            Function with signature ``objective(x) -> float``
+
+        jacobian : callable
+            Function with signature ``jacobian(x) -> np.ndarray (num_design_pts)``
+
+        num_design_pts : integer
+            The number of candidate design points
+        """
+        design_factors, noise_multiplier, pred_factors = \
+            self.get_batched_design_factors(parameter_samples, design_samples)
+        nsamples, num_design_pts = design_factors.shape[:2]
+        if nsamples_per_batch is None:
+            nsamples_per_batch = nsamples
+        batches = [np.arange(lb, min(lb+nsamples_per_batch, nsamples))
+                   for lb in range(0, nsamples, nsamples_per_batch)]
+
+        def evaluate_batch(x, batch):
+            values, grads = batched_optimality_criterion(
+                self.criteria, design_factors[batch], x,
+                None if noise_multiplier is None else noise_multiplier[batch],
+                None if pred_factors is None else pred_factors[batch],
+                self.regression_type)
+            return (sample_weights[batch].dot(values),
+                    sample_weights[batch].dot(grads))
+
+        cache = {}
+
+        def evaluate(x):
+            # the objective and jacobian are computed together so cache
+            # the result of the last design evaluated
+            key = x.tobytes()
+            if key in cache:
+                return cache[key]
+            if max_eval_concurrency > 1:
+                from multiprocessing.pool import ThreadPool
+                with ThreadPool(max_eval_concurrency) as pool:
+                    results = pool.map(partial(evaluate_batch, x), batches)
+            else:
+                results = [evaluate_batch(x, batch) for batch in batches]
+            cache.clear()
+            cache[key] = (sum([r[0] for r in results]),
+                          sum([r[1] for r in results]))
+            return cache[key]
+
+        def objective(x):
+            return evaluate(x)[0]
+
+        def jacobian(x):
+            return evaluate(x)[1]
+
+        return objective, jacobian, num_design_pts
+
     def solve_nonlinear_bayesian(self, samples, design_samples,
                                  sample_weights=None, options=None,
-                                 return_full=False, x0=None):
+                                 return_full=False, x0=None,
+                                 nsamples_per_batch=None,
+                                 max_eval_concurrency=1):
+        """
+        Compute the design that minimizes the expected value of the
+        optimality criterion with respect to the parameter samples.
+
+        The criteria A, C, D and I are evaluated for all samples at once
+        using batched linear algebra, see
+        :meth:`bayesian_batched_objective_and_jacobian`, whose arguments
+        nsamples_per_batch and max_eval_concurrency control the memory
+        and parallelism of the evaluation. The remaining criteria are
+        evaluated one sample at a time.
+        """
         assert callable(self.design_factors)
-        objs, jacs, num_design_pts = self.bayesian_objective_jacobian_components(
-            samples, design_samples)
-        lb_con = ub_con = np.atleast_1d(1)
-        A_con = np.ones((1, num_design_pts))
-        linear_constraint = LinearConstraint(A_con, lb_con, ub_con)
-        constraints = [linear_constraint]
-
         if sample_weights is None:
             sample_weights = np.ones(
                 samples.shape[1])/samples.shape[1]
         assert sample_weights.shape[0] == samples.shape[1]
 
-        def objective(x):
-            objective = 0
-            for obj, weight in zip(objs, sample_weights):
-                objective += obj(x)*weight
-            return objective
+        if self.criteria in ['A', 'C', 'D', 'I']:
+            objective, jacobian, num_design_pts = \
+                self.bayesian_batched_objective_and_jacobian(
+                    samples, design_samples, sample_weights,
+                    nsamples_per_batch, max_eval_concurrency)
+        else:
+            objs, jacs, num_design_pts = \
+                self.bayesian_objective_jacobian_components(
+                    samples, design_samples)
+
+            def objective(x):
+                objective = 0
+                for obj, weight in zip(objs, sample_weights):
+                    objective += obj(x)*weight
+                return objective
+
+            def jacobian(x):
+                vec = 0
+                for jac, weight in zip(jacs, sample_weights):
+                    vec += jac(x)*weight
+                return vec
 
-        def jacobian(x):
-            vec = 0
-            for jac, weight in zip(jacs, sample_weights):
-                vec += jac(x)*weight
-            return vec
+        lb_con = ub_con = np.atleast_1d(1)
+        A_con = np.ones((1, num_design_pts))
+        linear_constraint = LinearConstraint(A_con, lb_con, ub_con)
+        constraints = [linear_constraint]
 
         bounds = Bounds(
             [0]*num_design_pts, [1]*num_design_pts)
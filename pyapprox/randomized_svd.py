@@ -30,6 +30,57 @@ class MatVecOperator(object):
         return self.matrix.shape[1]
 
 
+class ChunkedMatVecOperator(MatVecOperator):
+    """
+    Operator representing the action of a matrix that is too large to fit 
+    in memory, e.g. a np.memmap of a matrix stored on disk, on a vector.
+    Only chunksize rows of the matrix are loaded into memory at a time 
+    by each thread. 
+
+    If max_eval_concurrency>1 the chunks are multiplied concurrently 
+    using a pool of threads. Numpy releases the global interpreter lock 
+    when reading memory mapped files and computing matrix products.
+    """
+    def __init__(self, matrix, chunksize=1000, max_eval_concurrency=1):
+        super().__init__(matrix)
+        self.chunksize = chunksize
+        self.max_eval_concurrency = max_eval_concurrency
+
+    def get_chunks(self):
+        nrows = self.num_rows()
+        return [(lb,min(lb+self.chunksize,nrows))
+                for lb in range(0,nrows,self.chunksize)]
+
+    def map_chunks(self, fun):
+        """
+        Apply a function with signature result = fun(lb,ub,block) to each
+        block of rows self.matrix[lb:ub] of the matrix.
+        """
+        def apply_chunk(chunk):
+            lb,ub = chunk
+            return fun(lb,ub,np.asarray(self.matrix[lb:ub]))
+        chunks = self.get_chunks()
+        if self.max_eval_concurrency>1:
+            from multiprocessing.pool import ThreadPool
+            with ThreadPool(self.max_eval_concurrency) as pool:
+                return pool.map(apply_chunk,chunks)
+        return [apply_chunk(chunk) for chunk in chunks]
+
+    def apply(self, vectors, transpose=True):
+        if transpose:
+            result = np.zeros((self.num_cols(),)+vectors.shape[1:])
+            def apply_chunk(lb,ub,block):
+                return np.dot(block.T,vectors[lb:ub])
+            for partial_result in self.map_chunks(apply_chunk):
+                result += partial_result
+        else:
+            result = np.empty((self.num_rows(),)+vectors.shape[1:])
+            def apply_chunk(lb,ub,block):
+                result[lb:ub] = np.dot(block,vectors)
+            self.map_chunks(apply_chunk)
+        return result
+
+
 def randomized_range_finder(operator, opts, num_power_iterations):
     """Given an m x n matrix A and an integer r, this scheme computes an m x r
     orthonormal matrix Q whose range approximates the range of A.
@@ -477,6 +528,87 @@ def randomized_svd(operator, opts):
 
     return U,S,V
 
+def streaming_randomized_svd(operator, opts):
+    """
+    Given an m x n matrix A compute an approximate singular value 
+    decomposition of A with a single pass over the rows of A.
+
+    Unlike the single pass variant of randomized_svd, A does not need to be
+    hermitian. Each block of rows of A is used to update the sketches 
+    Y = dot(A,X) and W = dot(Psi,A), where X and Psi are Gaussian random 
+    matrices, and then discarded, so only the rows of one block per thread
+    are held in memory.
+
+    Tropp, J. A., Yurtsever, A., Udell, M., Cevher, V. Practical Sketching
+    Algorithms for Low-Rank Matrix Approximation. SIAM J. Matrix Anal. 
+    Appl. 38(4), 1454-1485, 2017.
+
+    Parameters
+    ----------
+    operator : ChunkedMatVecOperator class
+        The matrix A stored in memory or on disk. The number of rows loaded
+        at a time is operator.chunksize
+
+    opts : dictionary
+       Options to configure svd.
+
+    Required arguments
+    ------------------
+    num_singular_values : integer
+         Number of singular values to extract. 
+
+    Optional arguments:
+    ------------------
+    num_extra_samples : integer (default=5)
+        The number of columns of X in addition to num_singular_values.
+
+    num_corange_samples : integer (default=2*(num_singular_values+num_extra_samples)+1)
+        The number of rows of Psi used to sketch the corange of A.
+
+    Returns
+    -------
+    U : matrix (m x num_singular_values)
+        left singular vectors of A = USV
+
+    S : vector (num_singular_values)
+        singular values of A = USV
+
+    V : matrix (num_singular_values x n)
+        right singular vectors of A = USV
+    """
+    num_singular_values=get_from_dict_or_apply_default(
+        opts,"num_singular_values",None)
+    if num_singular_values is None:
+        raise Exception("must specify num_singular_values in opts")
+    num_extra_samples=get_from_dict_or_apply_default(
+        opts,"num_extra_samples",5)
+    num_samples = num_singular_values + num_extra_samples
+    num_corange_samples=get_from_dict_or_apply_default(
+        opts,"num_corange_samples",2*num_samples+1)
+    assert num_corange_samples>=num_samples
+
+    X = np.random.normal(0.,1.,(operator.num_cols(),num_samples))
+    Psi = np.random.normal(
+        0.,1.,(num_corange_samples,operator.num_rows()))
+    Y = np.empty((operator.num_rows(),num_samples))
+    def update_sketches(lb,ub,block):
+        Y[lb:ub] = np.dot(block,X)
+        return np.dot(Psi[:,lb:ub],block)
+    W = np.zeros((num_corange_samples,operator.num_cols()))
+    for partial_W in operator.map_chunks(update_sketches):
+        W += partial_W
+
+    Q = np.linalg.qr(Y)[0]
+    # A is approximated by dot(Q,B)
+    B = np.linalg.lstsq(np.dot(Psi,Q),W,rcond=None)[0]
+    U, S, V = np.linalg.svd(B, full_matrices=False)
+    U = np.dot(Q,U)
+    U=U[:,:num_singular_values]
+    S=S[:num_singular_values]
+    V=V[:num_singular_values,:]
+    U,V = adjust_sign_svd(U,V)
+    return U,S,V
+
 def svd_using_orthogonal_basis(operator, Q, X, Y, single_pass):
     """
     Given an m x n matrix A, and an m x (r+p) matrix Q whose columns are
@@ -554,10 +686,57 @@ def adaptive_range_finder_update(Z, Q, y, it, num_extra_samples):
     Z = np.hstack((Z,z[:,np.newaxis]))
     return Z, Q
 
-def load_svd_data(history_filename):
+def get_svd_history_filename(history_filename):
     if history_filename[-4:]!='.npz':
         history_filename += '.npz'
-    svd_data = np.load(history_filename)
+    return history_filename
+
+def memmap_npz_array(filename, key):
+    """
+    Memory map an array stored in a .npz file, e.g. by np.savez, so that 
+    only the parts of the array accessed are read from disk.
+
+    Parameters
+    ----------
+    filename : string
+        The name of the .npz file
+
+    key : string
+        The name of the array in the file
+
+    Returns
+    -------
+    array : np.memmap or np.ndarray
+        The array. If the array is compressed, e.g. by np.savez_compressed,
+        it cannot be memory mapped and is loaded into memory.
+    """
+    import zipfile, struct
+    with zipfile.ZipFile(filename) as archive:
+        info = archive.getinfo(key+'.npy')
+        if info.compress_type!=zipfile.ZIP_STORED:
+            with archive.open(info) as fid:
+                return np.lib.format.read_array(fid)
+        with archive.open(info) as fid:
+            version = np.lib.format.read_magic(fid)
+            if version==(1,0):
+                shape, fortran_order, dtype = \
+                    np.lib.format.read_array_header_1_0(fid)
+            else:
+                shape, fortran_order, dtype = \
+                    np.lib.format.read_array_header_2_0(fid)
+            array_offset = fid.tell()
+    # the data of the member starts after its local file header which has
+    # a fixed size of 30 bytes followed by the filename and extra field
+    with open(filename, 'rb') as fid:
+        fid.seek(info.header_offset+26)
+        filename_len, extra_len = struct.unpack('<HH', fid.read(4))
+    offset = info.header_offset+30+filename_len+extra_len+array_offset
+    order = 'F' if fortran_order else 'C'
+    return np.memmap(filename, dtype=dtype, mode='r', shape=shape,
+                     order=order, offset=offset)
+
+def load_svd_data(history_filename):
+    svd_data = np.load(get_svd_history_filename(history_filename))
     U = svd_data['U']; S = svd_data['S']; V = svd_data['V']
     X = svd_data['X']; Y = svd_data['Y']; Q = svd_data['Q']
     return U, S, V, X, Y, Q
@@ -585,26 +764,34 @@ def compute_single_pass_adaptive_randomized_svd_from_file(
         The maximum number of samples used to compute svd. This must be less than
         or equal to size of the gaussian random samples X stored in the file.
         If None  all samples will be used
+
+    Notes
+    -----
+    The random samples X and their images Y are memory mapped and only 
+    the columns used to compute the svd are read from the file.
     """
-    U, S, V, X, Y, Qfile = load_svd_data(history_filename)
-    assert max_num_samples<=X.shape[1]
+    history_filename = get_svd_history_filename(history_filename)
+    X = memmap_npz_array(history_filename, 'X')
+    Y = memmap_npz_array(history_filename, 'Y')
 
     if max_num_samples is None:
         num_samples = X.shape[1]
     else:
+        assert max_num_samples<=X.shape[1]
         num_samples = max_num_samples
-    Q = np.empty((Qfile.shape[0],0),float)
-    Z = Y[:,:num_extra_samples].copy()
+    Q = np.empty((Y.shape[0],0),float)
+    Z = np.array(Y[:,:num_extra_samples])
 
     for j in range(num_samples-num_extra_samples):
         
-        y = Y[:,num_extra_samples+j]
+        y = np.array(Y[:,num_extra_samples+j])
         Z, Q = adaptive_range_finder_update(Z, Q, y, j, num_extra_samples)
 
-        # Recall not all X, Y samples are used to compute svd when adaptive
-        # range finder is used. X.shape[1] = Q.shape[1]+num_extra_samples
-        # this step here accounts for this inconsistency
-        Xj = X[:,:Q.shape[1]]; Yj =Y[:,:Q.shape[1]]
+    # Recall not all X, Y samples are used to compute svd when adaptive
+    # range finder is used. X.shape[1] = Q.shape[1]+num_extra_samples
+    # this step here accounts for this inconsistency
+    Xj = np.array(X[:,:Q.shape[1]]); Yj = np.array(Y[:,:Q.shape[1]])
+    del X, Y
 
     # Compute current svd
     XTQ = np.dot(Xj.T,Q)
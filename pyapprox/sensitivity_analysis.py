@@ -4,7 +4,8 @@ from itertools import combinations
 import numpy as np
 from pyapprox.indexing import compute_hyperbolic_indices, hash_array
 from pyapprox.utilities import nchoosek
-from pyapprox.low_discrepancy_sequences import sobol_sequence, halton_sequence
+from pyapprox.low_discrepancy_sequences import sobol_sequence, \
+    halton_sequence, randomized_sobol_sequence
 from functools import partial
 from pyapprox.probability_measure_sampling import \
     generate_independent_random_samples
@@ -307,6 +308,37 @@ def plot_interaction_values(interaction_values, interaction_terms, ax,
     return p
 
 
+def _get_morris_trajectories(nvars, nlevels, ntrajectories, eps=0):
+    r"""
+    Compute a set of Morris trajectories on the unit hypercube using
+    vectorized operations.
+
+    Returns
+    -------
+    trajectories : np.ndarray (nvars,nvars+1,ntrajectories)
+        The Morris trajectories. The ith variable is perturbed between the 
+        ith and (i+1)th sample of each trajectory
+    """
+    assert nlevels % 2 == 0
+    delta = nlevels/((nlevels-1)*2)
+    samples_1d = np.linspace(eps, 1-eps, nlevels)
+
+    initial_points = np.random.choice(samples_1d, (nvars, ntrajectories))
+    shifts = np.random.choice([-delta, delta], (nvars, ntrajectories))
+    can_decrease = (initial_points-delta) >= 0
+    can_increase = (initial_points+delta) <= 1
+    if np.any(~can_decrease & ~can_increase):
+        raise Exception('This should not happen')
+    shifts[can_decrease & ~can_increase] = -delta
+    shifts[~can_decrease & can_increase] = delta
+    # mask[ii, jj] is True if the ii-th variable has been perturbed
+    # in the jj-th sample of the trajectory
+    mask = np.arange(nvars)[:, None] < np.arange(nvars+1)[None, :]
+    trajectories = initial_points[:, None, :] + \
+        mask[:, :, None]*shifts[:, None, :]
+    return trajectories
+
+
 def get_morris_trajectory(nvars, nlevels, eps=0):
     r"""
     Compute a morris trajectory used to compute elementary effects
@@ -329,25 +361,7 @@ def get_morris_trajectory(nvars, nlevels, eps=0):
     trajectory : np.ndarray (nvars,nvars+1)
         The Morris trajectory which consists of nvars+1 samples
     """
-    assert nlevels % 2 == 0
-    delta = nlevels/((nlevels-1)*2)
-    samples_1d = np.linspace(eps, 1-eps, nlevels)
-
-    initial_point = np.random.choice(samples_1d, nvars)
-    shifts = np.diag(np.random.choice([-delta, delta], nvars))
-    trajectory = np.empty((nvars, nvars+1))
-    trajectory[:, 0] = initial_point
-    for ii in range(nvars):
-        trajectory[:, ii+1] = trajectory[:, ii].copy()
-        if (trajectory[ii, ii]-delta) >= 0 and (trajectory[ii, ii]+delta) <= 1:
-            trajectory[ii, ii+1] += shift[ii]
-        elif (trajectory[ii, ii]-delta) >= 0:
-            trajectory[ii, ii+1] -= delta
-        elif (trajectory[ii, ii]+delta) <= 1:
-            trajectory[ii, ii+1] += delta
-        else:
-            raise Exception('This should not happen')
-    return trajectory
+    return _get_morris_trajectories(nvars, nlevels, 1, eps)[:, :, 0]
 
 
 def get_morris_samples(nvars, nlevels, ntrajectories, eps=0, icdfs=None):
@@ -390,8 +404,9 @@ def get_morris_samples(nvars, nlevels, ntrajectories, eps=0, icdfs=None):
         icdfs = [lambda x: x]*nvars
     assert len(icdfs) == nvars
 
-    trajectories = np.hstack([get_morris_trajectory(nvars, nlevels, eps)
-                              for n in range(ntrajectories)])
+    trajectories = _get_morris_trajectories(
+        nvars, nlevels, ntrajectories, eps).reshape(
+            nvars, ntrajectories*(nvars+1), order='F')
     for ii in range(nvars):
         trajectories[ii, :] = icdfs[ii](trajectories[ii, :])
     return trajectories
@@ -420,14 +435,15 @@ def get_morris_elementary_effects(samples, values):
     assert samples.shape[1] % (nvars+1) == 0
     assert samples.shape[1] == values.shape[0]
     ntrajectories = samples.shape[1]//(nvars+1)
-    elem_effects = np.empty((nvars, ntrajectories, nqoi))
-    ix1 = 0
-    for ii in range(ntrajectories):
-        ix2 = ix1+nvars
-        delta = np.diff(samples[:, ix1+1:ix2+1]-samples[:, ix1:ix2]).max()
-        assert delta > 0
-        elem_effects[:, ii] = (values[ix1+1:ix2+1]-values[ix1:ix2])/delta
-        ix1 = ix2+1
+    trajectories = samples.reshape(
+        nvars, nvars+1, ntrajectories, order='F')
+    values = values.reshape(ntrajectories, nvars+1, nqoi)
+    # the ith variable is perturbed between the ith and (i+1)th sample
+    # of each trajectory
+    I = np.arange(nvars)
+    deltas = trajectories[I, I+1, :]-trajectories[I, I, :]
+    assert np.all(deltas != 0)
+    elem_effects = np.diff(values, axis=1).transpose(1, 0, 2)/deltas[:, :, None]
     return elem_effects
 
 
@@ -471,35 +487,114 @@ def print_morris_sensitivity_indices(mu, sigma, qoi=0):
     print(df)
 
 
-def downselect_morris_trajectories(samples, ntrajectories):
+def get_morris_trajectory_distances(trajectories, max_block_size=int(1e7)):
+    r"""
+    Compute the distance between each pair of Morris trajectories. The 
+    distance between two trajectories is the sum of the Euclidean distances
+    between every sample in the first trajectory and every sample in 
+    the second.
+
+    Parameters
+    ----------
+    trajectories : np.ndarray (nvars,nvars+1,ntrajectories)
+        The Morris trajectories
+
+    max_block_size : integer
+        The maximum number of pointwise distances computed at once. 
+        This bounds the memory used.
+
+    Returns
+    -------
+    distances : np.ndarray (ntrajectories,ntrajectories)
+        The distances between each pair of trajectories
+    """
+    nvars, npoints, ntrajectories = trajectories.shape
+    samples = trajectories.reshape(
+        nvars, npoints*ntrajectories, order='F').T
+    nblock_trajectories = max(
+        1, max_block_size//(npoints**2*ntrajectories))
+    # use ||x-y||^2 = ||x||^2+||y||^2-2x.y so that the bulk of the work
+    # is performed by a matrix-matrix product. Only the upper triangular
+    # blocks of the symmetric distance matrix are computed
+    sqnorms = np.sum(samples**2, axis=1)
+    distances = np.empty((ntrajectories, ntrajectories))
+    for ii in range(0, ntrajectories, nblock_trajectories):
+        jj = min(ii+nblock_trajectories, ntrajectories)
+        block = samples[ii*npoints:jj*npoints]
+        sqdists = -2*block.dot(samples[ii*npoints:].T)
+        sqdists += sqnorms[ii*npoints:jj*npoints, None]
+        sqdists += sqnorms[None, ii*npoints:]
+        np.maximum(sqdists, 0, out=sqdists)
+        distances[ii:jj, ii:] = np.sqrt(sqdists, out=sqdists).reshape(
+            jj-ii, npoints, ntrajectories-ii, npoints).sum(axis=(1, 3))
+        distances[ii:, ii:jj] = distances[ii:jj, ii:].T
+    return distances
+
+
+def downselect_morris_trajectories(samples, ntrajectories, method='greedy'):
+    r"""
+    Select a subset of Morris trajectories that maximizes the spread of the
+    trajectories in the input space. 
+
+    The spread of a set of trajectories is the square-root of the sum
+    of the squared distances between each pair of trajectories
+
+    Parameters
+    ----------
+    samples : np.ndarray (nvars,ncandidate_trajectories*(nvars+1))
+        The candidate morris trajectories
+
+    ntrajectories : integer
+        The number of Morris trajectories requested
+
+    method : string
+        'greedy' - Starting with all candidates, iteratively remove the 
+        trajectory that contributes least to the spread of the remaining
+        trajectories. This is similar to Ruano et al. Environmental 
+        Modelling & Software 37 (2012) 103-109 and requires 
+        O(ncandidate_trajectories**2) operations.
+        'enumerate' - Find the subset with the maximal spread by
+        enumerating all combinations of the candidates. This is only 
+        feasible for small numbers of candidates
+
+    Returns
+    -------
+    samples : np.ndarray (nvars,ntrajectories*(nvars+1))
+        The selected morris trajectories
+    """
     nvars = samples.shape[0]
     assert samples.shape[1] % (nvars+1) == 0
     ncandidate_trajectories = samples.shape[1]//(nvars+1)
-    #assert 10*ntrajectories<=ncandidate_trajectories
+    assert ntrajectories <= ncandidate_trajectories
 
     trajectories = np.reshape(
         samples, (nvars, nvars+1, ncandidate_trajectories), order='F')
-
-    distances = np.zeros((ncandidate_trajectories, ncandidate_trajectories))
-    for ii in range(ncandidate_trajectories):
-        for jj in range(ii+1):
-            distances[ii, jj] = cdist(
-                trajectories[:, :, ii].T, trajectories[:, :, jj].T).sum()
-            distances[jj, ii] = distances[ii, jj]
-
-    get_combinations = combinations(
-        np.arange(ncandidate_trajectories), ntrajectories)
-    ncombinations = nchoosek(ncandidate_trajectories, ntrajectories)
-    print('ncombinations', ncombinations)
-    values = np.empty(ncombinations)
-    best_index = None
-    best_value = -np.inf
-    for ii, index in enumerate(get_combinations):
-        value = np.sqrt(np.sum(
-            [distances[ix[0], ix[1]]**2 for ix in combinations(index, 2)]))
-        if value > best_value:
-            best_value = value
-            best_index = index
+    distances = get_morris_trajectory_distances(trajectories)
+    squared_distances = distances**2
+    # the distance of a trajectory to itself is not part of the spread
+    np.fill_diagonal(squared_distances, 0)
+
+    if method == 'greedy':
+        active = np.ones(ncandidate_trajectories, dtype=bool)
+        contributions = squared_distances.sum(axis=1)
+        for ii in range(ncandidate_trajectories-ntrajectories):
+            index = np.where(active)[0][
+                np.argmin(contributions[active])]
+            active[index] = False
+            contributions -= squared_distances[:, index]
+        best_index = np.where(active)[0]
+    elif method == 'enumerate':
+        best_value = -np.inf
+        for index in combinations(
+                np.arange(ncandidate_trajectories), ntrajectories):
+            index = np.asarray(index)
+            # each distinct pair appears twice in the symmetric block
+            value = squared_distances[np.ix_(index, index)].sum()/2
+            if value > best_value:
+                best_value = value
+                best_index = index
+    else:
+        raise Exception(f'Downselection method {method} not supported')
 
     samples = trajectories[:, :, best_index].reshape(
         nvars, ntrajectories*(nvars+1), order='F')
@@ -510,10 +605,12 @@ class SensitivityResult(OptimizeResult):
     pass
 
 
-def analyze_sensitivity_morris(fun, univariate_variables, ntrajectories, nlevels=4):
+def analyze_sensitivity_morris(fun, univariate_variables, ntrajectories,
+                               nlevels=4, ncandidate_trajectories=None,
+                               eps=0, max_eval_concurrency=1):
     r"""
-    Compute sensitivity indices by constructing an adaptive polynomial chaos
-    expansion.
+    Compute sensitivity indices using the Morris method of elementary
+    effects.
 
     Parameters
     ----------
@@ -525,13 +622,29 @@ def analyze_sensitivity_morris(fun, univariate_variables, ntrajectories, nlevels
         where ``z`` is a 2D np.ndarray with shape (nvars,nsamples) and the
         output is a 2D np.ndarray with shape (nsamples,nqoi)
 
+    univariate_variables : list
+        The univariate random variables :class:`scipy.stats.dist`
+
     ntrajectories : integer
         The number of Morris trajectories requested
 
-
     nlevels : integer
         The number of levels used for to define the morris grid.
 
+    ncandidate_trajectories : integer
+        The number of candidate trajectories from which the ntrajectories
+        are selected using :func:`downselect_morris_trajectories`. 
+        If None no downselection is performed.
+
+    eps : float 
+        Set grid used defining the Morris trajectory to [eps,1-eps].
+        This is needed when mapping the morris trajectories using inverse
+        CDFs of unbounded variables
+
+    max_eval_concurrency : integer
+        The maximum number of evaluations of ``fun`` run in parallel
+        with :class:`pyapprox.models.wrappers.PoolModel`
+
     Returns
     -------
     result : :class:`pyapprox.sensitivity_analysis.SensitivityResult`
@@ -556,14 +669,25 @@ def analyze_sensitivity_morris(fun, univariate_variables, ntrajectories, nlevels
     """
 
     nvars = len(univariate_variables)
-    samples = get_morris_samples(nvars, nlevels, ntrajectories)
-    values = function(samples)
+    icdfs = [rv.ppf for rv in univariate_variables]
+    if ncandidate_trajectories is None:
+        samples = get_morris_samples(
+            nvars, nlevels, ntrajectories, eps, icdfs)
+    else:
+        candidate_samples = get_morris_samples(
+            nvars, nlevels, ncandidate_trajectories, eps, icdfs)
+        samples = downselect_morris_trajectories(
+            candidate_samples, ntrajectories)
+    if max_eval_concurrency > 1:
+        from pyapprox.models.wrappers import PoolModel
+        fun = PoolModel(fun, max_eval_concurrency)
+    values = fun(samples)
     elem_effects = get_morris_elementary_effects(samples, values)
     mu, sigma = get_morris_sensitivity_indices(elem_effects)
 
     return SensitivityResult(
-        {'morris_mu': pce_main_effects,
-         'morris_sigma': pce_total_effects,
+        {'morris_mu': mu,
+         'morris_sigma': sigma,
          'samples': samples, 'values': values})
 
 
@@ -707,13 +831,16 @@ def get_AB_sample_sets_for_sobol_sensitivity_analysis(
     if method == 'random':
         samplesA = generate_independent_random_samples(variables, nsamples)
         samplesB = generate_independent_random_samples(variables, nsamples)
-    elif method == 'halton' or 'sobol':
+    elif method in ['halton', 'sobol', 'scrambled_sobol']:
         nvars = variables.num_vars()
         if method == 'halton':
             qmc_samples = halton_sequence(
                 2*nvars, qmc_start_index, qmc_start_index+nsamples)
-        else:
+        elif method == 'sobol':
             qmc_samples = sobol_sequence(2*nvars, nsamples, qmc_start_index)
+        else:
+            qmc_samples = randomized_sobol_sequence(
+                2*nvars, nsamples, 1, qmc_start_index)[0]
         samplesA = qmc_samples[:nvars, :]
         samplesB = qmc_samples[nvars:, :]
         for ii, rv in enumerate(variables.all_variables()):
@@ -736,24 +863,24 @@ def get_AB_sample_sets_for_sobol_sensitivity_analysis(
     return samplesA, samplesB
 
 
-def sampling_based_sobol_indices(
-        fun, variables, interaction_terms, nsamples, sampling_method='sobol',
-        qmc_start_index=0):
+def _evaluate_sobol_index_sample_sets(
+        fun, variables, interaction_terms, nsamples, sampling_method,
+        qmc_start_index):
     """
-    See I.M. Sobol. Mathematics and Computers in Simulation 55 (2001) 271–280
+    Evaluate a function at the sample sets A, B and :math:`A_B^{I}` needed
+    to compute sampling based Sobol indices.
 
-    and  
+    Returns
+    -------
+    valuesA : np.ndarray (nsamples, nqoi)
+        The values at the samples in A
 
-    Saltelli, Annoni et. al, Variance based sensitivity analysis of model 
-    output. Design and estimator for the total sensitivity index. 2010.
-    https://doi.org/10.1016/j.cpc.2009.09.018
+    valuesB : np.ndarray (nsamples, nqoi)
+        The values at the samples in B
 
-    Parameters
-    ----------
-    interaction_terms : np.ndarray (nvars, nterms)
-        Index defining the active terms in each interaction. If the
-        ith  variable is active interaction_terms[i] == 1 and zero otherwise
-        This index must be downward closed due to way sobol indices are computed
+    valuesAB : np.ndarray (nterms, nsamples, nqoi)
+        The values at the samples in :math:`A_B^{I}` for each interaction
+        term I
     """
     nvars = interaction_terms.shape[0]
     nterms = interaction_terms.shape[1]
@@ -762,33 +889,71 @@ def sampling_based_sobol_indices(
     assert nvars == samplesA.shape[0]
     valuesA = fun(samplesA)
     valuesB = fun(samplesB)
-    mean = valuesA.mean(axis=0)
-    variance = valuesA.var(axis=0)
-    interaction_values = np.empty((nterms, valuesA.shape[1]))
-    total_effect_values = [None for ii in range(nvars)]
-    interaction_values_dict = dict()
+    valuesAB = np.empty((nterms, valuesA.shape[0], valuesA.shape[1]))
     for ii in range(nterms):
         index = interaction_terms[:, ii]
         assert index.sum() > 0
         samplesAB = generate_sobol_index_sample_sets(
             samplesA, samplesB, index)
-        valuesAB = fun(samplesAB)
-        # entry b in Table 2 of Saltelli, Annoni et. al
-        interaction_values[ii, :] = \
-            (valuesB*(valuesAB-valuesA)).mean(axis=0)/variance
-        interaction_values_dict[tuple(np.where(index>0)[0])] = ii
-        if index.sum() == 1:
-            dd = np.where(index==1)[0][0]
-            # entry f in Table 2 of Saltelli, Annoni et. al
-            total_effect_values[dd] = 0.5 * \
-                np.mean((valuesA-valuesAB)**2, axis=0)/variance 
+        valuesAB[ii] = fun(samplesAB)
+    return valuesA, valuesB, valuesAB
+
+
+def _sobol_indices_from_sample_set_values(
+        interaction_terms, valuesA, valuesB, valuesAB):
+    """
+    Compute sampling based Sobol indices from the values at the sample sets
+    A, B and :math:`A_B^{I}` for a batch of realizations of these values.
+
+    Parameters
+    ----------
+    interaction_terms : np.ndarray (nvars, nterms)
+        Index defining the active terms in each interaction.
+
+    valuesA : np.ndarray (nrealizations, nsamples, nqoi)
+        The values at the samples in A
+
+    valuesB : np.ndarray (nrealizations, nsamples, nqoi)
+        The values at the samples in B
+
+    valuesAB : np.ndarray (nterms, nrealizations, nsamples, nqoi)
+        The values at the samples in :math:`A_B^{I}`
+
+    Returns
+    -------
+    sobol_indices : np.ndarray (nrealizations, nterms, nqoi)
+        The sobol indices of each interaction term
+
+    total_effect_values : np.ndarray (nrealizations, nvars, nqoi)
+        The total effect indices of each variable
+
+    variance : np.ndarray (nrealizations, nqoi)
+        The variance of each QoI
+
+    mean : np.ndarray (nrealizations, nqoi)
+        The mean of each QoI
+    """
+    nvars = interaction_terms.shape[0]
+    mean = valuesA.mean(axis=1)
+    variance = valuesA.var(axis=1)
+    # entry b in Table 2 of Saltelli, Annoni et. al
+    interaction_values = np.transpose(
+        (valuesB[None, :]*(valuesAB-valuesA[None, :])).mean(axis=2) /
+        variance[None, :], (1, 0, 2))
+    total_effect_values = np.full(
+        (valuesA.shape[0], nvars, valuesA.shape[2]), np.nan)
+    main_effect_terms = np.where(interaction_terms.sum(axis=0) == 1)[0]
+    for ii in main_effect_terms:
+        dd = np.where(interaction_terms[:, ii] == 1)[0][0]
+        # entry f in Table 2 of Saltelli, Annoni et. al
+        total_effect_values[:, dd] = 0.5 * \
+            np.mean((valuesA-valuesAB[ii])**2, axis=1)/variance
 
     # must substract of contributions from lower-dimensional terms from
     # each interaction value For example, let R_ij be interaction_values
     # the sobol index S_ij satisfies R_ij = S_i + S_j + S_ij
     from pyapprox.indexing import argsort_indices_leixographically
     I = argsort_indices_leixographically(interaction_terms)
-    from itertools import combinations
     sobol_indices = interaction_values.copy()
     sobol_indices_dict = dict()
     for ii in range(I.shape[0]):
@@ -800,12 +965,41 @@ def sampling_based_sobol_indices(
             for jj in range(nactive_vars-1):
                 indices = combinations(active_vars, jj+1)
                 for key in indices:
-                    sobol_indices[I[ii]] -= \
-                        sobol_indices[sobol_indices_dict[key]]
+                    sobol_indices[:, I[ii]] -= \
+                        sobol_indices[:, sobol_indices_dict[key]]
+    return sobol_indices, total_effect_values, variance, mean
 
-    total_effect_values = np.asarray(total_effect_values)
+
+def sampling_based_sobol_indices(
+        fun, variables, interaction_terms, nsamples, sampling_method='sobol',
+        qmc_start_index=0):
+    """
+    See I.M. Sobol. Mathematics and Computers in Simulation 55 (2001) 271–280
+
+    and  
+
+    Saltelli, Annoni et. al, Variance based sensitivity analysis of model 
+    output. Design and estimator for the total sensitivity index. 2010.
+    https://doi.org/10.1016/j.cpc.2009.09.018
+
+    Parameters
+    ----------
+    interaction_terms : np.ndarray (nvars, nterms)
+        Index defining the active terms in each interaction. If the
+        ith  variable is active interaction_terms[i] == 1 and zero otherwise
+        This index must be downward closed due to way sobol indices are computed
+    """
+    valuesA, valuesB, valuesAB = _evaluate_sobol_index_sample_sets(
+        fun, variables, interaction_terms, nsamples, sampling_method,
+        qmc_start_index)
+    sobol_indices, total_effect_values, variance, mean = \
+        _sobol_indices_from_sample_set_values(
+            interaction_terms, valuesA[None, :], valuesB[None, :],
+            valuesAB[:, None])
+    sobol_indices, total_effect_values = sobol_indices[0], \
+        total_effect_values[0]
+    variance, mean = variance[0], mean[0]
     assert np.all(variance>=0)
-    main_effects = sobol_indices[interaction_terms.sum(axis=0)==1, :]
     # We cannot guarantee that the main_effects will be <= 1. Because
     # variance and each interaction_index are computed with different sample
     # sets. Consider function of two variables which is constant in one variable
@@ -831,6 +1025,9 @@ def repeat_sampling_based_sobol_indices(fun, variables, interaction_terms,
     This function is useful when applid to a random 
     realization of a Gaussian process requires the Cholesky decomposition
     of a nsamples x nsamples matrix which becomes to costly for nsamples >1000
+
+    See :func:`bootstrap_sampling_based_sobol_indices` for an alternative
+    that only evaluates the function once.
     """
     means, variances, sobol_values,  total_values = [], [], [], []
     qmc_start_index = 0
@@ -850,11 +1047,96 @@ def repeat_sampling_based_sobol_indices(fun, variables, interaction_terms,
     return sobol_values, total_values, variances, means
 
 
+def bootstrap_sampling_based_sobol_indices(
+        fun, variables, interaction_terms, nsamples, nbootstraps=1000,
+        sampling_method='random', qmc_start_index=0, alpha=0.05,
+        nbootstraps_per_batch=None):
+    """
+    Compute sobol indices and bootstrap estimates of their confidence
+    intervals. Unlike :func:`repeat_sampling_based_sobol_indices` the 
+    function is only evaluated at the N samples required by 
+    :func:`sampling_based_sobol_indices`. The bootstrap replicates are
+    obtained by resampling, with replacement, the rows of the stored values
+    and are computed in batches of vectorized operations.
+
+    Parameters
+    ----------
+    interaction_terms : np.ndarray (nvars, nterms)
+        Index defining the active terms in each interaction. If the
+        ith  variable is active interaction_terms[i] == 1 and zero otherwise
+        This index must be downward closed due to way sobol indices are computed
+
+    nbootstraps : integer
+        The number of bootstrap replicates
+
+    sampling_method : string
+        The method used to generate the samples. The bootstrap assumes the
+        samples are independent so 'random' is recommended. Bootstrapping 
+        QMC samples produces conservative confidence intervals.
+
+    alpha : float
+        The confidence intervals have level 1-alpha
+
+    nbootstraps_per_batch : integer
+        The number of bootstrap replicates computed in each vectorized
+        batch. The memory required is proportional to
+        nbootstraps_per_batch*nterms*nsamples*nqoi. If None all replicates
+        are computed in a single batch
+
+    Returns
+    -------
+    result : dictionary
+        Result containing the sampling estimates of the mean, variance, 
+        sobol_indices and total_effects, e.g. result['sobol_indices']['value']
+        and statistics of the bootstrap replicates, which are accessed via 
+        the keys 'median', 'q1', 'q3', 'min', 'max' and 'values', e.g.
+        result['sobol_indices']['q1']. These can be passed directly to
+        :func:`plot_sensitivity_indices_with_confidence_intervals`.
+        The (1-alpha) percentile confidence intervals are stored with
+        the keys 'lower_bound' and 'upper_bound'.
+    """
+    valuesA, valuesB, valuesAB = _evaluate_sobol_index_sample_sets(
+        fun, variables, interaction_terms, nsamples, sampling_method,
+        qmc_start_index)
+    nsamples = valuesA.shape[0]
+    if nbootstraps_per_batch is None:
+        nbootstraps_per_batch = nbootstraps
+
+    estimates = _sobol_indices_from_sample_set_values(
+        interaction_terms, valuesA[None, :], valuesB[None, :],
+        valuesAB[:, None])
+    replicates = [[] for ii in range(len(estimates))]
+    for ii in range(0, nbootstraps, nbootstraps_per_batch):
+        nbatch = min(nbootstraps_per_batch, nbootstraps-ii)
+        indices = np.random.randint(0, nsamples, (nbatch, nsamples))
+        batch_replicates = _sobol_indices_from_sample_set_values(
+            interaction_terms, valuesA[indices], valuesB[indices],
+            valuesAB[:, indices])
+        for jj, item in enumerate(batch_replicates):
+            replicates[jj].append(item)
+
+    result = dict()
+    data_names = ['sobol_indices', 'total_effects', 'variance', 'mean']
+    quantiles = [alpha/2, 0.25, 0.5, 0.75, 1-alpha/2]
+    for estimate, item, name in zip(estimates, replicates, data_names):
+        item = np.concatenate(item, axis=0)
+        item_quantiles = np.quantile(item, quantiles, axis=0)
+        subdict = {'value': estimate[0], 'values': item,
+                   'min': item.min(axis=0), 'max': item.max(axis=0)}
+        for key, quantile in zip(
+                ['lower_bound', 'q1', 'median', 'q3', 'upper_bound'],
+                item_quantiles):
+            subdict[key] = quantile
+        result[name] = subdict
+    return result
+
+
 def analytic_sobol_indices_from_gaussian_process(
         gp, variable, interaction_terms, ngp_realizations=1,
         stat_functions=(np.mean, np.median, np.min, np.max),
         ninterpolation_samples=500, nvalidation_samples=100,
-        ncandidate_samples=1000, nquad_samples=50, use_cholesky=True, alpha=0):
+        ncandidate_samples=1000, nquad_samples=50, use_cholesky=True, alpha=0,
+        truncated_cholesky=None):
 
     x_train, y_train, K_inv, lscale, kernel_var, transform_quad_rules = \
         extract_gaussian_process_attributes_for_integration(gp)
@@ -862,7 +1144,8 @@ def analytic_sobol_indices_from_gaussian_process(
     if ngp_realizations > 0:
         gp_realizations = generate_gp_realizations(
             gp, ngp_realizations, ninterpolation_samples, nvalidation_samples,
-            ncandidate_samples, variable, use_cholesky, alpha)
+            ncandidate_samples, variable, use_cholesky, alpha,
+            truncated_cholesky)
 
         # Check how accurate realizations
         validation_samples = generate_independent_random_samples(variable, 1000)
@@ -932,7 +1215,8 @@ def sampling_based_sobol_indices_from_gaussian_process(
         ngp_realizations=1, normalize=True, nsobol_realizations=1,
         stat_functions=(np.mean, np.median, np.min, np.max),
         ninterpolation_samples=500, nvalidation_samples=100,
-        ncandidate_samples=1000, use_cholesky=True, alpha=0):
+        ncandidate_samples=1000, use_cholesky=True, alpha=0,
+        truncated_cholesky=None):
     """
     Compute sobol indices from Gaussian process using sampling. 
     This function returns the mean and variance of these values with 
@@ -978,6 +1262,12 @@ def sampling_based_sobol_indices_from_gaussian_process(
     ncandidate_samples : integer
         The number of candidate samples selected from when building the 
         interpolants of the random realizations
+
+    truncated_cholesky : dictionary
+        If not None, draw the random realizations using a low-rank pivoted
+        Cholesky factorization of the GP covariance with the keys
+        'max_rank' and 'tol'. See
+        :meth:`pyapprox.gaussian_process.GaussianProcess.predict_random_realization`
         
     Returns
     -------
@@ -996,7 +1286,8 @@ def sampling_based_sobol_indices_from_gaussian_process(
         assert ncandidate_samples > ninterpolation_samples
         gp_realizations = generate_gp_realizations(
             gp, ngp_realizations, ninterpolation_samples, nvalidation_samples,
-            ncandidate_samples, variables, use_cholesky, alpha)
+            ncandidate_samples, variables, use_cholesky, alpha,
+            truncated_cholesky)
         fun = gp_realizations
     else:
         fun = gp
@@ -1,4 +1,5 @@
 import unittest
+import os
 import pyapprox as pya
 import numpy as np
 import matplotlib.pyplot as plt
@@ -264,7 +265,8 @@ def setup_check_variance_reduction_model_ensemble_polynomial():
 
 def check_variance_reduction(allocate_samples,generate_samples_and_values,
                              get_cv_weights,get_rsquared,setup_model,
-                             rtol=1e-2,ntrials=1e3,max_eval_concurrency=1):
+                             rtol=1e-2,ntrials=1e3,max_eval_concurrency=1,
+                             vectorize_trials=False,assert_omp=True):
 
     assert get_rsquared is not None
     model_ensemble, cov, generate_samples = setup_model()
@@ -272,7 +274,8 @@ def check_variance_reduction(allocate_samples,generate_samples_and_values,
         estimate_variance_reduction(
             model_ensemble, cov, generate_samples,
             allocate_samples,generate_samples_and_values,
-            get_cv_weights,get_rsquared,ntrials,max_eval_concurrency)
+            get_cv_weights,get_rsquared,ntrials,max_eval_concurrency,
+            vectorize_trials=vectorize_trials,assert_omp=assert_omp)
 
 
     #print('true',true_var_reduction,'numerical',numerical_var_reduction)
@@ -485,6 +488,168 @@ class TestCVMC(unittest.TestCase):
             get_cv_weights, get_rsquared, setup_model, ntrials=5e4,
             max_eval_concurrency=1)
 
+    def test_variance_reduction_vectorized_trials(self):
+        setup_model = \
+            setup_check_variance_reduction_model_ensemble_polynomial
+        allocate_samples = pya.allocate_samples_mfmc
+        K,L = 3,2
+        generate_samples_and_values = partial(
+            generate_samples_and_values_acv_KL,K=K,L=L)
+        get_discrepancy_covariances =  partial(
+            get_discrepancy_covariances_KL,K=K,L=L)
+        get_cv_weights = partial(
+            get_approximate_control_variate_weights,
+            get_discrepancy_covariances=get_discrepancy_covariances)
+        get_rsquared = partial(
+            get_rsquared_acv,
+            get_discrepancy_covariances=get_discrepancy_covariances)
+
+        # check the samples traced for a single realization of the
+        # estimator are consistent with generate_samples_and_values
+        model_ensemble, cov, generate_samples = setup_model()
+        nmodels = cov.shape[0]
+        costs = np.asarray([100//2**ii for ii in range(nmodels)])
+        nhf_samples, nsample_ratios = allocate_samples(
+            cov, costs, int(1e4))[:2]
+        sample_ids, nsamples_per_trial = get_acv_sample_ids(
+            nhf_samples,nsample_ratios,generate_samples_and_values)
+        samples,values = generate_samples_and_values(
+            nhf_samples,nsample_ratios,model_ensemble,generate_samples)
+        assert nsamples_per_trial==max(
+            [s[1].shape[1] for s in samples[1:]])
+        for ii in range(nmodels):
+            for jj in range(2):
+                if samples[ii][jj] is None:
+                    assert sample_ids[ii][jj] is None
+                    continue
+                assert sample_ids[ii][jj].shape[0]==values[ii][jj].shape[0]
+        
+        check_variance_reduction(
+            allocate_samples, generate_samples_and_values,
+            get_cv_weights, get_rsquared, setup_model, ntrials=int(3e4),
+            vectorize_trials=True)
+
+        allocate_samples = pya.allocate_samples_mlmc
+        generate_samples_and_values = generate_samples_and_values_mlmc
+        get_cv_weights = get_mlmc_control_variate_weights_pool_wrapper
+        get_rsquared = get_rsquared_mlmc
+        check_variance_reduction(
+            allocate_samples, generate_samples_and_values,
+            get_cv_weights, get_rsquared, setup_model, ntrials=5e4,
+            vectorize_trials=True)
+
+        setup_model = setup_check_variance_reduction_model_ensemble_tunable
+        allocate_samples = pya.allocate_samples_mfmc
+        generate_samples_and_values = generate_samples_and_values_acv_IS
+        get_cv_weights = partial(
+            get_approximate_control_variate_weights,
+            get_discrepancy_covariances=get_discrepancy_covariances_IS)
+        get_rsquared = partial(
+            get_rsquared_acv,
+            get_discrepancy_covariances=get_discrepancy_covariances_IS)
+        check_variance_reduction(
+            allocate_samples, generate_samples_and_values,
+            get_cv_weights, get_rsquared, setup_model, rtol=1e-2,
+            ntrials=2e4, vectorize_trials=True)
+
+        # a pool is only created if OMP_NUM_THREADS=1 unless assert_omp=False
+        omp_num_threads = os.environ.pop('OMP_NUM_THREADS',None)
+        try:
+            self.assertRaises(
+                Exception, check_variance_reduction, allocate_samples,
+                generate_samples_and_values, get_cv_weights, get_rsquared,
+                setup_model, rtol=None, ntrials=10, max_eval_concurrency=2)
+            check_variance_reduction(
+                allocate_samples, generate_samples_and_values,
+                get_cv_weights, get_rsquared, setup_model, rtol=None,
+                ntrials=10, max_eval_concurrency=2, assert_omp=False)
+        finally:
+            if omp_num_threads is not None:
+                os.environ['OMP_NUM_THREADS'] = omp_num_threads
+
+    def test_streaming_acv_estimator(self):
+        model_ensemble, cov, generate_samples = \
+            setup_check_variance_reduction_model_ensemble_tunable()
+        costs = np.asarray([100,10,1])
+        for estimator_type in [ACVMF,MFMC]:
+            estimator = estimator_type(cov,costs)
+            acv_modification = estimator_type==ACVMF
+            streaming_estimator = StreamingACVEstimator(
+                estimator,generate_samples)
+            for target_cost in [1e3,1e4]:
+                nhf_samples,nsample_ratios = \
+                    streaming_estimator.set_target_cost(target_cost)
+                nprev_samples = streaming_estimator.nsamples_evaluated.copy()
+                # add values of the high-fidelity model in two batches
+                new_samples = streaming_estimator.get_new_samples()
+                nsamples = new_samples[0].shape[1]//2
+                streaming_estimator.add_values(
+                    0,model_ensemble.functions[0](
+                        new_samples[0][:,:nsamples]))
+                streaming_estimator.evaluate_models(model_ensemble)
+                nsamples = streaming_estimator.get_nsamples()
+                # only samples not previously evaluated are evaluated
+                assert np.allclose(
+                    streaming_estimator.nsamples_evaluated,nsamples)
+                assert np.all(nsamples>=nprev_samples)
+
+                stream_samples = streaming_estimator.samples[
+                    :,:nsamples.max()]
+                samples,values = generate_samples_and_values_mfmc(
+                    nhf_samples,nsample_ratios,model_ensemble,
+                    lambda n: stream_samples[:,:n],acv_modification)
+                assert np.allclose(
+                    streaming_estimator(),estimator(values))
+
+                shared_values = np.hstack(
+                    [v[0][:nsamples[0]] for v in values])
+                assert np.allclose(
+                    streaming_estimator.get_covariance(),
+                    np.cov(shared_values,rowvar=False))
+
+        # estimators that do not use nested samples are not supported
+        for estimator in [MLMC(cov,costs),ACVGMF(cov,costs,[0,0])]:
+            self.assertRaises(
+                Exception,StreamingACVEstimator,estimator,generate_samples)
+
+    def test_estimate_model_ensemble_covariance_sequential(self):
+        model_ensemble, cov, generate_samples = \
+            setup_check_variance_reduction_model_ensemble_polynomial()
+        nmodels = cov.shape[0]
+        costs = np.asarray([100//2**ii for ii in range(nmodels)])
+        target_cost = int(1e4)
+        for nbootstraps in [20,0]:
+            max_npilot_samples = 1000
+            pilot_cov, pilot_samples, pilot_values, history = \
+                estimate_model_ensemble_covariance_sequential(
+                    20,generate_samples,model_ensemble,
+                    pya.allocate_samples_mfmc,costs,target_cost,
+                    max_npilot_samples,rtol=5e-2,nbootstraps=nbootstraps)
+            npilot_samples = pilot_values.shape[0]
+            assert npilot_samples<max_npilot_samples
+            assert pilot_samples.shape[1]==npilot_samples
+            assert np.allclose(history['npilot_samples'][-1],npilot_samples)
+            assert np.allclose(pilot_cov,np.cov(pilot_values,rowvar=False))
+            assert np.allclose(
+                pilot_values[:,0:1],model_ensemble.functions[0](
+                    pilot_samples))
+            assert np.allclose(pilot_cov,cov,atol=5e-2)
+            nhf_samples,nsample_ratios = pya.allocate_samples_mfmc(
+                cov,costs,target_cost)[:2]
+            true_nsamples = np.concatenate(
+                [[nhf_samples],nsample_ratios*nhf_samples])
+            assert np.allclose(
+                history['nsamples'][-1],true_nsamples,rtol=0.2)
+
+        # check the study terminates when the maximum number of samples
+        # is reached
+        pilot_cov, pilot_samples, pilot_values, history = \
+            estimate_model_ensemble_covariance_sequential(
+                20,generate_samples,model_ensemble,
+                pya.allocate_samples_mfmc,costs,target_cost,50,rtol=1e-8,
+                nbootstraps=0)
+        assert np.allclose(history['npilot_samples'],[20,40,50])
+
     def test_CVMC(self):
         nhf_samples = 10
         model_ensemble, cov, generate_samples = \
@@ -600,6 +765,207 @@ class TestCVMC(unittest.TestCase):
         # To recover alexs answer use his standardization and initial guess
         # is mlmc with standardize=True')
 
+    def test_discrepancy_factors_batch(self):
+        nmodels = 5
+        matr = np.random.randn(nmodels,nmodels)
+        cov = np.dot(matr, matr.T)+np.eye(nmodels)
+        # get_discrepancy_covariances_KL assumes the sample ratios increase
+        nsample_ratios = np.sort(
+            np.exp(np.random.uniform(0,3,(4,nmodels-1))),axis=1)
+        mf_factors = get_discrepancy_factors_MF_batch(nsample_ratios)
+        for K in range(1,nmodels):
+            for L in range(1,K+1):
+                factors = get_discrepancy_factors_KL_batch(
+                    nsample_ratios,K,L,mf_factors)
+                rsquared = get_rsquared_acv_batch(cov,factors)
+                get_discrepancy_covariances = partial(
+                    get_discrepancy_covariances_KL,K=K,L=L)
+                for ii in range(nsample_ratios.shape[0]):
+                    CF,cf = get_discrepancy_covariances(
+                        cov,nsample_ratios[ii])
+                    assert np.allclose(cov[1:,1:]*factors[ii],CF)
+                    assert np.allclose(rsquared[ii],get_rsquared_acv(
+                        cov,nsample_ratios[ii],get_discrepancy_covariances))
+
+        for get_factors,get_discrepancy_covariances in zip(
+                [get_discrepancy_factors_MF_batch,
+                 get_discrepancy_factors_IS_batch],
+                [get_discrepancy_covariances_MF,
+                 get_discrepancy_covariances_IS]):
+            factors = get_factors(nsample_ratios)
+            for ii in range(nsample_ratios.shape[0]):
+                CF,cf = get_discrepancy_covariances(cov,nsample_ratios[ii])
+                assert np.allclose(cov[1:,1:]*factors[ii],CF)
+
+        # the ACV-KL factors are also valid for ratios that do not increase
+        # so r^2 cannot exceed the r^2 of the optimal control variate
+        nsample_ratios = np.exp(np.random.uniform(0,3,(100,nmodels-1)))
+        rsquared_ocv = get_control_variate_rsquared(cov)
+        for K in range(1,nmodels):
+            for L in range(1,K+1):
+                rsquared = get_rsquared_acv_batch(
+                    cov,get_discrepancy_factors_KL_batch(
+                        nsample_ratios,K,L))
+                assert np.all(rsquared<=rsquared_ocv*(1+1e-8))
+
+    def test_ACVMC_sample_allocation_multistart(self):
+        np.random.seed(1)
+        matr = np.random.randn(3,3)
+        cov = np.dot(matr, matr.T)
+        costs = [4, 2, 1]
+        target_cost = 20
+
+        nhf_samples_init, nsample_ratios_init =  allocate_samples_mlmc(
+            cov, costs, target_cost, standardize=True)[:2]
+        initial_guess = np.concatenate(
+            [[nhf_samples_init],nsample_ratios_init])
+        nhf_samples,nsample_ratios,log10_var=allocate_samples_acv_best_kl(
+            cov,costs,target_cost,standardize=False,
+            initial_guess=initial_guess,optim_options={'disp':False,'ftol':1e-10,'maxiter':10000,
+                           'iprint':0})
+        nhf_samples_ms,nsample_ratios_ms,log10_var_ms,KL = \
+            allocate_samples_acv_best_kl_multistart(
+                cov,costs,target_cost,standardize=False)
+        assert log10_var_ms<=log10_var+1e-6
+        estimator = ACVMFKL(cov,costs,target_cost,*KL)
+        assert np.allclose(
+            estimator.get_variance(nhf_samples_ms,nsample_ratios_ms),
+            10**log10_var_ms)
+        assert np.allclose(
+            costs[0]*nhf_samples_ms+np.dot(costs[1:],nsample_ratios_ms)*
+            nhf_samples_ms,target_cost)
+
+        # optim_options are passed to the local optimizer of the multistart
+        nhf_samples,nsample_ratios,log10_var=allocate_samples_acv_best_kl(
+            cov,costs,target_cost,standardize=False,
+            optim_options={'ftol':1e-10},optim_method='multistart',
+            nstarts=2,ncandidates=100)
+        assert np.allclose(log10_var,log10_var_ms,rtol=1e-4)
+
+    def test_ACVMC_sample_allocation_multistart_KL_constraints(self):
+        np.random.seed(0)
+        nmodels = 5
+        matr = np.random.randn(nmodels,nmodels)
+        cov = np.dot(matr, matr.T)
+        costs = np.asarray([16, 8, 4, 2, 1])
+        target_cost = 1000
+
+        # the unconstrained optimum uses fewer samples for the last
+        # low-fidelity models than for model L
+        K, L = 2, 2
+        nsample_ratios = allocate_samples_acv_multistart(
+            cov,costs,target_cost,
+            partial(get_discrepancy_factors_KL_batch,K=K,L=L),
+            standardize=False,nstarts=3,ncandidates=100)[1]
+        assert np.any(nsample_ratios[K:]<nsample_ratios[L-1])
+
+        nhf_samples,nsample_ratios,log10_var,KL = \
+            allocate_samples_acv_best_kl_multistart(
+                cov,costs,target_cost,standardize=False,ncandidates=200)
+        for a, b in get_sample_ratio_constraints_KL(nmodels,*KL):
+            assert nsample_ratios[a]>=nsample_ratios[b]*(1-1e-8)
+        estimator = ACVMFKL(cov,costs,target_cost,*KL)
+        assert np.allclose(
+            estimator.get_variance(nhf_samples,nsample_ratios),
+            10**log10_var)
+
+        # constrained candidates satisfy every constraint
+        candidates = get_acv_candidate_sample_ratios(costs,target_cost,100)
+        for K in range(1,nmodels):
+            for L in range(1,K+1):
+                ratio_constraints = get_sample_ratio_constraints_KL(
+                    nmodels,K,L)
+                constrained_candidates = apply_sample_ratio_constraints(
+                    candidates,ratio_constraints)
+                for a, b in ratio_constraints:
+                    assert np.all(constrained_candidates[:,a]>=
+                                  constrained_candidates[:,b])
+                # the batch factors match the ACV-KL covariances
+                factors = get_discrepancy_factors_KL_batch(
+                    constrained_candidates[:5],K,L)
+                for ii in range(5):
+                    CF = get_discrepancy_covariances_KL(
+                        cov,constrained_candidates[ii],K,L)[0]
+                    assert np.allclose(cov[1:,1:]*factors[ii],CF)
+
+    def test_variance_reduction_acv_recursion_index(self):
+        setup_model = \
+            setup_check_variance_reduction_model_ensemble_polynomial
+        model_ensemble, cov, generate_samples = setup_model()
+        # the second sample set of the last model is smaller than its first
+        recursion_index = [0,0,1,2]
+        nhf_samples,nsample_ratios = 10,np.asarray([2,3,6,2])
+        def allocate_samples(cov,costs,target_cost):
+            return nhf_samples,nsample_ratios
+        get_discrepancy_covariances = partial(
+            get_discrepancy_covariances_recursion_index,
+            recursion_index=recursion_index)
+        get_cv_weights = partial(
+            get_approximate_control_variate_weights,
+            get_discrepancy_covariances=get_discrepancy_covariances)
+        get_rsquared = partial(
+            get_rsquared_acv,
+            get_discrepancy_covariances=get_discrepancy_covariances)
+        generate_samples_and_values = partial(
+            generate_samples_and_values_acv_recursion_index,
+            recursion_index=recursion_index)
+        check_variance_reduction(
+            allocate_samples, generate_samples_and_values,
+            get_cv_weights, get_rsquared, setup_model, ntrials=int(5e4),
+            vectorize_trials=True)
+
+        factors = get_discrepancy_factors_recursion_index_batch(
+            nsample_ratios[np.newaxis,:],recursion_index)
+        assert np.allclose(
+            get_rsquared_acv_batch(cov,factors),
+            get_rsquared(cov,nsample_ratios))
+
+        # check ACV-MF, MFMC and ACV-KL are special cases
+        nmodels = cov.shape[0]
+        nsample_ratios = np.asarray([2,3,6,8])
+        assert np.allclose(
+            get_rsquared_acv(
+                cov,nsample_ratios,partial(
+                    get_discrepancy_covariances_recursion_index,
+                    recursion_index=np.arange(nmodels-1))),
+            get_rsquared_mfmc(cov,nsample_ratios))
+        for K in range(1,nmodels):
+            for L in range(1,K+1):
+                recursion_index = [0]*K+[L]*(nmodels-1-K)
+                CF,cf = get_discrepancy_covariances_recursion_index(
+                    cov,nsample_ratios,recursion_index)
+                CF_KL,cf_KL = get_discrepancy_covariances_KL(
+                    cov,nsample_ratios,K,L)
+                assert np.allclose(CF,CF_KL)
+                assert np.allclose(cf,cf_KL)
+
+    def test_search_acv_recursion_index(self):
+        model_ensemble, cov, generate_samples = \
+            setup_check_variance_reduction_model_ensemble_polynomial()
+        nmodels = cov.shape[0]
+        costs = np.asarray([100//2**ii for ii in range(nmodels)])
+        target_cost = int(1e4)
+        results = []
+        for max_nindices in [1000,10]:
+            nhf_samples, nsample_ratios, log10_var, recursion_index = \
+                search_acv_recursion_index(
+                    cov,costs,target_cost,standardize=False,
+                    max_nindices=max_nindices)
+            estimator = ACVGMF(cov,costs,recursion_index)
+            assert np.allclose(
+                estimator.get_variance(nhf_samples,nsample_ratios),
+                10**log10_var)
+            results.append(log10_var)
+        assert np.allclose(results[0],results[1],rtol=1e-2)
+
+        mfmc_log10_var = allocate_samples_mfmc(
+            cov,costs,target_cost,standardize=False)[2]
+        ocv_log10_var = np.log10(
+            cov[0,0]*(1-get_control_variate_rsquared(cov))*costs[0]/
+            target_cost)
+        assert log10_var<=mfmc_log10_var
+        assert log10_var>=ocv_log10_var
+
     @skiptest
     def test_ACVMC_objective_jacobian(self):
         
@@ -622,6 +988,124 @@ class TestCVMC(unittest.TestCase):
         #print(errors.min())
         assert errors.min()<1e-8
 
+    def test_evaluate_acv_sample_sets(self):
+        nevals = [0]*3
+        def setup_model(ii):
+            def model(samples):
+                nevals[ii] += samples.shape[1]
+                return np.hstack([samples.T**(ii+1),np.cos(samples.T)])
+            return model
+        functions = [setup_model(ii) for ii in range(3)]
+        def generate_samples(nsamples):
+            return np.random.uniform(0,1,(1,nsamples))
+        nhf_samples, nsample_ratios = 10, np.array([2,4])
+        for generate_samples_and_values in [
+                generate_samples_and_values_mlmc,
+                generate_samples_and_values_acv_IS,
+                generate_samples_and_values_mfmc,
+                partial(generate_samples_and_values_acv_recursion_index,
+                        recursion_index=[0,0])]:
+            results = []
+            for max_eval_concurrency,funcs in [
+                    (1,functions),(2,functions),(1,ModelEnsemble(functions))]:
+                nevals[:] = [0]*3
+                np.random.seed(1)
+                samples,values = generate_samples_and_values(
+                    nhf_samples,nsample_ratios,funcs,generate_samples,
+                    max_eval_concurrency=max_eval_concurrency)
+                # each model is evaluated once at each of its samples
+                nunique_samples = [np.unique(np.hstack(
+                    [s for s in ss if s is not None])).shape[0]
+                                   for ss in samples]
+                assert nevals==nunique_samples
+                for ii in range(3):
+                    for s,v in zip(samples[ii],values[ii]):
+                        if s is not None:
+                            assert np.allclose(v,functions[ii](s))
+                    # the values are views of the values of all jobs
+                    assert values[ii][0].base is values[0][0].base
+                results.append(values)
+            for values in results[1:]:
+                for v1,v2 in zip(results[0],values):
+                    assert np.allclose(v1[0],v2[0])
+        # the samples of consecutive levels of MLMC are shared
+        samples = generate_samples_and_values_mlmc(
+            nhf_samples,nsample_ratios,functions,generate_samples)[0]
+        for ii in range(1,3):
+            assert np.allclose(samples[ii][0],samples[ii-1][-1 if ii>1 else 0])
+            
+
+    def test_multioutput_acv(self):
+        np.random.seed(1)
+        univariate_variables = [uniform(0,1)]
+        variable = pya.IndependentMultivariateRandomVariable(
+            univariate_variables)
+        generate_samples = partial(
+            pya.generate_independent_random_samples,variable)
+        def setup_model(degree):
+            def model(samples):
+                return np.hstack(
+                    [samples.T**degree,np.cos(degree*samples.T)])
+            return model
+        models = [setup_model(degree) for degree in [5,4,3]]
+        nmodels, nqoi = len(models), 2
+        costs = [1,0.1,0.05]
+
+        x,w = pya.gauss_jacobi_pts_wts_1D(20,0,0)
+        x = (x[np.newaxis,:]+1)/2
+        vals = np.hstack([model(x) for model in models])
+        cov = np.cov(vals,aweights=w,rowvar=False,ddof=0)
+        centered_vals_sq = (vals-vals.T.dot(w))**2
+        V = np.cov(centered_vals_sq,aweights=w,rowvar=False,ddof=0)
+
+        # check the single output estimator matches ACV-GMF
+        recursion_index = [0,1]
+        nhf_samples, nsample_ratios = 10, np.array([2,4])
+        est = MultiOutputACV(
+            cov[::nqoi,::nqoi],costs,1,recursion_index)
+        CF,cf = get_discrepancy_covariances_recursion_index(
+            cov[::nqoi,::nqoi],nsample_ratios,recursion_index)
+        assert np.allclose(est.get_variance(nhf_samples,nsample_ratios),
+            cov[0,0]/nhf_samples*(1-cf.dot(np.linalg.solve(CF,cf))/cov[0,0]))
+
+        ntrials = int(1e4)
+        for statistic in ['mean','variance']:
+            est = MultiOutputACV(
+                cov,costs,nqoi,recursion_index,statistic,V)
+            estimates = np.empty((ntrials,nqoi))
+            for ii in range(ntrials):
+                samples,values = est.generate_data(
+                    nhf_samples,nsample_ratios,generate_samples,models)
+                estimates[ii] = est(values)
+            true_stats = vals[:,:nqoi].T.dot(w)
+            if statistic=='variance':
+                true_stats = np.diag(cov)[:nqoi]
+            est_cov = est.get_covariance(nhf_samples,nsample_ratios)
+            #print(estimates.mean(axis=0),true_stats)
+            #print(np.cov(estimates,rowvar=False),est_cov)
+            assert np.allclose(estimates.mean(axis=0),true_stats,
+                               rtol=1e-2,atol=1e-4)
+            assert np.allclose(
+                np.diag(np.cov(estimates,rowvar=False)),np.diag(est_cov),
+                rtol=5e-2)
+            # the estimator is better than single fidelity Monte Carlo 
+            hf_cov = est.get_discrepancy_covariances(
+                nhf_samples,nsample_ratios)[2]
+            assert np.all(np.diag(est_cov)<np.diag(hf_cov))
+
+        # allocation
+        target_cost = 100
+        est = MultiOutputACV(cov,costs,nqoi,[0,0],'variance',V)
+        nhf_samples,nsample_ratios,log10_var = est.allocate_samples(
+            target_cost)
+        assert np.allclose(
+            nhf_samples*(costs[0]+np.dot(costs[1:],nsample_ratios)),
+            target_cost,rtol=2e-2)
+        assert log10_var<np.log10(est.get_variance(
+            *standardize_sample_ratios(
+                target_cost/(costs[0]+2*np.sum(costs[1:])),
+                2*np.ones(nmodels-1))))
+
     def test_bootstrap_monte_carlo_estimator(self):
         nsamples = int(1e4)
         nbootstraps=int(1e3)
@@ -156,6 +156,45 @@ class TestFunctionTrain(unittest.TestCase):
 
         assert np.allclose(fd_gradient,ft_gradient)
 
+    def test_evaluate_function_train_jacobian(self):
+        """
+        Test the batched evaluation of the gradient with respect to the 
+        coefficients of the univariate functions against the single sample 
+        forward and backward passes.
+        """
+        alpha=0; beta=0; degree = 3; num_vars = 4; rank = 3
+        recursion_coeffs = jacobi_recurrence(
+            degree+1, alpha=alpha,beta=beta,probability=True)
+
+        ranks = ranks_vector(num_vars,rank)
+        num_params_1d=degree+1
+        ft_params=np.random.normal(
+            0.,1.,(num_params_1d*num_univariate_functions(ranks)))
+        homogeneous_ft_data = generate_homogeneous_function_train(
+            ranks,num_params_1d,ft_params)
+        univariate_function_params = [
+            np.random.normal(0.,1.,(degree+1)) for ii in range(num_vars)]
+        additive_ft_data = generate_additive_function_in_function_train_format(
+            univariate_function_params,True)
+
+        num_samples = 20
+        samples = np.random.uniform(-1.,1.,(num_vars,num_samples))
+        for ft_data in [homogeneous_ft_data,additive_ft_data]:
+            values, jacobian = evaluate_function_train_jacobian(
+                samples,ft_data,recursion_coeffs)
+            assert np.allclose(
+                values,evaluate_function_train(
+                    samples,ft_data,recursion_coeffs))
+            for ii in range(num_samples):
+                value, values_of_cores, derivs_of_cores = \
+                    evaluate_ft_gradient_forward_pass(
+                        samples[:,ii:ii+1],ft_data,recursion_coeffs)
+                gradient = evalaute_ft_gradient_backward_pass(
+                    ft_data[0],values_of_cores,derivs_of_cores,ft_data[2],
+                    ft_data[3])
+                assert np.allclose(value,values[ii])
+                assert np.allclose(gradient,jacobian[ii])
+
     def test_least_squares_regression(self):
         """
         Use non-linear least squares to estimate the coefficients of the
@@ -5,7 +5,7 @@ from pyapprox.variable_transformations import AffineRandomVariableTransformation
 from pyapprox.indexing import compute_hyperbolic_indices
 import pyapprox as pya
 from scipy import stats
-from scipy.linalg import solve_triangular
+from scipy.linalg import solve_triangular, cholesky
 from scipy.spatial.distance import cdist
 import copy
 import time
@@ -169,6 +169,174 @@ class TestGaussianProcess(unittest.TestCase):
             random_gp_vals[:gp_realizations.selected_canonical_samples.shape[1]],
             atol=5e-8)
 
+    def test_gaussian_process_predict_in_batches(self):
+        nvars = 2
+        ntrain_samples = 20
+        def func(x): return np.sum(x**2, axis=0)[:, np.newaxis]
+
+        train_samples = np.random.uniform(-1, 1, (nvars, ntrain_samples))
+        kernel = Matern(0.4, length_scale_bounds='fixed', nu=2.5)
+        kernel = ConstantKernel(
+            constant_value=2., constant_value_bounds='fixed')*kernel
+        gp = GaussianProcess(kernel, normalize_y=True)
+        gp.fit(train_samples, func(train_samples))
+
+        samples = np.random.uniform(-1, 1, (nvars, 1001))
+        true_vals, true_std = gp(samples, return_std=True)
+        for max_eval_concurrency in [1, 3]:
+            vals, std = gp(
+                samples, return_std=True, nsamples_per_batch=100,
+                max_eval_concurrency=max_eval_concurrency)
+            assert np.allclose(vals, true_vals)
+            assert np.allclose(std, true_std)
+        vals = gp(samples, nsamples_per_batch=100)
+        assert vals.shape == true_vals.shape
+        assert np.allclose(vals, true_vals)
+
+    def test_gaussian_process_log_marginal_likelihood(self):
+        from sklearn.gaussian_process import GaussianProcessRegressor
+        nvars = 3
+        ntrain_samples = 30
+        def func(x): return np.sum(np.cos(x), axis=0)[:, np.newaxis]
+
+        train_samples = np.random.uniform(-1, 1, (nvars, ntrain_samples))
+        train_vals = func(train_samples)
+        for nu in [0.5, 1.5, 2.5, np.inf]:
+            kernel = Matern([0.5, 1, 2], length_scale_bounds=(1e-2, 10),
+                            nu=nu)
+            kernel = ConstantKernel(
+                constant_value=2., constant_value_bounds=(1e-1, 10))*kernel
+            kernel += WhiteKernel(
+                noise_level=1e-2, noise_level_bounds=(1e-3, 1))
+            gp = GaussianProcess(kernel, optimizer=None, alpha=1e-8)
+            gp.fit(train_samples, train_vals)
+            sklearn_gp = GaussianProcessRegressor(
+                kernel, optimizer=None, alpha=1e-8)
+            sklearn_gp.fit(train_samples.T, train_vals)
+            theta = gp.kernel_.theta+0.1
+            lml, lml_grad = gp.log_marginal_likelihood(
+                theta, eval_gradient=True)
+            true_lml, true_lml_grad = sklearn_gp.log_marginal_likelihood(
+                theta, eval_gradient=True)
+            assert np.allclose(lml, true_lml)
+            assert np.allclose(lml_grad, true_lml_grad)
+
+        # fixed hyper-parameters and isotropic length scale
+        kernel = RBF(0.7, length_scale_bounds=(1e-2, 10))*ConstantKernel(
+            constant_value=2., constant_value_bounds='fixed')
+        gp = GaussianProcess(kernel, optimizer=None).fit(
+            train_samples, train_vals)
+        sklearn_gp = GaussianProcessRegressor(kernel, optimizer=None).fit(
+            train_samples.T, train_vals)
+        theta = gp.kernel_.theta-0.2
+        lml, lml_grad = gp.log_marginal_likelihood(theta, eval_gradient=True)
+        true_lml, true_lml_grad = sklearn_gp.log_marginal_likelihood(
+            theta, eval_gradient=True)
+        assert np.allclose(lml, true_lml)
+        assert np.allclose(lml_grad, true_lml_grad)
+
+    def test_gaussian_process_parallel_optimizer_restarts(self):
+        nvars = 2
+        ntrain_samples = 30
+        def func(x): return np.sum(np.cos(2*x), axis=0)[:, np.newaxis]
+
+        train_samples = np.random.uniform(-1, 1, (nvars, ntrain_samples))
+        train_vals = func(train_samples)
+        kernel = Matern([1, 1], length_scale_bounds=(1e-2, 10), nu=2.5)
+        gp = GaussianProcess(kernel, n_restarts_optimizer=4, random_state=1)
+        gp.fit(train_samples, train_vals)
+        parallel_gp = GaussianProcess(
+            kernel, n_restarts_optimizer=4, random_state=1)
+        parallel_gp.set_max_eval_concurrency(2)
+        parallel_gp.fit(train_samples, train_vals)
+        assert np.allclose(parallel_gp.log_marginal_likelihood_value_,
+                           gp.log_marginal_likelihood_value_)
+        assert np.allclose(parallel_gp.kernel_.theta, gp.kernel_.theta)
+        samples = np.random.uniform(-1, 1, (nvars, 100))
+        assert np.allclose(parallel_gp(samples), gp(samples))
+
+    def test_sparse_gaussian_process(self):
+        from scipy.optimize import approx_fprime
+        nvars = 2
+        ntrain_samples = 60
+        def func(x): return np.sum(np.cos(2*x), axis=0)[:, np.newaxis]
+
+        train_samples = np.random.uniform(-1, 1, (nvars, ntrain_samples))
+        train_vals = func(train_samples)
+        kernel = Matern([0.5, 0.8], length_scale_bounds=(1e-2, 10), nu=2.5)
+        kernel = ConstantKernel(
+            constant_value=1.5, constant_value_bounds=(1e-1, 10))*kernel
+        exact_gp = GaussianProcess(kernel, optimizer=None, alpha=1e-3)
+        exact_gp.fit(train_samples, train_vals)
+        samples = np.random.uniform(-1, 1, (nvars, 10))
+        exact_mean, exact_std = exact_gp(samples, return_std=True)
+        theta = exact_gp.kernel_.theta+0.1
+        for approximation in ['fitc', 'vfe']:
+            # when the inducing samples are the training samples the sparse
+            # GP is the exact GP
+            gp = SparseGaussianProcess(kernel, optimizer=None, alpha=1e-3)
+            gp.set_inducing_samples(train_samples)
+            gp.set_approximation(approximation)
+            gp.fit(train_samples, train_vals)
+            mean, std = gp(samples, return_std=True)
+            assert np.allclose(mean, exact_mean)
+            assert np.allclose(std, exact_std)
+            assert np.allclose(gp.log_marginal_likelihood(theta),
+                               exact_gp.log_marginal_likelihood(theta))
+
+            gp.set_inducing_samples(train_samples[:, :15])
+            gp.fit(train_samples, train_vals)
+            assert gp.X_train_.shape[0] == 15
+            lml, lml_grad = gp.log_marginal_likelihood(
+                theta, eval_gradient=True)
+            fd_lml_grad = approx_fprime(
+                theta, gp.log_marginal_likelihood, 1e-7)
+            assert np.allclose(lml_grad, fd_lml_grad, rtol=1e-5)
+
+    def test_integrate_sparse_gaussian_process(self):
+        nvars = 2
+        a = np.array([1, 0.25])
+        def func(x):
+            return np.sum(a[:, None]*(2*x-1)**2, axis=0)[:, np.newaxis]
+
+        ntrain_samples = 100
+        train_samples = np.random.uniform(0, 1, (nvars, ntrain_samples))
+        train_vals = func(train_samples)
+
+        univariate_variables = [stats.uniform(0, 1)]*nvars
+        variable = pya.IndependentMultivariateRandomVariable(
+            univariate_variables)
+
+        kernel = Matern(np.ones(nvars), length_scale_bounds=(1e-2, 10),
+                        nu=np.inf)
+        kernel = ConstantKernel(
+            constant_value=1., constant_value_bounds='fixed')*kernel
+        gp = SparseGaussianProcess(kernel, n_restarts_optimizer=1, alpha=1e-6)
+        sampler = CholeskySampler(nvars, 1000, variable)
+        gp.set_inducing_samples(sampler=sampler, ninducing_samples=20)
+        gp.fit(train_samples, train_vals)
+        assert np.allclose(gp.X_train_, sampler.training_samples.T)
+
+        expected_random_mean, variance_random_mean, expected_random_var,\
+            variance_random_var = integrate_gaussian_process(gp, variable)
+        true_mean = 1/3*a.sum()
+        assert np.allclose(expected_random_mean, true_mean, rtol=1e-3)
+
+        unnormalized_main_effect_0 = a[0]**2/5+(2*a[0]*a[1])/9+a[1]**2/9 -\
+            true_mean**2
+        unnormalized_main_effect_1 = a[1]**2/5+(2*a[0]*a[1])/9+a[0]**2/9 -\
+            true_mean**2
+        true_unnormalized_sobol_indices = np.array(
+            [[unnormalized_main_effect_0, unnormalized_main_effect_1, 0]]).T
+        true_sobol_indices = true_unnormalized_sobol_indices/np.sum(
+            true_unnormalized_sobol_indices)
+        interaction_terms = compute_hyperbolic_indices(nvars, 2)
+        interaction_terms = interaction_terms[:,
+            np.where(interaction_terms.max(axis=0)==1)[0]]
+        sobol_indices = compute_expected_sobol_indices(
+            gp, variable, interaction_terms, nquad_samples=100)[0]
+        assert np.allclose(sobol_indices, true_sobol_indices, atol=1e-3)
+
     def test_gaussian_process_pointwise_variance(self):
         nvars = 1
         lb, ub = 0, 1
@@ -492,6 +660,35 @@ class TestGaussianProcess(unittest.TestCase):
         # plt.plot(xx,vals)
         # plt.show()
 
+    def test_squared_exponential_kernel_integrals(self):
+        univariate_variables = [
+            stats.norm(0.5, 2), stats.uniform(-1, 2), stats.norm(0, 1)]
+        variable = pya.IndependentMultivariateRandomVariable(
+            univariate_variables)
+        nvars, ntrain_samples = variable.num_vars(), 30
+        train_samples = pya.generate_independent_random_samples(
+            variable, ntrain_samples)
+        length_scale = np.array([1.5, 0.5, 1.])
+
+        # quadrature rules with many points are needed to accurately
+        # integrate with respect to the Gaussian marginals
+        result_1d = \
+            get_gaussian_process_squared_exponential_kernel_1d_integrals(
+                train_samples, length_scale, variable, True,
+                nquad_samples=200)
+        true_integrals = [np.prod(np.array(r), axis=0) for r in result_1d]
+        for max_block_entries in [2**24, 2*nvars*ntrain_samples]:
+            integrals = \
+                get_gaussian_process_squared_exponential_kernel_integrals(
+                    train_samples, length_scale, variable, True,
+                    nquad_samples=50, max_block_entries=max_block_entries)
+            for integral, true_integral in zip(integrals, true_integrals):
+                assert np.allclose(integral, true_integral, rtol=1e-10)
+
+        integrals = get_gaussian_process_squared_exponential_kernel_integrals(
+            train_samples, length_scale, variable, True, skip_xi_1=True)
+        assert integrals[-1] is None
+
     def test_integrate_gaussian_process_uniform_mixed_bounds(self):
         nvars = 2
         def func(x): return np.sum(x**2, axis=0)[:, np.newaxis]
@@ -818,6 +1015,104 @@ class TestGaussianProcess(unittest.TestCase):
         assert np.allclose(
             total_effects, pce_total_effects, rtol=1e-4, atol=1e-4)
 
+    def test_gaussian_process_sobol_integrals(self):
+        nvars, ntrain_samples, nquad_samples = 4, 30, 20
+        variable = pya.IndependentMultivariateRandomVariable(
+            [stats.uniform(0, 1), stats.beta(2, 3), stats.norm(0, 1),
+             stats.uniform(-1, 2)])
+        train_samples = pya.generate_independent_random_samples(
+            variable, ntrain_samples)
+        length_scale = np.array([0.5, 0.8, 1., 0.7])
+        K = RBF(length_scale)(train_samples.T)+1e-2*np.eye(ntrain_samples)
+        L_inv = solve_triangular(
+            cholesky(K, lower=True), np.eye(ntrain_samples), lower=True)
+        K_inv = L_inv.T.dot(L_inv)
+        train_vals = np.hstack(
+            [np.cos(train_samples).sum(axis=0)[:, None],
+             np.prod(train_samples, axis=0)[:, None]])
+        kernel_var, y_train_mean = 2, 0.5
+        integrals = GaussianProcessSobolIntegrals(
+            variable, train_samples, train_vals, K_inv, length_scale,
+            kernel_var, True, y_train_mean, nquad_samples)
+
+        # compute the double integrals of the conditional expectations with
+        # tensor-product quadrature
+        univariate_quad_rules, pce = \
+            get_univariate_quadrature_rules_from_variable(
+                variable, [nquad_samples]*nvars)
+        P_list, P_mod_list, u_list = [], [], []
+        for ii in range(nvars):
+            xx_1d, ww_1d = univariate_quad_rules[ii](nquad_samples+1)
+            loc, scale = pce.var_trans.scale_parameters[
+                pce.basis_type_index_map[ii], :]
+            xx_1d = xx_1d*scale+loc
+            xx_2d = pya.cartesian_product([xx_1d]*2)
+            ww_2d = pya.outer_product([ww_1d]*2)
+            K1 = RBF(length_scale[ii])(xx_2d[:1].T, train_samples[ii:ii+1].T)
+            K2 = RBF(length_scale[ii])(xx_2d[1:].T, train_samples[ii:ii+1].T)
+            P_mod_list.append(K1.T.dot(ww_2d[:, None]*K2))
+            K = RBF(length_scale[ii])(xx_1d[:, None], train_samples[ii:ii+1].T)
+            P_list.append(K.T.dot(ww_1d[:, None]*K))
+            u_list.append(ww_2d.dot(np.exp(
+                -.5*(xx_2d[0]-xx_2d[1])**2/length_scale[ii]**2)))
+            assert np.allclose(P_list[-1], integrals.P_list[ii])
+            assert np.allclose(u_list[-1], integrals.u_list[ii])
+            assert np.allclose(P_mod_list[-1], compute_conditional_P(
+                xx_1d, ww_1d, train_samples[ii:ii+1], length_scale[ii]))
+
+        A_inv = K_inv*kernel_var
+        A_inv_y = A_inv.dot(train_vals)
+
+        def expected_variance(index):
+            P_p = np.prod(
+                [P_list[ii] if index[ii] == 1 else P_mod_list[ii]
+                 for ii in range(nvars)], axis=0)
+            U_p = np.prod(
+                [1 if index[ii] == 1 else u_list[ii] for ii in range(nvars)])
+            zeta = np.diag(A_inv_y.T.dot(P_p).dot(A_inv_y))
+            zeta = zeta+2*integrals.tau_A_inv_y*y_train_mean+y_train_mean**2
+            return mean_of_variance(
+                zeta, U_p-np.sum(A_inv*P_p), kernel_var,
+                integrals.expected_random_mean,
+                integrals.variance_random_mean)
+
+        interaction_terms = compute_hyperbolic_indices(nvars, 3)
+        interaction_terms = interaction_terms[
+            :, np.where(interaction_terms.max(axis=0) == 1)[0]]
+        values = integrals.interaction_variances(interaction_terms)
+        for index, value in zip(interaction_terms.T, values):
+            assert np.allclose(value, expected_variance(index))
+        values = integrals.total_effect_variances()
+        for index, value in zip(np.ones((nvars, nvars))-np.eye(nvars), values):
+            assert np.allclose(value, expected_variance(index))
+        assert np.allclose(
+            integrals.expected_random_var, expected_variance(np.ones(nvars)))
+
+    def test_predict_random_realization_truncated_cholesky(self):
+        nvars, ntrain_samples = 2, 10
+        train_samples = np.random.uniform(-1, 1, (nvars, ntrain_samples))
+        train_vals = np.cos(train_samples).sum(axis=0)[:, None]
+        kernel = Matern(0.5, length_scale_bounds='fixed', nu=np.inf)
+        gp = GaussianProcess(kernel, optimizer=None)
+        gp.fit(train_samples, train_vals)
+
+        samples = np.random.uniform(-1, 1, (nvars, 50))
+        mean, cov = gp(samples, return_cov=True)
+        rand_noise = np.eye(samples.shape[1])
+        vals = gp.predict_random_realization(
+            samples, rand_noise, truncated_cholesky={'max_rank': 50})
+        assert np.allclose((vals-mean).dot((vals-mean).T), cov, atol=1e-8)
+
+        # a low rank factorization only uses the first rows of the noise
+        vals = gp.predict_random_realization(
+            samples, rand_noise,
+            truncated_cholesky={'max_rank': 50, 'tol': 1e-4})
+        rank = np.where(np.absolute(vals-mean).max(axis=0) > 0)[0].max()+1
+        assert rank < 50
+        assert np.allclose(vals[:, rank:], mean)
+        assert np.allclose(
+            (vals-mean).dot((vals-mean).T), cov, atol=1e-4*np.trace(cov))
+
     def generate_gp_realizations(self):
         bounds = np.array(
             [0.2, 0.6, 1.15e-8, 1.15e-4, 0.2e-3, 160.e-3, 0.02, 0.1, 1., 5.,
@@ -1057,6 +1352,46 @@ class TestSamplers(unittest.TestCase):
         vals2 = gp2(validation_samples)
         assert np.allclose(vals1[:, 0:1], vals2)
 
+    def test_adaptive_gp_cholesky_update(self):
+        nvars = 2
+
+        def func(samples):
+            return np.cos(np.sum(samples**2, axis=0))[:, np.newaxis]
+
+        validation_samples = np.random.uniform(-1, 1, (nvars, 100))
+        kernel = Matern(0.5, length_scale_bounds=(1e-2, 10), nu=2.5)
+        sampler = CholeskySampler(nvars, 1000, None)
+        sampler.set_kernel(copy.deepcopy(kernel))
+        gp = AdaptiveGaussianProcess(
+            kernel=kernel, alpha=1e-10, normalize_y=True)
+        gp.setup(func, sampler, hyperparameter_update_interval=2)
+        gp.refine(10)
+        kernel_params = gp.kernel_.get_params()
+        # the hyper-parameters are not optimized and the Cholesky factor
+        # is updated
+        gp.refine(20)
+        assert gp.kernel_.get_params() == kernel_params
+
+        gp_full = GaussianProcess(
+            kernel=gp.kernel_, alpha=1e-10, normalize_y=True, optimizer=None)
+        gp_full.fit(gp.X_train_.T, func(gp.X_train_.T))
+        assert np.allclose(gp.L_, gp_full.L_)
+        assert np.allclose(gp.y_train_, gp_full.y_train_)
+        assert np.allclose(
+            gp.log_marginal_likelihood_value_,
+            gp_full.log_marginal_likelihood_value_)
+        vals, std = gp(validation_samples, return_std=True)
+        true_vals, true_std = gp_full(validation_samples, return_std=True)
+        assert np.allclose(vals, true_vals)
+        assert np.allclose(std, true_std)
+
+        # the hyper-parameters are optimized again
+        gp.refine(30)
+        assert gp.X_train_.shape[0] == 30
+        assert np.allclose(
+            gp.y_train_*gp._y_train_std+gp._y_train_mean,
+            func(gp.X_train_.T))
+
     def test_cholesky_sampler_adaptive_gp_fixed_kernel_II(self):
         np.random.seed(1)
         nvars = 10
@@ -1886,6 +2221,71 @@ class TestSamplers(unittest.TestCase):
         # number
         assert np.allclose(new_samples12, new_samples22)
 
+    def check_greedy_sampler_candidate_blocks(self, sampler_cls):
+        nvars = 2
+        variables = pya.IndependentMultivariateRandomVariable(
+            [stats.beta(20, 20)]*nvars)
+        generate_random_samples = partial(
+            pya.generate_independent_random_samples, variables)
+        kernel = pya.Matern(.1, length_scale_bounds='fixed', nu=np.inf)
+
+        nsamples, pivots = 20, []
+        for max_eval_concurrency, block_size, batch_size in [
+                (1, 1000, 1), (3, 17, 1), (2, 16, 4)]:
+            np.random.seed(1)
+            sampler = sampler_cls(
+                nvars, 100, 100, generate_random_samples, variables,
+                use_gauss_quadrature=False, econ=True, nugget=1e-8)
+            sampler.set_kernel(kernel)
+            sampler.set_max_eval_concurrency(max_eval_concurrency)
+            sampler.set_candidate_block_size(block_size)
+            sampler.set_batch_size(batch_size)
+            sampler(nsamples//2, verbosity=0)
+            sampler(nsamples, verbosity=0)
+            assert np.unique(sampler.pivots).shape[0] == nsamples
+            pivots.append(sampler.pivots)
+
+            # check the objective tracked by the sampler is correct
+            A = sampler.A[np.ix_(sampler.pivots, sampler.pivots)]
+            L_inv = solve_triangular(
+                cholesky(A, lower=True), np.eye(nsamples), lower=True)
+            if sampler_cls == GreedyVarianceOfMeanSampler:
+                obj_val = -np.sum(L_inv.dot(sampler.tau[sampler.pivots])**2)
+            else:
+                obj_val = -np.sum(L_inv.T.dot(L_inv)*sampler.P[
+                    np.ix_(sampler.pivots, sampler.pivots)])
+            assert np.allclose(sampler.best_obj_vals[-1], obj_val)
+        # blocking the candidates does not change the samples chosen
+        assert np.allclose(pivots[0], pivots[1])
+
+    def test_greedy_sampler_candidate_blocks(self):
+        self.check_greedy_sampler_candidate_blocks(
+            GreedyVarianceOfMeanSampler)
+        self.check_greedy_sampler_candidate_blocks(
+            GreedyIntegratedVarianceSampler)
+
+    def test_greedy_integrated_variance_sampler_lazy_batches(self):
+        nvars = 2
+        variables = pya.IndependentMultivariateRandomVariable(
+            [stats.beta(20, 20)]*nvars)
+        generate_random_samples = partial(
+            pya.generate_independent_random_samples, variables)
+        kernel = pya.Matern(.1, length_scale_bounds='fixed', nu=np.inf)
+
+        nsamples, pivots = 10, []
+        for batch_size in [1, 3, 5, 10]:
+            np.random.seed(1)
+            sampler = GreedyIntegratedVarianceSampler(
+                nvars, 100, 100, generate_random_samples, variables,
+                use_gauss_quadrature=False, econ=True, nugget=1e-8)
+            sampler.set_kernel(kernel)
+            sampler.set_batch_size(batch_size)
+            sampler(nsamples, verbosity=0)
+            pivots.append(np.asarray(sampler.pivots))
+        # lazy greedy selection chooses the same sequence of samples
+        for ii in range(1, len(pivots)):
+            assert np.array_equal(pivots[ii], pivots[0])
+
     def compare_ivar_samplers(self):
         nvars = 2
         variables = pya.IndependentMultivariateRandomVariable(
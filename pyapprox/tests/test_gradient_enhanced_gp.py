@@ -215,6 +215,36 @@ class TestGradientEnhancedGP(unittest.TestCase):
         # plt.legend()
         # plt.show()
 
+    def test_deriv_gp_kernel_gradient(self):
+        nvars, n_XX_func, n_XX_deriv = 2, 4, 3
+        XX_func = np.random.uniform(0,1,(n_XX_func,nvars))
+        XX_deriv = np.random.uniform(0,1,(n_XX_deriv,nvars))
+        XX_train = np.vstack([XX_func]+[XX_deriv]*nvars)
+        length_scale = np.array([0.7,1.3])
+        for return_code in ['full','values']:
+            kernel = DerivGPKernel(
+                n_XX_func,length_scale=length_scale,
+                length_scale_bounds=(1e-2,10))
+            kernel.return_code = return_code
+            K, K_grad = kernel(XX_train,eval_gradient=True)
+
+            # the gradient is with respect to the log of the length scales
+            def f(log_length_scale):
+                return full_kernel(
+                    XX_train,np.exp(log_length_scale),n_XX_func,
+                    return_code=return_code)
+            fd_K_grad = _approx_fprime(np.log(length_scale),f,1e-7)
+            assert np.allclose(K_grad,fd_K_grad,atol=1e-6)
+
+        K_grad = full_kernel_gradient(
+            XX_deriv[:,:1],length_scale[0],0,'derivs')
+        def f(log_length_scale):
+            return full_kernel(
+                XX_deriv[:,:1],np.exp(log_length_scale),0,
+                return_code='derivs')
+        fd_K_grad = _approx_fprime(np.log(length_scale[:1]),f,1e-7)
+        assert np.allclose(K_grad,fd_K_grad,atol=1e-6)
+
     def test_gradient_of_gp(self):
         gradient_enhanced_gp_example(1)
         #plt.show()
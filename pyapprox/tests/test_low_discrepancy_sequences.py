@@ -87,6 +87,68 @@ class TestLowDiscrepancySequences(unittest.TestCase):
              [1/16, 8/9,  0.64],
              [9/16, 1/27, 0.84]]).T
         assert np.allclose(true_samples[:, 2:], samples)
+
+    def test_sobol_sequence_jump_ahead(self):
+        nvars, nsamples, start_index = 10, 100, 1000
+        samples = sobol_sequence(nvars, nsamples+start_index)
+        assert np.allclose(
+            samples[:, start_index:],
+            sobol_sequence(nvars, nsamples, start_index))
+
+    def test_low_discrepancy_sequence_generators(self):
+        nvars, start_index = 4, 3
+        for Sequence, fun in [
+                (SobolSequence, lambda n: sobol_sequence(nvars, n)),
+                (HaltonSequence, lambda n: halton_sequence(nvars, 0, n))]:
+            generator = Sequence(nvars, start_index)
+            samples = np.hstack([generator(7), generator(20)])
+            assert generator.index == 30
+            assert np.allclose(samples, fun(30)[:, start_index:])
+
+    def test_randomized_sobol_sequence(self):
+        nvars, nsamples, nreplicates = 3, 256, 4
+        for scramble in ['shift', 'matousek', 'owen']:
+            samples = randomized_sobol_sequence(
+                nvars, nsamples, nreplicates, scramble=scramble)
+            assert samples.shape == (nreplicates, nvars, nsamples)
+            assert samples.min() >= 0 and samples.max() < 1
+            # randomization must preserve the stratification of the
+            # unscrambled sequence, e.g. each interval [k/2**m, (k+1)/2**m)
+            # contains one sample
+            for ii in range(nreplicates):
+                for dd in range(nvars):
+                    assert np.unique(
+                        np.floor(samples[ii, dd]*nsamples)).shape[0] == \
+                        nsamples
+            assert not np.allclose(samples[0], samples[1])
+
+            generator = RandomizedSobolSequence(
+                nvars, nreplicates, scramble)
+            samples = np.concatenate([generator(7), generator(20)], axis=2)
+            generator.index = 7
+            assert np.allclose(samples[:, :, 7:], generator(20))
+
+    def test_randomized_halton_sequence(self):
+        nvars, nsamples, nreplicates = 3, 100, 4
+        for scramble in ['shift', 'permutation']:
+            samples = randomized_halton_sequence(
+                nvars, nsamples, nreplicates, scramble=scramble)
+            assert samples.shape == (nreplicates, nvars, nsamples)
+            assert samples.min() >= 0 and samples.max() < 1
+            # the first prime**k samples of each dimension stratify [0, 1]
+            assert np.unique(np.floor(samples[0, 1, :81]*81)).shape[0] == 81
+
+    def test_estimate_mean_using_randomized_qmc(self):
+        nvars = 3
+        def fun(samples):
+            return np.prod(2*samples, axis=0)[:, None]
+        tol = 1e-4
+        sequence = RandomizedSobolSequence(nvars, 16)
+        mean, std_error, nsamples = estimate_mean_using_randomized_qmc(
+            fun, sequence, 64, tol, 2**16)
+        assert std_error <= tol and nsamples < 2**16
+        assert np.allclose(mean, 1, atol=5*std_error)
+        assert sequence.index == nsamples
  
 if __name__== "__main__":    
     low_discrepancy_sequences_test_suite = \
@@ -1,4 +1,5 @@
 import unittest
+import os
 import numpy as np
 from pyapprox.low_rank_multifidelity import *
 from functools import partial
@@ -130,6 +131,65 @@ class TestLowRankMultiFidelity(unittest.TestCase):
         assert numpy.allclose(numpy.dot(P.T,numpy.dot(numpy.dot(L,L.T),P)),G)
 
 
+    def test_select_nodes_randomized(self):
+        import tempfile
+        A = np.random.normal(0,1,(50,6)).dot(np.random.normal(0,1,(6,30)))
+        N = 6
+        pivots, L = select_nodes_randomized(A, N, chunksize=7)
+        assert np.unique(pivots).shape[0]==N
+        G = A[:,pivots].T.dot(A[:,pivots])
+        assert np.allclose(L.dot(L.T),G)
+        # the selected snapshots span the range of A
+        Q = np.linalg.qr(A[:,pivots])[0]
+        assert np.allclose(Q.dot(Q.T.dot(A)),A)
+
+        pivots, L = select_nodes_randomized(A, N, order=[3,1], chunksize=7)
+        assert np.allclose(pivots[:2],[3,1])
+        assert np.unique(pivots).shape[0]==N
+        
+        # snapshots stored on disk
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir,'snapshots.npy')
+            np.save(filename,A)
+            V = np.load(filename,mmap_mode='r')
+            np.random.seed(1)
+            pivots_mmap, L_mmap = select_nodes_randomized(V, N, chunksize=7)
+            np.random.seed(1)
+            pivots, L = select_nodes_randomized(A, N, chunksize=7)
+            assert np.allclose(pivots_mmap,pivots)
+            assert np.allclose(L_mmap,L)
+
+            hf_values = A[:,pivots].T**2
+            for ntest_samples in [4,1]:
+                test_values = np.random.normal(
+                    0,1,(ntest_samples,A.shape[0]))
+                mf_values_chunked, c_chunked = synthesis_operator(
+                    V[:,pivots].T,hf_values,L,test_values,chunksize=7)
+                mf_values, c = synthesis_operator(
+                    A[:,pivots].T,hf_values,L,test_values)
+                assert mf_values_chunked.shape==mf_values.shape
+                assert np.allclose(mf_values_chunked,mf_values)
+                assert np.allclose(c_chunked,c)
+
+            weights = np.diag(np.random.uniform(1,2,A.shape[0]))
+            weights[0,-1] = weights[-1,0] = 0.1
+            assert np.allclose(
+                synthesis_operator(
+                    V[:,pivots].T,hf_values,L,test_values,weights,
+                    chunksize=7)[0],
+                synthesis_operator(
+                    A[:,pivots].T,hf_values,L,test_values,weights)[0])
+            del V
+
+        mf_model = BiFidelityModel(
+            lambda x: A[:,x[0].astype(int)].T,
+            lambda x: A[:,x[0].astype(int)].T**2,
+            node_selection='randomized',chunksize=7)
+        mf_model.build_from_samples(
+            N,np.arange(A.shape[1])[np.newaxis,:],A.T)
+        assert np.allclose(mf_model.lf_selected_values,
+                           A[:,mf_model.lf_selected_samples[0]].T)
+
     def test_oscillatory_model(self):
         eps = 1.e-3
         mesh_dof=100
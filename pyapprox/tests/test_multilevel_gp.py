@@ -1,5 +1,6 @@
 import unittest
 from pyapprox.multilevel_gp import *
+from sklearn.gaussian_process.kernels import _approx_fprime
 import matplotlib.pyplot as plt
 from functools import partial
 
@@ -77,6 +78,33 @@ class TestMultilevelGP(unittest.TestCase):
             K[:,XX1.shape[0]:],p12**2*kernel1(XX1,XX2)+kernel2(XX1,XX2))
         print(K)
         
+    def test_multilevel_kernel_gradient(self):
+        nvars, nmodels = 2, 3
+        nsamples_per_model = [6,4,3]
+        XX_train = np.random.uniform(-1,1,(np.sum(nsamples_per_model),nvars))
+        length_scale = np.random.uniform(0.5,2,nmodels*nvars+nmodels-1)
+        mlgp_kernel = MultilevelGPKernel(
+            nvars, nsamples_per_model, length_scale=length_scale,
+            length_scale_bounds=[(1e-1,10)]*len(length_scale))
+        K, K_grad = mlgp_kernel(XX_train,eval_gradient=True)
+        assert np.allclose(K,full_multilevel_kernel(
+            XX_train,length_scale,nsamples_per_model))
+
+        # the gradient is with respect to the log of the hyperparameters
+        def f(log_hyperparams):
+            return full_multilevel_kernel(
+                XX_train,np.exp(log_hyperparams),nsamples_per_model)
+        fd_K_grad = _approx_fprime(np.log(length_scale),f,1e-7)
+        assert np.allclose(K_grad,fd_K_grad,atol=1e-6)
+
+        mlgp_kernel.return_code='values'
+        K, K_grad = mlgp_kernel(XX_train,eval_gradient=True)
+        def f(log_hyperparams):
+            return full_multilevel_kernel(
+                XX_train,np.exp(log_hyperparams),nsamples_per_model,True)
+        fd_K_grad = _approx_fprime(np.log(length_scale),f,1e-7)
+        assert np.allclose(K_grad,fd_K_grad,atol=1e-6)
+        
     @unittest.skip(reason="capability not complete")
     def test_2_models(self):
         # TODO Add Test which builds gp on two models data separately when
@@ -511,6 +511,53 @@ class TestOptimalExperimentalDesign(unittest.TestCase):
                 homog_outer_prods, design_factors, pp, return_grad=False,
                 noise_multiplier=noise_multiplier))
 
+    def test_matrix_free_criteria(self):
+        poly_degree = 4
+        num_design_pts = 31
+        design_samples = np.linspace(-1, 1, num_design_pts)
+        noise_multiplier = design_samples**2+1
+        design_factors = univariate_monomial_basis_matrix(
+            poly_degree, design_samples)
+        pred_factors = univariate_monomial_basis_matrix(
+            poly_degree, np.linspace(-1, 1, 11))
+        homog_outer_prods = compute_homoscedastic_outer_products(
+            design_factors)
+        assert np.allclose(
+            homog_outer_prods[:, :, 3],
+            np.outer(design_factors[3], design_factors[3]))
+        pp = np.random.uniform(1, 2, (num_design_pts, 1))
+        pp /= pp.sum()
+
+        criteria = [
+            partial(ioptimality_criterion, pred_factors=pred_factors),
+            coptimality_criterion,
+            doptimality_criterion, aoptimality_criterion,
+            partial(goptimality_criterion, pred_factors=pred_factors),
+            partial(roptimality_criterion, 0.5,
+                    pred_factors=pred_factors)]
+        for criterion in criteria:
+            for regression_type in ['lstsq', 'quantile']:
+                for noise in [None, noise_multiplier]:
+                    true_value, true_grad = criterion(
+                        homog_outer_prods, design_factors,
+                        design_prob_measure=pp, return_grad=True,
+                        noise_multiplier=noise,
+                        regression_type=regression_type)
+                    value, grad = criterion(
+                        None, design_factors,
+                        design_prob_measure=pp, return_grad=True,
+                        noise_multiplier=noise,
+                        regression_type=regression_type)
+                    assert np.allclose(value, true_value)
+                    assert np.allclose(grad, true_grad)
+
+        assert np.allclose(
+            compute_prediction_variance(
+                pp[:, 0], pred_factors, None, noise_multiplier,
+                design_factors=design_factors),
+            compute_prediction_variance(
+                pp[:, 0], pred_factors, homog_outer_prods, noise_multiplier))
+
     def test_gradient_log_determinant(self):
         """
         Test the identities 
@@ -592,6 +639,39 @@ class TestOptimalExperimentalDesign(unittest.TestCase):
         assert np.allclose(I, [0, 8, 21, 29])
         assert np.allclose(0.25*np.ones(4), mu[I], atol=1e-5)
 
+    def test_multiplicative_optimal_design(self):
+        np.random.seed(1)
+        poly_degree = 3
+        num_design_pts = 30
+        design_samples = np.linspace(-1, 1, num_design_pts)
+        design_factors = univariate_monomial_basis_matrix(
+            poly_degree, design_samples)
+        opts = {'pred_factors': univariate_monomial_basis_matrix(
+            poly_degree, np.linspace(-1, 1, 11))}
+
+        # compare with the analytical D-optimal design used in
+        # test_homoscedastic_least_squares_doptimal_design
+        opt_problem = AlphabetOptimalDesign('D', design_factors)
+        mu, res = opt_problem.solve(
+            {'solver': 'multiplicative', 'gtol': 1e-8}, return_full=True)
+        assert res.success
+        I = np.where(mu > 1e-5)[0]
+        assert np.allclose(I, [0, 8, 21, 29])
+        assert np.allclose(0.25*np.ones(4), mu[I], atol=1e-5)
+
+        for criteria in ['A', 'I']:
+            opt_problem = AlphabetOptimalDesign(
+                criteria, design_factors, opts=opts)
+            mu_slsqp = opt_problem.solve({'ftol': 1e-12, 'maxiter': 1000})
+            mu, res = opt_problem.solve(
+                {'solver': 'multiplicative', 'gtol': 1e-8}, return_full=True)
+            assert res.success
+            objective = opt_problem.get_objective_and_jacobian(
+                design_factors, None, None, opts)[0]
+            assert np.allclose(res.fun, objective(mu))
+            assert objective(mu) <= objective(mu_slsqp)+1e-8
+            assert np.allclose(mu, mu_slsqp, atol=1e-4)
+
     def test_heteroscedastic_quantile_local_doptimal_design(self):
         """
         Create D-optimal designs, for least squares regression with 
@@ -974,6 +1054,42 @@ class TestNonLinearOptimalExeprimentalDesign(unittest.TestCase):
         assert np.allclose(design_samples[I], [754.4, x_ub])
         assert np.allclose(mu[I], [0.5, 0.5])
 
+    def test_batched_bayesian_objective_and_jacobian(self):
+        design_samples = np.linspace(1e-1, 1, 20)[np.newaxis, :]
+        def noise_multiplier(p, x): return 1/michaelis_menten_model(p, x)
+        local_design_factors = \
+            lambda p, x: michaelis_menten_model_grad_parameters(p, x).T
+        opts = {'pred_factors': local_design_factors,
+                'pred_samples': np.linspace(0, 1, 11)[np.newaxis, :]}
+        parameter_samples = cartesian_product(
+            [np.array([1]), np.linspace(0.2, 1, 7)])
+        sample_weights = np.random.uniform(0, 1, parameter_samples.shape[1])
+        x = np.random.uniform(1, 2, design_samples.shape[1])
+        x /= x.sum()
+        for criteria in ['A', 'C', 'D', 'I']:
+            for regression_type in ['lstsq', 'quantile']:
+                for noise in [None, noise_multiplier]:
+                    opt_problem = AlphabetOptimalDesign(
+                        criteria, local_design_factors, noise, opts=opts,
+                        regression_type=regression_type)
+                    objs, jacs = opt_problem.\
+                        bayesian_objective_jacobian_components(
+                            parameter_samples, design_samples)[:2]
+                    true_value = np.sum(
+                        [w*obj(x) for obj, w in zip(objs, sample_weights)])
+                    true_grad = np.sum(
+                        [w*jac(x) for jac, w in zip(jacs, sample_weights)],
+                        axis=0).squeeze()
+                    for nsamples_per_batch, max_eval_concurrency in [
+                            (None, 1), (3, 2)]:
+                        objective, jacobian = opt_problem.\
+                            bayesian_batched_objective_and_jacobian(
+                                parameter_samples, design_samples,
+                                sample_weights, nsamples_per_batch,
+                                max_eval_concurrency)[:2]
+                        assert np.allclose(objective(x), true_value)
+                        assert np.allclose(jacobian(x), true_grad)
+
     def test_michaelis_menten_model_minimax_designs_homoscedastic(self):
         help_check_michaelis_menten_model_minimax_optimal_design('G')
         help_check_michaelis_menten_model_minimax_optimal_design('D')
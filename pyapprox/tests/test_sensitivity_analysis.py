@@ -221,6 +221,56 @@ class TestSensitivityAnalysis(unittest.TestCase):
         #     ix1=ix2
         # plt.xlim([0,1]); plt.ylim([0,1]); plt.show()
 
+    def test_morris_elementary_effects_linear_function(self):
+        nvars, nlevels, ntrajectories = 5, 4, 10
+        coefficients = np.arange(1, nvars+1)[:, None]
+        samples = get_morris_samples(nvars, nlevels, ntrajectories)
+        values = samples.T.dot(coefficients)
+        elem_effects = get_morris_elementary_effects(samples, values)
+        assert np.allclose(elem_effects[:, :, 0], coefficients)
+
+    def test_downselect_morris_trajectories(self):
+        nvars, nlevels, ncandidate_trajectories = 3, 4, 12
+        candidate_samples = get_morris_samples(
+            nvars, nlevels, ncandidate_trajectories)
+        trajectories = candidate_samples.reshape(
+            nvars, nvars+1, ncandidate_trajectories, order='F')
+        distances = get_morris_trajectory_distances(
+            trajectories, max_block_size=100)
+        for ii in range(ncandidate_trajectories):
+            for jj in range(ncandidate_trajectories):
+                assert np.allclose(distances[ii, jj], cdist(
+                    trajectories[:, :, ii].T, trajectories[:, :, jj].T).sum())
+
+        def spread(samples):
+            ntrajectories = samples.shape[1]//(nvars+1)
+            trajectories = samples.reshape(
+                nvars, nvars+1, ntrajectories, order='F')
+            return np.sqrt(np.triu(get_morris_trajectory_distances(
+                trajectories)**2, k=1).sum())
+
+        ntrajectories = 4
+        samples = downselect_morris_trajectories(
+            candidate_samples, ntrajectories, method='enumerate')
+        greedy_samples = downselect_morris_trajectories(
+            candidate_samples, ntrajectories, method='greedy')
+        assert greedy_samples.shape == (nvars, ntrajectories*(nvars+1))
+        assert spread(greedy_samples) <= spread(samples)
+        assert spread(greedy_samples) >= 0.9*spread(samples)
+
+    def test_analyze_sensitivity_morris(self):
+        nvars = 6
+        coefficients = np.array([78, 12, 0.5, 2, 97, 33])
+        function = partial(sobol_g_function, coefficients)
+        univariate_variables = [uniform(0, 1)]*nvars
+        result = analyze_sensitivity_morris(
+            function, univariate_variables, 20, ncandidate_trajectories=100)
+        assert result.samples.shape == (nvars, 20*(nvars+1))
+        assert result.morris_mu.shape == (nvars, 1)
+        # the most important variables have the smallest coefficients
+        assert np.argmax(result.morris_mu[:, 0]) == 2
+        assert np.argmin(result.morris_mu[:, 0]) == 4
+
     def test_analyze_sensitivity_sparse_grid(self):
         from pyapprox.benchmarks.benchmarks import setup_benchmark
         from pyapprox.adaptive_sparse_grid import isotropic_refinement_indicator
@@ -347,6 +397,48 @@ class TestSensitivityAnalysis(unittest.TestCase):
         assert np.allclose(sobol_indices, benchmark.sobol_indices,
                            rtol=5e-3, atol=1e-3)
 
+    def test_bootstrap_sobol_sensitivity_analysis_ishigami(self):
+        from pyapprox.benchmarks.benchmarks import setup_benchmark
+        benchmark = setup_benchmark("ishigami", a=7, b=0.1)
+
+        nsamples = 10000
+        nvars = benchmark.variable.num_vars()
+        order = 3
+        interaction_terms = compute_hyperbolic_indices(nvars, order)
+        interaction_terms = interaction_terms[:, 
+            np.where(interaction_terms.max(axis=0)==1)[0]]
+
+        np.random.seed(1)
+        sobol_indices, total_effect_indices, var, mean = \
+            sampling_based_sobol_indices(
+                benchmark.fun, benchmark.variable, interaction_terms, nsamples,
+                'random')
+
+        np.random.seed(1)
+        result = bootstrap_sampling_based_sobol_indices(
+            benchmark.fun, benchmark.variable, interaction_terms, nsamples,
+            nbootstraps=200, nbootstraps_per_batch=30)
+        assert np.allclose(result['sobol_indices']['value'], sobol_indices)
+        assert np.allclose(
+            result['total_effects']['value'], total_effect_indices)
+        assert np.allclose(result['variance']['value'], var)
+        assert np.allclose(result['mean']['value'], mean)
+        assert result['sobol_indices']['values'].shape == (
+            200, interaction_terms.shape[1], 1)
+
+        # check true values are contained in (conservatively widened)
+        # bootstrap confidence intervals
+        for name, true_values in zip(
+                ['sobol_indices', 'total_effects'],
+                [benchmark.sobol_indices, benchmark.total_effects]):
+            stats = result[name]
+            width = stats['upper_bound']-stats['lower_bound']
+            assert np.all(width > 0)
+            assert np.all(stats['q1'] <= stats['median'])
+            assert np.all(stats['median'] <= stats['q3'])
+            assert np.all(stats['lower_bound']-width <= true_values)
+            assert np.all(stats['upper_bound']+width >= true_values)
+
     def test_qmc_sobol_sensitivity_analysis_oakley(self):
         from pyapprox.benchmarks.benchmarks import setup_benchmark
         from pyapprox.approximate import approximate
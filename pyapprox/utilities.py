@@ -1510,7 +1510,6 @@ def update_cholesky_factorization(L_11, A_12, A_22):
     assert A_22.shape == (ncols, ncols)
     assert L_11.shape == (nrows, nrows)
     L_12 = solve_triangular(L_11, A_12, lower=True)
-    print(A_22 - L_12.T.dot(L_12))
     L_22 = np.linalg.cholesky(A_22 - L_12.T.dot(L_12))
     L = np.block([[L_11, np.zeros((nrows, ncols))], [L_12.T, L_22]])
     return L